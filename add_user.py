@@ -1,68 +1,32 @@
-import json
-import os
-from config import hash_password
-
-USERS_FILE = os.path.join(os.path.dirname(__file__), 'users.json')
+from config import hash_password, get_user_store
 
 
 def add_user(username, password, can_view_config=False):
-    # Load existing users
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r') as f:
-            users = json.load(f)
-    else:
-        users = []
     # Hash the password using config.hash_password
     hashed = hash_password(password)
-    # Check for duplicate username
-    for user in users:
-        if user['username'] == username:
-            print(f"User '{username}' already exists.")
-            return
-    # Add new user with permission
-    users.append({'username': username, 'password': hashed, 'can_view_config': can_view_config})
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
+    # Add new user with permission (refused if the username already exists)
+    if not get_user_store().add({'username': username, 'password': hashed, 'can_view_config': can_view_config}):
+        print(f"User '{username}' already exists.")
+        return
     print(f"User '{username}' added successfully.")
 
 
 def reset_password(username, new_password):
-    if not os.path.exists(USERS_FILE):
-        print("No users.json file found.")
+    if not get_user_store().update(username, password=hash_password(new_password)):
+        print(f"User '{username}' not found.")
         return
-    with open(USERS_FILE, 'r') as f:
-        users = json.load(f)
-    for user in users:
-        if user['username'] == username:
-            user['password'] = hash_password(new_password)
-            with open(USERS_FILE, 'w') as f:
-                json.dump(users, f, indent=2)
-            print(f"Password for '{username}' has been reset.")
-            return
-    print(f"User '{username}' not found.")
+    print(f"Password for '{username}' has been reset.")
 
 
 def delete_user(username):
-    if not os.path.exists(USERS_FILE):
-        print("No users.json file found.")
-        return
-    with open(USERS_FILE, 'r') as f:
-        users = json.load(f)
-    new_users = [user for user in users if user['username'] != username]
-    if len(new_users) == len(users):
+    if not get_user_store().delete(username):
         print(f"User '{username}' not found.")
         return
-    with open(USERS_FILE, 'w') as f:
-        json.dump(new_users, f, indent=2)
     print(f"User '{username}' deleted.")
 
 
 def show_all_users():
-    if not os.path.exists(USERS_FILE):
-        print("No users.json file found.")
-        return
-    with open(USERS_FILE, 'r') as f:
-        users = json.load(f)
+    users = get_user_store().list()
     if not users:
         print("No users found.")
         return
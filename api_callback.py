@@ -1,26 +1,46 @@
 import os
 import re
 import json
+import math
+import time
 import logging
 import urllib3
 import requests
 import subprocess
+import threading
 
 import powercode as PowerCode
 import utopia as Utopia
 import config
-from failure_tracker import FailureTracker
+import app_logging
+import http_client
+import metrics
+import resilience
+import log_reader
+import log_storage
+from failure_tracker import FailureTracker, SORT_FIELDS as FAILURE_SORT_FIELDS
+from order_queue import OrderQueue
+from customer_index import CustomerIndex, normalize_text, normalize_address
+from order_backfill import OrderBackfill
+from failure_retry import FailureRetryScheduler
+from webhook_idempotency import WebhookIdempotencyStore
+from email_outbox import EmailOutbox
+from step_executor import StepExecutor
+from ticket_templates import TicketTemplateCache, TemplateCatalog
+from login_throttle import LoginThrottle
 
 from config import *
 from dotenv import dotenv_values
 from flask_mail import Mail, Message
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for
+from flask import Flask, Response, request, jsonify, render_template, session, redirect, url_for
 from functools import wraps
+from contextlib import contextmanager
 from datetime import timedelta, datetime
 
 # Blueprints import
 from app.routes.powercode_route import powercode_bp
 from app.routes.utopia_route import utopia_bp
+from app.routes.results_route import results_bp
 
 # Only disable specific warnings, not all
 # urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -28,13 +48,18 @@ from app.routes.utopia_route import utopia_bp
 # Configure logging
 # Application logs go to app_main.log only
 # uWSGI system logs go to api_callback.log (configured in .ini file)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE)
-        # Removed StreamHandler() to prevent logs going to uWSGI
-    ]
+# Records are written by a background thread (LOG_ASYNC) as text or JSON lines (LOG_FORMAT)
+app_logging.setup_logging(
+    log_storage.RotatingLogHandler(
+        LOG_FILE,
+        max_bytes=LOG_MAX_BYTES,
+        interval_hours=LOG_ROTATE_HOURS,
+        backup_count=LOG_BACKUP_COUNT
+    ),
+    log_format=LOG_FORMAT,
+    use_async=LOG_ASYNC,
+    level=logging.INFO
+    # No StreamHandler, to prevent logs going to uWSGI
 )
 logger = logging.getLogger(__name__)
 
@@ -44,7 +69,11 @@ logging.getLogger('werkzeug').disabled = True
 
 
 def pretty_log_json(data, title=""):
-    """Pretty print JSON data for logging with proper indentation"""
+    """
+    Pretty print JSON data with indentation
+    For log messages prefer logger.info(msg, extra={'data': data}); the formatter
+    serializes it off the request thread and the log viewer pretty-prints it
+    """
     if isinstance(data, (dict, list)):
         formatted = json.dumps(data, indent=2, ensure_ascii=False)
         if title:
@@ -65,20 +94,122 @@ class UtopiaAPIHandler:
 
         # Admin credentials
         self.admin_username = ADMIN_USER
+
+        # Live log streams open at once in this process (each holds a request thread)
+        self.log_stream_slots = threading.BoundedSemaphore(LOG_STREAM_MAX_CONCURRENT)
         
         # Initialize Flask-Mail
         self.mail = Mail(self.app)
         
         # Initialize failure tracker
-        self.failure_tracker = FailureTracker()
+        self.failure_tracker = FailureTracker(
+            failure_file_path=FAILURE_JSON_FILE,
+            backend=FAILURE_STORE_BACKEND,
+            db_path=FAILURE_DB_FILE
+        )
+
+        # Initialize background order queue (workers start per process on first request)
+        self.order_queue = OrderQueue(
+            db_path=STATE_DB_FILE,
+            num_workers=ORDER_QUEUE_WORKERS,
+            poll_interval=ORDER_QUEUE_POLL_INTERVAL,
+            lease_timeout=ORDER_QUEUE_LEASE_TIMEOUT,
+            retention=ORDER_QUEUE_RETENTION_DAYS * 86400
+        )
+        self.app.before_request(self.start_background_workers)
+
+        # Failed logins per IP and username, shared by all workers and checked before bcrypt
+        self.login_throttle = LoginThrottle(
+            db_path=STATE_DB_FILE,
+            window=LOGIN_THROTTLE_WINDOW,
+            max_per_user=LOGIN_MAX_FAILURES_PER_USER,
+            max_per_ip=LOGIN_MAX_FAILURES_PER_IP,
+            lockout_base=LOGIN_LOCKOUT_BASE,
+            lockout_max=LOGIN_LOCKOUT_MAX,
+            verify_concurrency=LOGIN_VERIFY_CONCURRENCY
+        ) if LOGIN_THROTTLE_ENABLED else None
+
+        # Webhook deliveries keyed by (event, orderref), so redeliveries are not processed twice
+        self.webhook_deliveries = WebhookIdempotencyStore(
+            db_path=STATE_DB_FILE,
+            retention=WEBHOOK_IDEMPOTENCY_HOURS * 3600,
+            stale_after=ORDER_QUEUE_LEASE_TIMEOUT * 2
+        )
+
+        # Initialize email outbox (sender thread starts per process with the order queue)
+        self.email_outbox = EmailOutbox(
+            db_path=STATE_DB_FILE,
+            digest_window=EMAIL_DIGEST_WINDOW,
+            max_attempts=EMAIL_MAX_ATTEMPTS,
+            retry_base=EMAIL_RETRY_BASE,
+            smtp_timeout=MAIL_TIMEOUT,
+            retention=EMAIL_OUTBOX_RETENTION_DAYS * 86400
+        )
+
+        # Initialize local PowerCode customer index for duplicate checks (refreshed by one worker at a time)
+        self.customer_index = CustomerIndex(
+            db_path=STATE_DB_FILE,
+            refresh_interval=CUSTOMER_INDEX_REFRESH_HOURS * 3600,
+            max_age=CUSTOMER_INDEX_MAX_AGE_HOURS * 3600
+        )
+
+        # Initialize automatic retries of transient failures (one scheduler thread per process)
+        self.failure_retry = FailureRetryScheduler(
+            self.failure_tracker,
+            db_path=STATE_DB_FILE,
+            retry_types=FAILURE_RETRY_TYPES,
+            max_attempts=FAILURE_RETRY_MAX_ATTEMPTS,
+            base_delay=FAILURE_RETRY_BASE,
+            max_delay=FAILURE_RETRY_MAX_DELAY,
+            concurrency=FAILURE_RETRY_CONCURRENCY,
+            upstream_guard=resilience.get_guard()
+        )
+
+        # Initialize order backfill/reconciliation (scheduled runs are off unless BACKFILL_INTERVAL_HOURS is set)
+        self.order_backfill = OrderBackfill(
+            db_path=STATE_DB_FILE,
+            customer_index=self.customer_index,
+            failure_tracker=self.failure_tracker,
+            order_queue=self.order_queue,
+            failure_retry=self.failure_retry,
+            workers=BACKFILL_WORKERS,
+            rate=BACKFILL_RATE,
+            days=BACKFILL_DAYS,
+            statuses=BACKFILL_STATUSES,
+            project_statuses=BACKFILL_PROJECT_STATUSES,
+            interval_hours=BACKFILL_INTERVAL_HOURS,
+            scheduled_dry_run=BACKFILL_SCHEDULED_DRY_RUN
+        )
+
+        # Compiled ticket templates, recompiled when a template file changes on disk
+        self.ticket_templates = TicketTemplateCache()
+        # Template names/subjects/sizes for the editor, rebuilt when the directory changes
+        self.ticket_catalog = TemplateCatalog(TICKET_TEMPLATE_DIR)
 
         # Setup Blueprints
         self.app.register_blueprint(powercode_bp)
         self.app.register_blueprint(utopia_bp)
+        self.app.register_blueprint(results_bp)
         
         # Setup all routes
         self.setup_routes()
 
+    def start_background_workers(self):
+        """
+        Start background worker threads for this process.
+        Runs before each request; it is a no-op once workers are running, and
+        restarts them in uWSGI workers forked from the master process.
+        """
+        self.order_queue.start(self.process_order_job)
+        if EMAIL_OUTBOX_ENABLED:
+            self.email_outbox.start(self.app)
+        self.customer_index.start(PowerCode.list_powercode_customers)
+        self.order_backfill.start(self.process_backfill_order)
+        if FAILURE_RETRY_ENABLED:
+            self.failure_retry.start(self.retry_failure, self.notify_retries_exhausted)
+        if metrics.get_metrics() is not None:
+            metrics.get_metrics().start()
+
     def _reload_config(self):
         """Update instance variables after config reload"""
         self.admin_username = config.ADMIN_USER
@@ -119,6 +250,8 @@ class UtopiaAPIHandler:
         self.app.route('/api/failures/<orderref>/resolve', methods=['POST'])(self.login_required(self.resolve_failure_api))
         self.app.route('/api/failures/<orderref>/delete', methods=['DELETE'])(self.login_required(self.delete_failure_api))
         self.app.route('/api/failures/stats', methods=['GET'])(self.login_required(self.get_failure_stats_api))
+        self.app.route('/api/failures/trends', methods=['GET'])(self.login_required(self.get_failure_trends_api))
+        self.app.route('/api/failures/retries', methods=['GET'])(self.login_required(self.get_failure_retries_api))
 
         # Ticket template editor routes (protected)
         self.app.route('/admin/ticket-editor', methods=['GET'])(self.login_required(self.ticket_editor))
@@ -135,10 +268,48 @@ class UtopiaAPIHandler:
         # Log viewer routes (protected)
         self.app.route('/admin/logs', methods=['GET'])(self.login_required(self.admin_logs))
         self.app.route('/api/logs/read', methods=['GET'])(self.login_required(self.read_logs))
+        self.app.route('/api/logs/stream', methods=['GET'])(self.login_required(self.stream_logs))
         self.app.route('/api/logs/download', methods=['GET'])(self.login_required(self.download_logs))
+        self.app.route('/api/logs/segments', methods=['GET'])(self.login_required(self.list_log_segments))
 
         # API callback route (no auth required - for webhook)
         self.app.route('/api-callback', methods=['GET', 'POST'])(self.api_callback)
+
+        # Order job status routes (protected)
+        self.app.route('/api/jobs', methods=['GET'])(self.login_required(self.list_jobs_api))
+        self.app.route('/api/jobs/<job_id>', methods=['GET'])(self.login_required(self.get_job_api))
+        self.app.route('/api/webhook/deliveries', methods=['GET'])(self.login_required(self.list_webhook_deliveries_api))
+
+        # Upstream HTTP connection pool stats (protected)
+        self.app.route('/api/http/stats', methods=['GET'])(self.login_required(self.get_http_stats_api))
+
+        # Upstream rate limits and circuit breakers (protected)
+        self.app.route('/admin/upstreams', methods=['GET'])(self.login_required(self.admin_upstreams))
+        self.app.route('/api/upstreams', methods=['GET'])(self.login_required(self.get_upstreams_api))
+        self.app.route('/api/upstreams/<upstream>/reset', methods=['POST'])(self.login_required(self.reset_upstream_api))
+
+        # Stage and upstream latency metrics (/metrics also accepts METRICS_TOKEN for scrapers)
+        self.app.route('/metrics', methods=['GET'])(self.metrics_endpoint)
+        self.app.route('/admin/metrics', methods=['GET'])(self.login_required(self.admin_metrics))
+        self.app.route('/api/metrics/summary', methods=['GET'])(self.login_required(self.get_metrics_summary_api))
+        self.app.route('/api/metrics/reset', methods=['POST'])(self.login_required(self.reset_metrics_api))
+
+        # PowerCode customer index
+        self.app.route('/api/customer-index', methods=['GET'])(self.login_required(self.get_customer_index_api))
+        self.app.route('/api/customer-index/refresh', methods=['POST'])(self.login_required(self.refresh_customer_index_api))
+
+        # Order backfill / reconciliation
+        self.app.route('/api/backfill/runs', methods=['GET'])(self.login_required(self.list_backfill_runs_api))
+        self.app.route('/api/backfill/runs/<int:run_id>', methods=['GET'])(self.login_required(self.get_backfill_run_api))
+        self.app.route('/api/backfill/run', methods=['POST'])(self.login_required(self.start_backfill_api))
+
+        # Utopia lookup cache
+        self.app.route('/api/utopia/cache', methods=['GET'])(self.login_required(self.get_utopia_cache_api))
+        self.app.route('/api/utopia/cache/invalidate', methods=['POST'])(self.login_required(self.invalidate_utopia_cache_api))
+
+        # Email outbox routes
+        self.app.route('/api/email/outbox', methods=['GET'])(self.login_required(self.get_email_outbox_api))
+        self.app.route('/api/email/outbox/retry', methods=['POST'])(self.login_required(self.retry_email_outbox_api))
         
         # User password change route
         self.app.route('/api/user/change-password', methods=['POST'])(self.login_required(self.change_password_api))
@@ -204,28 +375,62 @@ class UtopiaAPIHandler:
         data = request.get_json()
         username = data.get('username', '').strip()
         password = data.get('password', '')
+        ip = request.remote_addr
+
+        # Locked-out IPs/usernames are turned away before any bcrypt work
+        throttle = self.login_throttle
+        if throttle:
+            retry_after = throttle.check(ip, username)
+            if retry_after:
+                logger.warning(f"Throttled login attempt for username: {username} from IP: {ip}")
+                return self._login_throttled(
+                    f'Too many failed login attempts. Try again in {math.ceil(retry_after)} seconds.',
+                    retry_after
+                )
+            slot = throttle.acquire_verification()
+            if slot is None:
+                logger.warning(f"Login for username: {username} from IP: {ip} rejected, password checks busy")
+                return self._login_throttled('Too many logins in progress. Please try again.', 1)
 
-        users = config.load_users()
-        # Check credentials against users.json
-        for user in users:
-            if user['username'] == username and config.verify_password(password, user['password']):
-                session.permanent = True
-                session['logged_in'] = True
-                session['username'] = username
-                logger.info(f"User '{username}' logged in successfully from IP: {request.remote_addr}")
-                return jsonify({'success': True}), 200
-
-        # Fallback to legacy admin credentials
-        if username == self.admin_username and config.check_admin_password(password):
+        try:
+            # Check credentials against the user store
+            user = config.get_user(username)
+            authenticated = bool(user) and config.verify_password(password, user['password'])
+
+            # Fallback to legacy admin credentials
+            if not authenticated and username == self.admin_username:
+                authenticated = config.check_admin_password(password)
+        finally:
+            if throttle:
+                throttle.release_verification(slot)
+
+        if authenticated:
+            if throttle:
+                throttle.record_success(ip, username)
             session.permanent = True
             session['logged_in'] = True
             session['username'] = username
-            logger.info(f"User '{username}' logged in successfully from IP: {request.remote_addr}")
+            logger.info(f"User '{username}' logged in successfully from IP: {ip}")
             return jsonify({'success': True}), 200
 
-        logger.warning(f"Failed login attempt for username: {username} from IP: {request.remote_addr}")
+        logger.warning(f"Failed login attempt for username: {username} from IP: {ip}")
+        if throttle:
+            lockout = throttle.record_failure(ip, username)
+            if lockout:
+                return self._login_throttled(
+                    f'Too many failed login attempts. Try again in {math.ceil(lockout)} seconds.',
+                    lockout
+                )
         return jsonify({'success': False, 'error': 'Invalid username or password'}), 401
 
+    @staticmethod
+    def _login_throttled(message, retry_after):
+        """429 response for a throttled login, with Retry-After"""
+        response = jsonify({'success': False, 'error': message})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+        return response
+
     def logout(self):
         """
         Logout handler
@@ -264,8 +469,8 @@ class UtopiaAPIHandler:
             
             logger.info(f"Admin lookup for orderref: {orderref} by user: {session.get('username')}")
             
-            # Call the Utopia API function
-            result = Utopia.getCustomerFromUtopia(orderref)
+            # Call the Utopia API function (cached; 'refresh': true forces a new upstream call)
+            result = Utopia.getCustomerFromUtopiaCached(orderref, refresh=bool(data.get('refresh')))
             
             # Check for error responses from Utopia API
             if isinstance(result, dict) and "error" in result:
@@ -286,7 +491,7 @@ class UtopiaAPIHandler:
             
             # Log successful lookup
             logger.info(f"Admin lookup successful for orderref: {orderref}")
-            logger.debug(pretty_log_json(result, f"Admin lookup result for {orderref}"))
+            logger.debug(f"Admin lookup result for {orderref}", extra={'data': result, 'orderref': orderref})
             
             # Return successful response with customer data
             return jsonify({
@@ -344,12 +549,33 @@ class UtopiaAPIHandler:
                 "sp_terms_agree_date": customer_data.get('termsagreement', {}).get('sp_terms_agree_date', "")
             }
             
-            logger.warning(f"Customer data to create account in Powercode: {pretty_log_json(customer_to_powercode)}")
+            logger.info("Customer data to create account in Powercode",
+                        extra={'data': customer_to_powercode, 'orderref': orderref})
 
             # Use shared customer creation logic
-            success, customer_id, error_message, ticket_id = self.process_customer_creation(
-                customer_to_powercode, orderref, service_plan
-            )
+            try:
+                success, customer_id, error_message, ticket_id = self.process_customer_creation(
+                    customer_to_powercode, orderref, service_plan
+                )
+            except (resilience.CircuitOpenError, resilience.UpstreamThrottledError) as e:
+                # PowerCode is refusing calls right now: leave the order to the retry scheduler
+                logger.warning(f"Admin customer creation for {orderref} deferred: {str(e)}")
+                self.failure_tracker.record_failure(
+                    orderref=orderref,
+                    error_message=str(e),
+                    failure_type=self.failure_type_for(e),
+                    customer_data=dict(customer_to_powercode, service_plan=service_plan)
+                )
+                retry_at = getattr(e, 'retry_at', None)
+                response = jsonify({
+                    'success': False,
+                    'error': f'{str(e)}. The order was queued for an automatic retry.'
+                })
+                response.status_code = 503
+                response.headers['Retry-After'] = str(
+                    max(1, math.ceil(retry_at - time.time())) if retry_at else math.ceil(UPSTREAM_BREAKER_COOLDOWN)
+                )
+                return response
             
             if not success:
                 if customer_id != -1:  # Customer exists
@@ -396,23 +622,65 @@ class UtopiaAPIHandler:
     
     def get_failures_api(self):
         """
-        API endpoint to get failure data
-        GET /api/failures - Returns JSON with failure list and statistics
+        API endpoint to get failure data, one page at a time
+        GET /api/failures - Returns JSON with a page of failures, paging info and statistics
+        Query parameters:
+            include_resolved=true|false, limit (default 50, max 500), offset,
+            failure_type, date_from, date_to (ISO dates), min_retries, max_retries,
+            search (orderref / error / customer data), sort (timestamp, first_failure,
+            retry_count, orderref, failure_type), order=asc|desc,
+            fields=summary (omit customer_data)
         """
         try:
-            include_resolved = request.args.get('include_resolved', 'false').lower() == 'true'
-            
-            # Get failure list and statistics
-            failures = self.failure_tracker.get_failure_list(include_resolved=include_resolved)
+            args = request.args
+            include_resolved = args.get('include_resolved', 'false').lower() == 'true'
+
+            try:
+                limit = min(max(int(args.get('limit', 50)), 1), 500)
+                offset = max(int(args.get('offset', 0)), 0)
+                min_retries = int(args['min_retries']) if args.get('min_retries') else None
+                max_retries = int(args['max_retries']) if args.get('max_retries') else None
+            except ValueError:
+                return jsonify({
+                    'success': False,
+                    'error': 'limit, offset, min_retries and max_retries must be integers'
+                }), 400
+
+            sort = args.get('sort', 'timestamp')
+            if sort not in FAILURE_SORT_FIELDS:
+                return jsonify({
+                    'success': False,
+                    'error': f'Invalid sort field. Use one of: {", ".join(FAILURE_SORT_FIELDS)}'
+                }), 400
+
+            # Get one page of failures and statistics
+            page = self.failure_tracker.query_failures(
+                limit=limit,
+                offset=offset,
+                include_resolved=include_resolved,
+                failure_type=args.get('failure_type') or None,
+                date_from=args.get('date_from') or None,
+                date_to=args.get('date_to') or None,
+                min_retries=min_retries,
+                max_retries=max_retries,
+                search=args.get('search', '').strip() or None,
+                sort=sort,
+                descending=args.get('order', 'desc').lower() != 'asc',
+                include_customer_data=args.get('fields', 'full') != 'summary'
+            )
             stats = self.failure_tracker.get_failure_stats()
             
             # logger.info(f"Failures retrieved by {session.get('username')}: {len(failures)} total")
             
             return jsonify({
                 'success': True,
-                'failures': failures,
+                'failures': page['failures'],
                 'stats': stats,
-                'total': len(failures)
+                'total': page['total'],
+                'limit': page['limit'],
+                'offset': page['offset'],
+                'has_more': page['has_more'],
+                'next_offset': page['next_offset']
             }), 200
             
         except Exception as e:
@@ -488,8 +756,9 @@ class UtopiaAPIHandler:
             stats = self.failure_tracker.get_failure_stats()
             
             # Get additional details
-            unresolved_failures = self.failure_tracker.get_failure_list(include_resolved=False)
-            recent_failures = unresolved_failures[:5]  # Last 5 unresolved
+            recent_failures = self.failure_tracker.query_failures(
+                limit=5, include_resolved=False, include_customer_data=False
+            )['failures']  # Last 5 unresolved
             
             return jsonify({
                 'success': True,
@@ -503,8 +772,72 @@ class UtopiaAPIHandler:
                 'success': False,
                 'error': f'Server error: {str(e)}'
             }), 500
+
+    def get_failure_trends_api(self):
+        """
+        API endpoint to get failure counts over time
+        GET /api/failures/trends - Returns JSON with failure counts per hour/day bucket
+
+        Query parameters:
+            granularity: "hour" or "day" (default "day")
+            days: How many days back to include (default 30, max 365)
+            failure_type: Only count this failure type
+        """
+        try:
+            granularity = request.args.get('granularity', 'day')
+            if granularity not in ('hour', 'day'):
+                return jsonify({
+                    'success': False,
+                    'error': "granularity must be 'hour' or 'day'"
+                }), 400
+            try:
+                days = min(max(int(request.args.get('days', 30)), 1), 365)
+            except ValueError:
+                return jsonify({
+                    'success': False,
+                    'error': 'days must be an integer'
+                }), 400
+
+            trends = self.failure_tracker.get_failure_trends(
+                granularity=granularity,
+                days=days,
+                failure_type=request.args.get('failure_type') or None
+            )
+
+            return jsonify({
+                'success': True,
+                'granularity': granularity,
+                'days': days,
+                'trends': trends
+            }), 200
+
+        except Exception as e:
+            logger.error(f"Error in get_failure_trends_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
         
 
+    def get_failure_retries_api(self):
+        """
+        API endpoint to get the automatic retry schedule
+        GET /api/failures/retries - Returns retryable failures with their next retry time and last outcome
+        """
+        try:
+            return jsonify({
+                'success': True,
+                'enabled': FAILURE_RETRY_ENABLED,
+                'retries': self.failure_retry.get_status()
+            }), 200
+
+        except Exception as e:
+            logger.error(f"Error in get_failure_retries_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
     def ticket_editor(self):
         """
         Renders the ticket template editor interface
@@ -556,11 +889,6 @@ class UtopiaAPIHandler:
                     'error': 'Template name is required'
                 }), 400
             
-            # Create ticket template directory if it doesn't exist
-            templates_dir = TICKET_TEMPLATE_DIR
-            if not os.path.exists(templates_dir):
-                os.makedirs(templates_dir)
-            
             # If no filename provided, generate from name
             if not filename:
                 filename = name.lower().replace(' ', '_').replace('-', '_')
@@ -568,21 +896,18 @@ class UtopiaAPIHandler:
                 filename = ''.join(c for c in filename if c.isalnum() or c == '_')
                 filename = f"{filename}.txt"
             
-            file_path = os.path.join(templates_dir, filename)
-            
-            # Save the template
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            # Save metadata
-            meta_path = os.path.join(templates_dir, f"{filename}.meta.json")
             metadata = {
                 'name': name,
                 'subject': subject,
                 'last_modified': datetime.now().isoformat()
             }
-            with open(meta_path, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, indent=2)
+            
+            # Save the template and its metadata (written to temp files and renamed, so a
+            # worker rendering a ticket never reads a half-written template; every worker's
+            # compiled copy is keyed by the file's mtime/inode and is replaced on its next use,
+            # and the rename changes the directory mtime, which refreshes their catalogs)
+            file_path = self.ticket_catalog.save(filename, content, metadata)
+            self.ticket_templates.invalidate(file_path)
             
             logger.info(f"Ticket template saved: {filename} by {session.get('username')}")
             
@@ -606,8 +931,6 @@ class UtopiaAPIHandler:
         GET /api/ticket-template/load/<template_id> - Returns template content
         """
         try:
-            templates_dir = TICKET_TEMPLATE_DIR
-            
             # Map template IDs to file names
             template_files = {
                 'new_customer': TICKET_TEMPLATE_FILE,
@@ -617,32 +940,29 @@ class UtopiaAPIHandler:
             }
             
             filename = template_files.get(template_id, f"{template_id}.txt")
-            file_path = os.path.join(templates_dir, filename)
+            metadata = self.ticket_catalog.get(filename)
             
-            if not os.path.exists(file_path):
+            # Content comes from the compiled-template cache (re-read only if the file changed)
+            content = None
+            if metadata is not None:
+                try:
+                    content = self.ticket_templates.get(os.path.join(TICKET_TEMPLATE_DIR, filename)).source
+                except FileNotFoundError:
+                    pass
+            
+            if content is None:
                 return jsonify({
                     'success': False,
                     'error': 'Template not found'
                 }), 404
             
-            # Load template content
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Try to load metadata
-            meta_path = os.path.join(templates_dir, f"{filename}.meta.json")
-            metadata = {}
-            if os.path.exists(meta_path):
-                with open(meta_path, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-            
             return jsonify({
                 'success': True,
                 'template_id': template_id,
                 'content': content,
-                'name': metadata.get('name', ''),
-                'subject': metadata.get('subject', ''),
-                'last_modified': metadata.get('last_modified', '')
+                'name': metadata['name'],
+                'subject': metadata['subject'],
+                'last_modified': metadata['last_modified']
             }), 200
             
         except Exception as e:
@@ -656,46 +976,28 @@ class UtopiaAPIHandler:
         """
         List all available ticket templates
         GET /api/ticket-template/list - Returns list of templates
+        
+        Served from the template catalog; sends an ETag, and answers 304 Not Modified
+        when the browser's If-None-Match still matches.
         """
         try:
-            templates_dir = TICKET_TEMPLATE_DIR
-            
-            if not os.path.exists(templates_dir):
-                return jsonify({
-                    'success': True,
-                    'templates': []
-                }), 200
-            
-            templates = []
-            
-            # Get all .txt files in the directory
-            for filename in os.listdir(templates_dir):
-                if filename.endswith('.txt') and not filename.endswith('.meta.json'):
-                    file_path = os.path.join(templates_dir, filename)
-                    meta_path = file_path + '.meta.json'
-                    
-                    # Load metadata if exists
-                    metadata = {}
-                    if os.path.exists(meta_path):
-                        with open(meta_path, 'r', encoding='utf-8') as f:
-                            metadata = json.load(f)
-                    
-                    # Get file stats
-                    file_stat = os.stat(file_path)
-                    
-                    templates.append({
-                        'id': filename.replace('.txt', ''),
-                        'name': metadata.get('name', filename),
-                        'subject': metadata.get('subject', ''),
-                        'filename': filename,
-                        'size': file_stat.st_size,
-                        'modified': datetime.fromtimestamp(file_stat.st_mtime).isoformat()
-                    })
-            
-            return jsonify({
+            entries, etag = self.ticket_catalog.list()
+            templates = [{
+                'id': entry['id'],
+                'name': entry['name'] or entry['filename'],
+                'subject': entry['subject'],
+                'filename': entry['filename'],
+                'size': entry['size'],
+                'modified': entry['modified']
+            } for entry in entries]
+            
+            response = jsonify({
                 'success': True,
                 'templates': templates
-            }), 200
+            })
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
             
         except Exception as e:
             logger.error(f"Error listing ticket templates: {str(e)}", exc_info=True)
@@ -719,12 +1021,8 @@ class UtopiaAPIHandler:
                     'error': 'Filename is required'
                 }), 400
             
-            templates_dir = TICKET_TEMPLATE_DIR
-            file_path = os.path.join(templates_dir, filename)
-            meta_path = os.path.join(templates_dir, f"{filename}.meta.json")
-            
             # Check if file exists
-            if not os.path.exists(file_path):
+            if self.ticket_catalog.get(filename) is None:
                 return jsonify({
                     'success': False,
                     'error': 'Template file not found'
@@ -740,12 +1038,13 @@ class UtopiaAPIHandler:
                     'error': f'Cannot delete the active template "{filename}". Please change the active template in Configuration first.'
                 }), 400
             
-            # Delete template file
-            os.remove(file_path)
-            
-            # Delete metadata file if exists
-            if os.path.exists(meta_path):
-                os.remove(meta_path)
+            # Delete template file and its metadata
+            if not self.ticket_catalog.delete(filename):
+                return jsonify({
+                    'success': False,
+                    'error': 'Template file not found'
+                }), 404
+            self.ticket_templates.invalidate(os.path.join(TICKET_TEMPLATE_DIR, filename))
             
             logger.info(f"Ticket template deleted: {filename} by {session.get('username')}")
             
@@ -767,8 +1066,7 @@ class UtopiaAPIHandler:
         GET /admin/config - Returns the HTML template for viewing/editing config settings
         """
         username = session.get("username")
-        users = config.load_users()
-        user = next((u for u in users if u['username'] == username), None)
+        user = config.get_user(username)
         if not user or not user.get('can_view_config', False):
             return render_template('403.html'), 403
         config_data = config.get_config_dict()
@@ -870,41 +1168,65 @@ class UtopiaAPIHandler:
     def read_logs(self):
         """
         Read log file and return content
-        GET /api/logs/read?lines=100&search=error - Returns log content with optional filters
+        GET /api/logs/read?lines=100&search=error - Returns the newest log entries with optional filters
+
+        Query parameters:
+            lines: Maximum number of entries to return (default 100, max 10000)
+            search: Case-insensitive text filter
+            level: Minimum level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+            since, until: Time range (YYYY-MM-DD or YYYY-MM-DDTHH:MM); includes rotated segments
+            before: Byte offset from a previous start_offset, to page to older entries
+            after, file_id: Byte offset and file id from a previous end_offset/file_id,
+                            to fetch only lines appended since then
         """
         try:
-            lines = int(request.args.get('lines', 100))
-            search = request.args.get('search', '').lower()
+            try:
+                lines = min(max(int(request.args.get('lines', 100)), 1), 10000)
+                before = request.args.get('before')
+                before = int(before) if before not in (None, '') else None
+                after = request.args.get('after')
+                after = int(after) if after not in (None, '') else None
+            except ValueError:
+                return jsonify({
+                    'success': False,
+                    'error': 'lines, before and after must be integers'
+                }), 400
+
+            try:
+                log_filter = log_reader.LogFilter(
+                    search=request.args.get('search', ''),
+                    level=request.args.get('level', ''),
+                    since=request.args.get('since', ''),
+                    until=request.args.get('until', '')
+                )
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
             
             if not os.path.exists(LOG_FILE):
                 return jsonify({
                     'success': True,
                     'content': 'Log file does not exist yet.',
-                    'total_lines': 0
+                    'entries': 0,
+                    'lines': 0
                 }), 200
-            
-            # Read the file
-            with open(LOG_FILE, 'r', encoding='utf-8', errors='ignore') as f:
-                all_lines = f.readlines()
-            
-            # Apply search filter if provided
-            if search:
-                filtered_lines = [line for line in all_lines if search in line.lower()]
+
+            if after is None and before is None and (log_filter.since or log_filter.until):
+                # Time window: may reach back into rotated, compressed segments
+                result = log_storage.read_window(LOG_FILE, lines, log_filter)
+            elif after is not None:
+                result = log_reader.read_since(
+                    LOG_FILE, after, request.args.get('file_id'), log_filter=log_filter
+                )
+                if result['reset']:
+                    # Log was rotated or truncated; send a fresh tail
+                    result = dict(log_reader.read_tail(LOG_FILE, lines, log_filter=log_filter), reset=True)
             else:
-                filtered_lines = all_lines
-            
-            # Get the last N lines
-            tail_lines = filtered_lines[-lines:] if len(filtered_lines) > lines else filtered_lines
+                result = log_reader.read_tail(LOG_FILE, lines, log_filter=log_filter, before=before)
             
-            content = ''.join(tail_lines)
-            
-            return jsonify({
-                'success': True,
-                'content': content,
-                'total_lines': len(all_lines),
-                'filtered_lines': len(filtered_lines),
-                'displayed_lines': len(tail_lines)
-            }), 200
+            return jsonify(dict(result, success=True)), 200
             
         except Exception as e:
             logger.error(f"Error reading logs: {str(e)}", exc_info=True)
@@ -913,23 +1235,136 @@ class UtopiaAPIHandler:
                 'error': f'Failed to read logs: {str(e)}'
             }), 500
     
+    def stream_logs(self):
+        """
+        Stream appended log lines as Server-Sent Events
+        GET /api/logs/stream?after=<offset>&file_id=<id>&search=error - Returns a text/event-stream
+
+        Accepts the same search/level/since/until filters as /api/logs/read. Starts at
+        after/file_id (or the Last-Event-ID header when the browser reconnects), or at
+        the end of the file. Events: "lines", "rotated", "gap"; comments keep the
+        connection alive. The stream ends after LOG_STREAM_MAX_SECONDS and the
+        browser's EventSource reconnects from the last event id. Beyond
+        LOG_STREAM_MAX_CONCURRENT open streams in this process it returns 503, and
+        the viewer falls back to polling /api/logs/read.
+        """
+        try:
+            after = request.args.get('after')
+            cursor_file_id = request.args.get('file_id') or None
+            last_event_id = request.headers.get('Last-Event-ID', '')
+            if '|' in last_event_id:
+                cursor_file_id, after = last_event_id.split('|', 1)
+            offset = int(after) if after not in (None, '') else None
+
+            log_filter = log_reader.LogFilter(
+                search=request.args.get('search', ''),
+                level=request.args.get('level', ''),
+                since=request.args.get('since', ''),
+                until=request.args.get('until', '')
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
+        if not self.log_stream_slots.acquire(blocking=False):
+            response = jsonify({'success': False, 'error': 'Too many live log streams open, try again later'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(math.ceil(LOG_STREAM_MAX_SECONDS))
+            return response
+
+        def generate():
+            # Tell EventSource how soon to reconnect once this stream ends
+            yield f"retry: {int(LOG_STREAM_POLL_INTERVAL * 1000)}\n\n"
+            try:
+                for event in log_reader.follow(
+                    LOG_FILE,
+                    offset=offset,
+                    cursor_file_id=cursor_file_id,
+                    log_filter=log_filter,
+                    poll_interval=LOG_STREAM_POLL_INTERVAL,
+                    max_seconds=LOG_STREAM_MAX_SECONDS,
+                    max_lag_bytes=LOG_STREAM_MAX_LAG_BYTES
+                ):
+                    name = event.pop('event')
+                    if name == 'heartbeat':
+                        yield f": keepalive\nid: {event['file_id']}|{event['end_offset']}\n\n"
+                        continue
+                    event_id = f"{event['file_id']}|{event['end_offset']}" if 'end_offset' in event else None
+                    yield (
+                        f"event: {name}\n"
+                        + (f"id: {event_id}\n" if event_id else "")
+                        + f"data: {json.dumps(event)}\n\n"
+                    )
+            except Exception as e:
+                logger.error(f"Error streaming logs: {str(e)}", exc_info=True)
+                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+        response = Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            # Disable proxy buffering (nginx) so events are delivered as they are written
+            'X-Accel-Buffering': 'no'
+        })
+        # Runs when the server closes the response, even if the client left before the first event
+        response.call_on_close(self.log_stream_slots.release)
+        return response
+
     def download_logs(self):
         """
-        Download the entire log file
-        GET /api/logs/download - Returns log file as download
+        Download the log file
+        GET /api/logs/download - Returns the active log file as download
+
+        Query parameters:
+            since, until: Download only this time range, across rotated segments
+            segment: Download one compressed segment (name from /api/logs/segments)
         """
         try:
+            from flask import send_file
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+            segment = request.args.get('segment')
+            if segment:
+                segments = {s['segment']: s for s in log_storage.list_segments(LOG_FILE)}
+                if segment not in segments:
+                    return jsonify({
+                        'success': False,
+                        'error': 'Log segment not found'
+                    }), 404
+                return send_file(
+                    os.path.abspath(segments[segment]['path']),
+                    as_attachment=True,
+                    download_name=segment,
+                    mimetype='application/gzip'
+                )
+
+            since = request.args.get('since')
+            until = request.args.get('until')
+            if since or until:
+                try:
+                    log_filter = log_reader.LogFilter(since=since, until=until)
+                except ValueError as e:
+                    return jsonify({
+                        'success': False,
+                        'error': str(e)
+                    }), 400
+                return Response(
+                    log_storage.iter_window(LOG_FILE, log_filter),
+                    mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename=app_logs_{stamp}.log'}
+                )
+
             if not os.path.exists(LOG_FILE):
                 return jsonify({
                     'success': False,
                     'error': 'Log file does not exist'
                 }), 404
             
-            from flask import send_file
+            # send_file resolves relative paths against the app root, not the working directory
             return send_file(
-                LOG_FILE,
+                os.path.abspath(LOG_FILE),
                 as_attachment=True,
-                download_name=f"app_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log",
+                download_name=f"app_logs_{stamp}.log",
                 mimetype='text/plain'
             )
             
@@ -940,6 +1375,27 @@ class UtopiaAPIHandler:
                 'error': f'Failed to download logs: {str(e)}'
             }), 500
 
+    def list_log_segments(self):
+        """
+        List rotated, compressed log segments
+        GET /api/logs/segments - Returns JSON with each segment's name, time range and sizes
+        """
+        try:
+            segments = [
+                {key: value for key, value in segment.items() if key not in ('blocks', 'path')}
+                for segment in log_storage.list_segments(LOG_FILE)
+            ]
+            return jsonify({
+                'success': True,
+                'segments': segments
+            }), 200
+        except Exception as e:
+            logger.error(f"Error listing log segments: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Failed to list log segments: {str(e)}'
+            }), 500
+
     # ============================================================================
     # MAIN CALLBACK FUNCTION
     # ============================================================================
@@ -947,6 +1403,7 @@ class UtopiaAPIHandler:
         """
         Handle incoming API callbacks from Utopia
         POST /api-callback - Expects JSON with event, orderref, and msg fields
+        The order is queued and processed in the background; returns 202 with a job ID
         """
         # Check if request has JSON data
         if not request.is_json:
@@ -954,27 +1411,38 @@ class UtopiaAPIHandler:
             return jsonify({"error": "Invalid or missing JSON payload"}), 400
 
         request_data = request.get_json()
-        logger.info(f"Received API callback: {pretty_log_json(request_data)}")
+        logger.info("Received API callback", extra={'data': request_data, 'orderref': request_data.get('orderref')})
 
-        try:
-            # Safely extract fields with .get()
-            event = request_data.get('event')
-            orderref = request_data.get('orderref')
-            msg = request_data.get('msg')
-            
-            # logger.info(f"Processing webhook - event: {event}, orderref: {orderref}, msg: {msg}")
-            
-            self.handle_information_from_post(event, orderref, msg)
+        # Safely extract fields with .get()
+        event = request_data.get('event')
+        orderref = request_data.get('orderref')
+        msg = request_data.get('msg')
 
-            response = {"data": "Information received"}
-        except KeyError as e:
-            logger.error(f"Missing key in JSON payload: {str(e)}")
-            response = {"error": f"Missing required field: {str(e)}"}
-            return jsonify(response), 400
+        # Redelivered events: acknowledge without queueing the order again
+        if orderref:
+            try:
+                delivery = self.webhook_deliveries.begin(event, orderref)
+            except Exception as e:
+                logger.error(f"Webhook idempotency check failed, processing anyway: {str(e)}", exc_info=True)
+                delivery = {"duplicate": False}
+            if delivery["duplicate"]:
+                response = {
+                    "data": "Duplicate delivery, already " + delivery["status"],
+                    "job_id": delivery["job_id"],
+                    "status_url": url_for('get_job_api', job_id=delivery["job_id"]) if delivery["job_id"] else None
+                }
+                return jsonify(response), 200
+
+        try:
+            job_id = self.order_queue.enqueue(event, orderref, msg, payload=request_data)
+            if orderref:
+                self.webhook_deliveries.attach_job(event, orderref, job_id)
         except Exception as e:
-            error = f"Error processing API callback: {str(e)}"
+            error = f"Error queueing API callback: {str(e)}"
             logger.error(error, exc_info=True)
-    
+            if orderref:
+                self._finish_delivery(event, orderref, False, error)
+
             self.failure_tracker.record_failure(
                 orderref=orderref,
                 error_message=error,
@@ -982,102 +1450,679 @@ class UtopiaAPIHandler:
             )
 
             response = {"error": "Error processing API callback"}
-            return jsonify(response), 400
+            return jsonify(response), 500
 
-        return jsonify(response), 200
+        response = {
+            "data": "Information received",
+            "job_id": job_id,
+            "status_url": url_for('get_job_api', job_id=job_id)
+        }
+        return jsonify(response), 202
 
-    def handle_information_from_post(self, event, orderref, msg):
+    def process_order_job(self, job):
         """
-        Route different message types to appropriate handlers
+        Process one queued webhook job (runs on an order queue worker thread)
+        Raises on error so the job is marked failed
         """
-        if msg == "Project New Order":
-            self.handle_new_order(orderref)
-        elif msg == "Test":
-            self.send_email(
-                f"Test Received",
-                f'Test webhook received for orderref: {orderref}\nEvent: {event}'
-            )
-        else:
-            logger.warning(f"Ignoring unhandled event: {msg} for orderref: {orderref}")
+        orderref = job.get('orderref')
+        with self.app.app_context():
+            try:
+                with metrics.span("order") as span:
+                    outcome = self.handle_information_from_post(job.get('event'), orderref, job.get('msg'))
+                    if outcome in ("utopia_error", "creation_failed"):
+                        span.fail()
+                metrics.inc(metrics.ORDERS, outcome=outcome)
+            except Exception as e:
+                metrics.inc(metrics.ORDERS, outcome="error")
+                error = f"Error processing API callback: {str(e)}"
+                logger.error(error, exc_info=True)
+
+                self.failure_tracker.record_failure(
+                    orderref=orderref,
+                    error_message=error,
+                    failure_type=self.failure_type_for(e)
+                )
+                if orderref:
+                    self._finish_delivery(job.get('event'), orderref, False, error)
+                raise
+
+            # A redelivery of an order that failed is processed again; anything else short-circuits
+            if orderref:
+                self._finish_delivery(
+                    job.get('event'), orderref, outcome not in ("utopia_error", "creation_failed"), outcome
+                )
 
-    def handle_new_order(self, orderref):
+    @contextmanager
+    def stage(self, name):
         """
-        Process a new order from Utopia:
-        1. Fetch customer data from Utopia
-        2. Search for existing customer in PowerCode
-        3. Create new customer or send notification if exists
+        Mark the current order job's stage and time it for the stage latency metrics.
+        Yields a metrics Span; call fail() on it when the stage failed without raising.
         """
-        logger.info(f"Processing new order from webhook - orderref: {orderref}")
-        
-        customer_from_utopia, error_msg = self.fetch_customer_data_from_utopia(orderref)
+        self.order_queue.set_stage(name)
+        with metrics.span(name) as span:
+            yield span
 
-        logger.info(pretty_log_json(customer_from_utopia, "Response from Utopia"))
+    @staticmethod
+    def failure_type_for(error):
+        """
+        Failure type for an order that raised: upstream_unavailable when a circuit breaker or
+        rate limit refused the call (retried automatically once the upstream recovers)
+        """
+        if isinstance(error, (resilience.CircuitOpenError, resilience.UpstreamThrottledError)):
+            return "upstream_unavailable"
+        return "powercode_api_error"
 
-        if error_msg:
-            logger.error(error_msg)
-            return
+    def _finish_delivery(self, event, orderref, success, outcome):
+        """Record a webhook delivery's result in the idempotency store (errors are only logged)"""
+        try:
+            self.webhook_deliveries.finish(event, orderref, success, outcome)
+        except Exception as e:
+            logger.error(f"Could not update webhook delivery for order {orderref}: {str(e)}", exc_info=True)
 
-        customer_to_powercode = self.customer_to_pc(customer_from_utopia, orderref)
+    def process_backfill_order(self, orderref):
+        """
+        Create the customer for one order found missing by the backfill (runs on a backfill thread)
+        Returns the handle_new_order outcome; errors are recorded in the failure tracker and re-raised
+        """
+        with self.app.app_context():
+            try:
+                return self.handle_new_order(orderref)
+            except Exception as e:
+                error = f"Error processing backfilled order: {str(e)}"
+                logger.error(error, exc_info=True)
 
-        firstname = customer_from_utopia.get("customer", {}).get("firstname", "")
-        lastname = customer_from_utopia.get("customer", {}).get("lastname", "")
-        utopia_city = customer_from_utopia.get("address", {}).get("city", "")
-        utopia_address = customer_from_utopia.get("address", {}).get("address", "")
-        
-        logger.info("Checking for existing customer in PowerCode...")
-        
-        exists, matching_customer = self.check_customer_exists(firstname, lastname, utopia_city, utopia_address)
+                self.failure_tracker.record_failure(
+                    orderref=orderref,
+                    error_message=error,
+                    failure_type=self.failure_type_for(e)
+                )
+                raise
+
+    def retry_failure(self, failure):
+        """
+        Retry one tracked failure (runs on a failure retry thread)
+        Creation failures with stored customer data re-run process_customer_creation after a
+        duplicate check; other failures re-run the whole new-order flow from Utopia.
+        Per-order error emails are not sent for retries; notify_retries_exhausted reports
+        the order once when its last retry has failed.
+        Returns (resolved, note); a retry that fails again records the failure (retry_count + 1)
+        """
+        orderref = failure['orderref']
+        customer_data = dict(failure.get('customer_data') or {})
+
+        with self.app.app_context():
+            if failure.get('failure_type') == 'powercode_creation_failed' and customer_data.get('firstname'):
+                service_plan = customer_data.pop('service_plan', '250 Mbps')
+                exists, matching_customer = self.check_customer_exists(
+                    customer_data.get('firstname', ''), customer_data.get('lastname', ''),
+                    customer_data.get('city', ''), customer_data.get('address', ''), customer_data.get('siteid', '')
+                )
+                if exists:
+                    return True, f"Customer already exists in PowerCode (ID: {matching_customer.get('CustomerID')})"
 
-        if exists:
-            pc_customer_id = matching_customer.get('CustomerID')
-            logger.info(f"Customer already exists in PowerCode - Customer ID: {pc_customer_id}")
-            formatted_customer_info = self.format_contact_info(customer_to_powercode)
-            self.send_email(
-                f"Duplicate Customer Detected - Order {orderref}",
-                f'Customer already exists in PowerCode with ID: {pc_customer_id}\n\n'
-                f'PowerCode URL: {PC_URL}:444/index.php?q&page=/customers/_view.php&customerid={pc_customer_id}\n\n'
-                f'{formatted_customer_info}',
-                orderref,
-            )
-        else:
-            self.handle_webhook_customer_creation(customer_from_utopia, orderref)
+                success, customer_id, error_message, ticket_id = self.process_customer_creation(
+                    customer_data, orderref, service_plan
+                )
+                if success:
+                    return True, f"Created by automatic retry (PowerCode ID: {customer_id})"
+                self.failure_tracker.record_failure(
+                    orderref=orderref,
+                    error_message=error_message,
+                    failure_type="powercode_creation_failed",
+                    customer_data=dict(customer_data, service_plan=service_plan)
+                )
+                return False, error_message
 
-    def fetch_customer_data_from_utopia(self, orderref):
+            outcome = self.handle_new_order(orderref, notify=False)
+            if outcome in ("created", "duplicate"):
+                return True, f"Automatic retry: customer {outcome}"
+            return False, f"Automatic retry outcome: {outcome}"
+
+    def notify_retries_exhausted(self, failure):
         """
-        Fetch customer data from Utopia API and handle errors.
-        Returns (customer_data, error_message)
+        Email that automatic retries of an order are used up (runs on a failure retry thread)
         """
-        customer_data = Utopia.getCustomerFromUtopia(orderref)
-        if isinstance(customer_data, dict) and "error" in customer_data:
-            utopia_error_msg = customer_data.get("error", "Unknown error")
-            error_msg = f"Utopia API error for order {orderref}: {utopia_error_msg}"
-            self.failure_tracker.record_failure(
-                orderref=orderref,
-                error_message=f"Utopia API error: {utopia_error_msg}",
-                failure_type="utopia_api_error"
+        orderref = failure['orderref']
+        with self.app.app_context():
+            self.send_email(
+                f"Automatic retries exhausted - Order {orderref}",
+                f"Order Reference: {orderref}\n"
+                f"Failure Type: {failure.get('failure_type')}\n"
+                f"Retries: {failure.get('retry_count', 0)}\n"
+                f"First Failure: {failure.get('first_failure')}\n"
+                f"Last Error: {failure.get('error_message')}\n\n"
+                f"The order is no longer retried automatically. Retry it from the failures page "
+                f"once the cause is fixed.\n",
+                orderref
             )
-            if "No valid records found for this ISP" not in utopia_error_msg:
-                self.send_email(
-                    f"Utopia API Error - Order {orderref}",
-                    f"Failed to fetch customer data from Utopia API\n\n"
-                    f"Order Reference: {orderref}\n"
-                    f"Error Message: {utopia_error_msg}\n\n",
-                    orderref
-                )
-            else:
-                logger.info(f"Skipping email notification for 'No valid records' error - orderref: {orderref}")
-            return None, error_msg
-        return customer_data, None
-
-    
 
-    def handle_webhook_customer_creation(self, customer_from_utopia, orderref):
+    def list_backfill_runs_api(self):
         """
-        Handle customer creation from webhook (Utopia API data)
-        Transforms Utopia data and processes customer creation workflow
+        API endpoint to list recent backfill runs
+        GET /api/backfill/runs - Returns run status, counts and throughput metrics (limit, default 20)
         """
-        # Transform Utopia data to PowerCode format
-        customer_to_powercode = self.customer_to_pc(customer_from_utopia, orderref)
+        try:
+            limit = min(int(request.args.get('limit', 20)), 200)
+            return jsonify({
+                'success': True,
+                'runs': self.order_backfill.list_runs(limit=limit)
+            }), 200
+
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'limit must be an integer'
+            }), 400
+        except Exception as e:
+            logger.error(f"Error in list_backfill_runs_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def get_backfill_run_api(self, run_id):
+        """
+        API endpoint to get one backfill run with its per-order report
+        GET /api/backfill/runs/<run_id>
+        """
+        try:
+            run = self.order_backfill.get_run(run_id)
+            if run is None:
+                return jsonify({
+                    'success': False,
+                    'error': f'Backfill run not found: {run_id}'
+                }), 404
+            return jsonify({
+                'success': True,
+                'run': run
+            }), 200
+
+        except Exception as e:
+            logger.error(f"Error in get_backfill_run_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def start_backfill_api(self):
+        """
+        API endpoint to start a backfill run in the background
+        POST /api/backfill/run - Optional JSON: dry_run (default true), statuses, project_statuses, days
+        Returns 202 with the run ID, or 409 if a run is already in progress
+        """
+        try:
+            data = request.get_json(silent=True) or {}
+            dry_run = data.get('dry_run', True) is not False
+            options = {key: data[key] for key in ('statuses', 'project_statuses', 'days') if data.get(key) is not None}
+            if 'days' in options:
+                options['days'] = int(options['days'])
+
+            logger.info(f"Backfill run requested (dry_run={dry_run}) by user: {session.get('username')}")
+            run_id = self.order_backfill.start_run(self.process_backfill_order, dry_run=dry_run, **options)
+            if run_id is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'A backfill run is already in progress'
+                }), 409
+            return jsonify({
+                'success': True,
+                'run_id': run_id,
+                'status_url': url_for('get_backfill_run_api', run_id=run_id)
+            }), 202
+
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'days must be an integer'
+            }), 400
+        except Exception as e:
+            logger.error(f"Error in start_backfill_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def list_jobs_api(self):
+        """
+        API endpoint to list queued webhook jobs
+        GET /api/jobs?orderref=...&status=...&limit=50 - Returns recent jobs and per-status counts
+        """
+        try:
+            orderref = request.args.get('orderref', '').strip() or None
+            status = request.args.get('status', '').strip() or None
+            limit = min(int(request.args.get('limit', 50)), 500)
+
+            jobs = self.order_queue.list_jobs(orderref=orderref, status=status, limit=limit)
+
+            return jsonify({
+                'success': True,
+                'jobs': jobs,
+                'queue': self.order_queue.get_queue_stats(),
+                'total': len(jobs)
+            }), 200
+
+        except Exception as e:
+            logger.error(f"Error in list_jobs_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def get_job_api(self, job_id):
+        """
+        API endpoint to get the status of a queued webhook job
+        GET /api/jobs/<job_id> - Returns job status, stage and error (if any)
+        """
+        try:
+            job = self.order_queue.get_job(job_id)
+
+            if not job:
+                return jsonify({
+                    'success': False,
+                    'error': f'Job {job_id} not found'
+                }), 404
+
+            return jsonify({
+                'success': True,
+                'job': job
+            }), 200
+
+        except Exception as e:
+            logger.error(f"Error in get_job_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def list_webhook_deliveries_api(self):
+        """
+        API endpoint to list recorded webhook deliveries
+        GET /api/webhook/deliveries - Optional filters: orderref, duplicates=true, limit (default 50)
+        Returns each (event, orderref) with its status, job ID and how many times it was delivered
+        """
+        try:
+            limit = min(int(request.args.get('limit', 50)), 500)
+            return jsonify({
+                'success': True,
+                'deliveries': self.webhook_deliveries.list_deliveries(
+                    orderref=request.args.get('orderref') or None,
+                    duplicates_only=request.args.get('duplicates', '').lower() == 'true',
+                    limit=limit
+                )
+            }), 200
+
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'limit must be an integer'
+            }), 400
+        except Exception as e:
+            logger.error(f"Error in list_webhook_deliveries_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def get_http_stats_api(self):
+        """
+        API endpoint to get upstream connection pool stats for the worker serving the request
+        GET /api/http/stats - Returns requests sent, connections opened and reuse ratio per upstream
+        """
+        try:
+            return jsonify({
+                'success': True,
+                'stats': http_client.get_pool_stats()
+            }), 200
+
+        except Exception as e:
+            logger.error(f"Error in get_http_stats_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def admin_upstreams(self):
+        """
+        Renders the upstream status page
+        GET /admin/upstreams - Returns the HTML template showing circuit breakers and rate limits
+        """
+        return render_template('upstreams.html', session=session)
+
+    def get_upstreams_api(self):
+        """
+        API endpoint to get circuit breaker state and call counters for Utopia and PowerCode
+        GET /api/upstreams - Returns each upstream's breaker state plus per-endpoint requests,
+        errors, retries, rejected calls and rate limit waits (shared by all workers)
+        """
+        try:
+            guard = resilience.get_guard()
+            if guard is None:
+                return jsonify({'success': True, 'enabled': False, 'upstreams': []}), 200
+
+            return jsonify({
+                'success': True,
+                'enabled': True,
+                **guard.get_status()
+            }), 200
+
+        except Exception as e:
+            logger.error(f"Error in get_upstreams_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def reset_upstream_api(self, upstream):
+        """
+        API endpoint to close an upstream's circuit breaker by hand
+        POST /api/upstreams/<upstream>/reset
+        """
+        try:
+            guard = resilience.get_guard()
+            if guard is None:
+                return jsonify({'success': False, 'error': 'Upstream resilience is disabled'}), 400
+
+            if not guard.reset(upstream):
+                return jsonify({'success': False, 'error': f'No circuit recorded for {upstream}'}), 404
+
+            return jsonify({'success': True, 'message': f'Circuit for {upstream} reset'}), 200
+
+        except Exception as e:
+            logger.error(f"Error in reset_upstream_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def metrics_endpoint(self):
+        """
+        Prometheus scrape endpoint with stage/upstream latency histograms and counters of all workers
+        GET /metrics - Requires a login session or "Authorization: Bearer <METRICS_TOKEN>"
+        """
+        authorized = 'logged_in' in session or (
+            METRICS_TOKEN and request.headers.get('Authorization', '') == f'Bearer {METRICS_TOKEN}'
+        )
+        if not authorized:
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+
+        store = metrics.get_metrics()
+        if store is None:
+            return Response('# Metrics are disabled (METRICS_ENABLED=false)\n', mimetype='text/plain')
+        try:
+            # Include this worker's latest observations; other workers flush every METRICS_FLUSH_INTERVAL
+            store.flush()
+            return Response(store.render_prometheus(), mimetype='text/plain; version=0.0.4')
+        except Exception as e:
+            logger.error(f"Error in metrics_endpoint: {str(e)}", exc_info=True)
+            return Response(f'# Server error: {str(e)}\n', status=500, mimetype='text/plain')
+
+    def admin_metrics(self):
+        """
+        Renders the latency dashboard
+        GET /admin/metrics - Returns the HTML template with p50/p95/p99 per stage and upstream endpoint
+        """
+        return render_template('metrics.html', session=session)
+
+    def get_metrics_summary_api(self):
+        """
+        API endpoint to get latency percentiles and error rates
+        GET /api/metrics/summary - Returns count, avg, p50, p95, p99 and error rate per stage and
+        per upstream endpoint, plus order outcome counters (aggregated across workers)
+        """
+        try:
+            store = metrics.get_metrics()
+            if store is None:
+                return jsonify({'success': True, 'enabled': False, 'stages': [], 'upstreams': [], 'counters': {}}), 200
+
+            store.flush()
+            return jsonify({
+                'success': True,
+                'enabled': True,
+                'flush_interval': store.flush_interval,
+                **store.get_summary()
+            }), 200
+
+        except Exception as e:
+            logger.error(f"Error in get_metrics_summary_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def reset_metrics_api(self):
+        """
+        API endpoint to clear the aggregated metrics
+        POST /api/metrics/reset
+        """
+        try:
+            store = metrics.get_metrics()
+            if store is None:
+                return jsonify({'success': False, 'error': 'Metrics are disabled'}), 400
+
+            store.reset()
+            return jsonify({'success': True, 'message': 'Metrics reset'}), 200
+
+        except Exception as e:
+            logger.error(f"Error in reset_metrics_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def get_customer_index_api(self):
+        """
+        API endpoint to get the local PowerCode customer index status
+        GET /api/customer-index - Returns indexed customer counts and the last bulk refresh
+        """
+        try:
+            return jsonify({
+                'success': True,
+                'stats': self.customer_index.get_stats()
+            }), 200
+
+        except Exception as e:
+            logger.error(f"Error in get_customer_index_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def refresh_customer_index_api(self):
+        """
+        API endpoint to refresh the PowerCode customer index now
+        POST /api/customer-index/refresh - Returns 409 if another worker is already refreshing
+        """
+        try:
+            logger.info(f"Customer index refresh requested by user: {session.get('username')}")
+            result = self.customer_index.refresh_if_due(PowerCode.list_powercode_customers, force=True)
+            if result is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'A refresh is already running'
+                }), 409
+            return jsonify({
+                'success': True,
+                'result': result
+            }), 200
+
+        except Exception as e:
+            logger.error(f"Error in refresh_customer_index_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def get_utopia_cache_api(self):
+        """
+        API endpoint to get Utopia contract lookup cache stats
+        GET /api/utopia/cache - Returns entries and hit/miss counters shared by all workers
+        """
+        try:
+            return jsonify({
+                'success': True,
+                'stats': Utopia.getCustomerCacheStats()
+            }), 200
+
+        except Exception as e:
+            logger.error(f"Error in get_utopia_cache_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def invalidate_utopia_cache_api(self):
+        """
+        API endpoint to drop cached Utopia contract lookups
+        POST /api/utopia/cache/invalidate - Optional JSON 'orderref'; without it the whole cache is cleared
+        """
+        try:
+            data = request.get_json(silent=True) or {}
+            orderref = (data.get('orderref') or '').strip() or None
+            removed = Utopia.invalidateCustomerCache(orderref)
+            logger.info(f"Utopia cache invalidated ({orderref or 'all'}) by user: {session.get('username')}")
+            return jsonify({
+                'success': True,
+                'removed': removed
+            }), 200
+
+        except Exception as e:
+            logger.error(f"Error in invalidate_utopia_cache_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def handle_information_from_post(self, event, orderref, msg):
+        """
+        Route different message types to appropriate handlers
+        Returns the handler's outcome (see handle_new_order), "test" or "ignored"
+        """
+        if msg == "Project New Order":
+            return self.handle_new_order(orderref)
+        elif msg == "Test":
+            self.send_email(
+                f"Test Received",
+                f'Test webhook received for orderref: {orderref}\nEvent: {event}'
+            )
+            return "test"
+        else:
+            logger.warning(f"Ignoring unhandled event: {msg} for orderref: {orderref}")
+            return "ignored"
+
+    def handle_new_order(self, orderref, notify=True):
+        """
+        Process a new order from Utopia:
+        1. Fetch customer data from Utopia
+        2. Search for existing customer in PowerCode
+        3. Create new customer or send notification if exists
+        notify=False skips the per-order error emails (automatic retries)
+        Returns the outcome: "created", "duplicate", "utopia_error" or "creation_failed"
+        """
+        logger.info(f"Processing new order from webhook - orderref: {orderref}")
+        
+        with self.stage("utopia_lookup") as span:
+            customer_from_utopia, error_msg = self.fetch_customer_data_from_utopia(orderref, notify)
+            if error_msg:
+                span.fail()
+
+        logger.info("Response from Utopia", extra={'data': customer_from_utopia})
+
+        if error_msg:
+            logger.error(error_msg)
+            return "utopia_error"
+
+        customer_to_powercode = self.customer_to_pc(customer_from_utopia, orderref)
+
+        firstname = customer_from_utopia.get("customer", {}).get("firstname", "")
+        lastname = customer_from_utopia.get("customer", {}).get("lastname", "")
+        utopia_city = customer_from_utopia.get("address", {}).get("city", "")
+        utopia_address = customer_from_utopia.get("address", {}).get("address", "")
+        utopia_siteid = customer_from_utopia.get("address", {}).get("siteid", "")
+        
+        logger.info("Checking for existing customer in PowerCode...")
+        
+        with self.stage("duplicate_check"):
+            exists, matching_customer = self.check_customer_exists(
+                firstname, lastname, utopia_city, utopia_address, utopia_siteid
+            )
+            if not exists and self.order_queue.is_rerun():
+                # An earlier run of this job may have created the customer before its worker died
+                matching_customer = self.find_customer_by_siteid(utopia_siteid, f"{firstname} {lastname}".strip())
+                exists = matching_customer is not None
+
+        if exists:
+            pc_customer_id = matching_customer.get('CustomerID')
+            logger.info(f"Customer already exists in PowerCode - Customer ID: {pc_customer_id}")
+            with self.stage("duplicate_notification"):
+                formatted_customer_info = self.format_contact_info(customer_to_powercode)
+                self.send_email(
+                    f"Duplicate Customer Detected - Order {orderref}",
+                    f'Customer already exists in PowerCode with ID: {pc_customer_id}\n\n'
+                    f'PowerCode URL: {PC_URL}:444/index.php?q&page=/customers/_view.php&customerid={pc_customer_id}\n\n'
+                    f'{formatted_customer_info}',
+                    orderref,
+                    digest_key="duplicate_customer",
+                    digest_subject="Duplicate Customers Detected"
+                )
+            return "duplicate"
+        if self.handle_webhook_customer_creation(customer_from_utopia, orderref, notify):
+            return "created"
+        return "creation_failed"
+
+    def fetch_customer_data_from_utopia(self, orderref, notify=True):
+        """
+        Fetch customer data from Utopia API and handle errors.
+        notify=False records the failure without emailing it
+        Returns (customer_data, error_message)
+        """
+        customer_data = Utopia.getCustomerFromUtopiaCached(orderref)
+        if isinstance(customer_data, dict) and "error" in customer_data:
+            utopia_error_msg = customer_data.get("error", "Unknown error")
+            error_msg = f"Utopia API error for order {orderref}: {utopia_error_msg}"
+            # "No valid records" means the order belongs to another ISP: permanent, so it is
+            # recorded under its own type, which is not retried automatically
+            no_records = "No valid records found for this ISP" in utopia_error_msg
+            self.failure_tracker.record_failure(
+                orderref=orderref,
+                error_message=f"Utopia API error: {utopia_error_msg}",
+                failure_type="utopia_no_records" if no_records else "utopia_api_error"
+            )
+            if not notify:
+                logger.info(f"Skipping email notification for Utopia error during retry - orderref: {orderref}")
+            elif not no_records:
+                self.send_email(
+                    f"Utopia API Error - Order {orderref}",
+                    f"Failed to fetch customer data from Utopia API\n\n"
+                    f"Order Reference: {orderref}\n"
+                    f"Error Message: {utopia_error_msg}\n\n",
+                    orderref
+                )
+            elif EMAIL_OUTBOX_ENABLED and EMAIL_DIGEST_WINDOW > 0:
+                # Frequent and usually harmless: report them as one periodic digest rather than one email each
+                self.send_email(
+                    f"No valid Utopia records - Order {orderref}",
+                    f"Order Reference: {orderref}\n"
+                    f"Error Message: {utopia_error_msg}\n",
+                    orderref,
+                    digest_key="utopia_no_records",
+                    digest_subject="Utopia orders with no valid records"
+                )
+            else:
+                logger.info(f"Skipping email notification for 'No valid records' error - orderref: {orderref}")
+            return None, error_msg
+        return customer_data, None
+
+    
+
+    def handle_webhook_customer_creation(self, customer_from_utopia, orderref, notify=True):
+        """
+        Handle customer creation from webhook (Utopia API data)
+        Transforms Utopia data and processes customer creation workflow
+        notify=False records a failed creation without emailing it
+        Returns True if the customer was created
+        """
+        # Transform Utopia data to PowerCode format
+        customer_to_powercode = self.customer_to_pc(customer_from_utopia, orderref)
         formatted_customer_to_powercode = self.format_contact_info(customer_to_powercode)
         
         logger.info(f"Creating customer in PowerCode with data:\n{formatted_customer_to_powercode}")
@@ -1104,109 +2149,198 @@ class UtopiaAPIHandler:
                     orderref,
                 )
             else:
-                # Creation failed - record in failure tracker
+                # Creation failed - record in failure tracker (with the plan, so it can be retried as is)
                 self.failure_tracker.record_failure(
                     orderref=orderref,
                     error_message=error_message,
                     failure_type="powercode_creation_failed",
-                    customer_data=customer_to_powercode
-                )
-                
-                self.send_email(
-                    f"Failed to create customer in PowerCode - Order {orderref}",
-                    f'Error: {error_message}\n\nCheck PowerCode logs for details.\n\n{formatted_customer_to_powercode}',
-                    orderref
+                    customer_data=dict(customer_to_powercode, service_plan=utopia_customers_service_plan)
                 )
+
+                if notify:
+                    self.send_email(
+                        f"Failed to create customer in PowerCode - Order {orderref}",
+                        f'Error: {error_message}\n\nCheck PowerCode logs for details.\n\n{formatted_customer_to_powercode}',
+                        orderref
+                    )
         else:
             # Success is already logged and email sent by process_customer_creation
             logger.info(f"Webhook customer creation completed successfully for orderref: {orderref}")
+        return success
 
 
     def process_customer_creation(self, customer_data, orderref, service_plan):
         """
         Core customer creation workflow
-        Handles:  create account → add plans → create ticket > add tags → send email
+        Handles:  create account → (add plans | create ticket | add tags in parallel) → send email
         Returns: (success, customer_id, error_message, ticket_id, )
         """
         try:
             # Create customer in PowerCode
             logger.info(f"Creating PowerCode account for orderref={orderref}")
-            customer_id, pc_response_text = PowerCode.create_powercode_account(customer_data)
-            
+            with self.stage("powercode_create") as span:
+                customer_id, pc_response_text = PowerCode.create_powercode_account(customer_data)
+                if customer_id == -1:
+                    span.fail()
+
             if customer_id == -1:
                 error_msg = f'Failed to create customer in PowerCode. Check server logs for details. PC response {pc_response_text}'
                 logger.error(f"PowerCode returned -1 for customer creation with response: {pc_response_text}. Orderref: {orderref}")
                 return False, -1, error_msg, None
-            
-            # Add service plans
-            plans_success, plan_responses = self.add_service_plans(customer_id, service_plan)
-            if not plans_success:
-                logger.warning(f"Some service plans failed to add for customer {customer_id}")
-
-            # Create PowerCode Ticket
-            ticket_description = self.get_ticket_description(customer_data)
-            ticket_id = PowerCode.create_powercode_ticket(
-                customer_id, 
-                description=ticket_description 
-            ) 
-
-            # ticket_id = PowerCode.create_powercode_ticket(customer_id, customer_data.get("firstname", ""))
-            logger.info(f'Support ticket created: {ticket_id} for customer {customer_id}')
-
-            # Add Customer Tags
-            tags_success, tags_added = self.add_customer_tags(customer_id, config.PC_CUST_TAGS)
-            if tags_success:
-                logger.info(f"Added tags to customer {customer_id}: {tags_added}")
-            else:
-                logger.warning(f"Failed to add tags {config.PC_CUST_TAGS} for customer {customer_id}")
-            
-            
+
+            try:
+                self.customer_index.add_created(customer_id, customer_data)
+            except Exception as e:
+                logger.warning(f"Could not add customer {customer_id} to customer index: {str(e)}")
+            
+            # Post-creation steps only depend on customer_id, so run them in parallel
+            with self.stage("post_creation_steps"):
+                # Every plan and tag is its own step, so PC_STEP_WORKERS bounds all of the calls
+                steps = StepExecutor(max_workers=PC_STEP_WORKERS, name=f"order-{orderref}")
+                plans = self.add_service_plan_steps(steps, customer_id, service_plan)
+                steps.add_step("ticket", self.create_customer_ticket, customer_id, customer_data)
+                tags = self.add_tag_steps(steps, customer_id, config.PC_CUST_TAGS)
+                call_results = steps.run()
+                step_results = {
+                    "service_plans": self.collect_service_plans(customer_id, plans, call_results),
+                    "ticket": call_results["ticket"],
+                    "tags": self.collect_tags(customer_id, tags, call_results),
+                }
+            for name, step_result in step_results.items():
+                if not step_result["skipped"]:
+                    metrics.observe_stage(f"post_creation.{name}", step_result["duration"], not step_result["success"])
+
+            step_errors = self.collect_step_errors(step_results)
+            ticket_id = step_results["ticket"]["result"]
+
+            if step_results["tags"]["success"] and step_results["tags"]["result"][0]:
+                logger.info(f"Added tags to customer {customer_id}: {step_results['tags']['result'][1]}")
+
+            # Customer exists in PowerCode at this point, so step failures are tracked
+            # separately instead of failing the whole creation
+            if step_errors:
+                logger.warning(f"Post-creation steps failed for customer {customer_id}: {step_errors}")
+                self.failure_tracker.record_failure(
+                    orderref=orderref,
+                    error_message=f"Customer {customer_id} created but post-creation steps failed: "
+                                  + "; ".join(f"{name}: {error}" for name, error in step_errors.items()),
+                    failure_type="powercode_post_creation_failed",
+                    customer_data=dict(customer_data, customer_id=customer_id)
+                )
+
             # Send Success Email
-            customer_full_name = f"{customer_data.get('firstname', '')} {customer_data.get('lastname', '')}".strip()
-            formatted_customer_info = self.format_contact_info(customer_data)
-            self.send_email(
-                f"Customer Created Successfully - {customer_full_name} (PC#{customer_id})",
-                f'Customer created in PowerCode!\n\n'
-                f'PowerCode ID: {customer_id}\n'
-                f'PowerCode URL: {PC_URL}:444/index.php?q&page=/customers/_view.php&customerid={customer_id}\n'
-                f'Support Ticket: {ticket_id}\n'
-                f'Service Plan: {service_plan}\n\n'
-                f'{formatted_customer_info}',
-                orderref
-            )
+            with self.stage("success_email"):
+                customer_full_name = f"{customer_data.get('firstname', '')} {customer_data.get('lastname', '')}".strip()
+                formatted_customer_info = self.format_contact_info(customer_data)
+                step_summary = "\n".join(
+                    f"  {name}: {'OK' if name not in step_errors else 'FAILED - ' + step_errors[name]}"
+                    for name in step_results
+                )
+                self.send_email(
+                    f"Customer Created Successfully - {customer_full_name} (PC#{customer_id})",
+                    f'Customer created in PowerCode!\n\n'
+                    f'PowerCode ID: {customer_id}\n'
+                    f'PowerCode URL: {PC_URL}:444/index.php?q&page=/customers/_view.php&customerid={customer_id}\n'
+                    f'Support Ticket: {ticket_id}\n'
+                    f'Service Plan: {service_plan}\n\n'
+                    f'Post-creation steps:\n{step_summary}\n\n'
+                    f'{formatted_customer_info}',
+                    orderref
+                )
             
             logger.info(f"Customer created successfully - PowerCode ID: {customer_id}, Utopia Site ID: {customer_data.get('siteid', 'N/A')}")
             return True, customer_id, None, ticket_id
-            
+
+        except (resilience.CircuitOpenError, resilience.UpstreamThrottledError):
+            # Recorded by the caller as upstream_unavailable (failure_type_for) and retried
+            # once PowerCode recovers
+            raise
         except Exception as e:
             error_msg = f'Error creating customer: {str(e)}'
             logger.error(f"Error in process_customer_creation: {str(e)}", exc_info=True)
             return False, -1, error_msg, None
 
 
-    def check_customer_exists(self, firstname, lastname, city, utopia_address=None):
+    def create_customer_ticket(self, customer_id, customer_data):
+        """
+        Create the new-customer support ticket in PowerCode
+        Returns: ticket_id (raises if PowerCode doesn't return one)
+        """
+        ticket_description = self.get_ticket_description(customer_data)
+        ticket_id = PowerCode.create_powercode_ticket(
+            customer_id, 
+            description=ticket_description 
+        ) 
+
+        if ticket_id is None:
+            raise RuntimeError(f"PowerCode did not return a ticket ID for customer {customer_id}")
+
+        logger.info(f'Support ticket created: {ticket_id} for customer {customer_id}')
+        return ticket_id
+
+    def collect_step_errors(self, step_results):
+        """
+        Turn post-creation step results into an error message per failed step
+        Steps returning (success, data) tuples count as failed when success is False
+        Returns: {step_name: error_message}
+        """
+        step_errors = {}
+        for name, step in step_results.items():
+            if not step["success"]:
+                step_errors[name] = step["error"]
+            elif isinstance(step["result"], tuple) and not step["result"][0]:
+                step_errors[name] = f"{name} partially failed: {step['result'][1]}"
+        return step_errors
+
+    def check_customer_exists(self, firstname, lastname, city, utopia_address=None, siteid=None):
         """
         Check if customer already exists in PowerCode
-        Compares name first, then address if names match
+        While the local customer index is fresh (a full refresh within CUSTOMER_INDEX_MAX_AGE_HOURS)
+        it answers on its own (same normalized name, plus the same siteid/extAccountID or the same
+        city and address); a stale index is not trusted either way and a live PowerCode search decides
         Returns: (exists, matching_customer_or_none)
         """
         utopia_full_name = f"{firstname} {lastname}".strip()
-        
+        name_key = normalize_text(utopia_full_name)
+
+        try:
+            if self.customer_index.is_fresh():
+                indexed = self.customer_index.find_duplicate(utopia_full_name, city, utopia_address, siteid)
+                if indexed:
+                    logger.info(
+                        f"Found existing customer in local index: {indexed.get('CompanyName')} "
+                        f"(ID: {indexed.get('CustomerID')}) with address: {indexed.get('Address1')}"
+                    )
+                    return True, indexed
+                logger.info(f"No existing customer in local index for: {utopia_full_name}")
+                return False, None
+            logger.info("Customer index is stale or was never refreshed, using live search")
+        except Exception as e:
+            logger.error(f"Customer index lookup failed, using live search: {str(e)}", exc_info=True)
+
         logger.info(f"Searching for existing customer: {utopia_full_name} in {city}")
         customers_list = PowerCode.search_powercode_customers(utopia_full_name)["customers"]
-        
+
+        # Index the customers with this name, so the next order for them is answered locally
+        try:
+            self.customer_index.add_customers(
+                [customer for customer in customers_list if normalize_text(customer.get("CompanyName", "")) == name_key]
+            )
+        except Exception as e:
+            logger.warning(f"Could not add search results to customer index: {str(e)}")
+
+        city_key = normalize_text(city)
+        utopia_addr = normalize_address(utopia_address) if utopia_address else None
+
         # Try to find a match by name and city
         for customer in customers_list:
             pc_full_name = customer.get("CompanyName", "")
-            pc_city = customer.get("City", "")
-            pc_address = customer.get("Address1", "").strip().upper()
-            
-            # First check: name and city match
-            if pc_full_name == utopia_full_name and pc_city == city:
+            pc_address = normalize_address(customer.get("Address1", ""))
+
+            # First check: name and city match (ignoring case, spacing and punctuation)
+            if normalize_text(pc_full_name) == name_key and normalize_text(customer.get("City", "")) == city_key:
                 # If we have address data, compare addresses
-                if utopia_address:
-                    utopia_addr = utopia_address.strip().upper()
-                    
+                if utopia_addr:
                     # If addresses are different, this is NOT a duplicate (different location)
                     if pc_address != utopia_addr:
                         logger.info(
@@ -1230,10 +2364,38 @@ class UtopiaAPIHandler:
         logger.info(f"No existing customer found for: {utopia_full_name}")
         return False, None
 
-    def add_service_plans(self, customer_id, primary_plan):
-        """
-        Add service plans to customer (primary + bond fee)
-        Returns: (success, responses)
+    def find_customer_by_siteid(self, siteid, full_name):
+        """
+        Look up the PowerCode customer whose extAccountID is this Utopia siteid
+        Checks the local customer index, then PowerCode readCustomer. A customer whose name
+        is known and differs (a new occupant of the premise) does not count.
+        Returns: matching customer record or None
+        """
+        if not siteid:
+            return None
+        name_key = normalize_text(full_name)
+        indexed = self.customer_index.find_by_ext_account_id(siteid)
+        if indexed and normalize_text(indexed.get('CompanyName', '')) == name_key:
+            logger.info(f"Found customer {indexed.get('CustomerID')} for siteid {siteid} in local index")
+            return indexed
+
+        data = PowerCode.get_customer_by_external_id(siteid).json()
+        if not isinstance(data, dict) or data.get('statusCode') not in (None, 0):
+            return None
+        customer_id = data.get('customerID') or data.get('CustomerID')
+        if not customer_id:
+            return None
+        pc_name = data.get('CompanyName') or data.get('companyName') or ''
+        if pc_name and normalize_text(pc_name) != name_key:
+            logger.info(f"PowerCode customer {customer_id} for siteid {siteid} is {pc_name}, not {full_name}")
+            return None
+        logger.info(f"Found PowerCode customer {customer_id} for siteid {siteid}")
+        return dict(data, CustomerID=customer_id, CompanyName=pc_name or full_name, ExtAccountID=siteid)
+
+    def add_service_plan_steps(self, steps, customer_id, primary_plan):
+        """
+        Register one step per service plan (primary + bond fee), each a single PowerCode call
+        Returns: [(step_name, service_id, label)] for collect_service_plans
         """
         # Service plan mapping
         service_plan_mapping = {
@@ -1245,41 +2407,61 @@ class UtopiaAPIHandler:
             "Bond fee": SERVICE_PLAN_BOND_FEE_ID,
         }
         
+        service_id_primary = service_plan_mapping.get(primary_plan, SERVICE_PLAN_250MBPS_ID)
+        service_id_bond = additional_service_plan_mapping.get("Bond fee")
+
+        plans = [("service_plans.primary", service_id_primary, f"Service plan '{primary_plan}'")]
+        if service_id_bond:
+            plans.append(("service_plans.bond", service_id_bond, "Bond fee service"))
+        for step_name, service_id, _ in plans:
+            steps.add_step(step_name, PowerCode.add_customer_service_plan, customer_id, service_id)
+        return plans
+
+    def collect_service_plans(self, customer_id, plans, step_results):
+        """
+        Combine the service plan steps into one post-creation result
+        Returns: step result whose result is (success, responses)
+        """
         responses = {}
-        
-        try:
-            # Add primary service plan
-            service_id_primary = service_plan_mapping.get(primary_plan, SERVICE_PLAN_250MBPS_ID)
-            service_plan_respond_primary = PowerCode.add_customer_service_plan(customer_id, service_id_primary)
-            responses['primary'] = service_plan_respond_primary
-            logger.info(f"Service plan '{primary_plan}' (ID: {service_id_primary}) added to customer {customer_id}: {service_plan_respond_primary}")
-            
-            # Add Bond fee
-            service_id_bond = additional_service_plan_mapping.get("Bond fee")
-            if service_id_bond:
-                service_plan_respond_bond = PowerCode.add_customer_service_plan(customer_id, service_id_bond)
-                responses['bond'] = service_plan_respond_bond
-                logger.info(f"Bond fee service (ID: {service_id_bond}) added to customer {customer_id}: {service_plan_respond_bond}")
-            
-            return True, responses
-            
-        except Exception as e:
-            logger.error(f"Error adding service plans to customer {customer_id}: {str(e)}", exc_info=True)
-            return False, responses
-        
-    
-    def add_customer_tags(self, customer_id, tags_id):
+        all_success = True
+        for step_name, service_id, label in plans:
+            step = step_results[step_name]
+            if step["success"]:
+                responses[step_name.split(".", 1)[1]] = step["result"]
+                logger.info(f"{label} (ID: {service_id}) added to customer {customer_id}: {step['result']}")
+            else:
+                all_success = False
+                logger.error(f"Error adding service plan {service_id} to customer {customer_id}: {step['error']}")
+        return self.combine_steps(step_results, [step_name for step_name, _, _ in plans], (all_success, responses))
+
+    def add_tag_steps(self, steps, customer_id, tags_id):
         """
-        Add tags to a customer using PowerCode UAPI, one API call per tag.
-        Returns (success: bool, tags: list)
+        Register one step per tag (PowerCode UAPI takes one call per tag)
+        Returns: [(step_name, tag)] for collect_tags
         """
         if isinstance(tags_id, str):
             tags_id = [int(tag.strip()) for tag in tags_id.split(",") if tag.strip()]
 
+        # Duplicate IDs are only added once
+        tags = [(f"tags.{tag}", tag) for tag in dict.fromkeys(tags_id or [])]
+        for step_name, tag in tags:
+            steps.add_step(step_name, PowerCode.add_customer_tag, customer_id, [tag])
+        return tags
+
+    def collect_tags(self, customer_id, tags, step_results):
+        """
+        Combine the tag steps into one post-creation result
+        Returns: step result whose result is (success, added tags)
+        """
         all_success = True
         added_tags = []
-        for tag in tags_id:
-            response = PowerCode.add_customer_tag(customer_id, [tag])
+        for step_name, tag in tags:
+            step = step_results[step_name]
+            if not step["success"]:
+                logger.error(f"Failed to add tag {tag} for customer {customer_id}: {step['error']}")
+                all_success = False
+                continue
+            response = step["result"]
             try:
                 result = json.loads(response)
             except Exception as e:
@@ -1291,48 +2473,71 @@ class UtopiaAPIHandler:
             else:
                 logger.error(f"Failed to add tag {tag} for customer {customer_id}: {result}")
                 all_success = False
-        return all_success, added_tags
+        return self.combine_steps(step_results, [step_name for step_name, _ in tags], (all_success, added_tags))
+
+    @staticmethod
+    def combine_steps(step_results, step_names, result):
+        """
+        One step result for a group of concurrent steps; failures of single steps are
+        reported through the (success, data) result, as collect_step_errors expects
+        """
+        return {
+            "success": True,
+            "result": result,
+            "error": None,
+            "skipped": False,
+            "duration": max((step_results[name]["duration"] for name in step_names), default=0.0),
+        }
 
 
     def get_ticket_description(self, customer_data):
         """
-        Load ticket description template and replace variables with customer data
+        Render the ticket description template with the customer's data
+        Variables: {customer_name}, {order_ref}, {site_id}, {email}, {phone}, {address},
+        {apt}, {city}, {state}, {zip}
         Returns formatted ticket description ready to send
         """
+        template_path = os.path.join(TICKET_TEMPLATE_DIR, TICKET_TEMPLATE_FILE)
         try:
-            # Load the template from file
-            template_path = os.path.join(TICKET_TEMPLATE_DIR, TICKET_TEMPLATE_FILE)
-            
-            if not os.path.exists(template_path):
-                logger.warning(f"Ticket template not found at {template_path}, using default")
-                return "New customer setup required. Please contact customer."
-            
-            with open(template_path, 'r', encoding='utf-8') as f:
-                template = f.read()
-            
-            # Replace variables with actual customer data
-            description = template.replace('{customer_name}', 
-                                        f"{customer_data.get('firstname', '')} {customer_data.get('lastname', '')}".strip())
-            # description = description.replace('{order_ref}', customer_data.get('orderref', 'N/A'))
-            # description = description.replace('{site_id}', customer_data.get('siteid', 'N/A'))
-            # description = description.replace('{email}', customer_data.get('email', 'N/A'))
-            # description = description.replace('{phone}', customer_data.get('phone', 'N/A'))
-            # description = description.replace('{address}', customer_data.get('address', 'N/A'))
-            # description = description.replace('{city}', customer_data.get('city', 'N/A'))
-            # description = description.replace('{state}', customer_data.get('state', 'N/A'))
-            # description = description.replace('{zip}', customer_data.get('zip', 'N/A'))
-        
-            return description
-        
+            return self.ticket_templates.render(template_path, customer_data)
+
+        except FileNotFoundError:
+            logger.warning(f"Ticket template not found at {template_path}, using default")
+            return "New customer setup required. Please contact customer."
+
         except Exception as e:
             logger.error(f"Error loading ticket description: {str(e)}", exc_info=True)
             return "Error loading ticket template. Please contact support."
 
     
-    def send_email(self, msg_subject, msg_body, order_ref=None):
+    def send_email(self, msg_subject, msg_body, order_ref=None, digest_key=None, digest_subject=None):
         """
-        Send email notification using Flask-Mail
+        Send email notification
+        With EMAIL_OUTBOX_ENABLED the message is queued and sent in the background
+        (with retries); otherwise it is sent immediately using Flask-Mail
+
+        Args:
+            msg_subject: Email subject
+            msg_body: Plain text body
+            order_ref: Related order reference
+            digest_key: Group with other notices of this kind into one digest email
+            digest_subject: Subject of the digest email
         """
+        if EMAIL_OUTBOX_ENABLED:
+            try:
+                self.email_outbox.enqueue(
+                    subject=msg_subject,
+                    body=msg_body,
+                    recipients=EMAIL_RECIPIENTS,
+                    sender=EMAIL_SENDER,
+                    orderref=order_ref,
+                    digest_key=digest_key,
+                    digest_subject=digest_subject
+                )
+                return "Email queued!"
+            except Exception as e:
+                logger.error(f"Error queueing email '{msg_subject}', sending directly: {str(e)}", exc_info=True)
+
         try:
             msg = Message(
                 subject=msg_subject,
@@ -1341,14 +2546,54 @@ class UtopiaAPIHandler:
                 body=msg_body
             )
             
-            self.mail.send(msg)
+            with metrics.span("smtp_send"):
+                self.mail.send(msg)
             logger.info(f"Email sent successfully - Subject: {msg_subject}")
 
             return "Email sent!"
         except Exception as e:
             logger.error(f"Error sending email '{msg_subject}': {str(e)}", exc_info=True)
             return f"Error sending email: {msg_subject}"
-    
+
+    def get_email_outbox_api(self):
+        """
+        API endpoint to inspect the email outbox
+        GET /api/email/outbox?status=failed&limit=50 - Returns recent messages and per-status counts
+        """
+        try:
+            status = request.args.get('status', '').strip() or None
+            limit = min(int(request.args.get('limit', 50)), 500)
+            return jsonify({
+                'success': True,
+                'enabled': EMAIL_OUTBOX_ENABLED,
+                'stats': self.email_outbox.get_stats(),
+                'messages': self.email_outbox.list_messages(status=status, limit=limit)
+            }), 200
+        except Exception as e:
+            logger.error(f"Error in get_email_outbox_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+
+    def retry_email_outbox_api(self):
+        """
+        API endpoint to re-queue failed emails
+        POST /api/email/outbox/retry - Returns JSON with the number of re-queued messages
+        """
+        try:
+            count = self.email_outbox.retry_failed()
+            logger.info(f"Re-queued {count} failed emails (by user: {session.get('username')})")
+            return jsonify({
+                'success': True,
+                'requeued': count
+            }), 200
+        except Exception as e:
+            logger.error(f"Error in retry_email_outbox_api: {str(e)}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
 
     def customer_to_pc(self, customer_from_utopia, orderref):
         """
@@ -3,5 +3,13 @@ from api_callback import UtopiaAPIHandler
 utopia_handler = UtopiaAPIHandler()
 app = utopia_handler.app
 
+# Under uWSGI, start background workers in each worker process right after fork
+# so queued orders are picked up without waiting for the first request
+try:
+    from uwsgidecorators import postfork
+    postfork(utopia_handler.start_background_workers)
+except ImportError:
+    pass
+
 if __name__ == "__main__":
     utopia_handler.run()
@@ -1,5 +1,7 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, session
+from app.routes.results_route import flash_result
 import powercode 
+import requests
 import json
 
 powercode_bp = Blueprint('powercode', __name__, template_folder='templates')
@@ -17,11 +19,15 @@ def powercode_panel():
 @powercode_bp.route('/admin/powercode/create_account', methods=['POST'])
 def create_account():
     customer_info = request.form.to_dict()
-    customer_id, error = powercode.create_powercode_account(customer_info)
+    try:
+        customer_id, error = powercode.create_powercode_account(customer_info)
+    except requests.exceptions.ConnectionError as e:
+        # PowerCode circuit open or rate limited
+        customer_id, error = -1, str(e)
     if error:
-        flash(f"Error: {error}")
+        flash_result(f"Error: {error}")
     else:
-        flash(f"Account created successfully!\nCustomer ID: {customer_id}")
+        flash_result(f"Account created successfully!\nCustomer ID: {customer_id}")
     return redirect(url_for('powercode.powercode_panel'))
 
 @powercode_bp.route('/admin/powercode/read_account', methods=['POST'])
@@ -32,9 +38,9 @@ def read_account():
         # Try to parse and format JSON
         json_data = result.json()
         formatted = json.dumps(json_data, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(result.text)
+        flash_result(result.text)
     return redirect(url_for('powercode.powercode_panel'))
 
 @powercode_bp.route('/admin/powercode/get_customer_by_external_id', methods=['POST'])
@@ -44,9 +50,9 @@ def get_customer_by_external_id():
     try:
         json_data = result.json()
         formatted = json.dumps(json_data, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(result.text)
+        flash_result(result.text)
     return redirect(url_for('powercode.powercode_panel'))
 
 @powercode_bp.route('/admin/powercode/search_customers', methods=['POST'])
@@ -59,9 +65,9 @@ def search_customers():
             formatted = json.dumps(result, indent=2)
         else:
             formatted = json.dumps(result.json(), indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('powercode.powercode_panel'))
 
 # search customer with new UAPI
@@ -75,9 +81,9 @@ def search_customers_by_uapi():
             formatted = json.dumps(result, indent=2)
         else:
             formatted = json.dumps(result.json(), indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('powercode.powercode_panel'))
 
 @powercode_bp.route('/admin/powercode/create_ticket', methods=['POST'])
@@ -85,7 +91,7 @@ def create_ticket():
     customer_id = request.form.get('customer_id')
     description = request.form.get('description')
     ticket_id = powercode.create_powercode_ticket(customer_id, description)
-    flash(f"Ticket created successfully!\nTicket ID: {ticket_id}")
+    flash_result(f"Ticket created successfully!\nTicket ID: {ticket_id}")
     return redirect(url_for('powercode.powercode_panel'))
 
 @powercode_bp.route('/admin/powercode/read_ticket', methods=['POST'])
@@ -95,9 +101,9 @@ def read_ticket():
     try:
         json_data = result.json()
         formatted = json.dumps(json_data, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(result.text)
+        flash_result(result.text)
     return redirect(url_for('powercode.powercode_panel'))
 
 @powercode_bp.route('/admin/powercode/add_service_plan', methods=['POST'])
@@ -110,9 +116,9 @@ def add_service_plan():
             formatted = json.dumps(result, indent=2)
         else:
             formatted = json.dumps(result.json(), indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('powercode.powercode_panel'))
 
 @powercode_bp.route('/admin/powercode/get_customer_tags', methods=['POST'])
@@ -124,9 +130,9 @@ def get_customer_tags():
             formatted = json.dumps(result, indent=2)
         else:
             formatted = json.dumps(result.json(), indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('powercode.powercode_panel'))
 
 @powercode_bp.route('/admin/powercode/add_customer_tag', methods=['POST'])
@@ -139,9 +145,9 @@ def add_customer_tag():
             formatted = json.dumps(result, indent=2)
         else:
             formatted = json.dumps(result.json(), indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('powercode.powercode_panel'))
 
 @powercode_bp.route('/admin/powercode/delete_customer_tag', methods=['POST'])
@@ -154,9 +160,9 @@ def delete_customer_tag():
             formatted = json.dumps(result, indent=2)
         else:
             formatted = json.dumps(result.json(), indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('powercode.powercode_panel'))
 
 @powercode_bp.route('/admin/powercode/read_custom_action', methods=['POST'])
@@ -168,7 +174,7 @@ def read_custom_action():
             formatted = json.dumps(result, indent=2)
         else:
             formatted = json.dumps(result.json(), indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('powercode.powercode_panel'))
\ No newline at end of file
@@ -0,0 +1,46 @@
+from flask import Blueprint, request, redirect, url_for, flash, jsonify, session
+from result_store import ResultStore
+import threading
+import config
+
+results_bp = Blueprint('results', __name__)
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_result_store():
+    """Result store in the shared state DB (created on first use)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ResultStore(
+                    db_path=config.STATE_DB_FILE,
+                    ttl=config.RESULT_STORE_TTL,
+                    max_entries=config.RESULT_STORE_MAX_ENTRIES,
+                    max_bytes=int(config.RESULT_STORE_MAX_MB * 1024 * 1024)
+                )
+    return _store
+
+
+def flash_result(text):
+    """Store a panel result server-side and flash only its ID (shown by static/js/results.js)"""
+    result_id = get_result_store().put(str(text), owner=session.get('username', ''), title=request.endpoint or '')
+    flash(result_id, 'result')
+
+
+@results_bp.before_request
+def require_login():
+    """Protect all routes in this blueprint"""
+    if 'logged_in' not in session:
+        return redirect(url_for('login'))
+
+@results_bp.route('/admin/results/<result_id>')
+def get_result(result_id):
+    """One page of a stored result: GET /admin/results/<id>?page=N"""
+    page = request.args.get('page', 1, type=int)
+    result = get_result_store().get_page(result_id, session.get('username', ''), page, config.RESULT_PAGE_LINES)
+    if result is None:
+        return jsonify({'success': False, 'error': 'Result not found or expired'}), 404
+    return jsonify({'success': True, **result}), 200
@@ -1,4 +1,5 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, session
+from app.routes.results_route import flash_result
 import utopia 
 import json
 
@@ -17,15 +18,15 @@ def utopia_panel():
 @utopia_bp.route('/admin/utopia/get_customer', methods=['POST'])
 def get_customer():
     orderref = request.form.get('orderref')
-    result = utopia.getCustomerFromUtopia(orderref)
+    result = utopia.getCustomerFromUtopiaCached(orderref, refresh=bool(request.form.get('refresh')))
     try:
         if isinstance(result, dict):
             formatted = json.dumps(result, indent=2)
         else:
             formatted = str(result)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/get_customer_by_cid', methods=['POST'])
@@ -34,9 +35,9 @@ def get_customer_by_cid():
     result = utopia.getCustomerByCID(cid)
     try:
         formatted = json.dumps(result, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/get_mac', methods=['POST'])
@@ -48,9 +49,9 @@ def get_mac():
             formatted = json.dumps(result, indent=2)
         else:
             formatted = str(result)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/get_service', methods=['POST'])
@@ -62,9 +63,9 @@ def get_service():
             formatted = json.dumps(result, indent=2)
         else:
             formatted = str(result)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/get_siteid_by_mac', methods=['POST'])
@@ -73,9 +74,9 @@ def get_siteid_by_mac():
     result = utopia.getSiteIDByMAC(mac)
     try:
         formatted = json.dumps(result, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/check_access', methods=['POST'])
@@ -84,9 +85,9 @@ def check_access():
     result = utopia.checkAccess(siteid=siteid if siteid else None)
     try:
         formatted = json.dumps(result, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/get_orders', methods=['POST'])
@@ -95,9 +96,9 @@ def get_orders():
     result = utopia.getOrders(siteid=siteid if siteid else None)
     try:
         formatted = json.dumps(result, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/get_projects', methods=['POST'])
@@ -106,9 +107,9 @@ def get_projects():
     result = utopia.getProjects(siteid=siteid if siteid else None)
     try:
         formatted = json.dumps(result, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/get_project_details', methods=['POST'])
@@ -117,9 +118,9 @@ def get_project_details():
     result = utopia.getProjectDetails(projectid)
     try:
         formatted = json.dumps(result, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/get_isp_products', methods=['POST'])
@@ -127,9 +128,9 @@ def get_isp_products():
     result = utopia.getISPProducts()
     try:
         formatted = json.dumps(result, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/suspend_service', methods=['POST'])
@@ -139,9 +140,9 @@ def suspend_service():
     result = utopia.suspendService(cid, siteid)
     try:
         formatted = json.dumps(result, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/unsuspend_service', methods=['POST'])
@@ -151,9 +152,9 @@ def unsuspend_service():
     result = utopia.unsuspendService(cid, siteid)
     try:
         formatted = json.dumps(result, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/change_speed', methods=['POST'])
@@ -166,9 +167,9 @@ def change_speed():
     result = utopia.changeSpeed(cid, siteid, uiaid, product, issuedate)
     try:
         formatted = json.dumps(result, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/cancel_service', methods=['POST'])
@@ -179,9 +180,9 @@ def cancel_service():
     result = utopia.cancelService(cid, siteid, issuedate)
     try:
         formatted = json.dumps(result, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/search_outage_tickets', methods=['POST'])
@@ -190,9 +191,9 @@ def search_outage_tickets():
     result = utopia.searchOutageTickets(siteid=siteid if siteid else None)
     try:
         formatted = json.dumps(result, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
 
 @utopia_bp.route('/admin/utopia/get_outage_ticket', methods=['POST'])
@@ -201,7 +202,7 @@ def get_outage_ticket():
     result = utopia.getOutageTicket(ticketid)
     try:
         formatted = json.dumps(result, indent=2)
-        flash(formatted)
+        flash_result(formatted)
     except:
-        flash(str(result))
+        flash_result(str(result))
     return redirect(url_for('utopia.utopia_panel'))
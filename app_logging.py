@@ -0,0 +1,206 @@
+"""
+Application logging setup.
+
+This module handles:
+- Plain-text or JSON-lines log formatting (LOG_FORMAT)
+- Writing log records from a background listener thread (QueueHandler/QueueListener),
+  so request and worker threads never wait on file I/O
+- Per-thread log context (orderref, job_id, stage, ...) attached to every record
+- Structured fields passed with `extra=` (e.g. duration_ms, upstream, data)
+"""
+
+import os
+import json
+import queue
+import logging
+import threading
+import contextvars
+import logging.handlers
+from contextlib import contextmanager
+
+# Fields copied from the log context / `extra=` into the output when present
+CONTEXT_FIELDS = ("orderref", "job_id", "stage", "upstream", "method", "status", "duration_ms")
+
+_context = contextvars.ContextVar("log_context", default={})
+
+
+def bind(**fields):
+    """
+    Add fields to the log context of the current thread (None removes a field)
+
+    Args:
+        **fields: Context fields, e.g. orderref="ABC123", stage="utopia_lookup"
+    """
+    context = dict(_context.get())
+    for key, value in fields.items():
+        if value is None:
+            context.pop(key, None)
+        else:
+            context[key] = value
+    _context.set(context)
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    Bind fields for the duration of a block, restoring the previous context afterwards
+
+    Args:
+        **fields: Context fields, e.g. orderref="ABC123", job_id="..."
+    """
+    token = _context.set(dict(_context.get(), **{k: v for k, v in fields.items() if v is not None}))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copy the log context onto each record (explicit `extra=` values win)"""
+
+    def filter(self, record):
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """
+    The original "%(asctime)s - %(levelname)s - %(message)s" format, with context
+    fields appended as key=value and `data` appended as compact JSON
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(levelname)s - %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        fields = " ".join(
+            f"{key}={getattr(record, key)}" for key in CONTEXT_FIELDS if getattr(record, key, None) is not None
+        )
+        data = getattr(record, "data", None)
+        if data is not None:
+            # Compact on purpose: the log viewer pretty-prints JSON on demand
+            first, sep, rest = text.partition("\n")
+            text = f"{first}: {json.dumps(data, ensure_ascii=False, default=str)}{sep}{rest}"
+        if fields:
+            first, sep, rest = text.partition("\n")
+            text = f"{first} [{fields}]{sep}{rest}"
+        return text
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line. "ts" and "level" come first and "ts" uses the
+    text format's timestamp, so log_reader can filter both formats the same way.
+    """
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in CONTEXT_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        data = getattr(record, "data", None)
+        if data is not None:
+            entry["data"] = data
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler whose listener thread is (re)started in the process that logs.
+    uWSGI forks workers after the app is imported and threads do not survive a
+    fork, so each worker starts its own listener on first use.
+    """
+
+    def __init__(self, handlers, maxsize: int = 10000):
+        """
+        Initialize handler
+
+        Args:
+            handlers: Handlers the listener writes to (e.g. the rotating file handler)
+            maxsize: Queue size; a full queue makes the logging thread wait (no records are dropped)
+        """
+        super().__init__(queue.Queue(maxsize))
+        self.handlers = handlers
+        self.maxsize = maxsize
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # Records queued before a fork belong to the parent; start clean
+            self.queue = queue.Queue(self.maxsize)
+            self._listener = logging.handlers.QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Let the listener thread do the formatting, but resolve anything that
+        # only exists on this thread (message args, exception info) first
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        self.queue.put(record)
+
+    def close(self):
+        """Write out queued records and stop the listener (called by logging.shutdown at exit)"""
+        with self._start_lock:
+            if self._listener and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+        super().close()
+
+
+def setup_logging(file_handler: logging.Handler, log_format: str = "text", use_async: bool = True,
+                  level: int = logging.INFO) -> logging.Handler:
+    """
+    Configure the root logger
+
+    Args:
+        file_handler: Handler that writes to the log file
+        log_format: "text" (default) or "json" (one JSON object per line)
+        use_async: Write records from a background thread instead of the logging thread
+        level: Root log level
+
+    Returns:
+        The handler installed on the root logger
+    """
+    file_handler.setFormatter(JSONFormatter() if log_format == "json" else TextFormatter())
+
+    handler = AsyncQueueHandler([file_handler]) if use_async else file_handler
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    return handler
@@ -0,0 +1,3 @@
+"""
+Load tests and benchmarks for UAC. Nothing here is imported by the application.
+"""
@@ -0,0 +1,792 @@
+"""
+Offline load test for the webhook and admin create-customer paths.
+
+This module handles:
+- Starting the Utopia/PowerCode stand-ins and an SMTP sink (benchmarks.mock_upstreams)
+- Starting the real WSGI app (api_wsgi:app) under uWSGI with api_callback.ini, or under the
+  threaded werkzeug server, in a scratch directory with its own state DBs; or targeting a
+  server that is already running and pointed at the stand-ins
+- Sending POST /api-callback and/or POST /api/create-customer at a set concurrency
+  (and optionally a set rate)
+- Waiting for the queued webhook jobs and reading their timings from /api/jobs/<job_id>
+- Sampling queue depth and, under uWSGI, busy workers while the test runs
+- Reporting throughput, latency percentiles, worker saturation and upstream calls per order
+
+Run from the command line (from the project root):
+    python -m benchmarks.load_test --orders 200 --concurrency 20
+    python -m benchmarks.load_test --server uwsgi --orders 500 --latency 0.2 --error-rate 0.05
+    python -m benchmarks.load_test --scenario create --app-env UPSTREAM_RATE_LIMITS= --json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import socket
+import secrets
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import requests
+
+from benchmarks import mock_upstreams
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UWSGI_INI = os.path.join(REPO_DIR, "api_callback.ini")
+
+SCENARIOS = ("webhook", "create", "mixed")
+TERMINAL_JOB_STATUSES = ("completed", "failed")
+
+# Werkzeug's threaded server, for machines without uWSGI
+SERVE_WERKZEUG = (
+    "import sys\n"
+    "from werkzeug.serving import run_simple\n"
+    "import api_wsgi\n"
+    "run_simple(sys.argv[1], int(sys.argv[2]), api_wsgi.app, threaded=True)\n"
+)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """
+    Percentile of raw samples, interpolating between the closest ranks
+
+    Args:
+        values: Samples
+        q: Quantile between 0 and 1
+
+    Returns:
+        The percentile, or None without samples
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def latency_summary(values: List[float]) -> Dict:
+    """
+    Summarize latency samples (seconds)
+
+    Returns:
+        Dictionary with count, avg, p50, p95, p99 and max
+    """
+    return {
+        "count": len(values),
+        "avg": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else None,
+    }
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+def _free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def read_uwsgi_stats(address: str) -> Optional[Dict]:
+    """
+    Read the uWSGI stats server (the `stats` option)
+
+    Args:
+        address: host:port of the stats server
+
+    Returns:
+        Decoded stats, or None if it could not be read
+    """
+    host, port = address.rsplit(":", 1)
+    try:
+        with socket.create_connection((host, int(port)), timeout=2) as sock:
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return json.loads(b"".join(chunks).decode("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+class AppServer:
+    """
+    The application under test, started in a subprocess
+
+    Under uWSGI it runs with api_callback.ini plus an HTTP listener, a stats server and
+    the scratch directory; werkzeug runs api_wsgi:app with one thread per request.
+    """
+
+    def __init__(self, kind: str, host: str, port: int, env: Dict[str, str], workdir: str,
+                 processes: Optional[int] = None, uwsgi_args: Optional[List[str]] = None):
+        self.kind = kind
+        self.host = host
+        self.port = port
+        self.env = env
+        self.workdir = workdir
+        self.processes = processes
+        self.uwsgi_args = uwsgi_args or []
+        self.stats_address = f"{host}:{_free_port(host)}" if kind == "uwsgi" else None
+        self.log_path = os.path.join(workdir, "server.log")
+        self._process = None
+        self._log = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def command(self) -> List[str]:
+        if self.kind == "werkzeug":
+            return [sys.executable, "-c", SERVE_WERKZEUG, self.host, str(self.port)]
+
+        command = [
+            "uwsgi", "--ini", UWSGI_INI,
+            "--http", f"{self.host}:{self.port}",
+            # Without it the HTTP router drops the client's reused keep-alive connections
+            "--http-keepalive",
+            "--stats", self.stats_address,
+            "--chdir", self.workdir,
+            "--pythonpath", REPO_DIR,
+            "--virtualenv", sys.prefix,
+            "--logto", self.log_path,
+        ]
+        if self.processes:
+            command += ["--processes", str(self.processes)]
+        return command + self.uwsgi_args
+
+    def start(self, timeout: float = 60):
+        """
+        Start the server and wait until it answers
+
+        Args:
+            timeout: Seconds to wait for the first response
+        """
+        self._log = open(self.log_path, "ab")
+        self._process = subprocess.Popen(
+            self.command(), cwd=self.workdir, env=self.env, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"{self.kind} exited with code {self._process.returncode}, see {self.log_path}")
+            try:
+                requests.get(f"{self.url}/login", timeout=2)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"{self.kind} did not answer within {timeout}s, see {self.log_path}")
+
+    def stop(self):
+        """Stop the server (uWSGI shuts down on SIGTERM with die-on-term)"""
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        if self._log:
+            self._log.close()
+            self._log = None
+
+
+class Sampler:
+    """
+    Samples order queue depth (GET /api/jobs) and uWSGI worker status while the test runs
+    """
+
+    def __init__(self, client: "LoadTest", interval: float = 1.0, stats_address: Optional[str] = None):
+        self.client = client
+        self.interval = interval
+        self.stats_address = stats_address
+        self.samples: List[Dict] = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="load-test-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            sample = {"at": time.time(), "in_flight": self.client.in_flight}
+            try:
+                queue = self.client.session().get(f"{self.client.url}/api/jobs", params={"limit": 1},
+                                                  timeout=5).json().get("queue", {})
+                sample["queued"] = queue.get("queued", 0)
+                sample["processing"] = queue.get("processing", 0)
+            except (requests.RequestException, ValueError):
+                pass
+            if self.stats_address:
+                stats = read_uwsgi_stats(self.stats_address)
+                if stats:
+                    workers = [worker for worker in stats.get("workers", []) if worker.get("status") != "cheap"]
+                    sample["workers"] = len(workers)
+                    sample["busy_workers"] = sum(1 for worker in workers if worker.get("status") == "busy")
+                    sample["listen_queue"] = stats.get("listen_queue", 0)
+            self.samples.append(sample)
+            self._stop.wait(self.interval)
+
+
+class LoadTest:
+    """
+    Sends orders to a running server and collects the timings
+    """
+
+    def __init__(self, url: str, username: str, password: str, scenario: str = "webhook",
+                 orders: int = 100, concurrency: int = 10, rate: float = 0.0,
+                 drain_timeout: float = 600, request_timeout: float = 120):
+        """
+        Args:
+            url: Base URL of the app
+            username: Admin user (create-customer and /api/jobs need a session)
+            password: Admin password
+            scenario: webhook, create or mixed (alternating)
+            orders: Number of orders to send
+            concurrency: Requests in flight at the same time
+            rate: Orders started per second (0 = as fast as the concurrency allows)
+            drain_timeout: Seconds to wait for queued jobs after the last request
+            request_timeout: Per-request timeout in seconds
+        """
+        self.url = url.rstrip("/")
+        self.username = username
+        self.password = password
+        self.scenario = scenario
+        self.orders = orders
+        self.concurrency = concurrency
+        self.rate = rate
+        self.drain_timeout = drain_timeout
+        self.request_timeout = request_timeout
+        self.run_id = datetime.now().strftime("%H%M%S") + secrets.token_hex(2).upper()
+
+        self.results: List[Dict] = []
+        self.jobs: Dict[str, Dict] = {}
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cookies = None
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+    def login(self):
+        """Log in once; every client thread reuses the session cookie"""
+        session = requests.Session()
+        response = session.post(f"{self.url}/login", json={"username": self.username, "password": self.password},
+                                timeout=self.request_timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"Login as {self.username} failed: HTTP {response.status_code} {response.text[:200]}")
+        self._cookies = session.cookies
+
+    def session(self) -> requests.Session:
+        """One keep-alive session per client thread"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            if self._cookies is not None:
+                session.cookies.update(self._cookies)
+            self._local.session = session
+        return session
+
+    def orderref(self, index: int) -> str:
+        # Unique per run, so webhook idempotency never drops a load-test order
+        return f"LT{self.run_id}{index:06d}"
+
+    def kind_for(self, index: int) -> str:
+        if self.scenario == "mixed":
+            return "webhook" if index % 2 == 0 else "create"
+        return self.scenario
+
+    def create_customer_payload(self, orderref: str) -> Dict:
+        return {
+            "orderref": orderref,
+            "service_plan": "1 Gbps",
+            "customer_data": {
+                "customer": {
+                    "firstname": "Load",
+                    "lastname": f"Admin{orderref}",
+                    "email": f"{orderref.lower()}@example.com",
+                    "phone": "4065550100",
+                    "pc-portal-username": f"{orderref.lower()}@example.com",
+                },
+                "address": {
+                    "address": f"{int(orderref[-6:]) + 100} Admin Ave",
+                    "apt": "",
+                    "city": "Bozeman",
+                    "state": "Montana",
+                    "zip": "59715",
+                    "siteid": f"A{orderref}",
+                },
+                "termsagreement": {"sp_terms_agree_date": "2026-01-01"},
+            },
+        }
+
+    def send(self, index: int, start_at: float) -> Dict:
+        """
+        Send one order
+
+        Args:
+            index: Order number within the run
+            start_at: Wall-clock time the order is scheduled for (rate limiting)
+
+        Returns:
+            Result record (kind, orderref, status, latency, job_id, error)
+        """
+        delay = start_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+        kind = self.kind_for(index)
+        orderref = self.orderref(index)
+        result = {"kind": kind, "orderref": orderref, "sent_at": time.time(), "status": None, "job_id": None}
+        with self._lock:
+            self.in_flight += 1
+        try:
+            if kind == "webhook":
+                response = self.session().post(
+                    f"{self.url}/api-callback",
+                    json={"event": "Project New Order", "orderref": orderref, "msg": "Project New Order"},
+                    timeout=self.request_timeout,
+                )
+            else:
+                response = self.session().post(
+                    f"{self.url}/api/create-customer",
+                    json=self.create_customer_payload(orderref),
+                    timeout=self.request_timeout,
+                    allow_redirects=False,
+                )
+            result["status"] = response.status_code
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            result["job_id"] = body.get("job_id")
+            if response.status_code >= 400:
+                result["error"] = body.get("error") or response.text[:200]
+        except requests.RequestException as e:
+            result["error"] = str(e)
+        finally:
+            result["latency"] = time.time() - result["sent_at"]
+            with self._lock:
+                self.in_flight -= 1
+        return result
+
+    # ------------------------------------------------------------------
+    # Run
+    # ------------------------------------------------------------------
+    def run(self) -> float:
+        """
+        Send every order, then wait for the queued webhook jobs
+
+        Returns:
+            Seconds spent sending
+        """
+        started = time.time()
+        interval = 1.0 / self.rate if self.rate > 0 else 0.0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="load-test") as pool:
+            futures = [pool.submit(self.send, index, started + index * interval) for index in range(self.orders)]
+            self.results = [future.result() for future in futures]
+        send_seconds = time.time() - started
+
+        self.wait_for_jobs()
+        return send_seconds
+
+    def wait_for_jobs(self):
+        """
+        Poll the accepted webhook jobs until they finish or drain_timeout passes.
+        Jobs are taken roughly in order, so each round stops at the first unfinished one.
+        """
+        pending = [result["job_id"] for result in self.results if result["kind"] == "webhook" and result["job_id"]]
+        deadline = time.time() + self.drain_timeout
+        while pending and time.time() < deadline:
+            still_pending = []
+            for position, job_id in enumerate(pending):
+                try:
+                    response = self.session().get(f"{self.url}/api/jobs/{job_id}", timeout=self.request_timeout)
+                    job = response.json().get("job")
+                except (requests.RequestException, ValueError):
+                    job = None
+                if job and job.get("status") in TERMINAL_JOB_STATUSES:
+                    self.jobs[job_id] = job
+                    continue
+                still_pending = pending[position:]
+                break
+            pending = still_pending
+            if pending:
+                time.sleep(0.5)
+        if pending:
+            logger.warning(f"{len(pending)} jobs still unfinished after {self.drain_timeout}s")
+
+    def server_get(self, path: str) -> Optional[Dict]:
+        try:
+            return self.session().get(f"{self.url}{path}", timeout=self.request_timeout).json()
+        except (requests.RequestException, ValueError):
+            return None
+
+    def server_post(self, path: str) -> Optional[Dict]:
+        try:
+            return self.session().post(f"{self.url}{path}", timeout=self.request_timeout).json()
+        except (requests.RequestException, ValueError):
+            return None
+
+    # ------------------------------------------------------------------
+    # Report
+    # ------------------------------------------------------------------
+    def report(self, send_seconds: float, samples: List[Dict], upstream_stats: Optional[Dict],
+               queue_workers: Optional[int] = None, server_metrics: Optional[Dict] = None) -> Dict:
+        """
+        Build the report
+
+        Args:
+            send_seconds: Time spent sending (from run())
+            samples: Sampler samples
+            upstream_stats: MockUpstreams.stats() for the run, if the mocks were ours
+            queue_workers: ORDER_QUEUE_WORKERS per process, for queue saturation
+            server_metrics: GET /api/metrics/summary after the run
+
+        Returns:
+            Report dictionary
+        """
+        report = {
+            "run_id": self.run_id,
+            "url": self.url,
+            "scenario": self.scenario,
+            "orders": self.orders,
+            "concurrency": self.concurrency,
+            "rate": self.rate or None,
+            "send_seconds": round(send_seconds, 3),
+            "requests": {},
+        }
+
+        for kind in ("webhook", "create"):
+            results = [result for result in self.results if result["kind"] == kind]
+            if not results:
+                continue
+            statuses: Dict[str, int] = {}
+            for result in results:
+                key = str(result["status"] or "error")
+                statuses[key] = statuses.get(key, 0) + 1
+            ok = [result for result in results if result["status"] and result["status"] < 400]
+            report["requests"][kind] = {
+                "sent": len(results),
+                "statuses": statuses,
+                "requests_per_second": round(len(ok) / send_seconds, 2) if send_seconds else None,
+                "latency": latency_summary([result["latency"] for result in ok]),
+                "errors": sorted({result["error"] for result in results if result.get("error")})[:5],
+            }
+
+        processed = 0
+        jobs = list(self.jobs.values())
+        if any(result["kind"] == "webhook" for result in self.results):
+            job_statuses: Dict[str, int] = {}
+            end_to_end, queue_wait, processing = [], [], []
+            for job in jobs:
+                job_statuses[job["status"]] = job_statuses.get(job["status"], 0) + 1
+                created, started, finished = (_parse_time(job.get(field)) for field in
+                                              ("created_at", "started_at", "finished_at"))
+                if created and finished:
+                    end_to_end.append(finished - created)
+                if created and started:
+                    queue_wait.append(started - created)
+                if started and finished:
+                    processing.append(finished - started)
+            accepted = sum(1 for result in self.results if result["kind"] == "webhook" and result["job_id"])
+            window = None
+            if jobs:
+                window = (max(_parse_time(job["finished_at"]) for job in jobs if job.get("finished_at"))
+                          - min(_parse_time(job["created_at"]) for job in jobs))
+            report["jobs"] = {
+                "accepted": accepted,
+                "finished": len(jobs),
+                "unfinished": accepted - len(jobs),
+                "statuses": job_statuses,
+                "orders_per_minute": round(len(jobs) / window * 60, 1) if window else None,
+                "end_to_end": latency_summary(end_to_end),
+                "queue_wait": latency_summary(queue_wait),
+                "processing": latency_summary(processing),
+            }
+            processed += len(jobs)
+
+        creates = report["requests"].get("create")
+        if creates:
+            created = sum(count for status, count in creates["statuses"].items() if status == "200")
+            report["requests"]["create"]["orders_per_minute"] = round(created / send_seconds * 60, 1) if send_seconds else None
+            processed += sum(count for status, count in creates["statuses"].items() if status in ("200", "409", "500"))
+
+        report["saturation"] = self._saturation(samples, queue_workers)
+
+        if upstream_stats is not None:
+            per_order = {}
+            for upstream, counts in sorted(upstream_stats["calls"].items()):
+                for endpoint, count in sorted(counts.items()):
+                    per_order[f"{upstream}:{endpoint}"] = round(count / processed, 2) if processed else None
+            total = sum(sum(counts.values()) for counts in upstream_stats["calls"].values())
+            report["upstream"] = {
+                "orders": processed,
+                "calls": upstream_stats["calls"],
+                "injected_errors": upstream_stats["errors"],
+                "calls_per_order": per_order,
+                "total_calls_per_order": round(total / processed, 2) if processed else None,
+                "emails": upstream_stats["emails"],
+            }
+
+        if server_metrics and server_metrics.get("success") and server_metrics.get("enabled"):
+            report["server_stages"] = [
+                {key: stage.get(key) for key in ("stage", "count", "errors", "avg", "p50", "p95", "p99")}
+                for stage in server_metrics.get("stages", [])
+            ]
+            report["server_orders"] = {
+                item["labels"].get("outcome"): int(item["value"])
+                for item in server_metrics.get("counters", {}).get("uac_orders_total", [])
+            }
+        return report
+
+    def _saturation(self, samples: List[Dict], queue_workers: Optional[int]) -> Dict:
+        """
+        Summarize the sampler: client requests in flight, queue depth, queue worker
+        utilization (processing jobs / worker threads) and busy uWSGI workers
+        """
+        def mean_and_peak(values):
+            return {"mean": round(sum(values) / len(values), 2), "peak": max(values)} if values else None
+
+        saturation = {
+            "samples": len(samples),
+            "in_flight": mean_and_peak([sample["in_flight"] for sample in samples]),
+            "queued": mean_and_peak([sample["queued"] for sample in samples if "queued" in sample]),
+            "processing": mean_and_peak([sample["processing"] for sample in samples if "processing" in sample]),
+        }
+        worker_samples = [sample for sample in samples if sample.get("workers")]
+        if worker_samples:
+            saturation["uwsgi_workers"] = max(sample["workers"] for sample in worker_samples)
+            saturation["uwsgi_busy"] = mean_and_peak([sample["busy_workers"] / sample["workers"]
+                                                      for sample in worker_samples])
+            saturation["listen_queue"] = mean_and_peak([sample["listen_queue"] for sample in worker_samples])
+        if queue_workers:
+            processes = saturation.get("uwsgi_workers") or 1
+            capacity = processes * queue_workers
+            utilization = [min(sample["processing"] / capacity, 1.0) for sample in samples if "processing" in sample]
+            saturation["queue_worker_threads"] = capacity
+            saturation["queue_utilization"] = mean_and_peak(utilization)
+        return saturation
+
+
+def format_report(report: Dict) -> str:
+    """Render the report as plain text"""
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.0f}ms"
+
+    def pct(value):
+        return "-" if value is None else f"{value * 100:.0f}%"
+
+    def latency_line(label, summary):
+        return (f"  {label:<22} n={summary['count']:<6} avg={ms(summary['avg']):<8} p50={ms(summary['p50']):<8} "
+                f"p95={ms(summary['p95']):<8} p99={ms(summary['p99']):<8} max={ms(summary['max'])}")
+
+    lines = [
+        f"Load test {report['run_id']} against {report['url']}",
+        f"  scenario={report['scenario']} orders={report['orders']} concurrency={report['concurrency']} "
+        f"rate={report['rate'] or 'unlimited'} sent in {report['send_seconds']}s",
+        "",
+        "Requests",
+    ]
+    for kind, summary in report["requests"].items():
+        lines.append(f"  {kind}: {summary['sent']} sent, statuses {summary['statuses']}, "
+                     f"{summary['requests_per_second']} req/s"
+                     + (f", {summary['orders_per_minute']} orders/min" if "orders_per_minute" in summary else ""))
+        lines.append(latency_line(f"{kind} response", summary["latency"]))
+        for error in summary["errors"]:
+            lines.append(f"    error: {error}")
+
+    jobs = report.get("jobs")
+    if jobs:
+        lines += [
+            "",
+            f"Webhook jobs: {jobs['finished']}/{jobs['accepted']} finished {jobs['statuses']}, "
+            f"{jobs['orders_per_minute']} orders/min",
+            latency_line("end to end", jobs["end_to_end"]),
+            latency_line("queue wait", jobs["queue_wait"]),
+            latency_line("processing", jobs["processing"]),
+        ]
+
+    saturation = report["saturation"]
+    lines += ["", f"Saturation ({saturation['samples']} samples, mean / peak)"]
+    for key, label in (("in_flight", "requests in flight"), ("queued", "jobs queued"),
+                       ("processing", "jobs processing"), ("listen_queue", "uWSGI listen queue")):
+        if saturation.get(key):
+            lines.append(f"  {label:<22} {saturation[key]['mean']} / {saturation[key]['peak']}")
+    if saturation.get("queue_utilization"):
+        lines.append(f"  {'queue workers busy':<22} {pct(saturation['queue_utilization']['mean'])} / "
+                     f"{pct(saturation['queue_utilization']['peak'])} of {saturation['queue_worker_threads']} threads")
+    if saturation.get("uwsgi_busy"):
+        lines.append(f"  {'uWSGI workers busy':<22} {pct(saturation['uwsgi_busy']['mean'])} / "
+                     f"{pct(saturation['uwsgi_busy']['peak'])} of {saturation['uwsgi_workers']} workers")
+
+    upstream = report.get("upstream")
+    if upstream:
+        lines += ["", f"Upstream calls per order ({upstream['orders']} orders, "
+                      f"{upstream['total_calls_per_order']} calls each, {upstream['emails']} emails)"]
+        for endpoint, per_order in upstream["calls_per_order"].items():
+            upstream_name, name = endpoint.split(":", 1)
+            total = upstream["calls"][upstream_name][name]
+            injected = upstream["injected_errors"].get(upstream_name, {}).get(name, 0)
+            lines.append(f"  {endpoint:<40} {per_order:<6} ({total} calls"
+                         + (f", {injected} injected errors)" if injected else ")"))
+
+    if report.get("server_stages"):
+        lines += ["", f"Server stages (from /api/metrics/summary, orders {report.get('server_orders')})"]
+        for stage in report["server_stages"]:
+            lines.append(f"  {stage['stage']:<34} n={stage['count']:<6} errors={stage['errors']:<4} "
+                         f"p50={ms(stage['p50']):<8} p95={ms(stage['p95']):<8} p99={ms(stage['p99'])}")
+    return "\n".join(lines)
+
+
+def build_app_env(mocks: mock_upstreams.MockUpstreams, workdir: str, admin_password: str,
+                  overrides: Dict[str, str]) -> Dict[str, str]:
+    """
+    Environment for an app started by the load test: pointed at the stand-ins, with its
+    state DBs in the scratch directory and a throwaway admin login
+
+    Args:
+        mocks: Started MockUpstreams
+        workdir: Scratch directory
+        admin_password: Password for the loadtest admin
+        overrides: --app-env values, applied last
+
+    Returns:
+        Environment dictionary
+    """
+    env = dict(os.environ)
+    env.update({
+        "PC_API_KEY": "load-test",
+        "UTOPIA_API_KEY": "load-test",
+        "CUSTOMER_PORTAL_PASSWORD": "load-test",
+        "PC_CUST_TAGS": "1,2",
+        "EMAIL_SENDER": "uac@example.com",
+        "EMAIL_RECIPIENTS": "ops@example.com",
+        "SECRET_KEY": secrets.token_hex(16),
+        "ADMIN_USER": "loadtest",
+        "ADMIN_PASS": admin_password,
+        "ADMIN_PASS_HASH": "",
+        "STATE_DB_FILE": os.path.join(workdir, "uac_state.db"),
+        "FAILURE_DB_FILE": os.path.join(workdir, "failed_orders.db"),
+        "FAILURE_JSON_FILE": os.path.join(workdir, "failed_orders.json"),
+        "TICKET_TEMPLATE_DIR": os.path.join(REPO_DIR, "ticket_descriptions"),
+        "METRICS_FLUSH_INTERVAL": "1",
+        "PYTHONPATH": os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])),
+    })
+    env.update(mocks.app_env())
+    env.update(overrides)
+    return env
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test /api-callback and /api/create-customer against mock upstreams")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="webhook",
+                        help="Endpoint to drive; mixed alternates between the two (default webhook)")
+    parser.add_argument("--orders", type=int, default=100, help="Orders to send (default 100)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Requests in flight at once (default 10)")
+    parser.add_argument("--rate", type=float, default=0.0, help="Orders started per second (0 = unlimited)")
+    parser.add_argument("--server", choices=("werkzeug", "uwsgi"), default="werkzeug",
+                        help="How to start the app (ignored with --target)")
+    parser.add_argument("--processes", type=int, help="uWSGI processes (default from api_callback.ini)")
+    parser.add_argument("--uwsgi-arg", action="append", dest="uwsgi_args", default=[],
+                        help="Extra uWSGI option, e.g. --uwsgi-arg=--threads=2 (repeatable)")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Environment override for the app, e.g. ORDER_QUEUE_WORKERS=4 (repeatable)")
+    parser.add_argument("--target", help="URL of an app that is already running (it must use the mock upstreams)")
+    parser.add_argument("--username", default="loadtest", help="Admin user for --target")
+    parser.add_argument("--password", help="Admin password for --target")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface for the app and the mocks")
+    parser.add_argument("--app-port", type=int, default=0, help="App port (default: a free one)")
+    parser.add_argument("--mock-port", type=int, default=0, help="Mock upstream port (default: a free one)")
+    parser.add_argument("--no-mocks", action="store_true", help="Do not start the mocks (with --target)")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Seconds between saturation samples")
+    parser.add_argument("--drain-timeout", type=float, default=600, help="Seconds to wait for queued jobs")
+    parser.add_argument("--workdir", help="Scratch directory for state DBs and logs (default: a temp dir)")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    mock_upstreams.add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    overrides = dict(item.split("=", 1) for item in args.app_env)
+
+    mocks = None
+    if not args.no_mocks:
+        smtp_port = None if args.target else 0
+        mocks = mock_upstreams.from_args(args, host=args.host, port=args.mock_port, smtp_port=smtp_port).start()
+
+    server = None
+    try:
+        if args.target:
+            url, username, password = args.target, args.username, args.password or ""
+            stats_address = None
+        else:
+            workdir = args.workdir or tempfile.mkdtemp(prefix="uac-load-")
+            os.makedirs(workdir, exist_ok=True)
+            password = secrets.token_urlsafe(12)
+            env = build_app_env(mocks, workdir, password, overrides)
+            server = AppServer(args.server, args.host, args.app_port or _free_port(args.host), env, workdir,
+                               processes=args.processes, uwsgi_args=args.uwsgi_args)
+            logger.info(f"Starting {args.server} on {server.url} (state and logs in {workdir})")
+            server.start()
+            url, username = server.url, "loadtest"
+            stats_address = server.stats_address
+
+        test = LoadTest(url, username, password, scenario=args.scenario, orders=args.orders,
+                        concurrency=args.concurrency, rate=args.rate, drain_timeout=args.drain_timeout)
+        test.login()
+
+        # Let startup work (customer index refresh, first-request setup) settle, then start counting
+        time.sleep(1)
+        test.server_post("/api/metrics/reset")
+        if mocks:
+            mocks.reset()
+
+        sampler = Sampler(test, interval=args.sample_interval, stats_address=stats_address)
+        sampler.start()
+        logger.info(f"Sending {args.orders} {args.scenario} orders with concurrency {args.concurrency}")
+        send_seconds = test.run()
+        sampler.stop()
+
+        # Give the other workers one metrics flush interval to write their numbers
+        time.sleep(1.5)
+        queue_workers = int(overrides.get("ORDER_QUEUE_WORKERS", os.environ.get("ORDER_QUEUE_WORKERS", "2")))
+        report = test.report(
+            send_seconds, sampler.samples, mocks.stats() if mocks else None,
+            queue_workers=None if args.target else queue_workers,
+            server_metrics=test.server_get("/api/metrics/summary"),
+        )
+    finally:
+        if server:
+            server.stop()
+        if mocks:
+            mocks.stop()
+
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0 if not report.get("jobs") or not report["jobs"]["unfinished"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
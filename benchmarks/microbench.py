@@ -0,0 +1,574 @@
+"""
+Microbenchmarks for the in-process code that runs on every order or admin request.
+
+This module handles:
+- Timing customer_to_pc, format_contact_info, pretty_log_json and get_ticket_description
+- Timing check_customer_exists over large customer lists, answered from a fresh local
+  customer index (hit and miss) and, for a stale index, by matching a live PowerCode search result
+- Timing every FailureTracker operation at 1k/10k/100k stored failures (SQLite backend)
+- Timing GET /api/logs/read (read_logs) against a generated 100 MB log file
+- Saving the results as baselines (benchmarks/baselines.json) and failing when a
+  benchmark is slower than its baseline by more than a threshold
+
+Everything runs against a scratch directory; no upstream is called. Timings depend on the
+machine, so compare against baselines saved on the same machine (--save).
+
+Run from the command line (from the project root):
+    python -m benchmarks.microbench
+    python -m benchmarks.microbench --group failure_tracker --sizes 1000,10000
+    python -m benchmarks.microbench --check --threshold 0.25
+    python -m benchmarks.microbench --save
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_LOG_MB = 100
+DEFAULT_THRESHOLD = 0.25
+
+# A benchmark runs `loops` iterations and returns the seconds they took (setup excluded)
+Bench = Callable[[int], float]
+
+
+def timed(func: Callable, *args, **kwargs) -> Bench:
+    """
+    Wrap a plain call as a benchmark
+
+    Args:
+        func: Function to time
+        *args, **kwargs: Passed to every call
+
+    Returns:
+        Benchmark function
+    """
+    def bench(loops: int) -> float:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func(*args, **kwargs)
+        return time.perf_counter() - start
+    return bench
+
+
+def measure(bench: Bench, min_time: float = 0.2, repeat: int = 5, max_loops: int = 1_000_000) -> Dict:
+    """
+    Time a benchmark: pick a loop count that runs for at least min_time, then repeat
+
+    Args:
+        bench: Benchmark function
+        min_time: Minimum seconds per repeat
+        repeat: Number of timed repeats
+        max_loops: Upper bound on the loop count
+
+    Returns:
+        Dictionary with loops, min, median and max seconds per operation
+    """
+    # Warm-up call: caches, first-touch page faults and one-off work (e.g. a first cleanup)
+    bench(1)
+    loops = 1
+    while True:
+        elapsed = bench(loops)
+        if elapsed >= min_time or loops >= max_loops:
+            break
+        # Aim a little past min_time, at most 10x more loops per step
+        loops = min(max_loops, max(loops + 1, min(loops * 10, int(loops * min_time * 1.2 / max(elapsed, 1e-9)))))
+
+    per_op = [bench(loops) / loops for _ in range(repeat)]
+    return {
+        "loops": loops,
+        "min": min(per_op),
+        "median": statistics.median(per_op),
+        "max": max(per_op),
+    }
+
+
+# ----------------------------------------------------------------------
+# Environment
+# ----------------------------------------------------------------------
+def prepare_environment(workdir: str):
+    """
+    Point the app's configuration at the scratch directory before anything imports config.
+    Upstream URLs point at a closed port; nothing here calls them.
+
+    Args:
+        workdir: Scratch directory (becomes the working directory)
+    """
+    unreachable = "http://127.0.0.1:9"
+    defaults = {
+        "PC_API_KEY": "bench",
+        "UTOPIA_API_KEY": "bench",
+        "PC_URL": unreachable,
+        "PC_URL_API": f"{unreachable}/api",
+        "PC_URL_UAPI": f"{unreachable}/uapi",
+        "UTOPIA_URL_ENDPOINT": unreachable,
+        "MAIL_SERVER": "127.0.0.1",
+        "EMAIL_SENDER": "uac@example.com",
+        "EMAIL_RECIPIENTS": "ops@example.com",
+        "CUSTOMER_PORTAL_PASSWORD": "bench",
+        "SECRET_KEY": "bench",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+    os.environ.update({
+        "STATE_DB_FILE": os.path.join(workdir, "uac_state.db"),
+        "FAILURE_DB_FILE": os.path.join(workdir, "failed_orders.db"),
+        "FAILURE_JSON_FILE": os.path.join(workdir, "failed_orders.json"),
+        "TICKET_TEMPLATE_DIR": os.path.join(REPO_DIR, "ticket_descriptions"),
+        # The generated log must not be rotated away while it is being read
+        "LOG_MAX_BYTES": str(1 << 40),
+        "METRICS_ENABLED": "false",
+    })
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    os.chdir(workdir)
+
+
+def build_handler():
+    """Create the application handler (after prepare_environment)"""
+    from api_callback import UtopiaAPIHandler
+    return UtopiaAPIHandler()
+
+
+# ----------------------------------------------------------------------
+# Sample data
+# ----------------------------------------------------------------------
+def sample_utopia_customer(index: int = 0) -> Dict:
+    """A contractlookup response shaped like Utopia's"""
+    return {
+        "customer": {
+            "firstname": "Jane",
+            "lastname": f"Roe{index}",
+            "email": f"jane.roe{index}@example.com",
+            "phone": "4065550100",
+        },
+        "address": {
+            "address": f"{index + 100} North Main Street",
+            "apt": "Unit 2",
+            "city": "Bozeman",
+            "state": "Montana",
+            "zip": "59715",
+            "siteid": f"S{index:07d}",
+        },
+        "termsagreement": {"sp_terms_agree_date": "2026-01-01"},
+        "orderitems": [{"description": "1 Gbps Internet"}, {"description": "Bond fee"}],
+    }
+
+
+def sample_pc_customers(count: int, seed: int = 1) -> List[Dict]:
+    """
+    PowerCode customer records as returned by searchCustomers
+
+    Args:
+        count: Number of customers
+        seed: Random seed, so every run gets the same list
+
+    Returns:
+        List of customer dictionaries
+    """
+    rng = random.Random(seed)
+    cities = ["Bozeman", "Helena", "Billings", "Missoula", "Butte", "Great Falls"]
+    streets = ["Main Street", "North Willson Ave", "W Babcock St", "S 3rd Avenue", "Oak St."]
+    return [
+        {
+            "CustomerID": str(10000 + i),
+            "CompanyName": f"Customer{i} Person{rng.randint(1, 999)}",
+            "City": rng.choice(cities),
+            "Address1": f"{rng.randint(1, 9999)} {rng.choice(streets)}",
+            "ExtAccountID": f"X{i:07d}",
+        }
+        for i in range(count)
+    ]
+
+
+# ----------------------------------------------------------------------
+# Benchmark groups; each yields (name, benchmark) after its own setup
+# ----------------------------------------------------------------------
+def formatting_benchmarks(handler, sizes, workdir, log_mb) -> Iterator[Tuple[str, Bench]]:
+    import api_callback
+
+    utopia_customer = sample_utopia_customer()
+    pc_customer = handler.customer_to_pc(utopia_customer, "ORD0000001")
+    yield "customer_to_pc", timed(handler.customer_to_pc, utopia_customer, "ORD0000001")
+    yield "format_contact_info", timed(handler.format_contact_info, pc_customer)
+    yield "pretty_log_json", timed(api_callback.pretty_log_json, utopia_customer, "Customer data")
+    yield "get_ticket_description", timed(handler.get_ticket_description, pc_customer)
+
+
+@contextmanager
+def live_search_results(index, customers: List[Dict]):
+    """
+    Treat the customer index as stale and answer PowerCode searchCustomers from memory,
+    so the timing covers matching the results rather than the network
+    """
+    import powercode as PowerCode
+
+    original, max_age = PowerCode.search_powercode_customers, index.max_age
+    PowerCode.search_powercode_customers = lambda search_string: {"customers": customers}
+    index.max_age = 0
+    try:
+        yield
+    finally:
+        PowerCode.search_powercode_customers, index.max_age = original, max_age
+
+
+def duplicate_check_benchmarks(handler, sizes, workdir, log_mb) -> Iterator[Tuple[str, Bench]]:
+    index = handler.customer_index
+    for size in sizes:
+        customers = sample_pc_customers(size)
+        # A full refresh, so the index is fresh and answers on its own
+        index.refresh(lambda customers=customers: customers)
+
+        # Indexed customer, matched by name, city and address (no site ID)
+        target = customers[size // 2]
+        first, last = target["CompanyName"].split(" ", 1)
+        yield (f"check_customer_exists.index_hit[{size}]",
+               timed(handler.check_customer_exists, first, last, target["City"], target["Address1"]))
+
+        # New customer: a miss in the fresh index (the common path, no PowerCode call)
+        yield (f"check_customer_exists.index_miss[{size}]",
+               timed(handler.check_customer_exists, "Jane", "Roe", "Bozeman", "100 North Main Street", "SNEW"))
+
+        # Stale index: the live search decides, scanning a result of `size` customers.
+        # The last result has the same name and city at another address, so nothing matches.
+        live_result = customers + [{"CustomerID": "1", "CompanyName": "Jane Roe", "City": "Bozeman",
+                                    "Address1": "1 Elsewhere Rd"}]
+        check = timed(handler.check_customer_exists, "Jane", "Roe", "Bozeman", "100 North Main Street", "SNEW")
+
+        def live_scan(loops, check=check, live_result=live_result):
+            with live_search_results(index, live_result):
+                return check(loops)
+        yield f"check_customer_exists.live_scan[{size}]", live_scan
+
+
+# Failure types the app records, with a typical error message for each
+FAILURE_TYPES = {
+    "utopia_api_error": "Utopia API error: 502 Bad Gateway",
+    "powercode_creation_failed": "Failed to create customer in PowerCode. Check server logs for details.",
+    "powercode_post_creation_failed": "Customer 10042 created but post-creation steps failed: tags: tags partially failed",
+    "upstream_unavailable": "powercode is unavailable (circuit breaker open)",
+    "admin_creation_failed": "Failed to create customer in PowerCode. Check server logs for details.",
+}
+
+
+def populate_failures(tracker, count: int, seed: int = 2):
+    """
+    Bulk-load failure records spread over the last 60 days (10% resolved)
+
+    Args:
+        tracker: FailureTracker with the SQLite backend
+        count: Number of records
+        seed: Random seed
+    """
+    from failure_tracker import SQLiteFailureStore
+
+    rng = random.Random(seed)
+    types = list(FAILURE_TYPES)
+    now = datetime.now().astimezone()
+    rows = []
+    for i in range(count):
+        timestamp = (now - timedelta(minutes=rng.randint(0, 60 * 24 * 60))).isoformat()
+        resolved = i % 10 == 0
+        rows.append(SQLiteFailureStore._record_to_row({
+            "orderref": f"F{i:07d}",
+            "error_message": f"{FAILURE_TYPES[types[i % len(types)]]} (attempt {i % 3})",
+            "failure_type": types[i % len(types)],
+            "timestamp": timestamp,
+            "first_failure": timestamp,
+            "retry_count": i % 4,
+            "resolved": resolved,
+            "resolved_timestamp": timestamp if resolved else None,
+            "resolution_note": "bench" if resolved else None,
+            "customer_data": sample_utopia_customer(i)["customer"],
+        }))
+    columns = SQLiteFailureStore.COLUMNS
+    with tracker.store.transaction() as conn:
+        conn.execute("DELETE FROM failures")
+        conn.executemany(
+            f"INSERT INTO failures ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+        )
+
+
+def failure_tracker_benchmarks(handler, sizes, workdir, log_mb) -> Iterator[Tuple[str, Bench]]:
+    from failure_tracker import FailureTracker
+
+    for size in sizes:
+        tracker = FailureTracker(failure_file_path=os.path.join(workdir, f"failures_{size}.json"),
+                                 db_path=os.path.join(workdir, f"failures_{size}.db"))
+        populate_failures(tracker, size)
+        existing = f"F{size // 2:07d}"
+        counter = iter(range(10 ** 9))
+
+        def record_new(loops, tracker=tracker, counter=counter):
+            refs = [f"N{next(counter):09d}" for _ in range(loops)]
+            start = time.perf_counter()
+            for ref in refs:
+                tracker.record_failure(ref, "bench", "powercode_creation_failed", {"firstname": "Jane"})
+            elapsed = time.perf_counter() - start
+            tracker.store.delete(refs)
+            return elapsed
+
+        def remove(loops, tracker=tracker, counter=counter):
+            refs = [f"R{next(counter):09d}" for _ in range(loops)]
+            for ref in refs:
+                tracker.record_failure(ref, "bench", "powercode_creation_failed")
+            start = time.perf_counter()
+            for ref in refs:
+                tracker.remove_failure(ref)
+            return time.perf_counter() - start
+
+        def mark_resolved(loops, tracker=tracker, counter=counter):
+            refs = [f"M{next(counter):09d}" for _ in range(loops)]
+            for ref in refs:
+                tracker.record_failure(ref, "bench", "powercode_creation_failed")
+            start = time.perf_counter()
+            for ref in refs:
+                tracker.mark_resolved(ref, "bench")
+            elapsed = time.perf_counter() - start
+            tracker.store.delete(refs)
+            return elapsed
+
+        yield f"failure_tracker.record_failure[{size}]", record_new
+        yield f"failure_tracker.record_repeat[{size}]", timed(tracker.record_failure, existing, "again", "powercode_creation_failed")
+        yield f"failure_tracker.get_failure[{size}]", timed(tracker.get_failure, existing)
+        yield f"failure_tracker.get_failures[{size}]", timed(tracker.get_failures)
+        yield f"failure_tracker.get_failure_list[{size}]", timed(tracker.get_failure_list)
+        yield f"failure_tracker.query_failures[{size}]", timed(tracker.query_failures)
+        yield (f"failure_tracker.query_failures.filtered[{size}]",
+               timed(tracker.query_failures, failure_type="utopia_api_error", min_retries=2, sort="retry_count"))
+        yield f"failure_tracker.query_failures.search[{size}]", timed(tracker.query_failures, search="Roe4242")
+        yield f"failure_tracker.mark_resolved[{size}]", mark_resolved
+        yield f"failure_tracker.remove_failure[{size}]", remove
+        yield f"failure_tracker.get_failure_stats[{size}]", timed(tracker.get_failure_stats)
+        yield f"failure_tracker.get_failure_trends[{size}]", timed(tracker.get_failure_trends, "hour", 7)
+        yield f"failure_tracker.cleanup_old_resolved[{size}]", timed(tracker.cleanup_old_resolved)
+
+
+def write_log_file(path: str, size_mb: int, seed: int = 3):
+    """
+    Write a text-format application log of about size_mb megabytes, spread over 7 days,
+    with some warnings, errors and tracebacks
+
+    Args:
+        path: Log file path
+        size_mb: Target size in megabytes
+        seed: Random seed
+    """
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    start = datetime.now() - timedelta(days=7)
+    # One entry per ~0.9s covers 7 days at 100 MB
+    step = timedelta(days=7) / max(target // 140, 1)
+    written = 0
+    moment = start
+    with open(path, "w", encoding="utf-8") as f:
+        chunk = []
+        while written < target:
+            moment += step
+            stamp = moment.strftime("%Y-%m-%d %H:%M:%S,") + f"{moment.microsecond // 1000:03d}"
+            roll = rng.random()
+            if roll < 0.002:
+                entry = (f"{stamp} - ERROR - [orderref=ORD{rng.randint(1, 10 ** 6):07d}] Error in handle_new_order\n"
+                         "Traceback (most recent call last):\n"
+                         '  File "api_callback.py", line 1963, in handle_new_order\n'
+                         "requests.exceptions.ReadTimeout: HTTPSConnectionPool read timed out\n")
+            elif roll < 0.02:
+                entry = f"{stamp} - WARNING - [orderref=ORD{rng.randint(1, 10 ** 6):07d}] Customer index lookup slow\n"
+            else:
+                entry = (f"{stamp} - INFO - [orderref=ORD{rng.randint(1, 10 ** 6):07d} stage=duplicate_check] "
+                         f"Searching for existing customer: Customer{rng.randint(1, 99999)} in Bozeman\n")
+            chunk.append(entry)
+            written += len(entry)
+            if len(chunk) >= 10000:
+                f.write("".join(chunk))
+                chunk = []
+        f.write("".join(chunk))
+
+
+def read_logs_benchmarks(handler, sizes, workdir, log_mb) -> Iterator[Tuple[str, Bench]]:
+    import config
+
+    path = os.path.join(workdir, config.LOG_FILE)
+    if not os.path.exists(path) or os.path.getsize(path) < log_mb * 1024 * 1024:
+        print(f"Writing a {log_mb} MB log file to {path}", file=sys.stderr)
+        write_log_file(path, log_mb)
+
+    client = handler.app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+        session["username"] = "bench"
+    since = (datetime.now() - timedelta(days=3)).strftime("%Y-%m-%dT%H:%M")
+    until = (datetime.now() - timedelta(days=3) + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M")
+
+    def read(query):
+        response = client.get("/api/logs/read", query_string=query)
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/logs/read failed: {response.status_code} {response.get_data(as_text=True)[:200]}")
+
+    label = f"{log_mb}MB"
+    yield f"read_logs.tail[{label}]", timed(read, {"lines": 100})
+    yield f"read_logs.tail_1000[{label}]", timed(read, {"lines": 1000})
+    yield f"read_logs.level_error[{label}]", timed(read, {"lines": 100, "level": "ERROR"})
+    yield f"read_logs.search_miss[{label}]", timed(read, {"lines": 100, "search": "no-such-text"})
+    yield f"read_logs.time_window[{label}]", timed(read, {"lines": 100, "since": since, "until": until})
+
+
+GROUPS = {
+    "formatting": formatting_benchmarks,
+    "duplicate_check": duplicate_check_benchmarks,
+    "failure_tracker": failure_tracker_benchmarks,
+    "read_logs": read_logs_benchmarks,
+}
+
+
+# ----------------------------------------------------------------------
+# Baselines
+# ----------------------------------------------------------------------
+def load_baselines(path: str = BASELINE_FILE) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baselines(results: Dict[str, Dict], path: str = BASELINE_FILE):
+    """
+    Merge results into the baseline file (benchmarks not run keep their old baseline)
+
+    Args:
+        results: name -> measure() result
+        path: Baseline file
+    """
+    baselines = load_baselines(path)
+    stored = baselines.get("results", {})
+    stored.update({name: {"seconds": result["min"]} for name, result in results.items()})
+    baselines = {
+        "machine": f"{platform.system()} {platform.machine()}, Python {platform.python_version()}",
+        "updated": datetime.now().astimezone().isoformat(timespec="seconds"),
+        "results": dict(sorted(stored.items())),
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(baselines, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def compare(results: Dict[str, Dict], baselines: Dict, threshold: float) -> List[Dict]:
+    """
+    Compare results with the baselines
+
+    Args:
+        results: name -> measure() result
+        baselines: Loaded baseline file
+        threshold: Allowed slowdown (0.25 = 25% slower than the baseline)
+
+    Returns:
+        One row per benchmark with baseline seconds, ratio and regressed flag
+    """
+    stored = baselines.get("results", {})
+    rows = []
+    for name, result in results.items():
+        baseline = stored.get(name, {}).get("seconds")
+        ratio = result["min"] / baseline if baseline else None
+        rows.append({
+            "name": name,
+            "seconds": result["min"],
+            "median": result["median"],
+            "baseline": baseline,
+            "ratio": ratio,
+            "regressed": ratio is not None and ratio > 1 + threshold,
+        })
+    return rows
+
+
+def format_seconds(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    if value < 1e-3:
+        return f"{value * 1e6:.1f}us"
+    if value < 1:
+        return f"{value * 1e3:.2f}ms"
+    return f"{value:.2f}s"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks for UAC's in-process hot paths")
+    parser.add_argument("--group", action="append", choices=sorted(GROUPS),
+                        help="Only run this group (repeatable; default all)")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Customer list / failure record counts (default 1000,10000,100000)")
+    parser.add_argument("--log-mb", type=int, default=DEFAULT_LOG_MB, help="Size of the generated log file")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timed repeat")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repeats per benchmark")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if a benchmark is slower than its baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown for --check (default 0.25 = 25%%)")
+    parser.add_argument("--save", action="store_true", help="Store the results as the new baselines")
+    parser.add_argument("--baseline-file", default=BASELINE_FILE, help="Baseline file")
+    parser.add_argument("--workdir", help="Scratch directory (default: a temp dir; reuse it to keep the log file)")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    baseline_file = os.path.abspath(args.baseline_file)
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="uac-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    prepare_environment(workdir)
+    # The application logs to app_main.log in the scratch directory
+    handler = build_handler()
+
+    baselines = load_baselines(baseline_file)
+    results = {}
+    for group in args.group or GROUPS:
+        for name, bench in GROUPS[group](handler, sizes, workdir, args.log_mb):
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = measure(bench, min_time=args.min_time, repeat=args.repeat)
+            if args.check and compare({name: results[name]}, baselines, args.threshold)[0]["regressed"]:
+                # Measure once more before calling it a regression; keep the faster run
+                retry = measure(bench, min_time=args.min_time, repeat=args.repeat)
+                results[name] = min(results[name], retry, key=lambda result: result["min"])
+            if not args.json:
+                print(f"{name:<55} {format_seconds(results[name]['min']):>10} "
+                      f"(median {format_seconds(results[name]['median'])}, {results[name]['loops']} loops)",
+                      flush=True)
+
+    rows = compare(results, baselines, args.threshold)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    elif any(row["baseline"] for row in rows):
+        print(f"\n{'benchmark':<55} {'now':>10} {'baseline':>10} {'ratio':>7}")
+        for row in rows:
+            ratio = f"{row['ratio']:.2f}x" if row["ratio"] is not None else "new"
+            flag = "  SLOWER" if row["regressed"] else ""
+            print(f"{row['name']:<55} {format_seconds(row['seconds']):>10} "
+                  f"{format_seconds(row['baseline']):>10} {ratio:>7}{flag}")
+
+    if args.save:
+        save_baselines(results, baseline_file)
+        print(f"\nSaved {len(results)} baselines to {baseline_file}")
+
+    regressions = [row for row in rows if row["regressed"]]
+    if args.check and regressions:
+        print(f"\n{len(regressions)} benchmark(s) more than {args.threshold:.0%} slower than baseline: "
+              + ", ".join(row["name"] for row in regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,461 @@
+"""
+Local stand-ins for the Utopia and PowerCode APIs, used by the load tests.
+
+This module handles:
+- Utopia /spquery/* (contractlookup returns a generated customer for any orderref)
+- PowerCode API actions (createCustomer, searchCustomers, createTicket, ...) and the
+  UAPI tag/search endpoints, on the same port
+- A minimal SMTP sink, so notification emails have somewhere to go
+- Latency, jitter and error injection, per upstream
+- Call counts per upstream and endpoint, served at GET /_stats (POST /_reset clears them)
+
+Point the app at it with:
+    UTOPIA_URL_ENDPOINT=http://127.0.0.1:8099
+    PC_URL_API=http://127.0.0.1:8099/api
+    PC_URL_UAPI=http://127.0.0.1:8099/uapi
+
+Run from the command line:
+    python -m benchmarks.mock_upstreams --port 8099 --latency 0.05 --error-rate 0.02
+"""
+
+import json
+import time
+import random
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+UPSTREAMS = ("utopia", "powercode")
+
+# Status code meaning "close the connection without answering"
+DROP_CONNECTION = 0
+
+
+class MockUpstreams:
+    """
+    Utopia and PowerCode stand-ins served from one threaded HTTP server.
+
+    Each upstream has its own profile: latency (seconds), jitter (seconds, uniform, added
+    to the latency), error_rate (0-1) and error_status (HTTP status of injected errors,
+    or 0 to drop the connection).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8099, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 503,
+                 geocode_rate: float = 0.0, duplicate_rate: float = 0.0, customers: int = 0,
+                 smtp_port: Optional[int] = None, seed: Optional[int] = None):
+        """
+        Args:
+            host: Interface to listen on
+            port: HTTP port (0 picks a free one)
+            latency: Default response delay for both upstreams, in seconds
+            jitter: Default random extra delay (0 to jitter seconds)
+            error_rate: Default fraction of calls answered with an injected error
+            error_status: HTTP status of injected errors (0 drops the connection)
+            geocode_rate: Fraction of createCustomer calls failing geocoding (statusCode 23)
+            duplicate_rate: Fraction of orders whose customer already exists in PowerCode
+            customers: Size of the PowerCode customer list (searchCustomers with "")
+            smtp_port: Also run an SMTP sink on this port (0 picks a free one, None = off)
+            seed: Random seed, for repeatable error injection
+        """
+        self.host = host
+        self.port = port
+        self.smtp_port = smtp_port
+        self.profiles = {
+            name: {"latency": latency, "jitter": jitter, "error_rate": error_rate, "error_status": error_status}
+            for name in UPSTREAMS
+        }
+        self.geocode_rate = geocode_rate
+        self.duplicate_rate = duplicate_rate
+        self.customer_list = [
+            {
+                "CustomerID": str(100000 + i),
+                "CompanyName": f"Existing Customer{i}",
+                "City": "Bozeman",
+                "Address1": f"{i + 1} Existing Ave",
+                "ExtAccountID": f"EX{i:06d}",
+            }
+            for i in range(customers)
+        ]
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._errors: Dict[str, Dict[str, int]] = {}
+        self._emails = 0
+        # Orders handed out by contractlookup, by customer name, for duplicate injection
+        self._orders: Dict[str, Dict] = {}
+        self._next_customer_id = 500000
+
+        self._server = None
+        self._smtp_server = None
+        self._threads = []
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self):
+        """Start serving in background threads"""
+        mock = self
+
+        class Handler(_UpstreamHandler):
+            upstreams = mock
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._threads.append(threading.Thread(target=self._server.serve_forever, name="mock-upstreams", daemon=True))
+
+        if self.smtp_port is not None:
+            class SMTPHandler(_SMTPSinkHandler):
+                upstreams = mock
+
+            self._smtp_server = socketserver.ThreadingTCPServer((self.host, self.smtp_port), SMTPHandler)
+            self._smtp_server.daemon_threads = True
+            self.smtp_port = self._smtp_server.server_address[1]
+            self._threads.append(threading.Thread(target=self._smtp_server.serve_forever, name="mock-smtp", daemon=True))
+
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Mock upstreams listening on {self.url}")
+        return self
+
+    def stop(self):
+        """Stop the servers"""
+        for server in (self._server, self._smtp_server):
+            if server:
+                server.shutdown()
+                server.server_close()
+        self._threads = []
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def app_env(self) -> Dict[str, str]:
+        """
+        Environment variables that point the app at these stand-ins
+
+        Returns:
+            Dictionary of variable -> value
+        """
+        env = {
+            "UTOPIA_URL_ENDPOINT": self.url,
+            "PC_URL": self.url,
+            "PC_URL_API": f"{self.url}/api",
+            "PC_URL_UAPI": f"{self.url}/uapi",
+            "PC_VERIFY_SSL": "false",
+        }
+        if self._smtp_server:
+            env.update({"MAIL_SERVER": self.host, "MAIL_PORT": str(self.smtp_port)})
+        return env
+
+    # ------------------------------------------------------------------
+    # Counters
+    # ------------------------------------------------------------------
+    def stats(self) -> Dict:
+        """
+        Calls served so far
+
+        Returns:
+            Dictionary with calls and injected errors per upstream and endpoint, and emails received
+        """
+        with self._lock:
+            return {
+                "calls": {upstream: dict(counts) for upstream, counts in self._counts.items()},
+                "errors": {upstream: dict(counts) for upstream, counts in self._errors.items()},
+                "emails": self._emails,
+            }
+
+    def reset(self):
+        """Clear the call counters"""
+        with self._lock:
+            self._counts = {}
+            self._errors = {}
+            self._emails = 0
+
+    def _count(self, upstream: str, endpoint: str, error: bool = False):
+        with self._lock:
+            counts = self._counts.setdefault(upstream, {})
+            counts[endpoint] = counts.get(endpoint, 0) + 1
+            if error:
+                errors = self._errors.setdefault(upstream, {})
+                errors[endpoint] = errors.get(endpoint, 0) + 1
+
+    def _count_email(self):
+        with self._lock:
+            self._emails += 1
+
+    def _chance(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def _delay(self, upstream: str) -> float:
+        profile = self.profiles[upstream]
+        with self._lock:
+            return profile["latency"] + self._random.uniform(0, profile["jitter"])
+
+    # ------------------------------------------------------------------
+    # Canned responses
+    # ------------------------------------------------------------------
+    def utopia_response(self, endpoint: str, body: Dict) -> Dict:
+        """
+        Build the Utopia /spquery/<endpoint> response
+
+        Args:
+            endpoint: Last path segment (contractlookup, orders, ...)
+            body: Decoded JSON request body
+
+        Returns:
+            Response body
+        """
+        if endpoint == "contractlookup":
+            orderref = str(body.get("orderref", ""))
+            suffix = "".join(ch for ch in orderref if ch.isalnum())[-12:] or "0"
+            order = {
+                "customer": {
+                    "firstname": "Load",
+                    "lastname": f"Test{suffix}",
+                    "email": f"load.{suffix.lower()}@example.com",
+                    "phone": "4065550100",
+                },
+                "address": {
+                    "address": f"{sum(map(ord, suffix)) % 9000 + 100} Main St",
+                    "apt": "",
+                    "city": "Bozeman",
+                    "state": "Montana",
+                    "zip": "59715",
+                    "siteid": f"S{suffix}",
+                },
+                "termsagreement": {"sp_terms_agree_date": "2026-01-01"},
+                "orderitems": [{"description": "1 Gbps Internet"}],
+            }
+            with self._lock:
+                self._orders[f"Load Test{suffix}".lower()] = order
+            return order
+        if endpoint == "orders":
+            return {"result": []}
+        return {"result": []}
+
+    def powercode_response(self, action: str, form: Dict[str, str]) -> Dict:
+        """
+        Build the PowerCode API response for an action
+
+        Args:
+            action: The 'action' form field
+            form: Decoded form fields
+
+        Returns:
+            Response body
+        """
+        if action == "searchCustomers":
+            search = form.get("searchString", "")
+            if not search:
+                return {"customers": self.customer_list}
+            with self._lock:
+                order = self._orders.get(search.lower())
+            if order and self._chance(self.duplicate_rate):
+                return {"customers": [{
+                    "CustomerID": "999999",
+                    "CompanyName": search,
+                    "City": order["address"]["city"],
+                    "Address1": order["address"]["address"],
+                }]}
+            return {"customers": []}
+        if action == "createCustomer":
+            if form.get("physicalAutomaticallyGeocode") == "1" and self._chance(self.geocode_rate):
+                return {"statusCode": 23, "message": "Unable to geocode address"}
+            with self._lock:
+                self._next_customer_id += 1
+                return {"statusCode": 0, "customerID": str(self._next_customer_id)}
+        if action == "readCustomer":
+            return {"statusCode": 1, "message": "Customer not found"}
+        if action == "createTicket":
+            return {"statusCode": 0, "message": "Ticket created", "ticketID": "1"}
+        return {"statusCode": 0, "message": "OK"}
+
+
+class _UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    upstreams: MockUpstreams = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_DELETE(self):
+        self._handle()
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        mock = self.upstreams
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length).decode("utf-8", errors="replace") if length else ""
+        path = urlparse(self.path).path
+
+        if path == "/_stats":
+            return self._send_json(200, mock.stats())
+        if path == "/_reset":
+            mock.reset()
+            return self._send_json(200, {"success": True})
+
+        if path.startswith("/spquery/"):
+            upstream, endpoint = "utopia", path.rsplit("/", 1)[-1]
+        elif path.startswith("/api"):
+            upstream, endpoint = "powercode", parse_qs(raw).get("action", [""])[0] or "unknown"
+        elif path.startswith("/uapi/"):
+            upstream, endpoint = "powercode", "uapi/" + path[len("/uapi/"):]
+        else:
+            return self._send_json(404, {"error": f"Unknown path {path}"})
+
+        time.sleep(mock._delay(upstream))
+
+        profile = mock.profiles[upstream]
+        if mock._chance(profile["error_rate"]):
+            mock._count(upstream, endpoint, error=True)
+            if profile["error_status"] == DROP_CONNECTION:
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            return self._send_json(profile["error_status"], {"error": "Injected error"})
+        mock._count(upstream, endpoint)
+
+        if upstream == "utopia":
+            try:
+                body = json.loads(raw or "{}")
+            except ValueError:
+                body = {}
+            return self._send_json(200, mock.utopia_response(endpoint, body))
+        if endpoint.startswith("uapi/"):
+            return self._send_json(200, {"Success": True, "Response": [{"TagID": 1, "TagName": "Load Test"}]})
+        form = {key: values[0] for key, values in parse_qs(raw).items()}
+        return self._send_json(200, mock.powercode_response(endpoint, form))
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Accepts any message and throws it away (enough SMTP for smtplib)"""
+    upstreams: MockUpstreams = None
+
+    def _reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+
+    def handle(self):
+        self._reply("220 mock-smtp ready")
+        in_data = False
+        for raw in self.rfile:
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            if in_data:
+                if line == ".":
+                    in_data = False
+                    self.upstreams._count_email()
+                    self._reply("250 OK queued")
+                continue
+            command = line[:4].upper()
+            if command == "EHLO":
+                self._reply("250-mock-smtp")
+                self._reply("250 8BITMIME")
+            elif command == "DATA":
+                in_data = True
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("250 OK")
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    """
+    Add the latency/error injection options shared by the mock and the load test CLI
+
+    Args:
+        parser: Parser to extend
+    """
+    group = parser.add_argument_group("mock upstreams")
+    group.add_argument("--latency", type=float, default=0.05, help="Upstream response delay in seconds (default 0.05)")
+    group.add_argument("--jitter", type=float, default=0.0, help="Random extra delay, 0 to N seconds")
+    group.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with an error")
+    group.add_argument("--error-status", type=int, default=503,
+                       help="HTTP status of injected errors (0 drops the connection)")
+    for upstream in UPSTREAMS:
+        group.add_argument(f"--{upstream}-latency", type=float, help=f"Override --latency for {upstream}")
+        group.add_argument(f"--{upstream}-error-rate", type=float, help=f"Override --error-rate for {upstream}")
+    group.add_argument("--geocode-rate", type=float, default=0.0,
+                       help="Fraction of createCustomer calls that fail geocoding")
+    group.add_argument("--duplicate-rate", type=float, default=0.0,
+                       help="Fraction of orders whose customer already exists in PowerCode")
+    group.add_argument("--customers", type=int, default=0, help="Size of the PowerCode customer list")
+    group.add_argument("--seed", type=int, help="Random seed for error injection")
+
+
+def from_args(args, host: str = "127.0.0.1", port: int = 0, smtp_port: Optional[int] = None) -> MockUpstreams:
+    """
+    Build a MockUpstreams from parsed add_profile_arguments options
+
+    Args:
+        args: argparse namespace
+        host: Interface to listen on
+        port: HTTP port (0 picks a free one)
+        smtp_port: SMTP sink port (None = no sink)
+
+    Returns:
+        MockUpstreams (not started)
+    """
+    mock = MockUpstreams(
+        host=host, port=port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        error_status=args.error_status, geocode_rate=args.geocode_rate, duplicate_rate=args.duplicate_rate,
+        customers=args.customers, smtp_port=smtp_port, seed=args.seed
+    )
+    for upstream in UPSTREAMS:
+        latency = getattr(args, f"{upstream}_latency")
+        error_rate = getattr(args, f"{upstream}_error_rate")
+        if latency is not None:
+            mock.profiles[upstream]["latency"] = latency
+        if error_rate is not None:
+            mock.profiles[upstream]["error_rate"] = error_rate
+    return mock
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve local stand-ins for the Utopia and PowerCode APIs")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8099, help="HTTP port")
+    parser.add_argument("--smtp-port", type=int, help="Also run an SMTP sink on this port")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    mock = from_args(args, host=args.host, port=args.port, smtp_port=args.smtp_port).start()
+    print(f"Mock upstreams on {mock.url}. Point the app at them with:")
+    for key, value in mock.app_env().items():
+        print(f"  {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
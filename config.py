@@ -3,9 +3,9 @@ Configuration module for UAC-Utopia Account Creation
 Loads all configuration from environment variables (.env file)
 """
 import os
-import json
 import bcrypt
 import warnings
+import threading
 
 from dotenv import load_dotenv
 
@@ -45,6 +45,10 @@ PC_addressRangev4 = int(os.getenv('PC_ADDRESS_RANGE_V4', '10228'))
 PC_CUST_TAGS = os.getenv("PC_CUST_TAGS")
 
 
+# Max concurrent PowerCode calls for post-creation steps (plans, ticket, tags)
+PC_STEP_WORKERS = int(os.getenv('PC_STEP_WORKERS', '4'))
+
+
 # Service Plan IDs (PowerCode)
 SERVICE_PLAN_1GBPS_ID = int(os.getenv('SERVICE_PLAN_1GBPS_ID', '164'))
 SERVICE_PLAN_250MBPS_ID = int(os.getenv('SERVICE_PLAN_250MBPS_ID', '163'))
@@ -63,6 +67,61 @@ UTOPIA_Contract_Lookup = '/spquery/contractlookup'
 UTOPIA_Contract_Download = '/spquery/contractdownload'
 UTOPIA_APView = "/spquery/apview"
 
+# ============================================================================
+# Upstream HTTP Client Settings
+# ============================================================================
+# Pooled keep-alive sessions are shared per upstream within each worker
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '4'))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '10'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+
+# ============================================================================
+# Upstream Rate Limits, Retries and Circuit Breaker
+# ============================================================================
+# Every Utopia/PowerCode call goes through resilience.py (state shared in STATE_DB_FILE)
+UPSTREAM_RESILIENCE_ENABLED = os.getenv('UPSTREAM_RESILIENCE_ENABLED', 'true').lower() == 'true'
+# Requests per second per upstream or upstream:endpoint (PowerCode action or Utopia path), e.g.
+# "utopia=10,powercode=5,powercode:createCustomer=1"; endpoints without a limit are not throttled
+UPSTREAM_RATE_LIMITS = os.getenv('UPSTREAM_RATE_LIMITS', 'utopia=10,powercode=10')
+# Longest a call waits for its rate limit before failing
+UPSTREAM_RATE_MAX_WAIT = float(os.getenv('UPSTREAM_RATE_MAX_WAIT', '10'))
+# Transient failures are retried with jittered backoff (reads only, unless the request never connected)
+UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', '2'))
+UPSTREAM_RETRY_BACKOFF = float(os.getenv('UPSTREAM_RETRY_BACKOFF', '0.5'))
+UPSTREAM_RETRY_MAX_BACKOFF = float(os.getenv('UPSTREAM_RETRY_MAX_BACKOFF', '8'))
+# After this many consecutive failures an upstream's calls fail fast for UPSTREAM_BREAKER_COOLDOWN
+# seconds; the cooldown doubles (up to UPSTREAM_BREAKER_MAX_COOLDOWN) each time a trial call fails
+UPSTREAM_BREAKER_THRESHOLD = int(os.getenv('UPSTREAM_BREAKER_THRESHOLD', '5'))
+UPSTREAM_BREAKER_COOLDOWN = float(os.getenv('UPSTREAM_BREAKER_COOLDOWN', '30'))
+UPSTREAM_BREAKER_MAX_COOLDOWN = float(os.getenv('UPSTREAM_BREAKER_MAX_COOLDOWN', '600'))
+
+# ============================================================================
+# Metrics
+# ============================================================================
+# Stage and upstream call timings, aggregated across workers in STATE_DB_FILE and served
+# at /metrics (Prometheus text format) and on the /admin/metrics dashboard
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+# Seconds between flushes of each worker's buffered observations
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '10'))
+# Bearer token for scraping /metrics without a login session (empty = session only)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# ============================================================================
+# Login Throttling
+# ============================================================================
+# Failed logins are counted per client IP and per username over LOGIN_THROTTLE_WINDOW seconds
+# (state shared in STATE_DB_FILE); a key that reaches its limit is locked out for
+# LOGIN_LOCKOUT_BASE seconds, doubling with each further lockout up to LOGIN_LOCKOUT_MAX
+LOGIN_THROTTLE_ENABLED = os.getenv('LOGIN_THROTTLE_ENABLED', 'true').lower() == 'true'
+LOGIN_THROTTLE_WINDOW = float(os.getenv('LOGIN_THROTTLE_WINDOW', '300'))
+LOGIN_MAX_FAILURES_PER_USER = int(os.getenv('LOGIN_MAX_FAILURES_PER_USER', '5'))
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv('LOGIN_MAX_FAILURES_PER_IP', '20'))
+LOGIN_LOCKOUT_BASE = float(os.getenv('LOGIN_LOCKOUT_BASE', '30'))
+LOGIN_LOCKOUT_MAX = float(os.getenv('LOGIN_LOCKOUT_MAX', '3600'))
+# Password checks (bcrypt) running at once across all workers; further logins get a 429 (0 = no cap)
+LOGIN_VERIFY_CONCURRENCY = int(os.getenv('LOGIN_VERIFY_CONCURRENCY', '2'))
+
 # ============================================================================
 # SSL Verification Settings
 # ============================================================================
@@ -75,6 +134,15 @@ MAIL_SERVER = os.getenv('MAIL_SERVER')
 MAIL_PORT = int(os.getenv('MAIL_PORT', 25))
 EMAIL_SENDER = os.getenv('EMAIL_SENDER')
 EMAIL_RECIPIENTS = os.getenv('EMAIL_RECIPIENTS', '').split(',')
+# Emails are queued in STATE_DB_FILE and sent by a background thread over one SMTP connection
+EMAIL_OUTBOX_ENABLED = os.getenv('EMAIL_OUTBOX_ENABLED', 'true').lower() == 'true'
+# Seconds to collect similar notices (duplicates, 'No valid records') into one digest email; 0 disables
+EMAIL_DIGEST_WINDOW = int(os.getenv('EMAIL_DIGEST_WINDOW', '300'))
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '8'))
+EMAIL_RETRY_BASE = int(os.getenv('EMAIL_RETRY_BASE', '30'))
+MAIL_TIMEOUT = int(os.getenv('MAIL_TIMEOUT', '30'))
+# Sent emails (which contain customer details) are deleted from the outbox after this many days (0 keeps them)
+EMAIL_OUTBOX_RETENTION_DAYS = float(os.getenv('EMAIL_OUTBOX_RETENTION_DAYS', '14'))
 
 # ============================================================================
 # Customer Portal Configuration
@@ -92,6 +160,108 @@ TICKET_TEMPLATE_META_FILE = os.getenv('TICKET_TEMPLATE_META_FILE', 'new_desc.txt
 # Logging Configuration
 # ============================================================================
 LOG_FILE = 'app_main.log'
+# 'text' (default) or 'json' (one JSON object per line with orderref/stage/duration_ms fields)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+# Write log records from a background thread so requests never wait on log file I/O
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'true').lower() == 'true'
+# Rotation: the active log is rotated at LOG_MAX_BYTES or after LOG_ROTATE_HOURS, old
+# segments are gzipped with a time index, and LOG_BACKUP_COUNT segments are kept
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(20 * 1024 * 1024)))
+LOG_ROTATE_HOURS = float(os.getenv('LOG_ROTATE_HOURS', '24'))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '30'))
+# Live log stream (/api/logs/stream): each stream is closed after LOG_STREAM_MAX_SECONDS
+# (below the uWSGI harakiri limit) and the browser reconnects from where it left off
+LOG_STREAM_MAX_SECONDS = float(os.getenv('LOG_STREAM_MAX_SECONDS', '25'))
+LOG_STREAM_POLL_INTERVAL = float(os.getenv('LOG_STREAM_POLL_INTERVAL', '1'))
+# A client further behind than this skips ahead instead of being sent everything
+LOG_STREAM_MAX_LAG_BYTES = int(os.getenv('LOG_STREAM_MAX_LAG_BYTES', str(4 * 1024 * 1024)))
+# Open streams per worker process; further ones get 503 and the viewer polls instead.
+# Keep below the uWSGI `threads` setting so other requests still get a thread
+LOG_STREAM_MAX_CONCURRENT = max(1, int(os.getenv('LOG_STREAM_MAX_CONCURRENT', '1')))
+
+# ============================================================================
+# Local State Storage
+# ============================================================================
+# SQLite database shared by all uWSGI workers for queues and other local state
+STATE_DB_FILE = os.getenv('STATE_DB_FILE', 'uac_state.db')
+
+# ============================================================================
+# Utopia Lookup Cache
+# ============================================================================
+# Contract lookups are cached in STATE_DB_FILE for UTOPIA_CACHE_TTL seconds (0 disables)
+UTOPIA_CACHE_TTL = int(os.getenv('UTOPIA_CACHE_TTL', '300'))
+UTOPIA_CACHE_MAX_ENTRIES = int(os.getenv('UTOPIA_CACHE_MAX_ENTRIES', '1000'))
+
+# ============================================================================
+# Admin Panel Results
+# ============================================================================
+# Output of PowerCode/Utopia panel actions is kept in STATE_DB_FILE under a result ID
+# (only the ID goes into the session cookie) and shown RESULT_PAGE_LINES lines at a time
+RESULT_STORE_TTL = int(os.getenv('RESULT_STORE_TTL', '3600'))
+RESULT_STORE_MAX_ENTRIES = int(os.getenv('RESULT_STORE_MAX_ENTRIES', '200'))
+RESULT_STORE_MAX_MB = float(os.getenv('RESULT_STORE_MAX_MB', '50'))
+RESULT_PAGE_LINES = int(os.getenv('RESULT_PAGE_LINES', '200'))
+
+# ============================================================================
+# PowerCode Customer Index
+# ============================================================================
+# Local copy of PowerCode customers (in STATE_DB_FILE) used for duplicate checks before
+# falling back to a live search; refreshed in bulk every N hours by one worker (0 disables)
+CUSTOMER_INDEX_REFRESH_HOURS = float(os.getenv('CUSTOMER_INDEX_REFRESH_HOURS', '6'))
+# Within this many hours of a full refresh the index answers duplicate checks on its own;
+# an older (or never refreshed) index falls back to the live search (0 = always search)
+CUSTOMER_INDEX_MAX_AGE_HOURS = float(os.getenv('CUSTOMER_INDEX_MAX_AGE_HOURS', '12'))
+
+# ============================================================================
+# Automatic Failure Retries
+# ============================================================================
+# Unresolved failures of these types are retried with exponential backoff and jitter
+# (FAILURE_RETRY_BASE seconds, doubling per retry up to FAILURE_RETRY_MAX_DELAY)
+FAILURE_RETRY_ENABLED = os.getenv('FAILURE_RETRY_ENABLED', 'true').lower() == 'true'
+FAILURE_RETRY_TYPES = [t.strip() for t in os.getenv(
+    'FAILURE_RETRY_TYPES',
+    'powercode_api_error,powercode_creation_failed,utopia_api_error,upstream_unavailable').split(',') if t.strip()]
+FAILURE_RETRY_MAX_ATTEMPTS = int(os.getenv('FAILURE_RETRY_MAX_ATTEMPTS', '5'))
+FAILURE_RETRY_BASE = float(os.getenv('FAILURE_RETRY_BASE', '300'))
+FAILURE_RETRY_MAX_DELAY = float(os.getenv('FAILURE_RETRY_MAX_DELAY', str(6 * 3600)))
+# Retries running at the same time across all workers
+FAILURE_RETRY_CONCURRENCY = int(os.getenv('FAILURE_RETRY_CONCURRENCY', '1'))
+
+# ============================================================================
+# Order Backfill / Reconciliation
+# ============================================================================
+# Recent Utopia orders (getOrders per status, getProjects per status ID) are compared with
+# PowerCode by siteid and missing customers are created (python order_backfill.py, /api/backfill/run)
+BACKFILL_STATUSES = [s.strip() for s in os.getenv('BACKFILL_STATUSES', 'new').split(',') if s.strip()]
+BACKFILL_PROJECT_STATUSES = [s.strip() for s in os.getenv('BACKFILL_PROJECT_STATUSES', '').split(',') if s.strip()]
+BACKFILL_DAYS = int(os.getenv('BACKFILL_DAYS', '14'))
+BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', '2'))
+# Orders started per second across all backfill workers (0 = no limit)
+BACKFILL_RATE = float(os.getenv('BACKFILL_RATE', '1'))
+# Hours between scheduled runs (0 disables); scheduled runs only report unless BACKFILL_SCHEDULED_DRY_RUN=false
+BACKFILL_INTERVAL_HOURS = float(os.getenv('BACKFILL_INTERVAL_HOURS', '0'))
+BACKFILL_SCHEDULED_DRY_RUN = os.getenv('BACKFILL_SCHEDULED_DRY_RUN', 'true').lower() == 'true'
+
+# ============================================================================
+# Failure Tracker Configuration
+# ============================================================================
+# 'sqlite' (default) or 'json' (legacy single-file store)
+FAILURE_STORE_BACKEND = os.getenv('FAILURE_STORE_BACKEND', 'sqlite')
+FAILURE_DB_FILE = os.getenv('FAILURE_DB_FILE', 'failed_orders.db')
+# Legacy JSON file; imported once into SQLite when the sqlite backend is used
+FAILURE_JSON_FILE = os.getenv('FAILURE_JSON_FILE', 'failed_orders.json')
+
+# ============================================================================
+# Order Queue Configuration
+# ============================================================================
+# Webhook orders are queued and processed by background worker threads
+ORDER_QUEUE_WORKERS = int(os.getenv('ORDER_QUEUE_WORKERS', '2'))
+ORDER_QUEUE_POLL_INTERVAL = float(os.getenv('ORDER_QUEUE_POLL_INTERVAL', '2'))
+ORDER_QUEUE_LEASE_TIMEOUT = int(os.getenv('ORDER_QUEUE_LEASE_TIMEOUT', '900'))
+# Completed/failed jobs (and their webhook payloads) are deleted this many days after finishing (0 keeps them)
+ORDER_QUEUE_RETENTION_DAYS = float(os.getenv('ORDER_QUEUE_RETENTION_DAYS', '30'))
+# Redelivered webhooks with the same (event, orderref) are not processed again for this many hours
+WEBHOOK_IDEMPOTENCY_HOURS = float(os.getenv('WEBHOOK_IDEMPOTENCY_HOURS', '168'))
 
 # ============================================================================
 # Configuration Validation
@@ -140,27 +310,38 @@ validate_config()
 # Users Management
 # ============================================================================
 USERS_FILE = os.path.join(os.path.dirname(__file__), 'users.json')
+# 'json' (default, users.json) or 'sqlite' (STATE_DB_FILE; users.json is imported once)
+USERS_STORE_BACKEND = os.getenv('USERS_STORE_BACKEND', 'json')
+
+_user_store = None
+_user_store_lock = threading.Lock()
+
+def get_user_store():
+    """Shared user store (created on first use), see user_store.py"""
+    global _user_store
+    if _user_store is None:
+        with _user_store_lock:
+            if _user_store is None:
+                from user_store import JSONUserStore, SQLiteUserStore
+                if USERS_STORE_BACKEND == 'sqlite':
+                    _user_store = SQLiteUserStore(STATE_DB_FILE, legacy_json_path=USERS_FILE)
+                else:
+                    _user_store = JSONUserStore(USERS_FILE)
+    return _user_store
 
 def load_users():
-    """Load users from users.json file"""
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    """Load all users (cached; reloaded only when the store changes)"""
+    return get_user_store().list()
+
+def get_user(username):
+    """Look up one user by username, or None"""
+    return get_user_store().get(username)
 
 def change_user_password(username, new_password):
-    """Change the password for a user in users.json"""
-    if not os.path.exists(USERS_FILE):
-        return False, "No users.json file found."
-    with open(USERS_FILE, 'r') as f:
-        users = json.load(f)
-    for user in users:
-        if user['username'] == username:
-            user['password'] = hash_password(new_password)
-            with open(USERS_FILE, 'w') as f2:
-                json.dump(users, f2, indent=2)
-            return True, None
-    return False, "User not found."
+    """Change the password for a user"""
+    if not get_user_store().update(username, password=hash_password(new_password)):
+        return False, "User not found."
+    return True, None
 
 # ============================================================================
 # Password Hashing Utilities
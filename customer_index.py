@@ -0,0 +1,449 @@
+"""
+Local index of PowerCode customers for duplicate detection.
+
+This module handles:
+- Keeping a copy of PowerCode customers (ID, name, city, address, extAccountID)
+  in the local SQLite state database, shared by all uWSGI workers
+- Normalizing names and addresses so case, whitespace, punctuation and common
+  street abbreviations don't hide a duplicate
+- Bulk refreshes from PowerCode (one worker at a time, on an interval or on demand)
+- Adding customers as UAC creates them and as live searches return them
+- Telling whether the last full refresh is recent enough to trust a lookup miss
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+# Street words normalized to the USPS abbreviation, so "123 North Main Street" == "123 N Main St"
+ADDRESS_ABBREVIATIONS = {
+    "NORTH": "N", "SOUTH": "S", "EAST": "E", "WEST": "W",
+    "NORTHEAST": "NE", "NORTHWEST": "NW", "SOUTHEAST": "SE", "SOUTHWEST": "SW",
+    "STREET": "ST", "AVENUE": "AVE", "ROAD": "RD", "DRIVE": "DR", "LANE": "LN",
+    "COURT": "CT", "CIRCLE": "CIR", "BOULEVARD": "BLVD", "PLACE": "PL", "TERRACE": "TER",
+    "PARKWAY": "PKWY", "HIGHWAY": "HWY", "TRAIL": "TRL", "WAY": "WAY",
+    "APARTMENT": "APT", "SUITE": "STE", "UNIT": "UNIT",
+}
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).astimezone().isoformat()
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """
+    Normalize a name or city for comparison: upper case, no punctuation, single spaces
+
+    Args:
+        value: Raw text
+
+    Returns:
+        Normalized text ("" for None)
+    """
+    return " ".join(_PUNCTUATION_RE.sub(" ", value or "").upper().split())
+
+
+def normalize_address(value: Optional[str]) -> str:
+    """
+    Normalize a street address: normalize_text plus common street abbreviations
+
+    Args:
+        value: Raw street address
+
+    Returns:
+        Normalized address
+    """
+    return " ".join(ADDRESS_ABBREVIATIONS.get(word, word) for word in normalize_text(value).split())
+
+
+def _field(record: Dict, *names) -> str:
+    """First non-empty value among alternative PowerCode field names"""
+    for name in names:
+        value = record.get(name)
+        if value not in (None, ""):
+            return str(value)
+    return ""
+
+
+class CustomerIndex(SQLiteStore):
+    """
+    SQLite-backed index of PowerCode customers keyed on normalized name, address and extAccountID
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS pc_customer_index (
+            customer_id TEXT PRIMARY KEY,
+            name TEXT,
+            city TEXT,
+            address TEXT,
+            ext_account_id TEXT,
+            name_key TEXT NOT NULL,
+            city_key TEXT NOT NULL,
+            address_key TEXT NOT NULL,
+            record TEXT,
+            source TEXT NOT NULL,
+            refresh_id INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_pc_customer_index_name ON pc_customer_index (name_key, city_key);
+        CREATE INDEX IF NOT EXISTS idx_pc_customer_index_ext ON pc_customer_index (ext_account_id);
+        CREATE TABLE IF NOT EXISTS pc_customer_index_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            refresh_id INTEGER NOT NULL DEFAULT 0,
+            last_refresh_at TEXT,
+            last_refresh_count INTEGER,
+            last_refresh_seconds REAL,
+            last_refresh_error TEXT,
+            next_refresh_at REAL NOT NULL DEFAULT 0,
+            refresh_lease_until REAL NOT NULL DEFAULT 0
+        );
+        INSERT OR IGNORE INTO pc_customer_index_meta (id) VALUES (1);
+    """
+
+    def __init__(self, db_path: str = "uac_state.db", refresh_interval: float = 6 * 3600,
+                 refresh_timeout: float = 600, max_age: float = 12 * 3600):
+        """
+        Initialize index
+
+        Args:
+            db_path: Path to SQLite database file
+            refresh_interval: Seconds between bulk refreshes by the background thread (0 disables them)
+            refresh_timeout: A refresh not finished within this time may be taken over by another worker
+            max_age: The index is complete enough to trust (see is_fresh) for this many seconds after
+                a full refresh finished (0 never trusts it)
+        """
+        super().__init__(db_path)
+        self.refresh_interval = refresh_interval
+        self.refresh_timeout = refresh_timeout
+        self.max_age = max_age
+
+        self._fetch_all = None
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+    def find_duplicate(self, full_name: str, city: str, address: Optional[str] = None,
+                       ext_account_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        Find an indexed customer that matches an incoming order
+
+        The normalized name must always match: a premise (Utopia site ID) served before can be
+        ordered again by a new occupant. A customer with the same name and extAccountID is a
+        duplicate; otherwise the normalized city must match, and the normalized address too when
+        one is given (same name at a different address is a different location).
+
+        Args:
+            full_name: "First Last" as sent to PowerCode
+            city: City
+            address: Street address
+            ext_account_id: Utopia site ID stored as the PowerCode extAccountID
+
+        Returns:
+            The matching PowerCode customer record, or None
+        """
+        conn = self._conn()
+        name_key = normalize_text(full_name)
+        if ext_account_id:
+            row = conn.execute(
+                "SELECT * FROM pc_customer_index WHERE ext_account_id = ? AND name_key = ? LIMIT 1",
+                (str(ext_account_id), name_key)
+            ).fetchone()
+            if row is not None:
+                return self._to_record(row)
+
+        query = "SELECT * FROM pc_customer_index WHERE name_key = ? AND city_key = ?"
+        params = [name_key, normalize_text(city)]
+        if address:
+            query += " AND address_key = ?"
+            params.append(normalize_address(address))
+        row = conn.execute(query + " LIMIT 1", params).fetchone()
+        return self._to_record(row) if row is not None else None
+
+    def is_fresh(self) -> bool:
+        """
+        Whether the last full refresh finished within max_age, so a lookup result (hit or
+        miss) can be trusted without a live PowerCode search
+
+        Returns:
+            True if the index is fresh
+        """
+        if self.max_age <= 0:
+            return False
+        row = self._conn().execute("SELECT last_refresh_at FROM pc_customer_index_meta WHERE id = 1").fetchone()
+        if not row or not row["last_refresh_at"]:
+            return False
+        try:
+            refreshed = datetime.fromisoformat(row["last_refresh_at"]).timestamp()
+        except ValueError:
+            return False
+        return time.time() - refreshed <= self.max_age
+
+    def find_by_ext_account_id(self, ext_account_id: str) -> Optional[Dict]:
+        """
+        Find an indexed customer by extAccountID (Utopia site ID)
+
+        Args:
+            ext_account_id: extAccountID
+
+        Returns:
+            PowerCode customer record, or None
+        """
+        row = self._conn().execute(
+            "SELECT * FROM pc_customer_index WHERE ext_account_id = ? LIMIT 1", (str(ext_account_id),)
+        ).fetchone()
+        return self._to_record(row) if row is not None else None
+
+    @staticmethod
+    def _to_record(row) -> Dict:
+        """PowerCode-style customer record for an index row"""
+        record = json.loads(row["record"]) if row["record"] else {}
+        record.setdefault("CustomerID", row["customer_id"])
+        record.setdefault("CompanyName", row["name"])
+        record.setdefault("City", row["city"])
+        record.setdefault("Address1", row["address"])
+        return record
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+    def _upsert(self, conn, customers: Iterable[Dict], source: str, refresh_id: int = 0) -> int:
+        """Insert or update PowerCode customer records; returns the number indexed"""
+        count = 0
+        now = time.time()
+        for customer in customers:
+            customer_id = _field(customer, "CustomerID", "customerID", "customerId")
+            if not customer_id:
+                continue
+            name = _field(customer, "CompanyName", "companyName")
+            city = _field(customer, "City", "city")
+            address = _field(customer, "Address1", "address1", "Address")
+            conn.execute(
+                "INSERT INTO pc_customer_index (customer_id, name, city, address, ext_account_id, name_key, "
+                "city_key, address_key, record, source, refresh_id, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(customer_id) DO UPDATE SET name = excluded.name, city = excluded.city, "
+                "address = excluded.address, ext_account_id = COALESCE(excluded.ext_account_id, ext_account_id), "
+                "name_key = excluded.name_key, city_key = excluded.city_key, address_key = excluded.address_key, "
+                "record = excluded.record, source = excluded.source, "
+                "refresh_id = MAX(refresh_id, excluded.refresh_id), updated_at = excluded.updated_at",
+                (customer_id, name, city, address,
+                 _field(customer, "ExtAccountID", "extAccountID", "ExternalID") or None,
+                 normalize_text(name), normalize_text(city), normalize_address(address),
+                 json.dumps(customer, default=str), source, refresh_id, now)
+            )
+            count += 1
+        return count
+
+    def add_customers(self, customers: Iterable[Dict], source: str = "search") -> int:
+        """
+        Index customer records returned by PowerCode (e.g. from a live search)
+
+        Args:
+            customers: PowerCode customer records (CustomerID, CompanyName, City, Address1, ...)
+            source: Where the records came from, for the listing
+
+        Returns:
+            Number of customers indexed
+        """
+        with self.transaction() as conn:
+            return self._upsert(conn, customers, source)
+
+    def add_created(self, customer_id, customer_data: Dict):
+        """
+        Index a customer UAC just created, so a repeated order is caught without a search
+
+        Args:
+            customer_id: New PowerCode customer ID
+            customer_data: The customer_to_pc() data the account was created from
+        """
+        full_name = f"{customer_data.get('firstname', '')} {customer_data.get('lastname', '')}".strip()
+        self.add_customers([{
+            "CustomerID": str(customer_id),
+            "CompanyName": full_name,
+            "City": customer_data.get("city", ""),
+            "Address1": customer_data.get("address", ""),
+            "ExtAccountID": customer_data.get("siteid", ""),
+        }], source="created")
+
+    def remove(self, customer_id) -> bool:
+        """
+        Drop a customer from the index
+
+        Args:
+            customer_id: PowerCode customer ID
+
+        Returns:
+            True if the customer was indexed
+        """
+        with self.transaction() as conn:
+            return conn.execute(
+                "DELETE FROM pc_customer_index WHERE customer_id = ?", (str(customer_id),)
+            ).rowcount > 0
+
+    # ------------------------------------------------------------------
+    # Bulk refresh
+    # ------------------------------------------------------------------
+    def refresh(self, fetch_all: Callable[[], List[Dict]]) -> Dict:
+        """
+        Replace the index with a full customer list from PowerCode.
+        Customers added while the list was being fetched are kept.
+
+        Args:
+            fetch_all: Returns every PowerCode customer record
+
+        Returns:
+            Dictionary with count and seconds
+        """
+        started = time.monotonic()
+        with self.transaction() as conn:
+            conn.execute("UPDATE pc_customer_index_meta SET refresh_id = refresh_id + 1 WHERE id = 1")
+            refresh_id = conn.execute("SELECT refresh_id FROM pc_customer_index_meta WHERE id = 1").fetchone()[0]
+            fetch_started = time.time()
+
+        try:
+            customers = fetch_all()
+        except Exception as e:
+            with self.transaction() as conn:
+                conn.execute("UPDATE pc_customer_index_meta SET last_refresh_error = ? WHERE id = 1", (str(e),))
+            raise
+
+        with self.transaction() as conn:
+            count = self._upsert(conn, customers, "refresh", refresh_id)
+            # Anything not in the full list and not touched since the fetch started was deleted in PowerCode
+            conn.execute(
+                "DELETE FROM pc_customer_index WHERE refresh_id < ? AND updated_at < ?", (refresh_id, fetch_started)
+            )
+            seconds = round(time.monotonic() - started, 2)
+            conn.execute(
+                "UPDATE pc_customer_index_meta SET last_refresh_at = ?, last_refresh_count = ?, "
+                "last_refresh_seconds = ?, last_refresh_error = NULL WHERE id = 1",
+                (_now(), count, seconds)
+            )
+        logger.info(f"Refreshed PowerCode customer index: {count} customers in {seconds}s")
+        return {"count": count, "seconds": seconds}
+
+    def _claim_refresh(self, force: bool = False) -> bool:
+        """
+        Take the refresh turn if one is due and no other worker is refreshing
+
+        Returns:
+            True if this worker should refresh now
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT next_refresh_at, refresh_lease_until FROM pc_customer_index_meta WHERE id = 1"
+            ).fetchone()
+            if row["refresh_lease_until"] > now or (not force and row["next_refresh_at"] > now):
+                return False
+            conn.execute(
+                "UPDATE pc_customer_index_meta SET refresh_lease_until = ?, next_refresh_at = ? WHERE id = 1",
+                (now + self.refresh_timeout, now + self.refresh_interval)
+            )
+        return True
+
+    def _release_refresh(self):
+        with self.transaction() as conn:
+            conn.execute("UPDATE pc_customer_index_meta SET refresh_lease_until = 0 WHERE id = 1")
+
+    def refresh_if_due(self, fetch_all: Callable[[], List[Dict]], force: bool = False) -> Optional[Dict]:
+        """
+        Refresh unless another worker is already refreshing (or, without force, one isn't due yet)
+
+        Args:
+            fetch_all: Returns every PowerCode customer record
+            force: Refresh even if the interval hasn't passed
+
+        Returns:
+            Refresh result, or None if this worker did not refresh
+        """
+        if not self._claim_refresh(force):
+            return None
+        try:
+            return self.refresh(fetch_all)
+        finally:
+            self._release_refresh()
+
+    def start(self, fetch_all: Callable[[], List[Dict]]):
+        """
+        Start the periodic refresh thread in this process (no-op if already running
+        or refresh_interval is 0). Only one worker refreshes at a time.
+
+        Args:
+            fetch_all: Returns every PowerCode customer record
+        """
+        if self.refresh_interval <= 0 or (self._pid == os.getpid() and self._thread):
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread:
+                return
+            self._fetch_all = fetch_all
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._refresh_loop,
+                name=f"customer-index-{self._pid}",
+                daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Signal the refresh thread to stop and wait for it"""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _refresh_loop(self):
+        # Check every minute; the shared next_refresh_at decides which worker's turn it is
+        while not self._stopping.is_set():
+            try:
+                self.refresh_if_due(self._fetch_all)
+            except Exception as e:
+                logger.error(f"Error refreshing PowerCode customer index: {e}", exc_info=True)
+            self._stopping.wait(min(60, self.refresh_interval))
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def get_stats(self) -> Dict:
+        """
+        Report index size and the last bulk refresh
+
+        Returns:
+            Dictionary with customers (per source), last refresh time/count/duration/error
+            and when the next refresh is due
+        """
+        conn = self._conn()
+        sources = {
+            row["source"]: row["n"]
+            for row in conn.execute("SELECT source, COUNT(*) AS n FROM pc_customer_index GROUP BY source")
+        }
+        meta = dict(conn.execute("SELECT * FROM pc_customer_index_meta WHERE id = 1").fetchone())
+        next_refresh = meta.pop("next_refresh_at")
+        refreshing = meta.pop("refresh_lease_until") > time.time()
+        meta.pop("id", None)
+        meta.pop("refresh_id", None)
+        return {
+            "customers": sum(sources.values()),
+            "by_source": sources,
+            "refreshing": refreshing,
+            "next_refresh_at": (datetime.fromtimestamp(next_refresh, timezone.utc).astimezone().isoformat()
+                                if next_refresh else None),
+            **meta,
+        }
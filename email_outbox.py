@@ -0,0 +1,412 @@
+"""
+Persistent outbox for notification emails.
+
+This module handles:
+- Queueing emails in the local SQLite state database instead of sending them inline
+- A background sender thread per worker process that reuses one SMTP connection
+- Retrying failed sends with exponential backoff, then marking them failed
+- Rolling up bursts of similar notices (same digest key) into one digest email
+- Deleting sent messages (which contain customer details) after a retention period
+"""
+
+import json
+import os
+import time
+import random
+import smtplib
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from flask_mail import Connection, Message
+
+import metrics
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).astimezone().isoformat()
+
+
+class SMTPConnection(Connection):
+    """
+    Flask-Mail connection with a socket timeout, so an unreachable mail server
+    fails the send instead of blocking the sender thread
+    """
+
+    def __init__(self, mail_state, timeout: float):
+        super().__init__(mail_state)
+        self.timeout = timeout
+
+    def configure_host(self):
+        smtp_class = smtplib.SMTP_SSL if self.mail.use_ssl else smtplib.SMTP
+        host = smtp_class(self.mail.server, self.mail.port, timeout=self.timeout)
+        host.set_debuglevel(int(self.mail.debug))
+        if self.mail.use_tls:
+            host.starttls()
+        if self.mail.username and self.mail.password:
+            host.login(self.mail.username, self.mail.password)
+        return host
+
+
+class EmailOutbox(SQLiteStore):
+    """
+    SQLite-backed email queue with an in-process sender thread
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            sender TEXT,
+            recipients TEXT NOT NULL,
+            orderref TEXT,
+            digest_key TEXT,
+            digest_subject TEXT,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            sent_at TEXT,
+            lease_until REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (status, next_attempt_at);
+        CREATE INDEX IF NOT EXISTS idx_email_outbox_digest ON email_outbox (digest_key, status);
+    """
+
+    def __init__(self, db_path: str = "uac_state.db", poll_interval: float = 2.0, digest_window: float = 300,
+                 max_attempts: int = 8, retry_base: float = 30, retry_max: float = 3600,
+                 smtp_timeout: float = 30, idle_close: float = 60, batch_size: int = 20,
+                 retention: float = 14 * 86400):
+        """
+        Initialize outbox
+
+        Args:
+            db_path: Path to SQLite database file
+            poll_interval: Seconds between checks when nothing is due
+            digest_window: Seconds a digest message waits for others with the same key (0 disables digests)
+            max_attempts: Send attempts before a message is marked failed
+            retry_base: Delay before the first retry; doubles on each further attempt
+            retry_max: Upper bound for the retry delay
+            smtp_timeout: Socket timeout for the SMTP connection
+            idle_close: Close the SMTP connection after this many idle seconds
+            batch_size: Maximum messages claimed per pass
+            retention: Seconds sent messages are kept after they were sent (0 keeps them forever)
+        """
+        super().__init__(db_path)
+        self.poll_interval = poll_interval
+        self.digest_window = digest_window
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.smtp_timeout = smtp_timeout
+        self.idle_close = idle_close
+        self.batch_size = batch_size
+        self.retention = retention
+        # Claimed messages not finished within this time are picked up again
+        self.lease_timeout = max(smtp_timeout * 4, 120)
+
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._connection = None
+        self._connection_used = 0.0
+        self._last_prune = 0.0
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+    def enqueue(self, subject: str, body: str, recipients: List[str], sender: Optional[str] = None,
+                orderref: Optional[str] = None, digest_key: Optional[str] = None,
+                digest_subject: Optional[str] = None) -> int:
+        """
+        Queue an email
+
+        Args:
+            subject: Email subject
+            body: Plain text body
+            recipients: Recipient addresses
+            sender: Sender address
+            orderref: Related order reference, for the outbox listing
+            digest_key: Messages with the same key queued within digest_window are sent as one digest
+            digest_subject: Subject for the digest email (defaults to the first message's subject)
+
+        Returns:
+            Outbox message ID
+        """
+        now = time.time()
+        due = now + self.digest_window if digest_key and self.digest_window > 0 else now
+        with self.transaction() as conn:
+            if digest_key and self.digest_window > 0:
+                # Join a digest that is already waiting, so the window starts at its first message
+                row = conn.execute(
+                    "SELECT MIN(next_attempt_at) AS due FROM email_outbox WHERE digest_key = ? AND status = ?",
+                    (digest_key, STATUS_PENDING)
+                ).fetchone()
+                if row["due"] is not None:
+                    due = row["due"]
+            message_id = conn.execute(
+                "INSERT INTO email_outbox (subject, body, sender, recipients, orderref, digest_key, digest_subject, "
+                "status, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (subject, body, sender, json.dumps([r.strip() for r in recipients if r and r.strip()]),
+                 orderref, digest_key, digest_subject, STATUS_PENDING, due, _now())
+            ).lastrowid
+        if due <= now:
+            self._wakeup.set()
+        logger.info(f"Queued email {message_id} - Subject: {subject}", extra={"orderref": orderref})
+        return message_id
+
+    def list_messages(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """
+        List outbox messages, newest first
+
+        Args:
+            status: Only return messages in this status
+            limit: Maximum number of messages to return
+
+        Returns:
+            List of message records (without bodies)
+        """
+        query = ("SELECT id, subject, orderref, digest_key, status, attempts, last_error, created_at, sent_at, "
+                 "next_attempt_at FROM email_outbox")
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self._conn().execute(query, params)]
+
+    def get_stats(self) -> Dict:
+        """
+        Count messages per status
+
+        Returns:
+            Dictionary of status -> count
+        """
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM email_outbox GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
+
+    def retry_failed(self) -> int:
+        """
+        Put failed messages back in the queue
+
+        Returns:
+            Number of messages re-queued
+        """
+        with self.transaction() as conn:
+            count = conn.execute(
+                "UPDATE email_outbox SET status = ?, attempts = 0, next_attempt_at = ? WHERE status = ?",
+                (STATUS_PENDING, time.time(), STATUS_FAILED)
+            ).rowcount
+        self._wakeup.set()
+        return count
+
+    # ------------------------------------------------------------------
+    # Sender side
+    # ------------------------------------------------------------------
+    def start(self, app):
+        """
+        Start the sender thread in this process (no-op if already running).
+        Safe to call repeatedly; the thread is restarted after a fork.
+
+        Args:
+            app: Flask app configured with Flask-Mail
+        """
+        if self._pid == os.getpid() and self._thread:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread:
+                return
+            self._app = app
+            self._pid = os.getpid()
+            self._connection = None
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._sender_loop,
+                name=f"email-sender-{self._pid}",
+                daemon=True
+            )
+            self._thread.start()
+            logger.info(f"Started email outbox sender in process {self._pid}")
+
+    def stop(self, timeout: float = 5.0):
+        """Signal the sender thread to stop and wait for it"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _sender_loop(self):
+        """Send due messages until stopped"""
+        with self._app.app_context():
+            while not self._stopping.is_set():
+                try:
+                    groups = self._claim_due()
+                except Exception as e:
+                    logger.error(f"Error claiming emails from outbox: {e}", exc_info=True)
+                    groups = []
+
+                for group in groups:
+                    self._deliver(group)
+
+                if not groups:
+                    if self._connection and time.monotonic() - self._connection_used > self.idle_close:
+                        self._close_connection()
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+            self._close_connection()
+
+    def _claim_due(self) -> List[List[Dict]]:
+        """
+        Claim due messages. Digest messages are claimed together with every
+        pending message that has the same key.
+
+        Returns:
+            List of message groups; each group is sent as one email
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            # Take back messages from a sender that died mid-send
+            conn.execute(
+                "UPDATE email_outbox SET status = ? WHERE status = ? AND lease_until < ?",
+                (STATUS_PENDING, STATUS_SENDING, now)
+            )
+            # Drop old sent messages, at most once an hour per process
+            if self.retention > 0 and now - self._last_prune > 3600:
+                self._last_prune = now
+                pruned = conn.execute(
+                    "DELETE FROM email_outbox WHERE status = ? AND julianday(sent_at) < julianday('now', ?)",
+                    (STATUS_SENT, f"-{int(self.retention)} seconds")
+                ).rowcount
+                if pruned:
+                    logger.info(f"Pruned {pruned} sent emails older than {self.retention / 86400:g} days")
+            rows = conn.execute(
+                "SELECT * FROM email_outbox WHERE status = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (STATUS_PENDING, now, self.batch_size)
+            ).fetchall()
+            groups = []
+            digest_keys = set()
+            for row in rows:
+                key = row["digest_key"]
+                if key is None:
+                    groups.append([dict(row)])
+                elif key not in digest_keys:
+                    digest_keys.add(key)
+                    members = conn.execute(
+                        "SELECT * FROM email_outbox WHERE digest_key = ? AND status = ? ORDER BY id",
+                        (key, STATUS_PENDING)
+                    ).fetchall()
+                    groups.append([dict(member) for member in members])
+            ids = [message["id"] for group in groups for message in group]
+            if ids:
+                conn.execute(
+                    f"UPDATE email_outbox SET status = ?, lease_until = ? WHERE id IN ({', '.join('?' * len(ids))})",
+                    [STATUS_SENDING, now + self.lease_timeout] + ids
+                )
+        return groups
+
+    def _build_message(self, group: List[Dict]) -> Message:
+        """Build one email for a single message or a digest group"""
+        first = group[0]
+        recipients = json.loads(first["recipients"])
+        if len(group) == 1:
+            return Message(subject=first["subject"], sender=first["sender"], recipients=recipients, body=first["body"])
+
+        subject = f"{first['digest_subject'] or first['subject']} ({len(group)} notices)"
+        sections = [
+            f"[{index}] {message['subject']} ({message['created_at']})\n\n{message['body'].rstrip()}"
+            for index, message in enumerate(group, 1)
+        ]
+        body = f"{len(group)} notifications were grouped into this email.\n\n" + \
+               ("\n\n" + "-" * 60 + "\n\n").join(sections) + "\n"
+        return Message(subject=subject, sender=first["sender"], recipients=recipients, body=body)
+
+    def _get_connection(self) -> SMTPConnection:
+        """Open the SMTP connection if needed; it stays open for later messages"""
+        if self._connection is None:
+            connection = SMTPConnection(self._app.extensions["mail"], self.smtp_timeout)
+            connection.__enter__()
+            self._connection = connection
+        return self._connection
+
+    def _close_connection(self):
+        if self._connection is not None:
+            try:
+                self._connection.__exit__(None, None, None)
+            except Exception:
+                pass
+            self._connection = None
+
+    def _deliver(self, group: List[Dict]):
+        """Send one group and record the outcome"""
+        ids = [message["id"] for message in group]
+        try:
+            message = self._build_message(group)
+            reused = self._connection is not None
+            with metrics.span("smtp_send"):
+                try:
+                    self._get_connection().send(message)
+                except (smtplib.SMTPServerDisconnected, ConnectionError):
+                    # The server closed the idle connection; reconnect once
+                    self._close_connection()
+                    if not reused:
+                        raise
+                    self._get_connection().send(message)
+            self._connection_used = time.monotonic()
+        except Exception as e:
+            self._close_connection()
+            self._schedule_retry(group, str(e))
+            return
+
+        with self.transaction() as conn:
+            conn.execute(
+                f"UPDATE email_outbox SET status = ?, sent_at = ?, attempts = attempts + 1, last_error = NULL "
+                f"WHERE id IN ({', '.join('?' * len(ids))})",
+                [STATUS_SENT, _now()] + ids
+            )
+        logger.info(
+            f"Email sent successfully - Subject: {message.subject}"
+            + (f" (digest of {len(group)})" if len(group) > 1 else "")
+        )
+
+    def _schedule_retry(self, group: List[Dict], error: str):
+        """Back off exponentially (with jitter), or mark failed after max_attempts"""
+        attempts = max(message["attempts"] for message in group) + 1
+        ids = [message["id"] for message in group]
+        placeholders = ", ".join("?" * len(ids))
+        if attempts >= self.max_attempts:
+            with self.transaction() as conn:
+                conn.execute(
+                    f"UPDATE email_outbox SET status = ?, attempts = ?, last_error = ? WHERE id IN ({placeholders})",
+                    [STATUS_FAILED, attempts, error] + ids
+                )
+            logger.error(f"Giving up on email '{group[0]['subject']}' after {attempts} attempts: {error}")
+            return
+
+        delay = min(self.retry_base * (2 ** (attempts - 1)), self.retry_max)
+        delay *= random.uniform(0.8, 1.2)
+        with self.transaction() as conn:
+            conn.execute(
+                f"UPDATE email_outbox SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ? "
+                f"WHERE id IN ({placeholders})",
+                [STATUS_PENDING, attempts, error, time.time() + delay] + ids
+            )
+        logger.warning(
+            f"Error sending email '{group[0]['subject']}' (attempt {attempts}/{self.max_attempts}), "
+            f"retrying in {delay:.0f}s: {error}"
+        )
@@ -0,0 +1,371 @@
+"""
+Automatic retries for tracked failures.
+
+This module handles:
+- Finding unresolved failures of retryable types (transient upstream errors)
+- Spacing retries out with exponential backoff and jitter, based on the failure's
+  retry_count and the time of its last failure or retry
+- Capping how many retries run at once across all uWSGI workers (leases in the
+  local SQLite state database)
+- Marking failures resolved when a retry succeeds
+- Reporting a failure once when its last automatic retry has failed
+- Pausing while an upstream's circuit breaker is open
+"""
+
+import os
+import time
+import zlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import app_logging
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRY_TYPES = (
+    "powercode_api_error", "powercode_creation_failed", "utopia_api_error", "upstream_unavailable"
+)
+
+
+def _timestamp(value: Optional[str]) -> float:
+    """Epoch seconds for an ISO timestamp (0 if missing or unparseable)"""
+    if not value:
+        return 0.0
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).astimezone().isoformat() if ts else None
+
+
+class FailureRetryScheduler(SQLiteStore):
+    """
+    Background scheduler that retries failures recorded by FailureTracker
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS failure_retries (
+            orderref TEXT PRIMARY KEY,
+            lease_until REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_attempt_at REAL,
+            last_outcome TEXT,
+            last_error TEXT
+        );
+    """
+
+    def __init__(self, failure_tracker, db_path: str = "uac_state.db",
+                 retry_types: Iterable[str] = DEFAULT_RETRY_TYPES, max_attempts: int = 5,
+                 base_delay: float = 300, max_delay: float = 6 * 3600, concurrency: int = 1,
+                 poll_interval: float = 30, lease_timeout: float = 900, upstream_guard=None):
+        """
+        Initialize scheduler
+
+        Args:
+            failure_tracker: FailureTracker holding the failures to retry
+            db_path: Path to SQLite database file (for retry leases)
+            retry_types: Failure types that are retried automatically
+            max_attempts: Failures with this many recorded retries are left for an operator
+            base_delay: Seconds before the first retry; doubles with each retry_count
+            max_delay: Upper bound for the retry delay
+            concurrency: Retries running at the same time across all workers
+            poll_interval: Seconds between checks for due retries
+            lease_timeout: A retry not finished within this time may be picked up again
+            upstream_guard: UpstreamGuard whose circuit breakers pause retries (None never pauses)
+        """
+        super().__init__(db_path)
+        self.failure_tracker = failure_tracker
+        self.retry_types = [t for t in retry_types if t]
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout
+        self.upstream_guard = upstream_guard
+
+        self._retry = None
+        self._on_exhausted = None
+        self._thread = None
+        self._pool = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Scheduling
+    # ------------------------------------------------------------------
+    def retry_delay(self, orderref: str, retry_count: int) -> float:
+        """
+        Backoff before the next retry: base_delay * 2^retry_count (capped), scaled by a
+        jitter factor between 0.5 and 1.5. The jitter is derived from the orderref and
+        retry_count, so it stays the same on every check and across workers.
+
+        Args:
+            orderref: Order reference
+            retry_count: Retries recorded so far
+
+        Returns:
+            Delay in seconds
+        """
+        delay = min(self.max_delay, self.base_delay * (2 ** min(retry_count, 20)))
+        jitter = zlib.crc32(f"{orderref}:{retry_count}".encode()) / 0xFFFFFFFF
+        return delay * (0.5 + jitter)
+
+    def _candidates(self) -> List[Dict]:
+        """Unresolved failures of retryable types that have retries left, oldest first"""
+        candidates = []
+        for failure_type in self.retry_types:
+            page = self.failure_tracker.query_failures(
+                limit=500, failure_type=failure_type, max_retries=self.max_attempts - 1,
+                sort="timestamp", descending=False
+            )
+            candidates.extend(f for f in page["failures"] if not f["orderref"].startswith("UNKNOWN_"))
+        return candidates
+
+    def _attempt_rows(self) -> Dict[str, Dict]:
+        return {row["orderref"]: dict(row) for row in self._conn().execute("SELECT * FROM failure_retries")}
+
+    def _next_retry_at(self, failure: Dict, attempt: Optional[Dict]) -> float:
+        """When a failure is next due, counted from its last failure or last retry, whichever is later"""
+        last = max(_timestamp(failure.get("timestamp")), (attempt or {}).get("last_attempt_at") or 0)
+        return last + self.retry_delay(failure["orderref"], failure.get("retry_count", 0))
+
+    def _claim_due(self) -> List[Dict]:
+        """
+        Lease due failures, up to the free concurrency slots across all workers
+
+        Returns:
+            Failure records this worker should retry now
+        """
+        if self._blocked_upstreams():
+            return []
+
+        now = time.time()
+        attempts = self._attempt_rows()
+        due = [f for f in self._candidates() if self._next_retry_at(f, attempts.get(f["orderref"])) <= now]
+        if not due:
+            return []
+
+        claimed = []
+        with self.transaction() as conn:
+            running = conn.execute(
+                "SELECT COUNT(*) FROM failure_retries WHERE lease_until > ?", (now,)
+            ).fetchone()[0]
+            for failure in due:
+                if running + len(claimed) >= self.concurrency:
+                    break
+                leased = conn.execute(
+                    "INSERT INTO failure_retries (orderref, lease_until) VALUES (?, ?) "
+                    "ON CONFLICT(orderref) DO UPDATE SET lease_until = excluded.lease_until "
+                    "WHERE lease_until <= ?",
+                    (failure["orderref"], now + self.lease_timeout, now)
+                ).rowcount
+                if leased:
+                    claimed.append(failure)
+        return claimed
+
+    def acquire_lease(self, orderref: str) -> bool:
+        """
+        Hold an order's retry lease, so the scheduler does not retry it while another
+        path (e.g. a backfill run) is re-processing it
+
+        Args:
+            orderref: Order reference
+
+        Returns:
+            True if the lease was taken, False if a retry of the order is running now
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            return conn.execute(
+                "INSERT INTO failure_retries (orderref, lease_until) VALUES (?, ?) "
+                "ON CONFLICT(orderref) DO UPDATE SET lease_until = excluded.lease_until "
+                "WHERE lease_until <= ?",
+                (orderref, now + self.lease_timeout, now)
+            ).rowcount > 0
+
+    def release_lease(self, orderref: str):
+        """Give back a lease taken with acquire_lease (not counted as a retry attempt)"""
+        with self.transaction() as conn:
+            conn.execute("UPDATE failure_retries SET lease_until = 0 WHERE orderref = ?", (orderref,))
+
+    def _blocked_upstreams(self) -> List[str]:
+        """Upstreams failing fast right now; retries wait until their circuits let calls through"""
+        if self.upstream_guard is None:
+            return []
+        try:
+            return self.upstream_guard.blocked_upstreams()
+        except Exception as e:
+            logger.warning(f"Could not read upstream circuit state: {e}")
+            return []
+
+    def _finish(self, orderref: str, outcome: str, error: Optional[str] = None):
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE failure_retries SET lease_until = 0, attempts = attempts + 1, last_attempt_at = ?, "
+                "last_outcome = ?, last_error = ? WHERE orderref = ?",
+                (time.time(), outcome, error, orderref)
+            )
+
+    def _run_retry(self, failure: Dict):
+        """Retry one failure and record the outcome"""
+        orderref = failure["orderref"]
+        started = time.monotonic()
+        with app_logging.log_context(orderref=orderref, stage="auto_retry"):
+            logger.info(
+                f"Retrying {failure['failure_type']} failure for order {orderref} "
+                f"(retry #{failure.get('retry_count', 0) + 1})"
+            )
+            try:
+                resolved, note = self._retry(failure)
+            except Exception as e:
+                logger.error(f"Automatic retry failed for order {orderref}: {e}", exc_info=True)
+                self.failure_tracker.record_failure(
+                    orderref=orderref,
+                    error_message=f"Automatic retry failed: {str(e)}",
+                    failure_type=failure["failure_type"],
+                    customer_data=failure.get("customer_data")
+                )
+                self._finish(orderref, "error", str(e))
+                self._check_exhausted(orderref)
+                return
+
+            duration_ms = round((time.monotonic() - started) * 1000)
+            current = self.failure_tracker.get_failure(orderref) if resolved else None
+            if current and not current.get("resolved") and self._recorded_since(failure, current):
+                # The retry created the customer but recorded a new failure (e.g. a post-creation
+                # step failed); leave that one open for an operator
+                self._finish(orderref, "superseded", f"{note}; new {current['failure_type']} failure recorded")
+                logger.warning(
+                    f"Automatic retry of order {orderref} recorded a new {current['failure_type']} failure: "
+                    f"{current.get('error_message')}", extra={"duration_ms": duration_ms}
+                )
+            elif resolved:
+                self.failure_tracker.mark_resolved(orderref, note)
+                self._finish(orderref, "resolved")
+                logger.info(f"Automatic retry resolved order {orderref}: {note}", extra={"duration_ms": duration_ms})
+            else:
+                self._finish(orderref, "failed", note)
+                logger.warning(f"Automatic retry did not resolve order {orderref}: {note}",
+                               extra={"duration_ms": duration_ms})
+                self._check_exhausted(orderref)
+
+    def _check_exhausted(self, orderref: str):
+        """Report a failure whose last retry just failed (that retry has already been recorded)"""
+        failure = self.failure_tracker.get_failure(orderref)
+        if (not failure or failure.get("resolved") or failure.get("failure_type") not in self.retry_types
+                or failure.get("retry_count", 0) != self.max_attempts):
+            return
+        logger.error(f"Automatic retries exhausted for order {orderref} after {failure['retry_count']} retries")
+        if self._on_exhausted is None:
+            return
+        try:
+            self._on_exhausted(failure)
+        except Exception as e:
+            logger.error(f"Error reporting exhausted retries for order {orderref}: {e}", exc_info=True)
+
+    @staticmethod
+    def _recorded_since(retried: Dict, current: Dict) -> bool:
+        """Whether the failure record was replaced after the retry started (other type or timestamp)"""
+        return (current.get("failure_type"), current.get("timestamp")) != \
+            (retried.get("failure_type"), retried.get("timestamp"))
+
+    def run_due(self) -> int:
+        """
+        Claim due failures and retry them on the worker pool
+
+        Returns:
+            Number of retries started
+        """
+        claimed = self._claim_due()
+        for failure in claimed:
+            self._pool.submit(self._run_retry, failure)
+        return len(claimed)
+
+    # ------------------------------------------------------------------
+    # Thread management
+    # ------------------------------------------------------------------
+    def start(self, retry: Callable[[Dict], Tuple[bool, str]], on_exhausted: Optional[Callable[[Dict], None]] = None):
+        """
+        Start the scheduler thread in this process (no-op if already running).
+        Safe to call repeatedly; the thread is restarted after a fork.
+
+        Args:
+            retry: Called with a failure record; returns (resolved, note). When not
+                resolved, the retry is expected to have recorded the new failure.
+            on_exhausted: Called once with the failure record when a failed retry was its
+                last one (retries are expected not to send per-attempt notifications)
+        """
+        if self._pid == os.getpid() and self._thread:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread:
+                return
+            self._retry = retry
+            self._on_exhausted = on_exhausted
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"failure-retry-{self._pid}")
+            self._thread = threading.Thread(target=self._scheduler_loop, name=f"failure-retry-{self._pid}", daemon=True)
+            self._thread.start()
+            logger.info(f"Started failure retry scheduler in process {self._pid} (types: {', '.join(self.retry_types)})")
+
+    def stop(self, timeout: float = 5.0):
+        """Signal the scheduler thread to stop and wait for it"""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._pool:
+            self._pool.shutdown(wait=False)
+        self._thread = None
+
+    def _scheduler_loop(self):
+        while not self._stopping.is_set():
+            try:
+                self.run_due()
+            except Exception as e:
+                logger.error(f"Error in failure retry scheduler: {e}", exc_info=True)
+            self._stopping.wait(self.poll_interval)
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def get_status(self) -> Dict:
+        """
+        Report retryable failures with their next retry time, plus retries running now
+
+        Returns:
+            Dictionary with settings, running retries and the retry schedule (soonest first)
+        """
+        now = time.time()
+        attempts = self._attempt_rows()
+        schedule = []
+        for failure in self._candidates():
+            attempt = attempts.get(failure["orderref"], {})
+            schedule.append({
+                "orderref": failure["orderref"],
+                "failure_type": failure["failure_type"],
+                "retry_count": failure.get("retry_count", 0),
+                "next_retry_at": _iso(self._next_retry_at(failure, attempt)),
+                "running": (attempt.get("lease_until") or 0) > now,
+                "auto_attempts": attempt.get("attempts", 0),
+                "last_outcome": attempt.get("last_outcome"),
+                "last_error": attempt.get("last_error"),
+            })
+        schedule.sort(key=lambda item: item["next_retry_at"] or "")
+        return {
+            "retry_types": self.retry_types,
+            "max_attempts": self.max_attempts,
+            "concurrency": self.concurrency,
+            "running": sum(1 for item in schedule if item["running"]),
+            "paused_for": self._blocked_upstreams(),
+            "schedule": schedule,
+        }
@@ -3,44 +3,181 @@ Failure tracking system for failed customer creation attempts.
 
 This module handles:
 - Recording failed order references with failure details
-- Saving/loading failure data to/from JSON file
+- Saving/loading failure data through a pluggable storage backend
+  (SQLite by default, legacy JSON file optional)
+- One-time migration of the legacy JSON file into SQLite
 - Managing failure records (add, remove, list)
+- Keeping failure statistics and hourly/daily trend counts up to date
+  incrementally, so serving them doesn't scan every record
 """
 
 import json
 import os
 import logging
-from datetime import datetime, timezone
-from typing import Dict, List, Optional, Tuple
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
 import uuid
 
+from sqlite_store import SQLiteStore
+
 logger = logging.getLogger(__name__)
 
-class FailureTracker:
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).astimezone().isoformat()
+
+
+def _parse_timestamp(value: str) -> Optional[datetime]:
+    """Parse an ISO timestamp, treating naive values as local time"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.astimezone()
+    return parsed
+
+
+# Fields the failure list can be sorted by
+SORT_FIELDS = ("timestamp", "first_failure", "retry_count", "orderref", "failure_type")
+
+
+def _date_to_upper_bound(date_to: Optional[str]) -> Optional[str]:
+    """Make a date-only upper bound (YYYY-MM-DD) include the whole day"""
+    if date_to and len(date_to) == 10:
+        return f"{date_to}T23:59:59.999999~"
+    return date_to
+
+
+class FailureStore(ABC):
     """
-    Manages tracking of failed customer creation attempts
+    Storage backend interface for failure records, keyed by orderref
     """
-    
+
+    @abstractmethod
+    def record(self, failure_record: Dict) -> Dict:
+        """
+        Insert a failure, or replace an existing one and increment its retry count
+
+        Args:
+            failure_record: New failure record (retry_count/first_failure are filled in)
+
+        Returns:
+            The stored record
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, orderref: str) -> Optional[Dict]:
+        """Get one failure record or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_all(self, include_resolved: bool = False) -> Dict:
+        """Get failure records keyed by orderref"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list(self, include_resolved: bool = False) -> List[Dict]:
+        """Get failure records sorted by timestamp (newest first)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def query(self, include_resolved: bool = False, failure_type: Optional[str] = None,
+              date_from: Optional[str] = None, date_to: Optional[str] = None,
+              min_retries: Optional[int] = None, max_retries: Optional[int] = None,
+              search: Optional[str] = None, sort: str = "timestamp", descending: bool = True,
+              limit: int = 50, offset: int = 0, include_customer_data: bool = True) -> Tuple[List[Dict], int]:
+        """
+        Get one page of failure records matching the filters
+
+        Args:
+            include_resolved: Whether to include resolved failures
+            failure_type: Only failures of this type
+            date_from: Only failures with timestamp >= this ISO date/time
+            date_to: Only failures with timestamp <= this ISO date/time (dates include the whole day)
+            min_retries: Only failures with retry_count >= this
+            max_retries: Only failures with retry_count <= this
+            search: Case-insensitive text matched against orderref, error message and customer data
+            sort: One of SORT_FIELDS
+            descending: Sort direction
+            limit: Page size
+            offset: Number of matching records to skip
+            include_customer_data: False to leave customer_data out of each record
+
+        Returns:
+            (records on this page, total number of matching records)
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, orderrefs: Iterable[str]) -> int:
+        """Delete failure records, returns the number removed"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def resolve(self, orderref: str, resolved_timestamp: str, resolution_note: str) -> bool:
+        """Mark a failure resolved, returns False if not found"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        """Get totals, per-type counts and retry sum"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def trends(self, granularity: str = "day", since: Optional[str] = None,
+               failure_type: Optional[str] = None) -> List[Dict]:
+        """
+        Get failure occurrence counts per time bucket and failure type
+
+        Args:
+            granularity: "hour" (bucket YYYY-MM-DDTHH) or "day" (bucket YYYY-MM-DD)
+            since: Only buckets >= this bucket value
+            failure_type: Only this failure type
+
+        Returns:
+            List of {"bucket", "failure_type", "count"} sorted by bucket
+        """
+        raise NotImplementedError
+
+    def prune_trends(self, granularity: str, before: str) -> int:
+        """Drop trend buckets older than `before`, returns the number removed"""
+        return 0
+
+    @abstractmethod
+    def resolved_records(self) -> List[Dict]:
+        """Get (orderref, resolved_timestamp, timestamp) for resolved failures"""
+        raise NotImplementedError
+
+
+class JSONFailureStore(FailureStore):
+    """
+    Legacy backend: the whole failure dictionary lives in one JSON file
+    and is rewritten on every change. Not safe for concurrent writers.
+    """
+
     def __init__(self, failure_file_path: str = "failed_orders.json"):
         """
-        Initialize failure tracker
-        
+        Initialize JSON store
+
         Args:
             failure_file_path: Path to JSON file for storing failure data
         """
         self.failure_file_path = failure_file_path
         self._ensure_file_exists()
-    
+
     def _ensure_file_exists(self):
         """Create failure file if it doesn't exist"""
         if not os.path.exists(self.failure_file_path):
             self._save_failures({})
             logger.info(f"Created new failure tracking file: {self.failure_file_path}")
-    
+
     def _load_failures(self) -> Dict:
         """
         Load failure data from JSON file
-        
+
         Returns:
             Dictionary of failure data
         """
@@ -50,11 +187,11 @@ class FailureTracker:
         except (FileNotFoundError, json.JSONDecodeError) as e:
             logger.error(f"Error loading failure data: {e}")
             return {}
-    
+
     def _save_failures(self, failures: Dict):
         """
         Save failure data to JSON file
-        
+
         Args:
             failures: Dictionary of failure data to save
         """
@@ -64,11 +201,522 @@ class FailureTracker:
             logger.debug(f"Saved failure data to {self.failure_file_path}")
         except Exception as e:
             logger.error(f"Error saving failure data: {e}")
-    
+
+    def record(self, failure_record: Dict) -> Dict:
+        failures = self._load_failures()
+        orderref = failure_record["orderref"]
+        existing = failures.get(orderref)
+        if existing:
+            failure_record["retry_count"] = existing.get("retry_count", 0) + 1
+            failure_record["first_failure"] = existing.get("timestamp")
+        else:
+            failure_record["first_failure"] = failure_record["timestamp"]
+        failures[orderref] = failure_record
+        self._save_failures(failures)
+        return failure_record
+
+    def get(self, orderref: str) -> Optional[Dict]:
+        return self._load_failures().get(orderref)
+
+    def get_all(self, include_resolved: bool = False) -> Dict:
+        failures = self._load_failures()
+        if not include_resolved:
+            failures = {k: v for k, v in failures.items() if not v.get("resolved", False)}
+        return failures
+
+    def list(self, include_resolved: bool = False) -> List[Dict]:
+        failure_list = list(self.get_all(include_resolved).values())
+        failure_list.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+        return failure_list
+
+    def query(self, include_resolved: bool = False, failure_type: Optional[str] = None,
+              date_from: Optional[str] = None, date_to: Optional[str] = None,
+              min_retries: Optional[int] = None, max_retries: Optional[int] = None,
+              search: Optional[str] = None, sort: str = "timestamp", descending: bool = True,
+              limit: int = 50, offset: int = 0, include_customer_data: bool = True) -> Tuple[List[Dict], int]:
+        date_to = _date_to_upper_bound(date_to)
+        search = search.lower() if search else None
+
+        matches = []
+        for failure in self.get_all(include_resolved).values():
+            timestamp = failure.get("timestamp", "")
+            retry_count = failure.get("retry_count", 0)
+            if failure_type and failure.get("failure_type") != failure_type:
+                continue
+            if date_from and timestamp < date_from:
+                continue
+            if date_to and timestamp > date_to:
+                continue
+            if min_retries is not None and retry_count < min_retries:
+                continue
+            if max_retries is not None and retry_count > max_retries:
+                continue
+            if search:
+                haystack = " ".join([
+                    str(failure.get("orderref", "")),
+                    str(failure.get("error_message", "")),
+                    json.dumps(failure.get("customer_data") or {}, ensure_ascii=False),
+                ]).lower()
+                if search not in haystack:
+                    continue
+            matches.append(failure)
+
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Cannot sort by '{sort}'")
+        empty = 0 if sort == "retry_count" else ""
+        matches.sort(key=lambda x: (x.get(sort) or empty, x.get("orderref", "")), reverse=descending)
+        page = matches[offset:offset + limit]
+        if not include_customer_data:
+            page = [{k: v for k, v in failure.items() if k != "customer_data"} for failure in page]
+        return page, len(matches)
+
+    def delete(self, orderrefs: Iterable[str]) -> int:
+        failures = self._load_failures()
+        removed = 0
+        for orderref in orderrefs:
+            if orderref in failures:
+                del failures[orderref]
+                removed += 1
+        if removed:
+            self._save_failures(failures)
+        return removed
+
+    def resolve(self, orderref: str, resolved_timestamp: str, resolution_note: str) -> bool:
+        failures = self._load_failures()
+        if orderref not in failures:
+            return False
+        failures[orderref]["resolved"] = True
+        failures[orderref]["resolved_timestamp"] = resolved_timestamp
+        failures[orderref]["resolution_note"] = resolution_note
+        self._save_failures(failures)
+        return True
+
+    def stats(self) -> Dict:
+        failures = self._load_failures()
+
+        total_failures = len(failures)
+        unresolved_failures = len([f for f in failures.values() if not f.get("resolved", False)])
+
+        # Count by failure type
+        failure_types = {}
+        for failure in failures.values():
+            failure_type = failure.get("failure_type", "unknown")
+            failure_types[failure_type] = failure_types.get(failure_type, 0) + 1
+
+        return {
+            "total_failures": total_failures,
+            "unresolved_failures": unresolved_failures,
+            "resolved_failures": total_failures - unresolved_failures,
+            "failure_types": failure_types,
+            "total_retries": sum(f.get("retry_count", 0) for f in failures.values())
+        }
+
+    def trends(self, granularity: str = "day", since: Optional[str] = None,
+               failure_type: Optional[str] = None) -> List[Dict]:
+        # Legacy backend has no counters; only the latest occurrence per orderref is known
+        length = 13 if granularity == "hour" else 10
+        counts = {}
+        for failure in self._load_failures().values():
+            bucket = failure.get("timestamp", "")[:length]
+            ftype = failure.get("failure_type", "unknown")
+            if (since and bucket < since) or (failure_type and ftype != failure_type):
+                continue
+            counts[(bucket, ftype)] = counts.get((bucket, ftype), 0) + 1
+        return [
+            {"bucket": bucket, "failure_type": ftype, "count": count}
+            for (bucket, ftype), count in sorted(counts.items())
+        ]
+
+    def resolved_records(self) -> List[Dict]:
+        return [
+            {
+                "orderref": orderref,
+                "resolved_timestamp": failure.get("resolved_timestamp"),
+                "timestamp": failure.get("timestamp"),
+            }
+            for orderref, failure in self._load_failures().items()
+            if failure.get("resolved", False)
+        ]
+
+
+class SQLiteFailureStore(SQLiteStore, FailureStore):
+    """
+    SQLite backend: one row per orderref, indexed for the admin queries,
+    updated incrementally and shared safely between uWSGI workers (WAL mode)
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS failures (
+            orderref TEXT PRIMARY KEY,
+            error_message TEXT,
+            failure_type TEXT NOT NULL DEFAULT 'unknown',
+            timestamp TEXT NOT NULL,
+            first_failure TEXT,
+            retry_count INTEGER NOT NULL DEFAULT 0,
+            resolved INTEGER NOT NULL DEFAULT 0,
+            resolved_timestamp TEXT,
+            resolution_note TEXT,
+            customer_data TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_failures_resolved ON failures (resolved, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_failures_type ON failures (failure_type);
+        CREATE INDEX IF NOT EXISTS idx_failures_timestamp ON failures (timestamp);
+        CREATE TABLE IF NOT EXISTS failure_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+
+        -- Running totals per failure type, kept in step with the failures table by triggers
+        CREATE TABLE IF NOT EXISTS failure_stats (
+            failure_type TEXT PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            resolved INTEGER NOT NULL DEFAULT 0,
+            retries INTEGER NOT NULL DEFAULT 0
+        );
+        -- Failure occurrences per hour/day bucket and type (not decremented on delete)
+        CREATE TABLE IF NOT EXISTS failure_buckets (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            failure_type TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket, failure_type)
+        );
+
+        CREATE TRIGGER IF NOT EXISTS trg_failures_insert AFTER INSERT ON failures BEGIN
+            INSERT INTO failure_stats (failure_type, total, resolved, retries)
+                VALUES (NEW.failure_type, 1, NEW.resolved, NEW.retry_count)
+                ON CONFLICT (failure_type) DO UPDATE SET
+                    total = total + 1, resolved = resolved + NEW.resolved, retries = retries + NEW.retry_count;
+            INSERT INTO failure_buckets (granularity, bucket, failure_type, count)
+                VALUES ('hour', substr(NEW.timestamp, 1, 13), NEW.failure_type, 1)
+                ON CONFLICT (granularity, bucket, failure_type) DO UPDATE SET count = count + 1;
+            INSERT INTO failure_buckets (granularity, bucket, failure_type, count)
+                VALUES ('day', substr(NEW.timestamp, 1, 10), NEW.failure_type, 1)
+                ON CONFLICT (granularity, bucket, failure_type) DO UPDATE SET count = count + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_failures_update AFTER UPDATE ON failures BEGIN
+            UPDATE failure_stats SET
+                total = total - 1, resolved = resolved - OLD.resolved, retries = retries - OLD.retry_count
+                WHERE failure_type = OLD.failure_type;
+            INSERT INTO failure_stats (failure_type, total, resolved, retries)
+                VALUES (NEW.failure_type, 1, NEW.resolved, NEW.retry_count)
+                ON CONFLICT (failure_type) DO UPDATE SET
+                    total = total + 1, resolved = resolved + NEW.resolved, retries = retries + NEW.retry_count;
+        END;
+
+        -- A repeated failure for the same orderref is a new occurrence
+        CREATE TRIGGER IF NOT EXISTS trg_failures_repeat AFTER UPDATE OF timestamp ON failures
+            WHEN NEW.timestamp != OLD.timestamp BEGIN
+            INSERT INTO failure_buckets (granularity, bucket, failure_type, count)
+                VALUES ('hour', substr(NEW.timestamp, 1, 13), NEW.failure_type, 1)
+                ON CONFLICT (granularity, bucket, failure_type) DO UPDATE SET count = count + 1;
+            INSERT INTO failure_buckets (granularity, bucket, failure_type, count)
+                VALUES ('day', substr(NEW.timestamp, 1, 10), NEW.failure_type, 1)
+                ON CONFLICT (granularity, bucket, failure_type) DO UPDATE SET count = count + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_failures_delete AFTER DELETE ON failures BEGIN
+            UPDATE failure_stats SET
+                total = total - 1, resolved = resolved - OLD.resolved, retries = retries - OLD.retry_count
+                WHERE failure_type = OLD.failure_type;
+        END;
+    """
+
+    # Bump when the counter tables change shape, so they are rebuilt from the failures table
+    STATS_VERSION = "1"
+
+    COLUMNS = ("orderref", "error_message", "failure_type", "timestamp", "first_failure", "retry_count",
+               "resolved", "resolved_timestamp", "resolution_note", "customer_data")
+
+    def __init__(self, db_path: str = "failed_orders.db", legacy_json_path: Optional[str] = None):
+        """
+        Initialize SQLite store
+
+        Args:
+            db_path: Path to SQLite database file
+            legacy_json_path: JSON failure file to import once, if it exists
+        """
+        super().__init__(db_path)
+        self._ensure_stats_built()
+        if legacy_json_path:
+            self.migrate_from_json(legacy_json_path)
+
+    def _ensure_stats_built(self):
+        """
+        Build the counter tables from existing rows once (e.g. for a database
+        created before counters existed). After that, triggers keep them current.
+        """
+        with self.transaction() as conn:
+            row = conn.execute("SELECT value FROM failure_meta WHERE key = 'stats_version'").fetchone()
+            if row and row["value"] == self.STATS_VERSION:
+                return
+            self._rebuild_stats(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO failure_meta (key, value) VALUES ('stats_version', ?)",
+                (self.STATS_VERSION,)
+            )
+        logger.info(f"Rebuilt failure statistics counters in {self.db_path}")
+
+    @staticmethod
+    def _rebuild_stats(conn):
+        """Recompute failure_stats and failure_buckets from the failures table"""
+        conn.execute("DELETE FROM failure_stats")
+        conn.execute(
+            "INSERT INTO failure_stats (failure_type, total, resolved, retries) "
+            "SELECT failure_type, COUNT(*), SUM(resolved), SUM(retry_count) FROM failures GROUP BY failure_type"
+        )
+        conn.execute("DELETE FROM failure_buckets")
+        for granularity, length in (("hour", 13), ("day", 10)):
+            conn.execute(
+                "INSERT INTO failure_buckets (granularity, bucket, failure_type, count) "
+                f"SELECT ?, substr(timestamp, 1, {length}), failure_type, COUNT(*) FROM failures "
+                f"GROUP BY substr(timestamp, 1, {length}), failure_type",
+                (granularity,)
+            )
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """
+        Import a legacy failed_orders.json file once. The file is renamed to
+        <name>.migrated afterwards so it is not imported again.
+
+        Args:
+            json_path: Path to legacy JSON failure file
+
+        Returns:
+            Number of records imported
+        """
+        if not os.path.exists(json_path):
+            return 0
+
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                failures = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Could not read legacy failure file {json_path} for migration: {e}")
+            return 0
+
+        with self.transaction() as conn:
+            # Another worker may have migrated while we were reading the file
+            if conn.execute("SELECT 1 FROM failure_meta WHERE key = 'json_migrated_from'").fetchone():
+                return 0
+            for orderref, failure in failures.items():
+                failure = dict(failure, orderref=failure.get("orderref") or orderref)
+                conn.execute(
+                    f"INSERT OR IGNORE INTO failures ({', '.join(self.COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                    self._record_to_row(failure)
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO failure_meta (key, value) VALUES ('json_migrated_from', ?)",
+                (os.path.abspath(json_path),)
+            )
+
+        try:
+            os.replace(json_path, f"{json_path}.migrated")
+        except OSError as e:
+            logger.warning(f"Migrated {json_path} but could not rename it: {e}")
+
+        logger.info(f"Migrated {len(failures)} failure records from {json_path} to {self.db_path}")
+        return len(failures)
+
+    @classmethod
+    def _record_to_row(cls, record: Dict) -> tuple:
+        return (
+            record["orderref"],
+            record.get("error_message"),
+            record.get("failure_type") or "unknown",
+            record.get("timestamp") or _now_iso(),
+            record.get("first_failure"),
+            int(record.get("retry_count", 0) or 0),
+            1 if record.get("resolved") else 0,
+            record.get("resolved_timestamp"),
+            record.get("resolution_note"),
+            json.dumps(record.get("customer_data") or {}, ensure_ascii=False),
+        )
+
+    @staticmethod
+    def _row_to_record(row) -> Dict:
+        record = dict(row)
+        record["resolved"] = bool(record["resolved"])
+        if "customer_data" in record:
+            try:
+                record["customer_data"] = json.loads(record["customer_data"] or "{}")
+            except ValueError:
+                record["customer_data"] = {}
+        # Keep the same shape as the JSON backend: resolution fields only once resolved
+        if not record["resolved"]:
+            record.pop("resolved_timestamp", None)
+            record.pop("resolution_note", None)
+        return record
+
+    def record(self, failure_record: Dict) -> Dict:
+        with self.transaction() as conn:
+            existing = conn.execute(
+                "SELECT retry_count, timestamp FROM failures WHERE orderref = ?",
+                (failure_record["orderref"],)
+            ).fetchone()
+            if existing:
+                failure_record["retry_count"] = existing["retry_count"] + 1
+                failure_record["first_failure"] = existing["timestamp"]
+            else:
+                failure_record["first_failure"] = failure_record["timestamp"]
+            # Upsert (not REPLACE) so the update triggers see the old row and keep counters right
+            conn.execute(
+                f"INSERT INTO failures ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(self.COLUMNS))}) "
+                f"ON CONFLICT (orderref) DO UPDATE SET "
+                + ", ".join(f"{c} = excluded.{c}" for c in self.COLUMNS if c != "orderref"),
+                self._record_to_row(failure_record)
+            )
+        return failure_record
+
+    def get(self, orderref: str) -> Optional[Dict]:
+        row = self._conn().execute("SELECT * FROM failures WHERE orderref = ?", (orderref,)).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def get_all(self, include_resolved: bool = False) -> Dict:
+        return {record["orderref"]: record for record in self.list(include_resolved)}
+
+    def list(self, include_resolved: bool = False) -> List[Dict]:
+        query = "SELECT * FROM failures"
+        if not include_resolved:
+            query += " WHERE resolved = 0"
+        query += " ORDER BY timestamp DESC"
+        return [self._row_to_record(row) for row in self._conn().execute(query)]
+
+    def query(self, include_resolved: bool = False, failure_type: Optional[str] = None,
+              date_from: Optional[str] = None, date_to: Optional[str] = None,
+              min_retries: Optional[int] = None, max_retries: Optional[int] = None,
+              search: Optional[str] = None, sort: str = "timestamp", descending: bool = True,
+              limit: int = 50, offset: int = 0, include_customer_data: bool = True) -> Tuple[List[Dict], int]:
+        clauses, params = [], []
+        if not include_resolved:
+            clauses.append("resolved = 0")
+        if failure_type:
+            clauses.append("failure_type = ?")
+            params.append(failure_type)
+        if date_from:
+            clauses.append("timestamp >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("timestamp <= ?")
+            params.append(_date_to_upper_bound(date_to))
+        if min_retries is not None:
+            clauses.append("retry_count >= ?")
+            params.append(min_retries)
+        if max_retries is not None:
+            clauses.append("retry_count <= ?")
+            params.append(max_retries)
+        if search:
+            pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            clauses.append(
+                "(orderref LIKE ? ESCAPE '\\' OR error_message LIKE ? ESCAPE '\\' OR customer_data LIKE ? ESCAPE '\\')"
+            )
+            params.extend([pattern, pattern, pattern])
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Cannot sort by '{sort}'")
+        direction = "DESC" if descending else "ASC"
+        columns = self.COLUMNS if include_customer_data else [c for c in self.COLUMNS if c != "customer_data"]
+
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM failures{where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(columns)} FROM failures{where} "
+            f"ORDER BY {sort} {direction}, orderref {direction} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )
+        return [self._row_to_record(row) for row in rows], total
+
+    def delete(self, orderrefs: Iterable[str]) -> int:
+        orderrefs = list(orderrefs)
+        if not orderrefs:
+            return 0
+        with self.transaction() as conn:
+            return conn.executemany("DELETE FROM failures WHERE orderref = ?", [(o,) for o in orderrefs]).rowcount
+
+    def resolve(self, orderref: str, resolved_timestamp: str, resolution_note: str) -> bool:
+        with self.transaction() as conn:
+            updated = conn.execute(
+                "UPDATE failures SET resolved = 1, resolved_timestamp = ?, resolution_note = ? WHERE orderref = ?",
+                (resolved_timestamp, resolution_note, orderref)
+            ).rowcount
+        return updated > 0
+
+    def stats(self) -> Dict:
+        # Reads the per-type counter rows, not the failures table
+        total = resolved = retries = 0
+        failure_types = {}
+        for row in self._conn().execute("SELECT * FROM failure_stats WHERE total > 0"):
+            failure_types[row["failure_type"]] = row["total"]
+            total += row["total"]
+            resolved += row["resolved"]
+            retries += row["retries"]
+        return {
+            "total_failures": total,
+            "unresolved_failures": total - resolved,
+            "resolved_failures": resolved,
+            "failure_types": failure_types,
+            "total_retries": retries
+        }
+
+    def trends(self, granularity: str = "day", since: Optional[str] = None,
+               failure_type: Optional[str] = None) -> List[Dict]:
+        query = "SELECT bucket, failure_type, count FROM failure_buckets WHERE granularity = ?"
+        params = [granularity]
+        if since:
+            query += " AND bucket >= ?"
+            params.append(since)
+        if failure_type:
+            query += " AND failure_type = ?"
+            params.append(failure_type)
+        query += " ORDER BY bucket"
+        return [dict(row) for row in self._conn().execute(query, params)]
+
+    def prune_trends(self, granularity: str, before: str) -> int:
+        with self.transaction() as conn:
+            return conn.execute(
+                "DELETE FROM failure_buckets WHERE granularity = ? AND bucket < ?",
+                (granularity, before)
+            ).rowcount
+
+    def resolved_records(self) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT orderref, resolved_timestamp, timestamp FROM failures WHERE resolved = 1"
+        )
+        return [dict(row) for row in rows]
+
+
+class FailureTracker:
+    """
+    Manages tracking of failed customer creation attempts
+    """
+
+    def __init__(self, failure_file_path: str = "failed_orders.json", backend: str = "sqlite",
+                 db_path: str = "failed_orders.db"):
+        """
+        Initialize failure tracker
+
+        Args:
+            failure_file_path: Path to JSON file for storing failure data (json backend),
+                               or legacy file to migrate from (sqlite backend)
+            backend: Storage backend, "sqlite" (default) or "json"
+            db_path: Path to SQLite database file (sqlite backend)
+        """
+        self.failure_file_path = failure_file_path
+        if backend == "json":
+            self.store = JSONFailureStore(failure_file_path)
+        elif backend == "sqlite":
+            self.store = SQLiteFailureStore(db_path, legacy_json_path=failure_file_path)
+        else:
+            raise ValueError(f"Unknown failure store backend: {backend}")
+
     def _generate_unique_orderref(self) -> str:
         """
         Generate a unique orderref for failures without an order reference
-        
+
         Returns:
             Unique identifier string
         """
@@ -76,198 +724,193 @@ class FailureTracker:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         short_uuid = str(uuid.uuid4())[:8]
         return f"UNKNOWN_{timestamp}_{short_uuid}"
-    
-    def record_failure(self, orderref: str, error_message: str, failure_type: str = "customer_creation", 
+
+    def record_failure(self, orderref: str, error_message: str, failure_type: str = "customer_creation",
                       customer_data: Optional[Dict] = None):
         """
         Record a new failure
-        
+
         Args:
             orderref: Order reference that failed
             error_message: Description of what went wrong
             failure_type: Type of failure (customer_creation, service_plan, etc.)
             customer_data: Optional customer data for debugging
         """
-        
-         # Generate unique orderref if empty or None
-        original_orderref = orderref
+
+        # Generate unique orderref if empty or None
         if not orderref or not orderref.strip():
             orderref = self._generate_unique_orderref()
             logger.warning(f"No orderref provided, generated: {orderref}")
-       
-        failures = self._load_failures()
-        
+
         failure_record = {
             "orderref": orderref,
             "error_message": error_message,
             "failure_type": failure_type,
-            "timestamp": datetime.now(timezone.utc).astimezone().isoformat(),
+            "timestamp": _now_iso(),
             "customer_data": customer_data or {},
             "retry_count": 0,
             "resolved": False
         }
-        
-        # If orderref already exists, update it (but increment retry count)
-        if orderref in failures:
-            failure_record["retry_count"] = failures[orderref].get("retry_count", 0) + 1
-            failure_record["first_failure"] = failures[orderref].get("timestamp")
+
+        # If orderref already exists, it is replaced and its retry count incremented
+        failure_record = self.store.record(failure_record)
+        if failure_record["retry_count"]:
             logger.warning(f"Recording repeated failure for orderref {orderref} (retry #{failure_record['retry_count']})")
         else:
-            failure_record["first_failure"] = failure_record["timestamp"]
             logger.info(f"Recording new failure for orderref {orderref}")
-        
-        failures[orderref] = failure_record
-        self._save_failures(failures)
-        
+
         logger.error(f"Failure recorded - OrderRef: {orderref}, Type: {failure_type}, Error: {error_message}")
-    
+
+    def get_failure(self, orderref: str) -> Optional[Dict]:
+        """
+        Get the failure record for one order
+
+        Args:
+            orderref: Order reference
+
+        Returns:
+            Failure record, or None if the order has no failure
+        """
+        return self.store.get(orderref)
+
     def get_failures(self, include_resolved: bool = False) -> Dict:
         """
         Get all failure records
-        
+
         Args:
             include_resolved: Whether to include resolved failures
-            
+
         Returns:
             Dictionary of failure records
         """
-        failures = self._load_failures()
-        
-        if not include_resolved:
-            # Filter out resolved failures
-            failures = {k: v for k, v in failures.items() if not v.get("resolved", False)}
-        
-        return failures
-    
+        return self.store.get_all(include_resolved)
+
     def get_failure_list(self, include_resolved: bool = False) -> List[Dict]:
         """
         Get failure records as a list sorted by timestamp (newest first)
-        
+
         Args:
             include_resolved: Whether to include resolved failures
-            
+
         Returns:
             List of failure records
         """
-        failures = self.get_failures(include_resolved)
-        
-        # Convert to list and sort by timestamp (newest first)
-        failure_list = list(failures.values())
-        failure_list.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-        
-        return failure_list
-    
+        return self.store.list(include_resolved)
+
+    def query_failures(self, limit: int = 50, offset: int = 0, **filters) -> Dict:
+        """
+        Get one page of failure records with server-side filtering and sorting
+
+        Args:
+            limit: Page size
+            offset: Number of matching records to skip
+            **filters: Filters and sort options accepted by FailureStore.query
+
+        Returns:
+            Dictionary with the page of failures, total matches and paging info
+        """
+        failures, total = self.store.query(limit=limit, offset=offset, **filters)
+        next_offset = offset + len(failures)
+        return {
+            "failures": failures,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "has_more": next_offset < total,
+            "next_offset": next_offset if next_offset < total else None
+        }
+
     def remove_failure(self, orderref: str) -> bool:
         """
         Remove a failure record
-        
+
         Args:
             orderref: Order reference to remove
-            
+
         Returns:
             True if removed, False if not found
         """
-        failures = self._load_failures()
-        
-        if orderref in failures:
-            del failures[orderref]
-            self._save_failures(failures)
+        if self.store.delete([orderref]):
             logger.info(f"Removed failure record for orderref: {orderref}")
             return True
         else:
             logger.warning(f"Attempted to remove non-existent failure record: {orderref}")
             return False
-    
+
     def mark_resolved(self, orderref: str, resolution_note: str = "") -> bool:
         """
         Mark a failure as resolved (instead of deleting)
-        
+
         Args:
             orderref: Order reference to mark as resolved
             resolution_note: Optional note about how it was resolved
-            
+
         Returns:
             True if marked as resolved, False if not found
         """
-        failures = self._load_failures()
-        
-        if orderref in failures:
-            failures[orderref]["resolved"] = True
-            failures[orderref]["resolved_timestamp"] =datetime.now(timezone.utc).astimezone().isoformat()
-            failures[orderref]["resolution_note"] = resolution_note
-            self._save_failures(failures)
+        if self.store.resolve(orderref, _now_iso(), resolution_note):
             logger.info(f"Marked failure as resolved for orderref: {orderref}")
             return True
         else:
             logger.warning(f"Attempted to mark non-existent failure as resolved: {orderref}")
             return False
-    
+
     def get_failure_stats(self) -> Dict:
         """
         Get statistics about failures
-        
+
         Returns:
             Dictionary with failure statistics
         """
-        failures = self._load_failures()
-        
-        total_failures = len(failures)
-        unresolved_failures = len([f for f in failures.values() if not f.get("resolved", False)])
-        resolved_failures = total_failures - unresolved_failures
-        
-        # Count by failure type
-        failure_types = {}
-        for failure in failures.values():
-            failure_type = failure.get("failure_type", "unknown")
-            failure_types[failure_type] = failure_types.get(failure_type, 0) + 1
-        
-        # Count retries
-        retries = sum(f.get("retry_count", 0) for f in failures.values())
-        
-        return {
-            "total_failures": total_failures,
-            "unresolved_failures": unresolved_failures,
-            "resolved_failures": resolved_failures,
-            "failure_types": failure_types,
-            "total_retries": retries
-        }
-    
-    def cleanup_old_resolved(self, days_old: int = 30) -> int:
+        return self.store.stats()
+
+    def get_failure_trends(self, granularity: str = "day", days: int = 30,
+                           failure_type: Optional[str] = None) -> List[Dict]:
+        """
+        Get failure counts per hour/day bucket and failure type
+
+        Args:
+            granularity: "hour" or "day"
+            days: How many days back to include
+            failure_type: Only this failure type
+
+        Returns:
+            List of {"bucket", "failure_type", "count"} sorted by bucket
+        """
+        if granularity not in ("hour", "day"):
+            raise ValueError(f"Unknown granularity: {granularity}")
+        since = (datetime.now().astimezone() - timedelta(days=days)).isoformat()
+        since = since[:13] if granularity == "hour" else since[:10]
+        return self.store.trends(granularity, since=since, failure_type=failure_type)
+
+    def cleanup_old_resolved(self, days_old: int = 30, hourly_trend_days: int = 14) -> int:
         """
         Remove resolved failures older than specified days
-        
+
+        Also drops hourly trend buckets older than hourly_trend_days (daily buckets are kept)
+
         Args:
             days_old: Remove resolved failures older than this many days
-            
+            hourly_trend_days: Keep this many days of hourly trend buckets
+
         Returns:
             Number of records removed
         """
-        from datetime import timedelta
-        
-        failures = self._load_failures()
-        cutoff_date = datetime.now() - timedelta(days=days_old)
-        
-        removed_count = 0
+        cutoff_date = datetime.now().astimezone() - timedelta(days=days_old)
+        hourly_cutoff = (datetime.now().astimezone() - timedelta(days=hourly_trend_days)).isoformat()[:13]
+        self.store.prune_trends("hour", hourly_cutoff)
+
         to_remove = []
-        
-        for orderref, failure in failures.items():
-            if failure.get("resolved", False):
-                resolved_timestamp = failure.get("resolved_timestamp", failure.get("timestamp"))
-                if resolved_timestamp:
-                    try:
-                        resolved_date = datetime.fromisoformat(resolved_timestamp)
-                        if resolved_date < cutoff_date:
-                            to_remove.append(orderref)
-                    except ValueError:
-                        # Invalid timestamp format, skip
-                        continue
-        
-        for orderref in to_remove:
-            del failures[orderref]
-            removed_count += 1
-        
+        for failure in self.store.resolved_records():
+            resolved_timestamp = failure.get("resolved_timestamp") or failure.get("timestamp")
+            resolved_date = _parse_timestamp(resolved_timestamp)
+            # Invalid timestamp format, skip
+            if resolved_date and resolved_date < cutoff_date:
+                to_remove.append(failure["orderref"])
+
+        removed_count = self.store.delete(to_remove)
+
         if removed_count > 0:
-            self._save_failures(failures)
             logger.info(f"Cleaned up {removed_count} old resolved failures")
-        
-        return removed_count
\ No newline at end of file
+
+        return removed_count
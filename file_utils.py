@@ -0,0 +1,46 @@
+"""
+File helpers shared by the file-backed stores.
+
+This module handles:
+- Writing a file atomically (temp file + fsync + rename), so readers in any uWSGI
+  worker see the old or the new content, never a partial file
+- Keeping the permissions of the file being replaced
+"""
+
+import os
+import stat
+import threading
+
+
+def write_atomic(path: str, content: str, mode: int = 0o666):
+    """
+    Write a text file through a temp file and rename, so readers see the old or the new
+    content, never a partial file
+
+    Args:
+        path: Destination path
+        content: File content
+        mode: Permissions for a new file (minus umask); an existing file keeps its own
+    """
+    try:
+        existing_mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        existing_mode = None
+
+    # Same directory, so the rename is atomic
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode if existing_mode is None else 0o600)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            if existing_mode is not None:
+                os.chmod(tmp_path, existing_mode)
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,170 @@
+"""
+Shared HTTP client layer for upstream APIs (Utopia, PowerCode).
+
+This module handles:
+- One pooled, keep-alive requests.Session per upstream and per worker process
+- Default connect/read timeouts for every call
+- Connection reuse statistics for each worker
+- Per-call timing logged with upstream/method/status/duration_ms fields (DEBUG)
+  and recorded in the upstream latency metrics
+- Routing every call through the resilience layer (rate limits, retries, circuit breaker)
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+import metrics
+import resilience
+
+logger = logging.getLogger(__name__)
+
+_sessions = {}
+_sessions_pid = None
+_sessions_lock = threading.Lock()
+
+
+class PooledSession(requests.Session):
+    """
+    requests.Session that applies a default timeout when the caller gives none and
+    sends each call through the upstream guard (see resilience.py)
+    """
+
+    def __init__(self, timeout, upstream: str = ""):
+        super().__init__()
+        self.default_timeout = timeout
+        self.upstream = upstream
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.default_timeout
+        guard = resilience.get_guard() if self.upstream else None
+        if guard is None:
+            return self._send(method, url, **kwargs)
+        return guard.call(self.upstream, method, url, kwargs, lambda: self._send(method, url, **kwargs))
+
+    def _send(self, method, url, **kwargs):
+        endpoint = resilience.endpoint_for(method, url, kwargs)
+        started = time.monotonic()
+        try:
+            response = super().request(method, url, **kwargs)
+        except Exception:
+            metrics.observe_upstream(self.upstream, endpoint, "error", time.monotonic() - started)
+            raise
+        metrics.observe_upstream(self.upstream, endpoint, str(response.status_code), time.monotonic() - started)
+        logger.debug(
+            f"{method} {response.url.split('?', 1)[0]} -> {response.status_code}",
+            extra={
+                "upstream": self.upstream,
+                "method": method,
+                "status": response.status_code,
+                "duration_ms": round((time.monotonic() - started) * 1000),
+            }
+        )
+        return response
+
+
+def _build_session(upstream: str) -> PooledSession:
+    """
+    Create a pooled session for an upstream using the configured pool size and timeouts
+
+    Args:
+        upstream: Upstream name (e.g. "utopia", "powercode")
+
+    Returns:
+        PooledSession with HTTP and HTTPS adapters mounted
+    """
+    session = PooledSession(timeout=(config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT), upstream=upstream)
+    adapter = HTTPAdapter(
+        pool_connections=config.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=config.HTTP_POOL_MAXSIZE,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    logger.info(
+        f"Created HTTP session for {upstream} in process {os.getpid()} "
+        f"(pool size: {config.HTTP_POOL_MAXSIZE}, timeouts: {session.default_timeout})"
+    )
+    return session
+
+
+def get_session(upstream: str) -> PooledSession:
+    """
+    Get the shared session for an upstream in the current process.
+    Sessions are rebuilt after a fork so sockets are never shared between workers.
+
+    Args:
+        upstream: Upstream name (e.g. "utopia", "powercode")
+
+    Returns:
+        PooledSession
+    """
+    global _sessions_pid
+
+    if _sessions_pid == os.getpid():
+        session = _sessions.get(upstream)
+        if session is not None:
+            return session
+
+    with _sessions_lock:
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        if upstream not in _sessions:
+            _sessions[upstream] = _build_session(upstream)
+        return _sessions[upstream]
+
+
+def close_sessions():
+    """Close all sessions in this process (e.g. after timeouts or pool size change)"""
+    global _sessions_pid
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _sessions_pid = None
+
+
+def get_pool_stats() -> Dict:
+    """
+    Report connection reuse for each upstream session in this worker process
+
+    Returns:
+        Dictionary with the worker pid and per-upstream request/connection counts
+    """
+    upstreams = {}
+    if _sessions_pid == os.getpid():
+        for upstream, session in list(_sessions.items()):
+            requests_sent = 0
+            connections_opened = 0
+            seen = set()
+            for adapter in session.adapters.values():
+                if id(adapter) in seen:
+                    continue
+                seen.add(id(adapter))
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    requests_sent += pool.num_requests
+                    connections_opened += pool.num_connections
+
+            reused = max(requests_sent - connections_opened, 0)
+            upstreams[upstream] = {
+                "requests": requests_sent,
+                "connections_opened": connections_opened,
+                "connections_reused": reused,
+                "reuse_ratio": round(reused / requests_sent, 3) if requests_sent else 0.0,
+            }
+
+    return {
+        "pid": os.getpid(),
+        "upstreams": upstreams,
+    }
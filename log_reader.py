@@ -0,0 +1,510 @@
+"""
+Incremental reader for the application log file.
+
+This module handles:
+- Tailing the log by seeking backwards from EOF in fixed-size blocks
+- Searching newest-first and stopping once enough matching entries are found
+- Level and time-range filters on whole log entries (tracebacks stay attached)
+- Byte-offset cursors so clients can fetch only lines appended since last read
+- Following the file across rotation for live streaming
+"""
+
+import os
+import re
+import time
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 64 * 1024
+# Upper bound on bytes scanned by one request, so a search with few matches
+# in a huge file returns a partial result (with a cursor) instead of reading it all
+MAX_SCAN_BYTES = 64 * 1024 * 1024
+
+# Text entries start with "%(asctime)s - %(levelname)s - ", JSON entries with
+# {"ts": ..., "level": ...} (see app_logging)
+ENTRY_RE = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - ([A-Z]+) - ")
+JSON_ENTRY_RE = re.compile(r'^\{"ts": "(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3})", "level": "([A-Z]+)"')
+TIME_RE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}(:\d{2}(:\d{2})?)?)?$")
+
+
+def parse_header(line: str) -> Optional[Tuple[str, str]]:
+    """
+    Get (timestamp, level) if the line starts a log entry in either format
+
+    Args:
+        line: Decoded log line
+
+    Returns:
+        (timestamp, level) or None for continuation lines
+    """
+    match = ENTRY_RE.match(line) or JSON_ENTRY_RE.match(line)
+    return (match.group(1), match.group(2)) if match else None
+
+
+def file_id(path: str) -> Optional[str]:
+    """
+    Identify the current log file, so a cursor from a rotated-away file is detected
+
+    Args:
+        path: Log file path
+
+    Returns:
+        "<device>:<inode>" string, or None if the file does not exist
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{st.st_dev}:{st.st_ino}"
+
+
+def normalize_time(value: Optional[str]) -> Optional[str]:
+    """
+    Turn a user supplied time ("2024-05-01", "2024-05-01T13:45") into the
+    log's own timestamp format so it can be compared as a string
+
+    Args:
+        value: Date or date-time string, or None
+
+    Returns:
+        Normalized string or None
+
+    Raises:
+        ValueError: If the value is not a date or date-time
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if not TIME_RE.match(value):
+        raise ValueError(f"Invalid time: {value}")
+    return value.replace("T", " ")
+
+
+class LogFilter:
+    """
+    Matches whole log entries against search text, minimum level and time range
+    """
+
+    def __init__(self, search: Optional[str] = None, level: Optional[str] = None,
+                 since: Optional[str] = None, until: Optional[str] = None):
+        """
+        Initialize filter
+
+        Args:
+            search: Case-insensitive text the entry must contain
+            level: Minimum level name (e.g. "WARNING" matches WARNING, ERROR, CRITICAL)
+            since: Only entries at or after this time (see normalize_time)
+            until: Only entries before or at this time (see normalize_time)
+
+        Raises:
+            ValueError: If level or times are invalid
+        """
+        self.search = search.lower() if search else None
+        self.min_level = None
+        if level:
+            self.min_level = logging.getLevelName(level.upper())
+            if not isinstance(self.min_level, int):
+                raise ValueError(f"Unknown log level: {level}")
+        self.since = normalize_time(since)
+        self.until = normalize_time(until)
+
+    @property
+    def active(self) -> bool:
+        return bool(self.search or self.min_level or self.since or self.until)
+
+    def matches(self, timestamp: Optional[str], level: Optional[str], text: str) -> bool:
+        """Check one entry (timestamp/level are None for lines without a header)"""
+        if self.min_level:
+            level_no = logging.getLevelName(level) if level else None
+            if not isinstance(level_no, int) or level_no < self.min_level:
+                return False
+        if self.since and (not timestamp or timestamp < self.since):
+            return False
+        if self.until and (not timestamp or timestamp[:len(self.until)] > self.until):
+            return False
+        if self.search and self.search not in text.lower():
+            return False
+        return True
+
+    def before_range(self, timestamp: Optional[str]) -> bool:
+        """True once a newest-first scan has gone past the start of the time range"""
+        return bool(self.since and timestamp and timestamp < self.since)
+
+
+def group_entries(lines: Iterable[str]) -> Iterator[Tuple[Optional[str], Optional[str], List[str]]]:
+    """
+    Group lines (oldest first) into log entries; continuation lines such as
+    tracebacks join the entry above them
+
+    Args:
+        lines: Decoded lines without newlines
+
+    Yields:
+        (timestamp, level, lines) per entry; timestamp/level are None for
+        continuation lines at the very start
+    """
+    current = None
+    for line in lines:
+        header = parse_header(line)
+        if header or current is None:
+            if current:
+                yield current
+            current = (header[0] if header else None, header[1] if header else None, [line])
+        else:
+            current[2].append(line)
+    if current:
+        yield current
+
+
+def seek_time(f, size: int, since: str) -> int:
+    """
+    Binary search a chronological log for the first entry at or after `since`
+
+    Args:
+        f: File opened in binary mode
+        size: Number of bytes to search
+        since: Timestamp in log format (see normalize_time)
+
+    Returns:
+        Line-aligned byte offset at or shortly before the first entry >= since
+    """
+    lo, hi = 0, size
+    while hi - lo > BLOCK_SIZE:
+        mid = (lo + hi) // 2
+        timestamp = _next_timestamp(f, mid, hi)
+        if timestamp is None or timestamp >= since:
+            hi = mid
+        else:
+            lo = mid
+    return _next_line_boundary(f, lo) if lo else 0
+
+
+def _next_timestamp(f, offset: int, limit: int) -> Optional[str]:
+    """Timestamp of the first entry header starting after `offset` (before `limit`)"""
+    f.seek(_next_line_boundary(f, offset))
+    while f.tell() < limit:
+        line = f.readline()
+        if not line:
+            return None
+        header = parse_header(line.decode("utf-8", errors="replace"))
+        if header:
+            return header[0]
+    return None
+
+
+def _reverse_lines(f, end: int, block_size: int = BLOCK_SIZE) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yield (start_offset, line) pairs from `end` backwards to the start of the file
+
+    Args:
+        f: File opened in binary mode
+        end: Byte offset to start from (exclusive); should sit on a line boundary
+        block_size: Bytes read per seek
+
+    Yields:
+        Byte offset where the line starts and the line without its newline
+    """
+    position = end
+    remainder = b""
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        f.seek(position)
+        chunk = f.read(read_size) + remainder
+        parts = chunk.split(b"\n")
+        # parts[0] may be the tail of a line that continues in the previous block
+        remainder = parts[0]
+        offset = position + len(chunk)
+        for part in reversed(parts[1:]):
+            offset -= len(part) + 1
+            yield offset + 1, part
+    if remainder or end > 0:
+        yield 0, remainder
+
+
+def _reverse_entries(f, end: int) -> Iterator[Tuple[int, Optional[str], Optional[str], List[str]]]:
+    """
+    Group lines into log entries while reading backwards, so continuation lines
+    (e.g. tracebacks) are kept with the header line that precedes them
+
+    Yields:
+        (start_offset, timestamp, level, lines) for each entry, newest first
+    """
+    pending = []
+    for offset, raw in _reverse_lines(f, end):
+        line = raw.decode("utf-8", errors="replace")
+        if not line and not pending and offset + 1 >= end:
+            # Trailing newline at EOF
+            continue
+        pending.append(line)
+        header = parse_header(line)
+        if header:
+            pending.reverse()
+            yield offset, header[0], header[1], pending
+            pending = []
+    if pending:
+        pending.reverse()
+        yield 0, None, None, pending
+
+
+def read_tail(path: str, entries: int = 100, log_filter: Optional[LogFilter] = None,
+              before: Optional[int] = None, max_scan_bytes: int = MAX_SCAN_BYTES) -> Dict:
+    """
+    Return the newest matching entries, reading backwards from EOF (or from a cursor)
+
+    Args:
+        path: Log file path
+        entries: Maximum number of entries to return
+        log_filter: Optional filter; the scan stops once `entries` matches are found
+        before: Byte offset to read backwards from (start_offset of a previous page)
+        max_scan_bytes: Stop after scanning this many bytes even if fewer matches were found
+
+    Returns:
+        Dictionary with content, entries, start_offset (cursor for older entries),
+        end_offset (cursor for newer lines), has_more, scanned_bytes, file_id and file_size
+    """
+    log_filter = log_filter or LogFilter()
+    size = os.path.getsize(path)
+    end = size if before is None else max(0, min(before, size))
+    matched = []
+    start = end
+    reached_since = False
+
+    with open(path, "rb") as f:
+        if before is None:
+            # Only hand out complete lines; a partial last line is picked up by the next read
+            end = last_line_boundary(f, size)
+            start = end
+        for offset, timestamp, level, lines in _reverse_entries(f, end):
+            if log_filter.before_range(timestamp):
+                reached_since = True
+                break
+            start = offset
+            if log_filter.matches(timestamp, level, "\n".join(lines)):
+                matched.append(lines)
+                if len(matched) >= entries:
+                    break
+            if end - offset >= max_scan_bytes:
+                break
+
+    matched.reverse()
+    content_lines = [line for lines in matched for line in lines]
+    return {
+        "content": "\n".join(content_lines) + ("\n" if content_lines else ""),
+        "entries": len(matched),
+        "lines": len(content_lines),
+        "start_offset": start,
+        "end_offset": end if before is None else None,
+        "has_more": start > 0 and not reached_since,
+        "scanned_bytes": end - start,
+        "file_id": file_id(path),
+        "file_size": size,
+    }
+
+
+def read_since(path: str, offset: int, cursor_file_id: Optional[str] = None,
+               log_filter: Optional[LogFilter] = None, max_bytes: int = 4 * 1024 * 1024) -> Dict:
+    """
+    Return complete lines appended after `offset`
+
+    Args:
+        path: Log file path
+        offset: end_offset returned by a previous read
+        cursor_file_id: file_id returned by a previous read; a mismatch means the file was rotated
+        log_filter: Optional filter applied to each new entry
+        max_bytes: Maximum bytes to read in one call; the returned cursor continues from there
+
+    Returns:
+        Dictionary like read_tail, plus "reset": True when the cursor no longer applies
+        (file rotated or truncated), in which case the caller should reload the tail
+    """
+    log_filter = log_filter or LogFilter()
+    size = os.path.getsize(path)
+    current_id = file_id(path)
+    if offset < 0 or offset > size or (cursor_file_id and cursor_file_id != current_id):
+        return {
+            "reset": True,
+            "content": "",
+            "entries": 0,
+            "lines": 0,
+            "start_offset": None,
+            "end_offset": None,
+            "file_id": current_id,
+            "file_size": size,
+        }
+
+    with open(path, "rb") as f:
+        content_lines, entries, consumed = _read_forward(f, offset, size, log_filter, max_bytes)
+
+    return {
+        "reset": False,
+        "content": "\n".join(content_lines) + ("\n" if content_lines else ""),
+        "entries": entries,
+        "lines": len(content_lines),
+        "start_offset": offset,
+        "end_offset": offset + consumed,
+        "file_id": current_id,
+        "file_size": size,
+    }
+
+
+def follow(path: str, offset: Optional[int] = None, cursor_file_id: Optional[str] = None,
+           log_filter: Optional[LogFilter] = None, poll_interval: float = 1.0,
+           max_seconds: float = 25.0, heartbeat_interval: float = 10.0,
+           batch_bytes: int = 256 * 1024, max_lag_bytes: int = 4 * 1024 * 1024) -> Iterator[Dict]:
+    """
+    Follow the log file like `tail -F`, yielding only appended lines.
+
+    The open file handle is kept across rotation, so lines written to the old
+    file before it was rotated are still delivered before switching to the new one.
+    Nothing is read ahead of the consumer: each batch (at most batch_bytes) is read
+    only after the previous event was taken, and a consumer more than max_lag_bytes
+    behind skips ahead (reported as a "gap" event) instead of buffering.
+
+    Args:
+        path: Log file path
+        offset: Byte offset to start from (default: end of file)
+        cursor_file_id: file_id the offset belongs to; a mismatch starts the current file from 0
+        log_filter: Optional filter applied to each entry
+        poll_interval: Seconds between checks when there is nothing new
+        max_seconds: Stop after this long (keeps requests under the uWSGI harakiri limit)
+        heartbeat_interval: Seconds of silence before a "heartbeat" event
+        batch_bytes: Maximum bytes read per "lines" event
+        max_lag_bytes: Maximum unread bytes before skipping ahead
+
+    Yields:
+        {"event": "lines", "content", "entries", "lines", "end_offset", "file_id"}
+        {"event": "rotated", "file_id"} when a new log file is picked up (offset restarts at 0)
+        {"event": "gap", "skipped_bytes", "end_offset", "file_id"} when the consumer fell behind
+        {"event": "heartbeat", "end_offset", "file_id"} to keep idle connections open
+    """
+    log_filter = log_filter or LogFilter()
+    deadline = time.monotonic() + max_seconds
+    last_event = time.monotonic()
+    f = None
+
+    try:
+        while time.monotonic() < deadline:
+            if f is None:
+                try:
+                    f = open(path, "rb")
+                except FileNotFoundError:
+                    time.sleep(poll_interval)
+                    continue
+                current_id = _handle_id(f)
+                size = os.fstat(f.fileno()).st_size
+                if offset is None:
+                    offset = last_line_boundary(f, size)
+                elif cursor_file_id and cursor_file_id != current_id:
+                    offset = 0
+                    yield {"event": "rotated", "file_id": current_id}
+                    last_event = time.monotonic()
+                cursor_file_id = current_id
+
+            size = os.fstat(f.fileno()).st_size
+            if size < offset:
+                # Truncated in place
+                offset = 0
+                yield {"event": "rotated", "file_id": cursor_file_id}
+                last_event = time.monotonic()
+
+            if size - offset > max_lag_bytes:
+                skip_to = _next_line_boundary(f, size - max_lag_bytes)
+                yield {"event": "gap", "skipped_bytes": skip_to - offset,
+                       "end_offset": skip_to, "file_id": cursor_file_id}
+                offset = skip_to
+                last_event = time.monotonic()
+
+            if size > offset:
+                content_lines, entries, consumed = _read_forward(f, offset, size, log_filter, batch_bytes)
+                offset += consumed
+                if content_lines:
+                    yield {
+                        "event": "lines",
+                        "content": "\n".join(content_lines) + "\n",
+                        "entries": entries,
+                        "lines": len(content_lines),
+                        "end_offset": offset,
+                        "file_id": cursor_file_id,
+                    }
+                    last_event = time.monotonic()
+                if consumed:
+                    continue
+
+            # Caught up with this handle; switch files if the path now points elsewhere
+            if file_id(path) not in (None, cursor_file_id):
+                f.close()
+                f = None
+                continue
+
+            if time.monotonic() - last_event >= heartbeat_interval:
+                yield {"event": "heartbeat", "end_offset": offset, "file_id": cursor_file_id}
+                last_event = time.monotonic()
+            time.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
+
+
+def _handle_id(f) -> str:
+    st = os.fstat(f.fileno())
+    return f"{st.st_dev}:{st.st_ino}"
+
+
+def _read_forward(f, offset: int, size: int, log_filter: LogFilter,
+                  max_bytes: int) -> Tuple[List[str], int, int]:
+    """
+    Read complete lines from `offset` (at most max_bytes) and apply the filter
+
+    Returns:
+        (matching lines, number of matching entries, bytes consumed)
+    """
+    f.seek(offset)
+    data = f.read(min(max_bytes, size - offset))
+    # Stop at the last newline so partially written lines are read next time
+    consumed = data.rfind(b"\n") + 1
+    if consumed == 0 and len(data) >= max_bytes:
+        # A single line longer than max_bytes; hand it out in pieces rather than stalling
+        consumed = len(data)
+        data += b"\n"
+    else:
+        data = data[:consumed]
+
+    raw_lines = data.split(b"\n")[:-1] if data else []
+    content_lines = []
+    entries = 0
+    for timestamp, level, lines in group_entries(raw.decode("utf-8", errors="replace") for raw in raw_lines):
+        if log_filter.matches(timestamp, level, "\n".join(lines)):
+            content_lines.extend(lines)
+            entries += 1
+    return content_lines, entries, consumed
+
+
+def _next_line_boundary(f, offset: int) -> int:
+    """Offset just after the first newline at or after `offset`"""
+    f.seek(offset)
+    position = offset
+    while True:
+        block = f.read(BLOCK_SIZE)
+        if not block:
+            return position
+        index = block.find(b"\n")
+        if index >= 0:
+            return position + index + 1
+        position += len(block)
+
+
+def last_line_boundary(f, size: int) -> int:
+    """Offset just after the last newline in the file (0 if there is none)"""
+    position = size
+    while position > 0:
+        read_size = min(BLOCK_SIZE, position)
+        position -= read_size
+        f.seek(position)
+        index = f.read(read_size).rfind(b"\n")
+        if index >= 0:
+            return position + index + 1
+    return 0
+
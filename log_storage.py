@@ -0,0 +1,442 @@
+"""
+Rotating, compressed storage for the application log.
+
+This module handles:
+- Rotating the active log file by size and age, safely across uWSGI worker processes
+- Compressing rotated segments to gzip as independently decompressible blocks
+- Writing a sidecar index per segment mapping timestamps to block offsets
+- Reading a time window across segments and the active file, decompressing only
+  the blocks that overlap it
+"""
+
+import os
+import glob
+import gzip
+import json
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+import log_reader
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Uncompressed bytes per gzip member; a time-window read decompresses whole blocks
+INDEX_BLOCK_SIZE = 1024 * 1024
+SEGMENT_SUFFIX = ".gz"
+INDEX_SUFFIX = ".idx.json"
+
+_index_cache = {}
+
+
+@contextmanager
+def _rotation_lock(log_path: str):
+    """Exclusive lock shared by every process writing to log_path"""
+    if fcntl is None:
+        yield
+        return
+    with open(log_path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _parse_timestamp(timestamp: str) -> datetime:
+    # fromisoformat rather than strptime: strptime's lazy import can fail when
+    # first used concurrently from the listener and compression threads
+    return datetime.fromisoformat(timestamp.replace(",", "."))
+
+
+def _first_timestamp(path: str) -> Optional[str]:
+    """Timestamp of the first entry in a plain log file"""
+    try:
+        with open(path, "rb") as f:
+            for _ in range(50):
+                line = f.readline()
+                if not line:
+                    break
+                header = log_reader.parse_header(line.decode("utf-8", errors="replace"))
+                if header:
+                    return header[0]
+    except FileNotFoundError:
+        pass
+    return None
+
+
+class RotatingLogHandler(logging.FileHandler):
+    """
+    FileHandler that rotates the log by size and age and gzips old segments.
+
+    Every uWSGI worker has its own handler writing to the same file, so rotation
+    takes a file lock and each handler reopens the file when the path no longer
+    points at the file it has open (another worker rotated it).
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 20 * 1024 * 1024, interval_hours: float = 24,
+                 backup_count: int = 30, compress_delay: float = 5.0, encoding: str = "utf-8"):
+        """
+        Initialize handler
+
+        Args:
+            filename: Active log file path
+            max_bytes: Rotate once the file reaches this size (0 disables)
+            interval_hours: Rotate once the first entry is this old (0 disables)
+            backup_count: Number of compressed segments to keep
+            compress_delay: Seconds to wait before compressing a rotated file, so
+                            workers that have not reopened yet can finish writing to it
+            encoding: File encoding
+        """
+        super().__init__(filename, mode="a", encoding=encoding)
+        self.max_bytes = max_bytes
+        self.interval = timedelta(hours=interval_hours) if interval_hours else None
+        self.backup_count = backup_count
+        self.compress_delay = compress_delay
+        self._rotate_at = (None, None)
+
+    def emit(self, record):
+        try:
+            if self.stream is not None:
+                self._reopen_if_moved()
+                if self._should_rotate():
+                    self._rotate()
+        except Exception:
+            self.handleError(record)
+        super().emit(record)
+
+    def _stream_stat(self):
+        return os.fstat(self.stream.fileno())
+
+    def _reopen_if_moved(self):
+        """Reopen the log path if another process rotated it"""
+        try:
+            st = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            st = None
+        current = self._stream_stat()
+        if st is None or (st.st_dev, st.st_ino) != (current.st_dev, current.st_ino):
+            self._reopen()
+
+    def _reopen(self):
+        self.stream.close()
+        self.stream = self._open()
+
+    def _should_rotate(self) -> bool:
+        st = self._stream_stat()
+        if st.st_size == 0:
+            return False
+        if self.max_bytes and st.st_size >= self.max_bytes:
+            return True
+        if self.interval:
+            # Work out the rotation deadline once per file, not on every record
+            if self._rotate_at[0] != st.st_ino:
+                first = _first_timestamp(self.baseFilename)
+                deadline = _parse_timestamp(first) + self.interval if first else None
+                self._rotate_at = (st.st_ino, deadline)
+            deadline = self._rotate_at[1]
+            if deadline and deadline <= datetime.now():
+                return True
+        return False
+
+    def _rotate(self):
+        """Rename the active file to a timestamped segment and compress it in the background"""
+        with _rotation_lock(self.baseFilename):
+            # Another worker may have rotated while we waited for the lock
+            self._reopen_if_moved()
+            if not self._should_rotate():
+                return
+            first = _first_timestamp(self.baseFilename)
+            started = _parse_timestamp(first) if first else datetime.now()
+            target = f"{self.baseFilename}.{started.strftime('%Y%m%d-%H%M%S')}"
+            suffix = 1
+            while os.path.exists(target) or os.path.exists(target + SEGMENT_SUFFIX):
+                target = f"{self.baseFilename}.{started.strftime('%Y%m%d-%H%M%S')}-{suffix}"
+                suffix += 1
+            os.rename(self.baseFilename, target)
+            self._reopen()
+
+        thread = threading.Thread(
+            target=self._compress_pending,
+            name="log-compress",
+            daemon=True
+        )
+        thread.start()
+
+    def _compress_pending(self):
+        """Compress rotated files (including any left over by a worker that exited) and prune old ones"""
+        time.sleep(self.compress_delay)
+        try:
+            with _rotation_lock(self.baseFilename):
+                for path in _uncompressed_segments(self.baseFilename):
+                    if time.time() - os.path.getmtime(path) >= self.compress_delay:
+                        compress_segment(path)
+                prune_segments(self.baseFilename, self.backup_count)
+        except Exception as e:
+            logger.error(f"Error compressing rotated log segments: {str(e)}", exc_info=True)
+
+
+def _uncompressed_segments(log_path: str) -> List[str]:
+    """Rotated segments that have not been compressed yet"""
+    paths = []
+    for path in glob.glob(glob.escape(log_path) + ".*"):
+        name = path[len(log_path) + 1:]
+        if name[:8].isdigit() and not path.endswith((SEGMENT_SUFFIX, INDEX_SUFFIX, ".tmp")):
+            paths.append(path)
+    return sorted(paths)
+
+
+def compress_segment(path: str, block_size: int = INDEX_BLOCK_SIZE) -> Dict:
+    """
+    Gzip a rotated segment as a series of gzip members (one per ~block_size of
+    log lines) and write its sidecar index. The result is a normal .gz file
+    (gunzip/zcat read all members).
+
+    Args:
+        path: Uncompressed segment path; removed once the .gz and index are written
+        block_size: Uncompressed bytes per gzip member
+
+    Returns:
+        The index written to <path>.gz.idx.json
+    """
+    gz_path = path + SEGMENT_SUFFIX
+    blocks = []
+    first_ts = last_ts = None
+    raw_offset = 0
+
+    with open(path, "rb") as src, open(gz_path + ".tmp", "wb") as dst:
+        while True:
+            block = src.read(block_size)
+            if not block:
+                break
+            if not block.endswith(b"\n"):
+                # Keep blocks on line boundaries
+                block += src.readline()
+            block_first = block_last = None
+            for line in block.split(b"\n"):
+                header = log_reader.parse_header(line.decode("utf-8", errors="replace"))
+                if header:
+                    block_first = block_first or header[0]
+                    block_last = header[0]
+            # A block made only of continuation lines belongs to the previous entry's time
+            block_first = block_first or last_ts
+            blocks.append([block_first, raw_offset, dst.tell()])
+            dst.write(gzip.compress(block))
+            raw_offset += len(block)
+            first_ts = first_ts or block_first
+            last_ts = block_last or last_ts
+        compressed_size = dst.tell()
+
+    index = {
+        "segment": os.path.basename(gz_path),
+        "first_ts": first_ts,
+        "last_ts": last_ts,
+        "size": raw_offset,
+        "compressed_size": compressed_size,
+        # [first entry timestamp, uncompressed offset, compressed offset] per gzip member
+        "blocks": blocks,
+    }
+    with open(gz_path + INDEX_SUFFIX + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(gz_path + ".tmp", gz_path)
+    os.replace(gz_path + INDEX_SUFFIX + ".tmp", gz_path + INDEX_SUFFIX)
+    os.remove(path)
+    logger.info(f"Compressed log segment {os.path.basename(path)} ({raw_offset} -> {compressed_size} bytes)")
+    return index
+
+
+def prune_segments(log_path: str, backup_count: int) -> int:
+    """
+    Delete the oldest compressed segments beyond backup_count
+
+    Returns:
+        Number of segments removed
+    """
+    segments = list_segments(log_path)
+    removed = 0
+    for segment in segments[:max(len(segments) - backup_count, 0)]:
+        for path in (segment["path"], segment["path"] + INDEX_SUFFIX):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        removed += 1
+    return removed
+
+
+def list_segments(log_path: str) -> List[Dict]:
+    """
+    List compressed segments of a log file, oldest first
+
+    Args:
+        log_path: Active log file path
+
+    Returns:
+        List of index dictionaries (without blocks) plus "path"
+    """
+    segments = []
+    for index_path in glob.glob(glob.escape(log_path) + ".*" + SEGMENT_SUFFIX + INDEX_SUFFIX):
+        index = _load_index(index_path)
+        if index:
+            segments.append(index)
+    segments.sort(key=lambda s: (s["first_ts"] or "", s["segment"]))
+    return segments
+
+
+def _load_index(index_path: str) -> Optional[Dict]:
+    """Load a sidecar index, cached until the file changes"""
+    try:
+        mtime = os.path.getmtime(index_path)
+    except FileNotFoundError:
+        return None
+    cached = _index_cache.get(index_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read log index {index_path}: {e}")
+        return None
+    index["path"] = index_path[:-len(INDEX_SUFFIX)]
+    index["segment"] = os.path.basename(index["path"])
+    _index_cache[index_path] = (mtime, index)
+    return index
+
+
+def _segment_lines(segment: Dict, since: Optional[str], until: Optional[str]) -> Iterator[str]:
+    """Decompress only the blocks of a segment that overlap [since, until]"""
+    blocks = segment["blocks"]
+    start = 0
+    if since:
+        for i, block in enumerate(blocks):
+            if block[0] and block[0] <= since:
+                start = i
+    with open(segment["path"], "rb") as f:
+        for i in range(start, len(blocks)):
+            block_first = blocks[i][0]
+            if until and block_first and block_first[:len(until)] > until:
+                return
+            end = blocks[i + 1][2] if i + 1 < len(blocks) else segment["compressed_size"]
+            f.seek(blocks[i][2])
+            data = gzip.decompress(f.read(end - blocks[i][2]))
+            for line in data.decode("utf-8", errors="replace").split("\n")[:-1]:
+                yield line
+
+
+def _active_lines(log_path: str, since: Optional[str]) -> Iterator[str]:
+    """Lines of the active file from the first entry at or after since"""
+    try:
+        f = open(log_path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        f.seek(log_reader.seek_time(f, size, since) if since else 0)
+        remaining = size - f.tell()
+        while remaining > 0:
+            line = f.readline(remaining)
+            if not line.endswith(b"\n"):
+                break
+            remaining -= len(line)
+            yield line[:-1].decode("utf-8", errors="replace")
+
+
+def _window_sources(log_path: str, log_filter: log_reader.LogFilter) -> List:
+    """Segments overlapping the filter's time range plus the active file, oldest first"""
+    sources = []
+    for segment in list_segments(log_path):
+        if log_filter.until and segment["first_ts"] and segment["first_ts"][:len(log_filter.until)] > log_filter.until:
+            continue
+        if log_filter.since and segment["last_ts"] and segment["last_ts"] < log_filter.since:
+            continue
+        sources.append(segment)
+    active_first = _first_timestamp(log_path)
+    if not (log_filter.until and active_first and active_first[:len(log_filter.until)] > log_filter.until):
+        sources.append(None)  # active file
+    return sources
+
+
+def _source_entries(log_path: str, source: Optional[Dict], log_filter: log_reader.LogFilter):
+    """Matching entries of one source, oldest first, stopping after the time range"""
+    if source is None:
+        lines = _active_lines(log_path, log_filter.since)
+    else:
+        lines = _segment_lines(source, log_filter.since, log_filter.until)
+    for timestamp, level, entry_lines in log_reader.group_entries(lines):
+        if log_filter.until and timestamp and timestamp[:len(log_filter.until)] > log_filter.until:
+            return
+        if log_filter.matches(timestamp, level, "\n".join(entry_lines)):
+            yield entry_lines
+
+
+def read_window(log_path: str, entries: int, log_filter: log_reader.LogFilter) -> Dict:
+    """
+    Return the newest `entries` matching entries inside the filter's time range,
+    across compressed segments and the active file
+
+    Args:
+        log_path: Active log file path
+        entries: Maximum number of entries to return
+        log_filter: Filter with since and/or until set
+
+    Returns:
+        Dictionary like log_reader.read_tail, plus "segments" (names read); end_offset
+        and file_id refer to the active file so clients can keep following it
+    """
+    sources = _window_sources(log_path, log_filter)
+    collected = deque()
+    read_from = []
+    has_more = False
+    for position in range(len(sources) - 1, -1, -1):
+        source = sources[position]
+        matched = deque(maxlen=entries)
+        found = 0
+        for entry_lines in _source_entries(log_path, source, log_filter):
+            matched.append(entry_lines)
+            found += 1
+        read_from.append(source["segment"] if source else os.path.basename(log_path))
+        collected.extendleft(reversed(matched))
+        if len(collected) >= entries:
+            has_more = found > len(matched) or len(collected) > entries or position > 0
+            break
+    while len(collected) > entries:
+        collected.popleft()
+
+    content_lines = [line for entry_lines in collected for line in entry_lines]
+    size = 0
+    end_offset = 0
+    if os.path.exists(log_path):
+        with open(log_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            end_offset = log_reader.last_line_boundary(f, size)
+    return {
+        "content": "\n".join(content_lines) + ("\n" if content_lines else ""),
+        "entries": len(collected),
+        "lines": len(content_lines),
+        "start_offset": None,
+        "end_offset": end_offset,
+        "has_more": has_more,
+        "segments": list(reversed(read_from)),
+        "file_id": log_reader.file_id(log_path),
+        "file_size": size,
+    }
+
+
+def iter_window(log_path: str, log_filter: log_reader.LogFilter) -> Iterator[str]:
+    """
+    Yield every matching entry in the time range as text, oldest first
+    (used to download a window without building it in memory)
+    """
+    for source in _window_sources(log_path, log_filter):
+        for entry_lines in _source_entries(log_path, source, log_filter):
+            yield "\n".join(entry_lines) + "\n"
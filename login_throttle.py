@@ -0,0 +1,189 @@
+"""
+Login throttling, shared by all uWSGI workers.
+
+This module handles:
+- Counting failed logins per client IP and per username in a sliding window
+  (local SQLite state database)
+- Locking a key out once it reaches its limit, for a period that doubles with each
+  further lockout and is forgotten after a quiet period
+- Rejecting locked-out logins before any bcrypt work is done
+- Capping how many password verifications run at once across all workers, so a burst
+  of logins cannot keep every worker busy hashing while webhooks wait
+"""
+
+import time
+import logging
+from typing import List, Optional
+
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+
+class LoginThrottle(SQLiteStore):
+    """
+    SQLite-backed failed-login counters, lockouts and verification slots
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS login_failures (
+            key TEXT NOT NULL,
+            ts REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_login_failures_key ON login_failures (key, ts);
+        CREATE INDEX IF NOT EXISTS idx_login_failures_ts ON login_failures (ts);
+        CREATE TABLE IF NOT EXISTS login_lockouts (
+            key TEXT PRIMARY KEY,
+            locked_until REAL NOT NULL,
+            level INTEGER NOT NULL,
+            last_failure REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS login_verifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lease_until REAL NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str = "uac_state.db", window: float = 300, max_per_user: int = 5,
+                 max_per_ip: int = 20, lockout_base: float = 30, lockout_max: float = 3600,
+                 verify_concurrency: int = 2, verify_lease: float = 30):
+        """
+        Initialize throttle
+
+        Args:
+            db_path: Path to SQLite database file
+            window: Seconds of failed logins counted against each key
+            max_per_user: Failed logins per username within the window before a lockout
+            max_per_ip: Failed logins per client IP within the window before a lockout
+            lockout_base: Length of the first lockout in seconds; each further one doubles it
+            lockout_max: Longest lockout; a key's lockout history is forgotten after this
+                long without failures
+            verify_concurrency: Password verifications running at once across all workers
+                (0 = no cap)
+            verify_lease: A verification slot not released within this time is freed
+        """
+        super().__init__(db_path)
+        self.window = window
+        self.limits = {"user": max_per_user, "ip": max_per_ip}
+        self.lockout_base = lockout_base
+        self.lockout_max = lockout_max
+        self.verify_concurrency = verify_concurrency
+        self.verify_lease = verify_lease
+
+    @staticmethod
+    def _keys(ip: str, username: str) -> List[str]:
+        keys = [f"ip:{ip or 'unknown'}"]
+        if username:
+            keys.append(f"user:{username.lower()}")
+        return keys
+
+    def check(self, ip: str, username: str) -> float:
+        """
+        Whether a login may be attempted (a single read, done before any password check)
+
+        Args:
+            ip: Client IP address
+            username: Submitted username
+
+        Returns:
+            Seconds until the login may be tried again, or 0 if it is allowed now
+        """
+        keys = self._keys(ip, username)
+        row = self._conn().execute(
+            f"SELECT MAX(locked_until) FROM login_lockouts WHERE key IN ({','.join('?' * len(keys))})",
+            keys
+        ).fetchone()
+        locked_until = row[0] or 0
+        return max(0.0, locked_until - time.time())
+
+    def record_failure(self, ip: str, username: str) -> float:
+        """
+        Count a failed login against the IP and the username, locking out any key that
+        reached its limit
+
+        Args:
+            ip: Client IP address
+            username: Submitted username
+
+        Returns:
+            Seconds the login is now locked out for (0 if not locked out)
+        """
+        now = time.time()
+        lockout = 0.0
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM login_failures WHERE ts < ?", (now - self.window,))
+            conn.execute(
+                "DELETE FROM login_lockouts WHERE locked_until < ? AND last_failure < ?",
+                (now, now - self.lockout_max)
+            )
+            for key in self._keys(ip, username):
+                conn.execute("INSERT INTO login_failures (key, ts) VALUES (?, ?)", (key, now))
+                failures = conn.execute("SELECT COUNT(*) FROM login_failures WHERE key = ?", (key,)).fetchone()[0]
+                previous = conn.execute(
+                    "SELECT level FROM login_lockouts WHERE key = ?", (key,)
+                ).fetchone()
+                level = previous["level"] if previous else 0
+                if failures < self.limits[key.split(":", 1)[0]]:
+                    if previous:
+                        conn.execute("UPDATE login_lockouts SET last_failure = ? WHERE key = ?", (now, key))
+                    continue
+
+                level += 1
+                duration = min(self.lockout_base * (2 ** (level - 1)), self.lockout_max)
+                conn.execute(
+                    "INSERT INTO login_lockouts (key, locked_until, level, last_failure) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET locked_until = excluded.locked_until, "
+                    "level = excluded.level, last_failure = excluded.last_failure",
+                    (key, now + duration, level, now)
+                )
+                # The next lockout needs a fresh run of failures after this one ends
+                conn.execute("DELETE FROM login_failures WHERE key = ?", (key,))
+                lockout = max(lockout, duration)
+                logger.warning(f"Login locked out for {key} for {duration:.0f}s (lockout #{level})")
+        return lockout
+
+    def record_success(self, ip: str, username: str):
+        """
+        Clear the username's failures and lockout history after a successful login
+        (the IP's are left to expire, so one valid account cannot reset an IP's budget)
+
+        Args:
+            ip: Client IP address
+            username: Username that logged in
+        """
+        key = f"user:{username.lower()}"
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM login_failures WHERE key = ?", (key,))
+            conn.execute("DELETE FROM login_lockouts WHERE key = ?", (key,))
+
+    def acquire_verification(self) -> Optional[int]:
+        """
+        Take a password verification slot
+
+        Returns:
+            Slot id to pass to release_verification, or None if all slots are busy
+            (0 when verifications are not capped)
+        """
+        if self.verify_concurrency <= 0:
+            return 0
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM login_verifications WHERE lease_until < ?", (now,))
+            running = conn.execute("SELECT COUNT(*) FROM login_verifications").fetchone()[0]
+            if running >= self.verify_concurrency:
+                return None
+            cursor = conn.execute(
+                "INSERT INTO login_verifications (lease_until) VALUES (?)", (now + self.verify_lease,)
+            )
+            return cursor.lastrowid
+
+    def release_verification(self, slot: int):
+        """
+        Give back a slot taken with acquire_verification
+
+        Args:
+            slot: Slot id
+        """
+        if slot:
+            with self.transaction() as conn:
+                conn.execute("DELETE FROM login_verifications WHERE id = ?", (slot,))
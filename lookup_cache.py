@@ -0,0 +1,335 @@
+"""
+Shared lookup cache for upstream API responses.
+
+This module handles:
+- A bounded LRU + TTL cache stored in the local SQLite state database, so all
+  uWSGI workers see the same entries
+- Single-flight loading: concurrent lookups for the same key (in this process or
+  in other workers) wait for one upstream call instead of each making their own
+- Explicit invalidation of one key or a whole namespace
+- Hit/miss counters shared across workers
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """An in-progress load that other threads in this process can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class LookupCache(SQLiteStore):
+    """
+    SQLite-backed LRU + TTL cache for one namespace of keys
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS lookup_cache (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT,
+            expires_at REAL NOT NULL DEFAULT 0,
+            last_access REAL NOT NULL,
+            loading_until REAL,
+            PRIMARY KEY (namespace, key)
+        );
+        CREATE INDEX IF NOT EXISTS idx_lookup_cache_lru ON lookup_cache (namespace, last_access);
+        CREATE TABLE IF NOT EXISTS lookup_cache_stats (
+            namespace TEXT PRIMARY KEY,
+            hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0,
+            coalesced INTEGER NOT NULL DEFAULT 0,
+            evictions INTEGER NOT NULL DEFAULT 0,
+            invalidations INTEGER NOT NULL DEFAULT 0
+        );
+    """
+
+    def __init__(self, db_path: str = "uac_state.db", namespace: str = "default", ttl: float = 300,
+                 max_entries: int = 1000, load_timeout: float = 30, poll_interval: float = 0.05):
+        """
+        Initialize cache
+
+        Args:
+            db_path: Path to SQLite database file
+            namespace: Name that separates this cache's keys and counters from other caches
+            ttl: Seconds an entry stays fresh
+            max_entries: Least recently used entries beyond this are evicted
+            load_timeout: Seconds to wait on another worker's load before loading ourselves
+            poll_interval: Seconds between checks while waiting on another worker's load
+        """
+        super().__init__(db_path)
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.load_timeout = load_timeout
+        self.poll_interval = poll_interval
+
+        self._flights = {}
+        self._flights_pid = None
+        self._flights_lock = threading.Lock()
+
+    def _count(self, conn, counter: str, amount: int = 1):
+        """Add to one of the shared counters (inside the caller's transaction)"""
+        conn.execute(
+            f"INSERT INTO lookup_cache_stats (namespace, {counter}) VALUES (?, ?) "
+            f"ON CONFLICT(namespace) DO UPDATE SET {counter} = {counter} + excluded.{counter}",
+            (self.namespace, amount)
+        )
+
+    def _read_fresh(self, key: str, counter: Optional[str] = "hits"):
+        """
+        Return (found, value) for a fresh entry, touching it for LRU and counting the hit
+
+        Args:
+            key: Cache key
+            counter: Counter to increment when found (None counts nothing)
+        """
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT value FROM lookup_cache WHERE namespace = ? AND key = ? AND value IS NOT NULL AND expires_at > ?",
+            (self.namespace, key, now)
+        ).fetchone()
+        if row is None:
+            return False, None
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE lookup_cache SET last_access = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key)
+            )
+            if counter:
+                self._count(conn, counter)
+        return True, json.loads(row["value"])
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Get a fresh cached value
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Cached value, or None if missing or expired
+        """
+        return self._read_fresh(key)[1]
+
+    def set(self, key: str, value: Any):
+        """
+        Store a value and evict the least recently used entries over max_entries
+
+        Args:
+            key: Cache key
+            value: JSON-serializable value
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO lookup_cache (namespace, key, value, expires_at, last_access) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, "
+                "expires_at = excluded.expires_at, last_access = excluded.last_access",
+                (self.namespace, key, json.dumps(value), now + self.ttl, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now: float):
+        """Drop expired entries, then the least recently used ones beyond max_entries"""
+        idle = "(loading_until IS NULL OR loading_until < ?)"
+        conn.execute(
+            f"DELETE FROM lookup_cache WHERE namespace = ? AND expires_at <= ? AND {idle}",
+            (self.namespace, now, now)
+        )
+        evicted = conn.execute(
+            f"DELETE FROM lookup_cache WHERE rowid IN ("
+            f"  SELECT rowid FROM lookup_cache WHERE namespace = ? AND {idle} "
+            f"  ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, now, self.max_entries)
+        ).rowcount
+        if evicted > 0:
+            self._count(conn, "evictions", evicted)
+
+    def _claim_load(self, key: str) -> bool:
+        """
+        Mark a key as being loaded by this worker, unless another worker is already loading it
+
+        Returns:
+            True if this worker should load the key
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            claimed = conn.execute(
+                "INSERT INTO lookup_cache (namespace, key, last_access, loading_until) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(namespace, key) DO UPDATE SET loading_until = excluded.loading_until "
+                "WHERE loading_until IS NULL OR loading_until < ?",
+                (self.namespace, key, now, now + self.load_timeout, now)
+            ).rowcount
+        return claimed > 0
+
+    def _release_load(self, key: str):
+        """Clear this worker's loading mark (the entry itself is kept if it was stored)"""
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE lookup_cache SET loading_until = NULL WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            )
+            conn.execute(
+                "DELETE FROM lookup_cache WHERE namespace = ? AND key = ? AND value IS NULL",
+                (self.namespace, key)
+            )
+
+    def _wait_for_other_worker(self, key: str):
+        """
+        Poll for the entry another worker is loading
+
+        Returns:
+            (found, value); found is False if that load finished without caching or timed out
+        """
+        deadline = time.monotonic() + self.load_timeout
+        while time.monotonic() < deadline:
+            found, value = self._read_fresh(key, counter="coalesced")
+            if found:
+                return True, value
+            row = self._conn().execute(
+                "SELECT loading_until FROM lookup_cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+            if row is None or row["loading_until"] is None or row["loading_until"] < time.time():
+                return False, None
+            time.sleep(self.poll_interval)
+        return False, None
+
+    def _load(self, key: str, loader: Callable[[], Any], cacheable: Callable[[Any], bool], refresh: bool):
+        """Load a key with the cross-worker loading mark held, and cache the result if cacheable"""
+        if not self._claim_load(key) and not refresh:
+            found, value = self._wait_for_other_worker(key)
+            if found:
+                return value
+            # The other worker's result was not cacheable (or it died); load ourselves
+            self._claim_load(key)
+
+        with self.transaction() as conn:
+            self._count(conn, "misses")
+        try:
+            value = loader()
+            if cacheable(value):
+                self.set(key, value)
+            return value
+        finally:
+            self._release_load(key)
+
+    def get_or_load(self, key: str, loader: Callable[[], Any],
+                    cacheable: Optional[Callable[[Any], bool]] = None, refresh: bool = False) -> Any:
+        """
+        Return the cached value for a key, or load it once for all concurrent callers
+
+        Args:
+            key: Cache key
+            loader: Called with no arguments to fetch the value on a miss
+            cacheable: Decides whether a loaded value is stored (e.g. skip error responses);
+                uncacheable values are still shared with callers waiting in this process
+            refresh: Skip the cached value and load a new one
+
+        Returns:
+            Cached or freshly loaded value
+        """
+        if cacheable is None:
+            cacheable = lambda value: value is not None  # noqa: E731
+
+        if not refresh:
+            found, value = self._read_fresh(key)
+            if found:
+                return value
+
+        with self._flights_lock:
+            if self._flights_pid != os.getpid():
+                # Flights started before a fork belong to the parent
+                self._flights = {}
+                self._flights_pid = os.getpid()
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if flight.done.wait(self.load_timeout):
+                with self.transaction() as conn:
+                    self._count(conn, "coalesced")
+                if flight.error is not None:
+                    raise flight.error
+                return flight.value
+            logger.warning(f"Timed out waiting for cache load of {self.namespace}:{key}; loading directly")
+            return loader()
+
+        try:
+            flight.value = self._load(key, loader, cacheable, refresh)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+    def invalidate(self, key: Optional[str] = None) -> int:
+        """
+        Remove one entry, or every entry in this namespace
+
+        Args:
+            key: Cache key (None clears the namespace)
+
+        Returns:
+            Number of entries removed
+        """
+        with self.transaction() as conn:
+            if key is None:
+                removed = conn.execute(
+                    "DELETE FROM lookup_cache WHERE namespace = ? AND value IS NOT NULL", (self.namespace,)
+                ).rowcount
+            else:
+                removed = conn.execute(
+                    "DELETE FROM lookup_cache WHERE namespace = ? AND key = ? AND value IS NOT NULL",
+                    (self.namespace, key)
+                ).rowcount
+            if removed > 0:
+                self._count(conn, "invalidations", removed)
+        logger.info(f"Invalidated {removed} {self.namespace} cache entr{'y' if removed == 1 else 'ies'}"
+                    + (f" for {key}" if key is not None else ""))
+        return removed
+
+    def get_stats(self) -> Dict:
+        """
+        Report cache size and the hit/miss counters shared by all workers
+
+        Returns:
+            Dictionary with entries, ttl, max_entries, hits, misses, coalesced, evictions,
+            invalidations and hit_ratio
+        """
+        conn = self._conn()
+        entries = conn.execute(
+            "SELECT COUNT(*) AS n FROM lookup_cache WHERE namespace = ? AND value IS NOT NULL AND expires_at > ?",
+            (self.namespace, time.time())
+        ).fetchone()["n"]
+        row = conn.execute("SELECT * FROM lookup_cache_stats WHERE namespace = ?", (self.namespace,)).fetchone()
+        counters = {k: row[k] if row else 0 for k in ("hits", "misses", "coalesced", "evictions", "invalidations")}
+        lookups = counters["hits"] + counters["misses"] + counters["coalesced"]
+        return {
+            "namespace": self.namespace,
+            "entries": entries,
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            **counters,
+            "hit_ratio": round((counters["hits"] + counters["coalesced"]) / lookups, 3) if lookups else None,
+        }
@@ -0,0 +1,472 @@
+"""
+Latency and error metrics shared by all uWSGI workers.
+
+This module handles:
+- Timing spans for order-processing stages and upstream calls, recorded in
+  fixed-bucket histograms alongside error counters
+- Buffering observations in each worker and flushing them periodically into the
+  local SQLite state database, where all workers' data adds up
+- Rendering the aggregate in the Prometheus text exposition format (/metrics)
+- Estimating p50/p95/p99 from the histogram buckets for the dashboard
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import config
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_DURATION = "uac_stage_duration_seconds"
+STAGE_ERRORS = "uac_stage_errors_total"
+UPSTREAM_DURATION = "uac_upstream_request_duration_seconds"
+UPSTREAM_REQUESTS = "uac_upstream_requests_total"
+ORDERS = "uac_orders_total"
+GEOCODE_RETRIES = "uac_powercode_geocode_retries_total"
+
+# Metric name -> (type, help text) for the Prometheus output
+METRICS = {
+    STAGE_DURATION: ("histogram", "Time spent in each order-processing stage"),
+    STAGE_ERRORS: ("counter", "Stage runs that raised or reported a failure"),
+    UPSTREAM_DURATION: ("histogram", "Latency of Utopia and PowerCode HTTP calls"),
+    UPSTREAM_REQUESTS: ("counter", "Utopia and PowerCode HTTP calls by status (error = no response)"),
+    ORDERS: ("counter", "Webhook orders processed, by outcome"),
+    GEOCODE_RETRIES: ("counter", "PowerCode createCustomer calls re-sent after a geocoding failure"),
+}
+
+
+def _label_key(labels: Dict) -> str:
+    """Canonical JSON form of a label set (used as a storage key)"""
+    return json.dumps({k: str(v) for k, v in labels.items()}, sort_keys=True)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = [f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())]
+    if extra:
+        items.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def quantile(q: float, bounds: Iterable[float], counts: List[int]) -> Optional[float]:
+    """
+    Estimate a quantile from histogram buckets, interpolating linearly within the bucket
+    (the same estimate as Prometheus' histogram_quantile)
+
+    Args:
+        q: Quantile between 0 and 1
+        bounds: Finite upper bounds of the buckets
+        counts: Observations per bucket (not cumulative); one more entry than bounds for +Inf
+
+    Returns:
+        Estimated value, or None without observations
+    """
+    bounds = list(bounds)
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for i, count in enumerate(counts):
+        if cumulative + count >= rank and count:
+            if i >= len(bounds):
+                # Falls in the +Inf bucket: the best estimate is the largest finite bound
+                return bounds[-1]
+            return lower + (bounds[i] - lower) * (rank - cumulative) / count
+        cumulative += count
+        if i < len(bounds):
+            lower = bounds[i]
+    return bounds[-1]
+
+
+class Span:
+    """A running timing span; call fail() when the stage did not succeed without raising"""
+
+    def __init__(self):
+        self.failed = False
+
+    def fail(self):
+        self.failed = True
+
+
+class MetricsStore(SQLiteStore):
+    """
+    Counters and latency histograms buffered per worker and aggregated in SQLite
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS metric_counters (
+            name TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            value REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, labels)
+        );
+        CREATE TABLE IF NOT EXISTS metric_histograms (
+            name TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            buckets TEXT NOT NULL,
+            counts TEXT NOT NULL,
+            sum REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, labels)
+        );
+    """
+
+    def __init__(self, db_path: str = "uac_state.db", buckets: Iterable[float] = DEFAULT_BUCKETS,
+                 flush_interval: float = 10):
+        """
+        Initialize store
+
+        Args:
+            db_path: Path to SQLite database file
+            buckets: Upper bounds of the histogram buckets in seconds
+            flush_interval: Seconds between flushes of this worker's buffered observations
+        """
+        super().__init__(db_path)
+        self.buckets = tuple(sorted(buckets))
+        self.flush_interval = flush_interval
+
+        self._counters = {}
+        self._histograms = {}
+        self._buffer_pid = os.getpid()
+        self._lock = threading.Lock()
+
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Recording (in memory, per worker)
+    # ------------------------------------------------------------------
+    def _check_fork(self):
+        """Drop observations buffered by the parent process (called with the lock held)"""
+        if self._buffer_pid != os.getpid():
+            self._counters = {}
+            self._histograms = {}
+            self._buffer_pid = os.getpid()
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """
+        Add to a counter
+
+        Args:
+            name: Metric name
+            amount: Amount to add
+            **labels: Label values
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._check_fork()
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Record one observation in a histogram
+
+        Args:
+            name: Metric name
+            value: Observed value (seconds)
+            **labels: Label values
+        """
+        key = (name, _label_key(labels))
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            self._check_fork()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def span(self, stage: str):
+        """
+        Time a block as an order-processing stage. Raising, or calling fail() on the
+        yielded Span, counts the run as an error.
+
+        Args:
+            stage: Stage name (e.g. "utopia_lookup", "powercode_create")
+        """
+        span = Span()
+        started = time.monotonic()
+        try:
+            yield span
+        except BaseException:
+            span.failed = True
+            raise
+        finally:
+            self.observe(STAGE_DURATION, time.monotonic() - started, stage=stage)
+            if span.failed:
+                self.inc(STAGE_ERRORS, stage=stage)
+
+    # ------------------------------------------------------------------
+    # Aggregation (shared SQLite tables)
+    # ------------------------------------------------------------------
+    def flush(self):
+        """Add this worker's buffered observations to the shared tables"""
+        with self._lock:
+            self._check_fork()
+            counters, self._counters = self._counters, {}
+            histograms, self._histograms = self._histograms, {}
+        if not counters and not histograms:
+            return
+
+        buckets = json.dumps(self.buckets)
+        try:
+            with self.transaction() as conn:
+                for (name, labels), amount in counters.items():
+                    conn.execute(
+                        "INSERT INTO metric_counters (name, labels, value) VALUES (?, ?, ?) "
+                        "ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value",
+                        (name, labels, amount)
+                    )
+                for (name, labels), (counts, total, count) in histograms.items():
+                    row = conn.execute(
+                        "SELECT buckets, counts FROM metric_histograms WHERE name = ? AND labels = ?",
+                        (name, labels)
+                    ).fetchone()
+                    if row is not None and row["buckets"] == buckets:
+                        counts = [a + b for a, b in zip(json.loads(row["counts"]), counts)]
+                        conn.execute(
+                            "UPDATE metric_histograms SET counts = ?, sum = sum + ?, count = count + ? "
+                            "WHERE name = ? AND labels = ?",
+                            (json.dumps(counts), total, count, name, labels)
+                        )
+                    else:
+                        # New series (or the bucket layout changed): start it over
+                        conn.execute(
+                            "INSERT OR REPLACE INTO metric_histograms (name, labels, buckets, counts, sum, count) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (name, labels, buckets, json.dumps(counts), total, count)
+                        )
+        except Exception:
+            # Put the observations back so they are not lost
+            with self._lock:
+                for key, amount in counters.items():
+                    self._counters[key] = self._counters.get(key, 0) + amount
+                for key, (counts, total, count) in histograms.items():
+                    current = self._histograms.setdefault(key, [[0] * len(counts), 0.0, 0])
+                    current[0] = [a + b for a, b in zip(current[0], counts)]
+                    current[1] += total
+                    current[2] += count
+            raise
+
+    def reset(self):
+        """Clear all aggregated metrics (and this worker's buffer)"""
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM metric_counters")
+            conn.execute("DELETE FROM metric_histograms")
+        logger.info("Metrics reset")
+
+    def _rows(self):
+        conn = self._conn()
+        counters = [dict(row) for row in conn.execute("SELECT * FROM metric_counters ORDER BY name, labels")]
+        histograms = [dict(row) for row in conn.execute("SELECT * FROM metric_histograms ORDER BY name, labels")]
+        return counters, histograms
+
+    def render_prometheus(self) -> str:
+        """
+        Aggregated metrics of all workers in the Prometheus text format (version 0.0.4)
+
+        Returns:
+            Exposition text
+        """
+        counters, histograms = self._rows()
+        series = {}
+        for row in counters:
+            series.setdefault(row["name"], []).append(row)
+        for row in histograms:
+            series.setdefault(row["name"], []).append(row)
+
+        lines = []
+        for name in sorted(set(series) | set(METRICS)):
+            kind, help_text = METRICS.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for row in series.get(name, []):
+                labels = json.loads(row["labels"])
+                if "counts" not in row:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(row['value'])}")
+                    continue
+                cumulative = 0
+                bounds = json.loads(row["buckets"])
+                for bound, count in zip(bounds + ["+Inf"], json.loads(row["counts"])):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', le))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(round(row['sum'], 6))}")
+                lines.append(f"{name}_count{_format_labels(labels)} {row['count']}")
+        return "\n".join(lines) + "\n"
+
+    def get_summary(self) -> Dict:
+        """
+        Latency percentiles and error rates per stage and per upstream endpoint
+
+        Returns:
+            Dictionary with stages, upstreams (count, avg, p50, p95, p99, errors, error_rate)
+            and the remaining counters
+        """
+        counters, histograms = self._rows()
+        counter_values = {}
+        for row in counters:
+            counter_values.setdefault(row["name"], []).append((json.loads(row["labels"]), row["value"]))
+
+        stage_errors = {labels.get("stage"): value for labels, value in counter_values.get(STAGE_ERRORS, [])}
+        upstream_errors = {}
+        for labels, value in counter_values.get(UPSTREAM_REQUESTS, []):
+            status = labels.get("status", "")
+            if status == "error" or status.startswith("5"):
+                key = (labels.get("upstream"), labels.get("endpoint"))
+                upstream_errors[key] = upstream_errors.get(key, 0) + value
+
+        stages, upstreams = [], []
+        for row in histograms:
+            if row["name"] not in (STAGE_DURATION, UPSTREAM_DURATION):
+                continue
+            labels = json.loads(row["labels"])
+            bounds, counts = json.loads(row["buckets"]), json.loads(row["counts"])
+            if row["name"] == STAGE_DURATION:
+                item = {"stage": labels.get("stage"), "errors": stage_errors.get(labels.get("stage"), 0)}
+                stages.append(item)
+            else:
+                item = {
+                    "upstream": labels.get("upstream"),
+                    "endpoint": labels.get("endpoint"),
+                    "errors": upstream_errors.get((labels.get("upstream"), labels.get("endpoint")), 0),
+                }
+                upstreams.append(item)
+            item["errors"] = int(item["errors"])
+            item["count"] = row["count"]
+            item["error_rate"] = round(item["errors"] / row["count"], 4) if row["count"] else None
+            item["avg"] = round(row["sum"] / row["count"], 4) if row["count"] else None
+            for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                value = quantile(q, bounds, counts)
+                item[name] = round(value, 4) if value is not None else None
+
+        return {
+            "stages": sorted(stages, key=lambda s: -(s["p95"] or 0)),
+            "upstreams": sorted(upstreams, key=lambda u: -(u["p95"] or 0)),
+            "counters": {
+                name: [{"labels": labels, "value": value} for labels, value in values]
+                for name, values in counter_values.items() if name != STAGE_ERRORS
+            },
+        }
+
+    # ------------------------------------------------------------------
+    # Thread management
+    # ------------------------------------------------------------------
+    def start(self):
+        """
+        Start the flush thread in this process (no-op if already running).
+        Safe to call repeatedly; the thread is restarted after a fork.
+        """
+        if self._pid == os.getpid() and self._thread:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread:
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._flush_loop, name=f"metrics-{self._pid}", daemon=True)
+            self._thread.start()
+            logger.info(f"Started metrics flush thread in process {self._pid}")
+
+    def stop(self, timeout: float = 5.0):
+        """Signal the flush thread to stop, wait for it and flush what is left"""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing metrics: {e}", exc_info=True)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Optional[MetricsStore]:
+    """
+    Shared metrics store (created on first use)
+
+    Returns:
+        MetricsStore, or None when METRICS_ENABLED is false
+    """
+    global _metrics
+    if not config.METRICS_ENABLED:
+        return None
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsStore(db_path=config.STATE_DB_FILE, flush_interval=config.METRICS_FLUSH_INTERVAL)
+    return _metrics
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time a block as an order-processing stage (see MetricsStore.span).
+    Yields a Span even when metrics are disabled, so callers can always call fail().
+    """
+    store = get_metrics()
+    if store is None:
+        yield Span()
+        return
+    with store.span(stage) as running:
+        yield running
+
+
+def observe_stage(stage: str, duration: float, failed: bool = False):
+    """Record a stage whose duration was measured elsewhere (e.g. a StepExecutor step)"""
+    store = get_metrics()
+    if store is not None:
+        store.observe(STAGE_DURATION, duration, stage=stage)
+        if failed:
+            store.inc(STAGE_ERRORS, stage=stage)
+
+
+def observe_upstream(upstream: str, endpoint: str, status: str, duration: float):
+    """Record one upstream HTTP call (status is the HTTP status code or "error")"""
+    store = get_metrics()
+    if store is not None:
+        store.observe(UPSTREAM_DURATION, duration, upstream=upstream, endpoint=endpoint)
+        store.inc(UPSTREAM_REQUESTS, upstream=upstream, endpoint=endpoint, status=status)
+
+
+def inc(name: str, amount: float = 1, **labels):
+    """Add to a counter (no-op when metrics are disabled)"""
+    store = get_metrics()
+    if store is not None:
+        store.inc(name, amount, **labels)
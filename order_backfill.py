@@ -0,0 +1,616 @@
+"""
+Backfill and reconciliation of Utopia orders against PowerCode.
+
+This module handles:
+- Collecting recent orders from Utopia (getOrders per status, plus getProjects)
+- Sorting each order into: already in PowerCode (by siteid / extAccountID), already
+  queued, previously failed, or missing
+- Creating the missing ones through a bounded worker pool with a rate limit
+- Dry-run reports and throughput metrics, stored in the state DB for the admin API
+- An optional scheduled run, taken by one worker at a time
+
+Run from the command line:
+    python order_backfill.py --dry-run --status new --days 14
+"""
+
+import json
+import os
+import time
+import logging
+import argparse
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+import app_logging
+import powercode as PowerCode
+import utopia as Utopia
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+# Order classifications
+EXISTS = "exists"
+QUEUED = "queued"
+FAILED = "failed"
+MISSING = "missing"
+
+# Recorded when the customer was created but a plan/ticket/tag step failed; creating or
+# finding the customer does not fix it, so backfill never resolves it
+POST_CREATION_FAILURE = "powercode_post_creation_failed"
+
+# Date fields Utopia order/project records may carry
+_DATE_FIELDS = ("orderdate", "date", "created", "createdate", "datecreated", "submitted")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).astimezone().isoformat()
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the backfill worker threads
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Initialize limiter
+
+        Args:
+            rate: Tokens added per second (0 or less disables limiting)
+            burst: Maximum tokens that can accumulate
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _records(response) -> List[Dict]:
+    """List of records from a Utopia query response (a list, or a dict wrapping one)"""
+    if isinstance(response, list):
+        return [r for r in response if isinstance(r, dict)]
+    if isinstance(response, dict):
+        if "error" in response:
+            raise ValueError(f"Utopia API error: {response['error']}")
+        for key in ("result", "results", "orders", "projects", "data"):
+            if isinstance(response.get(key), list):
+                return [r for r in response[key] if isinstance(r, dict)]
+    return []
+
+
+def _record_date(record: Dict) -> Optional[datetime]:
+    """Date of an order/project record, if it has a recognizable one"""
+    for field in _DATE_FIELDS:
+        value = record.get(field)
+        if value:
+            try:
+                return datetime.fromisoformat(str(value)[:10])
+            except ValueError:
+                continue
+    return None
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class OrderBackfill(SQLiteStore):
+    """
+    Reconciles Utopia orders with PowerCode and records each run
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS backfill_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trigger TEXT NOT NULL,
+            dry_run INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            options TEXT,
+            report TEXT,
+            error TEXT,
+            started_at TEXT NOT NULL,
+            started_ts REAL NOT NULL,
+            finished_at TEXT,
+            heartbeat REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_backfill_runs_trigger ON backfill_runs (trigger, started_ts);
+    """
+
+    def __init__(self, db_path: str = "uac_state.db", customer_index=None, failure_tracker=None,
+                 order_queue=None, failure_retry=None, workers: int = 2, rate: float = 1.0, days: int = 14,
+                 statuses: Iterable[str] = ("new",), project_statuses: Iterable[str] = (),
+                 interval_hours: float = 0, scheduled_dry_run: bool = True, stale_after: float = 600):
+        """
+        Initialize backfill
+
+        Args:
+            db_path: Path to SQLite database file
+            customer_index: CustomerIndex checked before asking PowerCode for a siteid
+            failure_tracker: FailureTracker used to flag previously failed orders
+            order_queue: OrderQueue used to skip orders that are already queued
+            failure_retry: FailureRetryScheduler whose lease is held while a previously failed
+                order is re-processed, so it is never retried by both at once
+            workers: Orders checked/created at the same time
+            rate: Orders started per second across all workers (0 = unlimited)
+            days: Only orders from the last N days (orders without a date are always included)
+            statuses: Utopia order statuses passed to getOrders
+            project_statuses: Utopia project status IDs passed to getProjects
+            interval_hours: Hours between scheduled runs (0 disables them)
+            scheduled_dry_run: Scheduled runs only report (no customers created)
+            stale_after: A running run without progress for this long no longer blocks new runs
+        """
+        super().__init__(db_path)
+        self.customer_index = customer_index
+        self.failure_tracker = failure_tracker
+        self.order_queue = order_queue
+        self.failure_retry = failure_retry
+        self.workers = max(1, workers)
+        self.rate = rate
+        self.days = days
+        self.statuses = [s for s in statuses if s]
+        self.project_statuses = [s for s in project_statuses if s]
+        self.interval_hours = interval_hours
+        self.scheduled_dry_run = scheduled_dry_run
+        self.stale_after = stale_after
+
+        self._process_order = None
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Collecting and classifying
+    # ------------------------------------------------------------------
+    def collect_orders(self, statuses: Optional[List[str]] = None, project_statuses: Optional[List[str]] = None,
+                       days: Optional[int] = None) -> List[Dict]:
+        """
+        Pull recent orders from Utopia
+
+        Args:
+            statuses: Order statuses for getOrders (defaults to the configured ones)
+            project_statuses: Project status IDs for getProjects (defaults to the configured ones)
+            days: Only orders from the last N days (defaults to the configured value)
+
+        Returns:
+            One record per orderref: orderref, siteid, status, date and sources
+        """
+        statuses = self.statuses if statuses is None else statuses
+        project_statuses = self.project_statuses if project_statuses is None else project_statuses
+        days = self.days if days is None else days
+        cutoff = datetime.now() - timedelta(days=days) if days else None
+
+        queries = [("orders", status, lambda s: Utopia.getOrders(status=s)) for status in statuses]
+        queries += [("projects", status, lambda s: Utopia.getProjects(statusid=s)) for status in project_statuses]
+
+        orders = {}
+        for source, status, query in queries:
+            records = _records(query(status))
+            logger.info(f"Backfill: Utopia {source} ({status}) returned {len(records)} records")
+            for record in records:
+                orderref = str(record.get("orderref") or "").strip()
+                if not orderref:
+                    continue
+                date = _record_date(record)
+                if cutoff and date and date < cutoff:
+                    continue
+                order = orders.setdefault(orderref, {
+                    "orderref": orderref,
+                    "siteid": "",
+                    "status": record.get("status") or status,
+                    "date": date.date().isoformat() if date else None,
+                    "sources": [],
+                })
+                order["siteid"] = order["siteid"] or str(record.get("siteid") or "")
+                order["sources"].append(f"{source}:{status}")
+        return list(orders.values())
+
+    def _in_powercode(self, siteid: str) -> Optional[str]:
+        """
+        PowerCode customer ID for a Utopia siteid (extAccountID), or None
+
+        The local customer index is checked first; a live readCustomer lookup fills the gap.
+        """
+        if not siteid:
+            return None
+        if self.customer_index is not None:
+            indexed = self.customer_index.find_by_ext_account_id(siteid)
+            if indexed:
+                return str(indexed.get("CustomerID"))
+        data = PowerCode.get_customer_by_external_id(siteid).json()
+        if not isinstance(data, dict) or data.get("statusCode") not in (None, 0):
+            return None
+        customer_id = data.get("customerID") or data.get("CustomerID")
+        if customer_id:
+            if self.customer_index is not None:
+                self.customer_index.add_customers([dict(data, CustomerID=customer_id, ExtAccountID=siteid)],
+                                                  source="backfill")
+            return str(customer_id)
+        return None
+
+    def classify(self, order: Dict) -> Dict:
+        """
+        Decide what to do with one order
+
+        Args:
+            order: Record from collect_orders
+
+        Returns:
+            The order with classification (exists/queued/failed/missing) and customer_id / failure_type
+        """
+        orderref = order["orderref"]
+        if self.order_queue is not None:
+            active = [job for job in self.order_queue.list_jobs(orderref=orderref, limit=5)
+                      if job["status"] in ("queued", "processing")]
+            if active:
+                return dict(order, classification=QUEUED, job_id=active[0]["job_id"])
+
+        customer_id = self._in_powercode(order.get("siteid"))
+        if customer_id:
+            return dict(order, classification=EXISTS, customer_id=customer_id)
+
+        failure = self.failure_tracker.get_failure(orderref) if self.failure_tracker is not None else None
+        if failure and not failure.get("resolved"):
+            return dict(order, classification=FAILED, failure_type=failure.get("failure_type"))
+        return dict(order, classification=MISSING)
+
+    def _resolve_failure(self, orderref: str, note: str):
+        """
+        Resolve an open failure for an order that is now in PowerCode. The record is
+        read again here, so a post-creation failure recorded while this run created
+        the customer stays open.
+        """
+        if self.failure_tracker is None:
+            return
+        failure = self.failure_tracker.get_failure(orderref)
+        if not failure or failure.get("resolved"):
+            return
+        if failure.get("failure_type") == POST_CREATION_FAILURE:
+            logger.warning(f"Leaving {POST_CREATION_FAILURE} failure open for order {orderref}: "
+                           f"{failure.get('error_message')}")
+            return
+        self.failure_tracker.mark_resolved(orderref, note)
+
+    def _acquire_retry_lease(self, orderref: str) -> bool:
+        """Take the order's automatic-retry lease (always succeeds without a scheduler)"""
+        return self.failure_retry is None or self.failure_retry.acquire_lease(orderref)
+
+    def _release_retry_lease(self, orderref: str):
+        if self.failure_retry is not None:
+            self.failure_retry.release_lease(orderref)
+
+    # ------------------------------------------------------------------
+    # Running
+    # ------------------------------------------------------------------
+    def _claim_run(self, trigger: str, dry_run: bool, options: Dict) -> Optional[int]:
+        """Record a new run unless one is already in progress; returns the run ID"""
+        now = time.time()
+        with self.transaction() as conn:
+            running = conn.execute(
+                "SELECT id FROM backfill_runs WHERE status = 'running' AND heartbeat > ?", (now - self.stale_after,)
+            ).fetchone()
+            if running is not None:
+                return None
+            conn.execute(
+                "UPDATE backfill_runs SET status = 'abandoned', finished_at = ? WHERE status = 'running'", (_now(),)
+            )
+            return conn.execute(
+                "INSERT INTO backfill_runs (trigger, dry_run, status, options, started_at, started_ts, heartbeat) "
+                "VALUES (?, ?, 'running', ?, ?, ?, ?)",
+                (trigger, int(dry_run), json.dumps(options), _now(), now, now)
+            ).lastrowid
+
+    def _heartbeat(self, run_id: int):
+        with self.transaction() as conn:
+            conn.execute("UPDATE backfill_runs SET heartbeat = ? WHERE id = ?", (time.time(), run_id))
+
+    def _finish_run(self, run_id: int, status: str, report: Optional[Dict] = None, error: Optional[str] = None):
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE backfill_runs SET status = ?, report = ?, error = ?, finished_at = ?, heartbeat = ? WHERE id = ?",
+                (status, json.dumps(report) if report is not None else None, error, _now(), time.time(), run_id)
+            )
+
+    def run(self, process_order: Callable[[str], Optional[str]], dry_run: bool = True, trigger: str = "manual",
+            statuses: Optional[List[str]] = None, project_statuses: Optional[List[str]] = None,
+            days: Optional[int] = None, run_id: Optional[int] = None) -> Optional[Dict]:
+        """
+        Reconcile recent Utopia orders and create the missing customers
+
+        Args:
+            process_order: Creates the customer for an orderref and returns an outcome
+                ("created", "duplicate", "utopia_error", "creation_failed"); raising counts as an error
+            dry_run: Only classify orders and report what would be created
+            trigger: "manual", "cli" or "schedule", for the run listing
+            statuses: Order statuses (defaults to the configured ones)
+            project_statuses: Project status IDs (defaults to the configured ones)
+            days: Only orders from the last N days (defaults to the configured value)
+            run_id: Run already claimed with start_run (otherwise one is claimed here)
+
+        Returns:
+            Run report, or None if another run is in progress
+        """
+        options = {"statuses": statuses if statuses is not None else self.statuses,
+                   "project_statuses": project_statuses if project_statuses is not None else self.project_statuses,
+                   "days": self.days if days is None else days,
+                   "workers": self.workers, "rate": self.rate}
+        if run_id is None:
+            run_id = self._claim_run(trigger, dry_run, options)
+            if run_id is None:
+                logger.warning("Backfill: another run is in progress")
+                return None
+
+        started = time.monotonic()
+        limiter = RateLimiter(self.rate)
+        results = []
+        results_lock = threading.Lock()
+
+        def handle(order):
+            limiter.acquire()
+            order_started = time.monotonic()
+            result = dict(order)
+            with app_logging.log_context(orderref=order["orderref"], stage="backfill"):
+                try:
+                    result = self.classify(order)
+                    if result["classification"] in (MISSING, FAILED):
+                        if dry_run:
+                            result["outcome"] = "would_create"
+                        elif result["classification"] == FAILED and not self._acquire_retry_lease(order["orderref"]):
+                            # The retry scheduler is re-processing this order right now
+                            result["outcome"] = "retry_in_progress"
+                        else:
+                            try:
+                                result["outcome"] = process_order(order["orderref"]) or "done"
+                            finally:
+                                if result["classification"] == FAILED:
+                                    self._release_retry_lease(order["orderref"])
+                            if result["outcome"] == "created":
+                                self._resolve_failure(order["orderref"], "Customer created by backfill")
+                    else:
+                        result["outcome"] = "skipped"
+                        if result["classification"] == EXISTS and not dry_run:
+                            self._resolve_failure(
+                                order["orderref"], f"Backfill found PowerCode customer {result['customer_id']}"
+                            )
+                except Exception as e:
+                    logger.error(f"Backfill failed for order {order['orderref']}: {e}", exc_info=True)
+                    result.update(outcome="error", error=str(e))
+            result["duration_ms"] = round((time.monotonic() - order_started) * 1000)
+            with results_lock:
+                results.append(result)
+                if len(results) % 10 == 0:
+                    self._heartbeat(run_id)
+
+        try:
+            orders = self.collect_orders(options["statuses"], options["project_statuses"], options["days"])
+            collected = time.monotonic()
+            logger.info(f"Backfill run {run_id}: {len(orders)} orders to reconcile (dry_run={dry_run})")
+
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"backfill-{run_id}") as pool:
+                for order in orders:
+                    pool.submit(contextvars.copy_context().run, handle, order)
+        except Exception as e:
+            logger.error(f"Backfill run {run_id} failed: {e}", exc_info=True)
+            self._finish_run(run_id, "failed", error=str(e))
+            raise
+
+        report = self._report(run_id, dry_run, trigger, results, started, collected)
+        self._finish_run(run_id, "completed", report)
+        logger.info(
+            f"Backfill run {run_id} finished: {report['counts']}",
+            extra={"duration_ms": round(report["metrics"]["elapsed_seconds"] * 1000), "data": report["metrics"]}
+        )
+        return report
+
+    @staticmethod
+    def _report(run_id: int, dry_run: bool, trigger: str, results: List[Dict], started: float,
+                collected: float) -> Dict:
+        """Summarize a run: counts per classification and outcome, plus throughput"""
+        elapsed = time.monotonic() - started
+        processing = time.monotonic() - collected
+        counts = {}
+        for result in results:
+            for key in ("classification", "outcome"):
+                value = result.get(key)
+                if value:
+                    counts[value] = counts.get(value, 0) + 1
+        durations = [r["duration_ms"] for r in results]
+        created = counts.get("created", 0)
+        return {
+            "run_id": run_id,
+            "dry_run": dry_run,
+            "trigger": trigger,
+            "orders": len(results),
+            "counts": counts,
+            "metrics": {
+                "elapsed_seconds": round(elapsed, 2),
+                "collect_seconds": round(collected - started, 2),
+                "orders_per_minute": round(len(results) / processing * 60, 1) if processing > 0 else None,
+                "created_per_minute": round(created / processing * 60, 1) if processing > 0 else None,
+                "avg_order_ms": round(sum(durations) / len(durations)) if durations else None,
+                "p95_order_ms": _percentile(durations, 95),
+            },
+            "results": sorted(results, key=lambda r: r["orderref"]),
+        }
+
+    def start_run(self, process_order: Callable[[str], Optional[str]], dry_run: bool = True,
+                  trigger: str = "manual", **options) -> Optional[int]:
+        """
+        Run a backfill on a background thread
+
+        Returns:
+            Run ID, or None if another run is in progress
+        """
+        run_options = {"statuses": options.get("statuses", self.statuses),
+                       "project_statuses": options.get("project_statuses", self.project_statuses),
+                       "days": options.get("days", self.days), "workers": self.workers, "rate": self.rate}
+        run_id = self._claim_run(trigger, dry_run, run_options)
+        if run_id is None:
+            return None
+
+        def target():
+            try:
+                self.run(process_order, dry_run=dry_run, trigger=trigger, run_id=run_id, **options)
+            except Exception:
+                pass  # Logged and recorded on the run by run()
+
+        threading.Thread(target=target, name=f"backfill-run-{run_id}", daemon=True).start()
+        return run_id
+
+    # ------------------------------------------------------------------
+    # Schedule
+    # ------------------------------------------------------------------
+    def start(self, process_order: Callable[[str], Optional[str]]):
+        """
+        Start the scheduler thread in this process (no-op if already running or interval_hours is 0).
+        Only one worker runs a scheduled backfill at a time.
+
+        Args:
+            process_order: Creates the customer for an orderref (see run)
+        """
+        if self.interval_hours <= 0 or (self._pid == os.getpid() and self._thread):
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread:
+                return
+            self._process_order = process_order
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._schedule_loop, name=f"backfill-{self._pid}", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Signal the scheduler thread to stop and wait for it"""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _schedule_loop(self):
+        while not self._stopping.is_set():
+            try:
+                last = self._conn().execute(
+                    "SELECT MAX(started_ts) AS ts FROM backfill_runs WHERE trigger = 'schedule'"
+                ).fetchone()["ts"]
+                if last is None or time.time() - last >= self.interval_hours * 3600:
+                    self.run(self._process_order, dry_run=self.scheduled_dry_run, trigger="schedule")
+            except Exception as e:
+                logger.error(f"Error in scheduled backfill: {e}", exc_info=True)
+            self._stopping.wait(60)
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def list_runs(self, limit: int = 20) -> List[Dict]:
+        """
+        List recent runs, newest first (counts and metrics, without per-order results)
+
+        Args:
+            limit: Maximum number of runs to return
+
+        Returns:
+            List of run summaries
+        """
+        runs = []
+        for row in self._conn().execute(
+                "SELECT id, trigger, dry_run, status, options, report, error, started_at, finished_at "
+                "FROM backfill_runs ORDER BY id DESC LIMIT ?", (limit,)):
+            run = dict(row)
+            run["dry_run"] = bool(run["dry_run"])
+            run["options"] = json.loads(run["options"]) if run["options"] else {}
+            report = json.loads(run.pop("report")) if row["report"] else {}
+            run["counts"] = report.get("counts")
+            run["metrics"] = report.get("metrics")
+            runs.append(run)
+        return runs
+
+    def get_run(self, run_id: int) -> Optional[Dict]:
+        """
+        Get one run with its full report
+
+        Args:
+            run_id: Run ID
+
+        Returns:
+            Run record with report, or None
+        """
+        row = self._conn().execute("SELECT * FROM backfill_runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        run = dict(row)
+        run["dry_run"] = bool(run["dry_run"])
+        run["options"] = json.loads(run["options"]) if run["options"] else {}
+        run["report"] = json.loads(run["report"]) if run["report"] else None
+        return run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconcile recent Utopia orders with PowerCode")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be created")
+    parser.add_argument("--status", action="append", dest="statuses",
+                        help="Utopia order status for getOrders (repeatable; default from BACKFILL_STATUSES)")
+    parser.add_argument("--project-status", action="append", dest="project_statuses",
+                        help="Utopia project status ID for getProjects (repeatable)")
+    parser.add_argument("--days", type=int, help="Only orders from the last N days")
+    parser.add_argument("--workers", type=int, help="Orders processed at the same time")
+    parser.add_argument("--rate", type=float, help="Orders started per second (0 = unlimited)")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args(argv)
+
+    # Imported here so the module can be used without building the Flask app
+    from api_callback import UtopiaAPIHandler
+
+    handler = UtopiaAPIHandler()
+    backfill = handler.order_backfill
+    if args.workers:
+        backfill.workers = args.workers
+    if args.rate is not None:
+        backfill.rate = args.rate
+
+    report = backfill.run(
+        handler.process_backfill_order,
+        dry_run=args.dry_run,
+        trigger="cli",
+        statuses=args.statuses,
+        project_statuses=args.project_statuses,
+        days=args.days
+    )
+    if report is None:
+        print("Another backfill run is in progress.")
+        return 1
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for result in report["results"]:
+            print(f"{result['orderref']:<20} {result.get('siteid') or '-':<14} "
+                  f"{result.get('classification') or '-':<10} {result['outcome']:<16} {result['duration_ms']}ms")
+        print(f"\nRun {report['run_id']} ({'dry run' if report['dry_run'] else 'live'}): {report['counts']}")
+        print(f"Metrics: {report['metrics']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,395 @@
+"""
+Durable background queue for webhook orders.
+
+This module handles:
+- Persisting incoming webhook events to a local SQLite job table
+- Running a pool of worker threads that claim and process queued jobs
+- Tracking per-job status and processing stage for the job-status API
+- Keeping running jobs' heartbeats fresh from a per-process thread, so a slow stage
+  is not mistaken for a dead worker
+- Re-queueing jobs whose worker died mid-run (e.g. uWSGI reload)
+- Deleting completed and failed jobs (with their webhook payloads) after a retention period
+"""
+
+import json
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import app_logging
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_PROCESSING = "processing"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).astimezone().isoformat()
+
+
+class OrderQueue(SQLiteStore):
+    """
+    SQLite-backed job queue with an in-process worker pool
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS order_jobs (
+            job_id TEXT PRIMARY KEY,
+            event TEXT,
+            orderref TEXT,
+            msg TEXT,
+            payload TEXT,
+            status TEXT NOT NULL,
+            stage TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            heartbeat REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_order_jobs_status ON order_jobs (status, created_at);
+        CREATE INDEX IF NOT EXISTS idx_order_jobs_orderref ON order_jobs (orderref);
+    """
+
+    def __init__(self, db_path: str = "uac_state.db", num_workers: int = 2,
+                 poll_interval: float = 2.0, lease_timeout: int = 900, max_attempts: int = 3,
+                 retention: float = 30 * 86400):
+        """
+        Initialize order queue
+
+        Args:
+            db_path: Path to SQLite database file
+            num_workers: Number of worker threads per process
+            poll_interval: Seconds between polls when the queue is idle
+            lease_timeout: Seconds after which a 'processing' job with no heartbeat is re-queued
+                (running jobs are heartbeated every third of this)
+            max_attempts: Number of times a job is started before it is marked failed
+            retention: Seconds completed/failed jobs are kept after they finished (0 keeps them forever)
+        """
+        super().__init__(db_path)
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.retention = retention
+
+        self._handler = None
+        self._threads = []
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._current = threading.local()
+        self._last_recovery = 0.0
+        self._running = set()
+        self._running_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+    def enqueue(self, event: Optional[str], orderref: Optional[str], msg: Optional[str],
+                payload: Optional[Dict] = None) -> str:
+        """
+        Add a webhook event to the queue
+
+        Args:
+            event: Webhook event name
+            orderref: Order reference from the webhook
+            msg: Webhook message type (e.g. "Project New Order")
+            payload: Full webhook body, kept for debugging
+
+        Returns:
+            Job ID of the queued job
+        """
+        job_id = uuid.uuid4().hex
+        now = _now()
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO order_jobs (job_id, event, orderref, msg, payload, status, stage, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, event, orderref, msg, json.dumps(payload or {}), STATUS_QUEUED, STATUS_QUEUED, now, now)
+            )
+        self._wakeup.set()
+        logger.info(f"Queued job {job_id} - msg: {msg}, orderref: {orderref}")
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """
+        Get a single job record
+
+        Args:
+            job_id: Job ID returned by enqueue
+
+        Returns:
+            Job record or None if not found
+        """
+        row = self._conn().execute("SELECT * FROM order_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list_jobs(self, orderref: Optional[str] = None, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """
+        List jobs, newest first
+
+        Args:
+            orderref: Only return jobs for this order reference
+            status: Only return jobs in this status
+            limit: Maximum number of jobs to return
+
+        Returns:
+            List of job records
+        """
+        query = "SELECT * FROM order_jobs"
+        clauses, params = [], []
+        if orderref:
+            clauses.append("orderref = ?")
+            params.append(orderref)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        return [self._row_to_job(row) for row in self._conn().execute(query, params)]
+
+    def get_queue_stats(self) -> Dict:
+        """
+        Count jobs per status
+
+        Returns:
+            Dictionary of status -> count
+        """
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM order_jobs GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
+
+    # ------------------------------------------------------------------
+    # Progress reporting (called from inside the handler)
+    # ------------------------------------------------------------------
+    def set_stage(self, stage: str):
+        """
+        Record the processing stage of the job running on the current thread.
+        Does nothing when called outside a queue worker (e.g. admin requests).
+
+        Args:
+            stage: Short stage name (e.g. "utopia_lookup", "powercode_create")
+        """
+        job_id = getattr(self._current, "job_id", None)
+        if not job_id:
+            return
+        app_logging.bind(stage=stage)
+        try:
+            with self.transaction() as conn:
+                conn.execute(
+                    "UPDATE order_jobs SET stage = ?, updated_at = ?, heartbeat = ? WHERE job_id = ?",
+                    (stage, _now(), time.time(), job_id)
+                )
+        except Exception as e:
+            logger.warning(f"Could not update stage for job {job_id}: {e}")
+
+    def is_rerun(self) -> bool:
+        """
+        Whether the job running on the current thread was started before (its worker
+        died or its heartbeat lapsed), so earlier work may already have reached PowerCode.
+        False outside a queue worker.
+        """
+        return getattr(self._current, "job_id", None) is not None and getattr(self._current, "attempts", 1) > 1
+
+    # ------------------------------------------------------------------
+    # Worker side
+    # ------------------------------------------------------------------
+    def start(self, handler: Callable[[Dict], None]):
+        """
+        Start worker threads in this process (no-op if already running).
+        Safe to call repeatedly; threads are restarted after a fork.
+
+        Args:
+            handler: Callable that processes one job record; raising marks the job failed
+        """
+        if self._pid == os.getpid() and self._threads:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+            self._handler = handler
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._threads = []
+            self._requeue_stale()
+            heartbeat = threading.Thread(target=self._heartbeat_loop, name=f"order-heartbeat-{self._pid}", daemon=True)
+            heartbeat.start()
+            self._threads.append(heartbeat)
+            for i in range(self.num_workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"order-worker-{self._pid}-{i}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started {self.num_workers} order queue workers in process {self._pid}")
+
+    def stop(self, timeout: float = 5.0):
+        """Signal worker threads to stop and wait for them"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _worker_loop(self):
+        """Claim and process jobs until stopped"""
+        while not self._stopping.is_set():
+            try:
+                job = self._claim_next()
+            except Exception as e:
+                logger.error(f"Error claiming job from queue: {e}", exc_info=True)
+                job = None
+
+            if job is None:
+                if time.time() - self._last_recovery > self.lease_timeout:
+                    self._requeue_stale()
+                    self._prune_finished()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._run_job(job)
+
+    def _run_job(self, job: Dict):
+        """Run the handler for one claimed job and record the outcome"""
+        job_id = job["job_id"]
+        self._current.job_id = job_id
+        self._current.attempts = job.get("attempts", 1)
+        with self._running_lock:
+            self._running.add(job_id)
+        started = time.monotonic()
+        # Every log record written while the job runs carries its job_id, orderref and stage
+        with app_logging.log_context(job_id=job_id, orderref=job.get("orderref"), stage="started"):
+            try:
+                self._handler(job)
+            except Exception as e:
+                logger.error(
+                    f"Job {job_id} failed (orderref: {job.get('orderref')}): {e}", exc_info=True,
+                    extra={"duration_ms": round((time.monotonic() - started) * 1000)}
+                )
+                self._finish(job_id, STATUS_FAILED, str(e))
+            else:
+                self._finish(job_id, STATUS_COMPLETED)
+                logger.info(
+                    f"Job {job_id} completed in {time.monotonic() - started:.2f}s (orderref: {job.get('orderref')})",
+                    extra={"duration_ms": round((time.monotonic() - started) * 1000)}
+                )
+            finally:
+                self._current.job_id = None
+                with self._running_lock:
+                    self._running.discard(job_id)
+
+    def _heartbeat_loop(self):
+        """Refresh the heartbeat of every job this process is running until stopped"""
+        interval = max(1.0, self.lease_timeout / 3)
+        while not self._stopping.wait(interval):
+            with self._running_lock:
+                job_ids = list(self._running)
+            if not job_ids:
+                continue
+            try:
+                with self.transaction() as conn:
+                    conn.execute(
+                        f"UPDATE order_jobs SET heartbeat = ? WHERE status = ? "
+                        f"AND job_id IN ({', '.join('?' * len(job_ids))})",
+                        [time.time(), STATUS_PROCESSING] + job_ids
+                    )
+            except Exception as e:
+                logger.warning(f"Could not refresh heartbeat of running jobs: {e}")
+
+    def _claim_next(self) -> Optional[Dict]:
+        """
+        Atomically move the oldest queued job to 'processing'
+
+        Returns:
+            Claimed job record or None if the queue is empty
+        """
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM order_jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (STATUS_QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = _now()
+            conn.execute(
+                "UPDATE order_jobs SET status = ?, stage = ?, attempts = attempts + 1, "
+                "started_at = ?, updated_at = ?, heartbeat = ? WHERE job_id = ?",
+                (STATUS_PROCESSING, "started", now, now, time.time(), row["job_id"])
+            )
+        job = self._row_to_job(row)
+        job["attempts"] += 1
+        return job
+
+    def _finish(self, job_id: str, status: str, error: Optional[str] = None):
+        """Mark a job completed or failed, keeping the last stage it reached"""
+        now = _now()
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE order_jobs SET status = ?, error = ?, finished_at = ?, updated_at = ? WHERE job_id = ?",
+                (status, error, now, now, job_id)
+            )
+
+    def _requeue_stale(self):
+        """
+        Re-queue jobs left in 'processing' by a worker that died, or fail
+        them once they have used up max_attempts
+        """
+        self._last_recovery = time.time()
+        cutoff = self._last_recovery - self.lease_timeout
+        now = _now()
+        with self.transaction() as conn:
+            failed = conn.execute(
+                "UPDATE order_jobs SET status = ?, stage = ?, error = ?, finished_at = ?, updated_at = ? "
+                "WHERE status = ? AND heartbeat < ? AND attempts >= ?",
+                (STATUS_FAILED, STATUS_FAILED, "Worker stopped while processing job", now, now,
+                 STATUS_PROCESSING, cutoff, self.max_attempts)
+            ).rowcount
+            requeued = conn.execute(
+                "UPDATE order_jobs SET status = ?, stage = ?, updated_at = ? WHERE status = ? AND heartbeat < ?",
+                (STATUS_QUEUED, STATUS_QUEUED, now, STATUS_PROCESSING, cutoff)
+            ).rowcount
+        if requeued or failed:
+            logger.warning(f"Recovered stale jobs - requeued: {requeued}, failed: {failed}")
+
+    def _prune_finished(self):
+        """Delete completed and failed jobs that finished more than `retention` seconds ago"""
+        if self.retention <= 0:
+            return
+        try:
+            with self.transaction() as conn:
+                # finished_at is ISO 8601 with a UTC offset, which julianday() understands
+                deleted = conn.execute(
+                    "DELETE FROM order_jobs WHERE status IN (?, ?) AND julianday(finished_at) < julianday('now', ?)",
+                    (STATUS_COMPLETED, STATUS_FAILED, f"-{int(self.retention)} seconds")
+                ).rowcount
+        except Exception as e:
+            logger.error(f"Error pruning finished jobs: {e}", exc_info=True)
+            return
+        if deleted:
+            logger.info(f"Pruned {deleted} finished jobs older than {self.retention / 86400:g} days")
+
+    @staticmethod
+    def _row_to_job(row) -> Dict:
+        job = dict(row)
+        job.pop("heartbeat", None)
+        try:
+            job["payload"] = json.loads(job.get("payload") or "{}")
+        except ValueError:
+            pass
+        return job
@@ -1,10 +1,11 @@
 """ Working With Powercode"""
-import os
 import json
-import time
 import base64
 import config
 import requests
+import http_client
+import metrics
+import resilience
 
 from requests.auth import HTTPBasicAuth, AuthBase
 from config import PC_VERIFY_SSL, CUSTOMER_PORTAL_PASSWORD
@@ -20,10 +21,15 @@ class PcApiKeyAuth(AuthBase):
         r.headers["Authorization"] = f"Basic {self.encoded_key}"
         return r
 
+def _http():
+    """Pooled keep-alive session shared by all PowerCode API/UAPI calls in this worker"""
+    return http_client.get_session("powercode")
+
+
 #===========================================
 # Customers methods 
 #===========================================
-def create_powercode_account(customer_info, max_retries=3, retry_delay=5):
+def create_powercode_account(customer_info, max_retries=2):
     if customer_info['state'] == "Montana":
         customer_info['state'] = "MT"
 
@@ -62,36 +68,36 @@ def create_powercode_account(customer_info, max_retries=3, retry_delay=5):
         "extAccountID": customer_info['siteid'],
     }
 
+    # Transport errors are retried (and PowerCode outages short-circuited) by the
+    # resilience layer in http_client; the loop only re-sends when geocoding fails
     for attempt in range(max_retries):
         print(f"Attempt #{attempt + 1} to create Powercode account.")
 
         try:
-            response = requests.post(config.PC_URL_API, data=account_data, verify=PC_VERIFY_SSL)
-            # print(PC_response.json())
-
-            if 'customerID' in response.json():
-                # Account created successfully
-                PC_customer_id = response.json()['customerID']
-                print(f"Powercode account created successfully: {response}")
-                return PC_customer_id, None
-            elif response.json().get('statusCode') == 23:
-                # Geocoding failed, retry with physicalAutomaticallyGeocode set to 0
-                # print("Geocoding failed. Retrying with physicalAutomaticallyGeocode set to 0.")
-                account_data["physicalAutomaticallyGeocode"] = 0
-                time.sleep(retry_delay)
-            else:
-                # Other error, stop retrying
-                # print(f"Failed to create Powercode account. Response: {PC_response.json()}")
-                error_message = response.json().get('message', 'Unknown error in Powercode')
-                #utopia_handler.send_email("Failed to create Powercode account", f"Error message: {error_message}")
-                break
-
+            response = _http().post(config.PC_URL_API, data=account_data, verify=PC_VERIFY_SSL)
+            result = response.json()
+        except (resilience.CircuitOpenError, resilience.UpstreamThrottledError):
+            # PowerCode is unavailable right now: let the caller record it as such
+            raise
         except Exception as e:
             print(f"Exception during Powercode account creation: {e}")
-            time.sleep(retry_delay)
+            return -1, str(e)
+
+        if 'customerID' in result:
+            # Account created successfully
+            PC_customer_id = result['customerID']
+            print(f"Powercode account created successfully: {response}")
+            return PC_customer_id, None
+        elif result.get('statusCode') == 23:
+            # Geocoding failed, retry with physicalAutomaticallyGeocode set to 0
+            account_data["physicalAutomaticallyGeocode"] = 0
+            metrics.inc(metrics.GEOCODE_RETRIES)
+        else:
+            # Other error, stop retrying
+            break
+
+    print(f"Failed to create Powercode account after {attempt + 1} attempts.")
 
-    print(f"Failed to create Powercode account after {max_retries} attempts.")
-    
     print("Status Code:", response.status_code)
     print("Response Body:", response.text)
 
@@ -105,7 +111,7 @@ def read_powercode_account(customerID):
         'customerID': customerID,
     }
 
-    PC_response = requests.post(config.PC_URL_API, data=account_data, verify=PC_VERIFY_SSL)
+    PC_response = _http().post(config.PC_URL_API, data=account_data, verify=PC_VERIFY_SSL)
     return PC_response
 
 # Read account
@@ -116,7 +122,7 @@ def get_customer_by_external_id(external_id):
         'extAccountID': external_id,
     }
 
-    PC_response = requests.post(config.PC_URL_API, data=account_data, verify=PC_VERIFY_SSL)
+    PC_response = _http().post(config.PC_URL_API, data=account_data, verify=PC_VERIFY_SSL)
     return PC_response
 
 
@@ -128,10 +134,19 @@ def search_powercode_customers(searchString):
         'searchString': searchString,
     }
 
-    PC_response = requests.post(config.PC_URL_API, data=account_data, verify=PC_VERIFY_SSL)
+    PC_response = _http().post(config.PC_URL_API, data=account_data, verify=PC_VERIFY_SSL)
     return PC_response.json()
 
 
+# List all customers (an empty search string matches every customer)
+# Used for bulk refreshes of the local duplicate-detection index
+def list_powercode_customers():
+    response = search_powercode_customers("")
+    if "customers" not in response:
+        raise ValueError(f"Unexpected PowerCode customer list response: {response}")
+    return response["customers"]
+
+
 # Search customer with UAPI
 def search_customers_with_uapi(searchString):
     """
@@ -145,7 +160,7 @@ def search_customers_with_uapi(searchString):
         "query": searchString,
     }
 
-    response = requests.get(
+    response = _http().get(
         url,
         params = params,
         auth = PcApiKeyAuth(config.PC_API_KEY),
@@ -177,7 +192,7 @@ def create_powercode_ticket(customer_id, description):
 
     }
 
-    PC_response = requests.post(config.PC_URL_API, data=ticket_data, verify=PC_VERIFY_SSL)
+    PC_response = _http().post(config.PC_URL_API, data=ticket_data, verify=PC_VERIFY_SSL)
 
     # after ticket created, response will contain ticketID that will be need for reply ticket
     # {'message': 'Ticket created', 'statusCode': 0, 'ticketID': '15'}
@@ -195,7 +210,7 @@ def read_powercode_ticket(ticket_id):
         "ticketID": ticket_id
     }
 
-    PC_response = requests.post(config.PC_URL_API, data=ticket_data, verify=PC_VERIFY_SSL)
+    PC_response = _http().post(config.PC_URL_API, data=ticket_data, verify=PC_VERIFY_SSL)
 
     # after ticket created, response will contain ticketID that will be need for reply ticket
     # {'message': 'Ticket created', 'statusCode': 0, 'ticketID': '15'}
@@ -220,7 +235,7 @@ def add_customer_service_plan(customer_id, service_plan_id):
         'prorateService': 0
     }
 
-    pc_response = requests.post(config.PC_URL_API, data=service_data, verify=PC_VERIFY_SSL)
+    pc_response = _http().post(config.PC_URL_API, data=service_data, verify=PC_VERIFY_SSL)
 
     return pc_response.json()
 
@@ -239,7 +254,7 @@ def get_customer_tags(customer_id):
         "customerID": customer_id
     }
 
-    response = requests.get(
+    response = _http().get(
         url,
         params = params,
         auth = PcApiKeyAuth(config.PC_API_KEY),
@@ -264,7 +279,7 @@ def add_customer_tag(customer_id, tags_id_list):
         "tags[]": tags_id_list
     }
 
-    response = requests.post(
+    response = _http().post(
         url,
         params = params,
         auth = PcApiKeyAuth(config.PC_API_KEY),
@@ -285,7 +300,7 @@ def delete_customer_tag(customer_id, tags_id):
         "tags[]": tags_id
     }
 
-    response = requests.delete(
+    response = _http().delete(
         url,
         params = params,
         auth = PcApiKeyAuth(config.PC_API_KEY),
@@ -301,6 +316,6 @@ def read_custom_action(action):
         "action": action,
     }
 
-    response = requests.post(config.PC_URL_API, data=fields, verify=PC_VERIFY_SSL)
+    response = _http().post(config.PC_URL_API, data=fields, verify=PC_VERIFY_SSL)
     return response.json()
     
\ No newline at end of file
@@ -0,0 +1,544 @@
+"""
+Resilience layer for upstream API calls (Utopia, PowerCode).
+
+This module handles:
+- Token-bucket rate limits per upstream and endpoint, shared by all uWSGI workers
+  through the local SQLite state database
+- Retrying transient failures with jittered exponential backoff (honoring Retry-After);
+  calls that change data upstream are only retried when the request never reached it
+- A circuit breaker per upstream: after repeated failures calls fail fast with
+  CircuitOpenError until a single trial call succeeds again
+- Breaker state and per-endpoint counters for the admin page
+"""
+
+import time
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+import config
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# PowerCode API actions that only read data
+IDEMPOTENT_ACTION_PREFIXES = ("read", "search", "get", "list")
+# Utopia endpoints (last URL path segment) that change data
+UTOPIA_WRITE_ENDPOINTS = ("editserviceitem", "editorderitem", "suspend", "unsuspend", "changespeed", "cancelservice")
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+    def __init__(self, upstream: str, retry_at: Optional[float] = None):
+        self.upstream = upstream
+        self.retry_at = retry_at
+        when = f" until {_iso(retry_at)}" if retry_at else ""
+        super().__init__(f"{upstream} is unavailable (circuit breaker open{when})")
+
+
+class UpstreamThrottledError(requests.exceptions.ConnectionError):
+    """Raised when a call would have to wait too long for its rate limit"""
+
+    def __init__(self, upstream: str, endpoint: str, wait: float):
+        self.upstream = upstream
+        self.endpoint = endpoint
+        super().__init__(f"{upstream} {endpoint} rate limit would delay the call by {wait:.1f}s")
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).astimezone().isoformat() if ts else None
+
+
+def parse_rate_limits(value: str) -> Dict[str, float]:
+    """
+    Parse rate limits like "utopia=10,powercode=5,powercode:createCustomer=1"
+
+    Args:
+        value: Comma-separated upstream[:endpoint]=requests-per-second pairs
+
+    Returns:
+        Dictionary of "upstream" or "upstream:endpoint" to requests per second
+    """
+    limits = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        key, rate = item.split("=", 1)
+        try:
+            limits[key.strip()] = float(rate)
+        except ValueError:
+            logger.warning(f"Ignoring invalid upstream rate limit '{item.strip()}'")
+    return limits
+
+
+def endpoint_for(method: str, url: str, kwargs: Dict) -> str:
+    """
+    Name of the endpoint a call goes to: the PowerCode API action, otherwise the URL path
+
+    Args:
+        method: HTTP method
+        url: Request URL
+        kwargs: Keyword arguments passed to requests
+
+    Returns:
+        Endpoint name (e.g. "createCustomer", "contractlookup", "customer/Find")
+    """
+    data = kwargs.get("data")
+    if isinstance(data, dict) and data.get("action"):
+        return str(data["action"])
+    path = urlsplit(url).path.strip("/")
+    if "/spquery/" in f"/{path}/" or path.startswith("address/"):
+        return path.rsplit("/", 1)[-1]
+    return "/".join(path.split("/")[-2:]) or method.upper()
+
+
+def is_idempotent(upstream: str, method: str, endpoint: str) -> bool:
+    """
+    Whether a call can be sent again without risk of changing data twice
+
+    Args:
+        upstream: Upstream name
+        method: HTTP method
+        endpoint: Endpoint name from endpoint_for
+
+    Returns:
+        True for reads (GET, PowerCode read/search actions, Utopia queries)
+    """
+    if method.upper() in ("GET", "HEAD", "OPTIONS"):
+        return True
+    if upstream == "utopia":
+        return endpoint.lower() not in UTOPIA_WRITE_ENDPOINTS
+    return endpoint.lower().startswith(IDEMPOTENT_ACTION_PREFIXES)
+
+
+def _retry_after(response) -> Optional[float]:
+    """Seconds requested by a Retry-After header (delta or HTTP date), if any"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class UpstreamGuard(SQLiteStore):
+    """
+    Rate limits, retries and circuit breakers for upstream calls, shared by all workers
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS upstream_circuits (
+            upstream TEXT PRIMARY KEY,
+            state TEXT NOT NULL DEFAULT 'closed',
+            failures INTEGER NOT NULL DEFAULT 0,
+            open_until REAL NOT NULL DEFAULT 0,
+            cooldown REAL NOT NULL DEFAULT 0,
+            trial_until REAL NOT NULL DEFAULT 0,
+            opened_count INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            last_change REAL
+        );
+        CREATE TABLE IF NOT EXISTS upstream_limits (
+            upstream TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            tokens REAL,
+            updated REAL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            retries INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0,
+            throttled_ms INTEGER NOT NULL DEFAULT 0,
+            last_status TEXT,
+            last_at REAL,
+            PRIMARY KEY (upstream, endpoint)
+        );
+    """
+
+    def __init__(self, db_path: str = "uac_state.db", rate_limits: Optional[Dict[str, float]] = None,
+                 failure_threshold: int = 5, cooldown: float = 30, max_cooldown: float = 600,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8,
+                 max_wait: float = 10):
+        """
+        Initialize guard
+
+        Args:
+            db_path: Path to SQLite database file
+            rate_limits: Requests per second by "upstream" or "upstream:endpoint" (the more
+                specific key wins; missing or 0 means no limit)
+            failure_threshold: Consecutive failures (errors or 5xx responses) that open a circuit
+            cooldown: Seconds an opened circuit fails fast before a trial call is let through
+            max_cooldown: Upper bound for the cooldown, which doubles after each failed trial
+            max_retries: Retries of a transient failure within one call
+            backoff_base: Backoff before the first retry in seconds; doubles per retry (full jitter)
+            backoff_max: Upper bound for one backoff or Retry-After wait
+            max_wait: Longest a call waits for its rate limit before failing
+        """
+        super().__init__(db_path)
+        self.rate_limits = rate_limits or {}
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.max_cooldown = max(cooldown, max_cooldown)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_wait = max_wait
+        self.trial_timeout = config.HTTP_CONNECT_TIMEOUT + config.HTTP_READ_TIMEOUT
+
+    # ------------------------------------------------------------------
+    # Rate limiting
+    # ------------------------------------------------------------------
+    def rate_for(self, upstream: str, endpoint: str) -> float:
+        """Requests per second allowed for an endpoint (0 = unlimited)"""
+        return self.rate_limits.get(f"{upstream}:{endpoint}", self.rate_limits.get(upstream, 0))
+
+    def acquire(self, upstream: str, endpoint: str):
+        """
+        Take a token from the endpoint's bucket, waiting for one if needed.
+        The bucket holds up to one second of tokens, so short bursts are allowed.
+
+        Raises:
+            UpstreamThrottledError: If the wait would exceed max_wait
+        """
+        rate = self.rate_for(upstream, endpoint)
+        if rate <= 0:
+            return
+        burst = max(1.0, rate)
+        waited = 0.0
+        while True:
+            now = time.time()
+            with self.transaction() as conn:
+                row = conn.execute(
+                    "SELECT tokens, updated FROM upstream_limits WHERE upstream = ? AND endpoint = ?",
+                    (upstream, endpoint)
+                ).fetchone()
+                tokens = burst
+                if row is not None and row["tokens"] is not None:
+                    tokens = min(burst, row["tokens"] + max(0.0, now - row["updated"]) * rate)
+                wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+                if not wait:
+                    tokens -= 1
+                conn.execute(
+                    "INSERT INTO upstream_limits (upstream, endpoint, tokens, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(upstream, endpoint) DO UPDATE SET tokens = excluded.tokens, "
+                    "updated = excluded.updated, throttled_ms = throttled_ms + ?",
+                    (upstream, endpoint, tokens, now, round(waited * 1000) if not wait else 0)
+                )
+            if not wait:
+                return
+            if waited + wait > self.max_wait:
+                self._count(upstream, endpoint, "rejected", "throttled")
+                raise UpstreamThrottledError(upstream, endpoint, waited + wait)
+            time.sleep(wait)
+            waited += wait
+
+    # ------------------------------------------------------------------
+    # Circuit breaker
+    # ------------------------------------------------------------------
+    def _circuit(self, upstream: str) -> Optional[Dict]:
+        row = self._conn().execute("SELECT * FROM upstream_circuits WHERE upstream = ?", (upstream,)).fetchone()
+        return dict(row) if row else None
+
+    def before_call(self, upstream: str, endpoint: str) -> bool:
+        """
+        Check the upstream's circuit before a call
+
+        Returns:
+            True if this call is the half-open trial that decides whether the circuit closes
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or another call holds the trial
+        """
+        circuit = self._circuit(upstream)
+        if circuit is None or circuit["state"] == STATE_CLOSED:
+            return False
+
+        now = time.time()
+        if circuit["state"] == STATE_OPEN and circuit["open_until"] > now:
+            self._count(upstream, endpoint, "rejected", "circuit_open")
+            raise CircuitOpenError(upstream, circuit["open_until"])
+
+        # Cooldown over (or the last trial was abandoned): one call across all workers gets to try
+        with self.transaction() as conn:
+            claimed = conn.execute(
+                "UPDATE upstream_circuits SET state = ?, trial_until = ?, last_change = ? "
+                "WHERE upstream = ? AND ((state = ? AND open_until <= ?) OR (state = ? AND trial_until <= ?))",
+                (STATE_HALF_OPEN, now + self.trial_timeout, now, upstream, STATE_OPEN, now, STATE_HALF_OPEN, now)
+            ).rowcount
+        if claimed:
+            logger.info(f"Circuit for {upstream} half-open, trying {endpoint}", extra={"upstream": upstream})
+            return True
+        self._count(upstream, endpoint, "rejected", "circuit_open")
+        raise CircuitOpenError(upstream, now + self.cooldown)
+
+    def record_result(self, upstream: str, endpoint: str, ok: bool, status: str, trial: bool = False,
+                      error: Optional[str] = None, retried: bool = False):
+        """
+        Count a call and update the upstream's circuit
+
+        Args:
+            upstream: Upstream name
+            endpoint: Endpoint name
+            ok: False for failures that count toward opening the circuit
+            status: HTTP status or exception name, for the counters
+            trial: The call was the half-open trial
+            error: Error text for failures
+            retried: The call will be retried
+        """
+        now = time.time()
+        opened = closed = False
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO upstream_limits (upstream, endpoint, requests, errors, retries, last_status, last_at) "
+                "VALUES (?, ?, 1, ?, ?, ?, ?) ON CONFLICT(upstream, endpoint) DO UPDATE SET "
+                "requests = requests + 1, errors = errors + excluded.errors, retries = retries + excluded.retries, "
+                "last_status = excluded.last_status, last_at = excluded.last_at",
+                (upstream, endpoint, 0 if ok else 1, 1 if retried else 0, status, now)
+            )
+            row = conn.execute("SELECT * FROM upstream_circuits WHERE upstream = ?", (upstream,)).fetchone()
+            if ok:
+                if row is not None and (row["failures"] or row["state"] != STATE_CLOSED):
+                    closed = row["state"] != STATE_CLOSED
+                    conn.execute(
+                        "UPDATE upstream_circuits SET state = ?, failures = 0, cooldown = 0, open_until = 0, "
+                        "trial_until = 0, last_change = CASE WHEN state = ? THEN last_change ELSE ? END "
+                        "WHERE upstream = ?",
+                        (STATE_CLOSED, STATE_CLOSED, now, upstream)
+                    )
+            else:
+                failures = (row["failures"] if row else 0) + 1
+                state = row["state"] if row else STATE_CLOSED
+                cooldown = row["cooldown"] if row else 0
+                if state == STATE_HALF_OPEN and trial:
+                    cooldown = min(self.max_cooldown, max(self.cooldown, cooldown * 2))
+                    opened = True
+                elif state == STATE_CLOSED and failures >= self.failure_threshold:
+                    cooldown = self.cooldown
+                    opened = True
+                conn.execute(
+                    "INSERT INTO upstream_circuits (upstream, state, failures, open_until, cooldown, "
+                    "opened_count, last_error, last_change) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(upstream) DO UPDATE SET state = excluded.state, failures = excluded.failures, "
+                    "open_until = excluded.open_until, cooldown = excluded.cooldown, "
+                    "opened_count = opened_count + excluded.opened_count, last_error = excluded.last_error, "
+                    "last_change = CASE WHEN excluded.opened_count THEN excluded.last_change ELSE last_change END",
+                    (upstream, STATE_OPEN if opened else state, failures, now + cooldown if opened else
+                     (row["open_until"] if row else 0), cooldown, 1 if opened else 0, error, now)
+                )
+
+        if opened:
+            logger.error(
+                f"Circuit for {upstream} opened for {cooldown:.0f}s after {failures} consecutive failures "
+                f"(last: {endpoint}: {error})",
+                extra={"upstream": upstream}
+            )
+        elif closed:
+            logger.info(f"Circuit for {upstream} closed, {endpoint} succeeded", extra={"upstream": upstream})
+
+    def _count(self, upstream: str, endpoint: str, counter: str, status: str):
+        with self.transaction() as conn:
+            conn.execute(
+                f"INSERT INTO upstream_limits (upstream, endpoint, {counter}, last_status, last_at) "
+                f"VALUES (?, ?, 1, ?, ?) ON CONFLICT(upstream, endpoint) DO UPDATE SET "
+                f"{counter} = {counter} + 1, last_status = excluded.last_status, last_at = excluded.last_at",
+                (upstream, endpoint, status, time.time())
+            )
+
+    def blocked_upstreams(self) -> List[str]:
+        """
+        Upstreams that currently fail fast: open and cooling down, or half-open with a trial in flight
+
+        Returns:
+            List of upstream names
+        """
+        now = time.time()
+        return [row["upstream"] for row in self._conn().execute(
+            "SELECT upstream FROM upstream_circuits WHERE (state = ? AND open_until > ?) OR (state = ? AND trial_until > ?)",
+            (STATE_OPEN, now, STATE_HALF_OPEN, now)
+        )]
+
+    def reset(self, upstream: str) -> bool:
+        """
+        Close an upstream's circuit by hand
+
+        Returns:
+            True if the upstream had a circuit record
+        """
+        with self.transaction() as conn:
+            updated = conn.execute(
+                "UPDATE upstream_circuits SET state = ?, failures = 0, cooldown = 0, open_until = 0, "
+                "trial_until = 0, last_change = ? WHERE upstream = ?",
+                (STATE_CLOSED, time.time(), upstream)
+            ).rowcount
+        if updated:
+            logger.info(f"Circuit for {upstream} reset by an administrator", extra={"upstream": upstream})
+        return updated > 0
+
+    # ------------------------------------------------------------------
+    # Calls
+    # ------------------------------------------------------------------
+    def _backoff(self, attempt: int, response=None) -> float:
+        """Full-jitter exponential backoff, or the upstream's Retry-After if it asked for one"""
+        retry_after = _retry_after(response)
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def _retryable_error(error: Exception, idempotent: bool) -> bool:
+        """Transport errors are retried for reads; writes only if the connection was never made"""
+        if isinstance(error, (CircuitOpenError, UpstreamThrottledError)):
+            return False
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        return idempotent and isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+    def call(self, upstream: str, method: str, url: str, kwargs: Dict, send: Callable[[], requests.Response]):
+        """
+        Send one upstream request through the rate limit, circuit breaker and retry policy
+
+        Args:
+            upstream: Upstream name
+            method: HTTP method
+            url: Request URL
+            kwargs: Keyword arguments of the request (used to name the endpoint)
+            send: Sends the request once and returns the response
+
+        Returns:
+            requests.Response (a 5xx/429 response is returned once retries are used up)
+
+        Raises:
+            CircuitOpenError: The upstream's circuit is open
+            UpstreamThrottledError: The endpoint's rate limit would delay the call too long
+            requests.exceptions.RequestException: The last transport error
+        """
+        endpoint = endpoint_for(method, url, kwargs)
+        idempotent = is_idempotent(upstream, method, endpoint)
+        attempt = 0
+        while True:
+            trial = self.before_call(upstream, endpoint)
+            self.acquire(upstream, endpoint)
+            try:
+                response = send()
+            except requests.exceptions.RequestException as e:
+                retry = attempt < self.max_retries and not trial and self._retryable_error(e, idempotent)
+                self.record_result(upstream, endpoint, False, type(e).__name__, trial, str(e), retry)
+                if not retry:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(
+                    f"{method} {endpoint} on {upstream} failed ({type(e).__name__}), retrying in {delay:.2f}s",
+                    extra={"upstream": upstream}
+                )
+            else:
+                status = response.status_code
+                failed = status >= 500
+                retry = (attempt < self.max_retries and not trial and status in RETRY_STATUSES
+                         and (idempotent or status == 429))
+                self.record_result(upstream, endpoint, not failed, str(status), trial,
+                                   f"HTTP {status}" if failed else None, retry)
+                if not retry:
+                    return response
+                delay = self._backoff(attempt, response)
+                response.close()
+                logger.warning(
+                    f"{method} {endpoint} on {upstream} returned {status}, retrying in {delay:.2f}s",
+                    extra={"upstream": upstream}
+                )
+            time.sleep(delay)
+            attempt += 1
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def get_status(self) -> Dict:
+        """
+        Report breaker state per upstream and call counters per endpoint
+
+        Returns:
+            Dictionary with settings and a list of upstreams, each with its endpoints
+        """
+        now = time.time()
+        conn = self._conn()
+        circuits = {row["upstream"]: dict(row) for row in conn.execute("SELECT * FROM upstream_circuits")}
+        endpoints = {}
+        for row in conn.execute("SELECT * FROM upstream_limits ORDER BY upstream, endpoint"):
+            endpoint = dict(row)
+            endpoint["rate_limit"] = self.rate_for(endpoint["upstream"], endpoint["endpoint"]) or None
+            endpoint["last_at"] = _iso(endpoint["last_at"])
+            for field in ("tokens", "updated"):
+                endpoint.pop(field)
+            endpoints.setdefault(endpoint.pop("upstream"), []).append(endpoint)
+
+        upstreams = []
+        for name in sorted(set(circuits) | set(endpoints) | {"utopia", "powercode"}):
+            circuit = circuits.get(name, {})
+            state = circuit.get("state", STATE_CLOSED)
+            upstreams.append({
+                "upstream": name,
+                "state": state,
+                "failures": circuit.get("failures", 0),
+                "open_until": _iso(circuit.get("open_until")) if state == STATE_OPEN else None,
+                "retry_in": max(0, round(circuit.get("open_until", 0) - now)) if state == STATE_OPEN else None,
+                "cooldown": circuit.get("cooldown") or None,
+                "opened_count": circuit.get("opened_count", 0),
+                "last_error": circuit.get("last_error"),
+                "last_change": _iso(circuit.get("last_change")),
+                "rate_limit": self.rate_limits.get(name) or None,
+                "endpoints": endpoints.get(name, []),
+            })
+        return {
+            "failure_threshold": self.failure_threshold,
+            "cooldown": self.cooldown,
+            "max_cooldown": self.max_cooldown,
+            "max_retries": self.max_retries,
+            "upstreams": upstreams,
+        }
+
+
+_guard = None
+_guard_lock = threading.Lock()
+
+
+def get_guard() -> Optional[UpstreamGuard]:
+    """
+    Shared guard for upstream calls (created on first use)
+
+    Returns:
+        UpstreamGuard, or None when UPSTREAM_RESILIENCE_ENABLED is false
+    """
+    global _guard
+    if not config.UPSTREAM_RESILIENCE_ENABLED:
+        return None
+    if _guard is None:
+        with _guard_lock:
+            if _guard is None:
+                _guard = UpstreamGuard(
+                    db_path=config.STATE_DB_FILE,
+                    rate_limits=parse_rate_limits(config.UPSTREAM_RATE_LIMITS),
+                    failure_threshold=config.UPSTREAM_BREAKER_THRESHOLD,
+                    cooldown=config.UPSTREAM_BREAKER_COOLDOWN,
+                    max_cooldown=config.UPSTREAM_BREAKER_MAX_COOLDOWN,
+                    max_retries=config.UPSTREAM_MAX_RETRIES,
+                    backoff_base=config.UPSTREAM_RETRY_BACKOFF,
+                    backoff_max=config.UPSTREAM_RETRY_MAX_BACKOFF,
+                    max_wait=config.UPSTREAM_RATE_MAX_WAIT
+                )
+    return _guard
@@ -0,0 +1,141 @@
+"""
+Server-side store for admin panel results.
+
+This module handles:
+- Keeping the output of a PowerCode/Utopia panel action in the local SQLite state
+  database under a random result ID, so only the ID travels in the session cookie
+  and any uWSGI worker can serve it after the redirect
+- Serving a result one page of lines at a time
+- Expiring results after a TTL and evicting the least recently viewed ones beyond a
+  maximum count or total size
+"""
+
+import time
+import secrets
+import logging
+from typing import Dict, Optional
+
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+
+class ResultStore(SQLiteStore):
+    """
+    SQLite-backed LRU + TTL store of result texts, keyed by result ID
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS admin_results (
+            id TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            title TEXT NOT NULL,
+            text TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            line_count INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_admin_results_lru ON admin_results (last_access);
+        CREATE INDEX IF NOT EXISTS idx_admin_results_expires ON admin_results (expires_at);
+    """
+
+    def __init__(self, db_path: str = "uac_state.db", ttl: float = 3600, max_entries: int = 200,
+                 max_bytes: int = 50 * 1024 * 1024):
+        """
+        Initialize store
+
+        Args:
+            db_path: Path to SQLite database file
+            ttl: Seconds a result can be viewed after it was created
+            max_entries: Least recently viewed results beyond this are evicted
+            max_bytes: Least recently viewed results are evicted while all results together
+                are larger than this (the newest result is always kept)
+        """
+        super().__init__(db_path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def put(self, text: str, owner: str, title: str = "") -> str:
+        """
+        Store a result
+
+        Args:
+            text: Result text (e.g. pretty-printed JSON)
+            owner: Username the result belongs to; only they can read it
+            title: Short label, e.g. the panel action that produced it
+
+        Returns:
+            Result ID
+        """
+        result_id = secrets.token_urlsafe(12)
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO admin_results (id, owner, title, text, size, line_count, created_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (result_id, owner, title, text, len(text.encode("utf-8")), len(text.splitlines()) or 1,
+                 now, now + self.ttl, now)
+            )
+            self._evict(conn, now, keep=result_id)
+        return result_id
+
+    def _evict(self, conn, now: float, keep: str):
+        """Drop expired results, then the least recently viewed ones over the count and size limits"""
+        conn.execute("DELETE FROM admin_results WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM admin_results WHERE id IN ("
+            "  SELECT id FROM admin_results ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM admin_results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in conn.execute(
+            "SELECT id, size FROM admin_results WHERE id != ? ORDER BY last_access", (keep,)
+        ).fetchall():
+            conn.execute("DELETE FROM admin_results WHERE id = ?", (row["id"],))
+            total -= row["size"]
+            if total <= self.max_bytes:
+                break
+
+    def get_page(self, result_id: str, owner: str, page: int = 1, page_size: int = 200) -> Optional[Dict]:
+        """
+        One page of a result's lines
+
+        Args:
+            result_id: Result ID returned by put
+            owner: Username asking for it
+            page: Page number, starting at 1 (clamped to the last page)
+            page_size: Lines per page
+
+        Returns:
+            Dict with id, title, created_at, total_lines, page, pages and text,
+            or None if the result is unknown, expired or not the owner's
+        """
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT id, title, text, line_count, created_at FROM admin_results "
+            "WHERE id = ? AND owner = ? AND expires_at > ?",
+            (result_id, owner, now)
+        ).fetchone()
+        if row is None:
+            return None
+        with self.transaction() as conn:
+            conn.execute("UPDATE admin_results SET last_access = ? WHERE id = ?", (now, result_id))
+
+        page_size = max(1, page_size)
+        pages = max(1, -(-row["line_count"] // page_size))
+        page = min(max(1, page), pages)
+        lines = row["text"].splitlines()
+        return {
+            "id": row["id"],
+            "title": row["title"],
+            "created_at": row["created_at"],
+            "total_lines": row["line_count"],
+            "page": page,
+            "pages": pages,
+            "text": "\n".join(lines[(page - 1) * page_size:page * page_size]),
+        }
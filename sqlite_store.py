@@ -0,0 +1,97 @@
+"""
+Shared SQLite helpers for local, cross-process state.
+
+This module handles:
+- Opening WAL-mode connections that are safe to share between uWSGI workers
+- Keeping one connection per thread (and per process after fork)
+- Running short write transactions with BEGIN IMMEDIATE
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def connect(db_path: str, timeout: float = 30.0) -> sqlite3.Connection:
+    """
+    Open a SQLite connection configured for concurrent access
+
+    Args:
+        db_path: Path to the SQLite database file
+        timeout: Seconds to wait on a locked database before failing
+
+    Returns:
+        sqlite3.Connection in autocommit mode with dict-like rows
+    """
+    directory = os.path.dirname(db_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    return conn
+
+
+class SQLiteStore:
+    """
+    Base class for small SQLite-backed stores
+
+    Subclasses set SCHEMA to the DDL they need; it is applied once per process.
+    """
+
+    SCHEMA = ""
+
+    def __init__(self, db_path: str):
+        """
+        Initialize the store and make sure the schema exists
+
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._init_schema()
+
+    def _init_schema(self):
+        """Create tables and indexes if they don't exist"""
+        if self.SCHEMA:
+            self._conn().executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """
+        Get the connection for the current thread, reopening it after a fork
+
+        Returns:
+            sqlite3.Connection
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = connect(self.db_path)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run a block inside a write transaction (BEGIN IMMEDIATE)
+
+        Yields:
+            sqlite3.Connection to execute statements on
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
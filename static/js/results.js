@@ -0,0 +1,40 @@
+// Admin panel results (PowerCode / Utopia panels)
+// Results are stored server-side; the page only gets their IDs and loads them one page at a time
+
+async function loadResultPage(container, page) {
+    const text = container.querySelector('.result-text');
+    const pager = container.querySelector('.result-pager');
+    const label = container.querySelector('.result-page-label');
+
+    try {
+        const response = await fetch(`/admin/results/${encodeURIComponent(container.dataset.resultId)}?page=${page}`);
+        const result = await response.json();
+        if (!result.success) {
+            text.textContent = result.error || 'Result not available';
+            pager.classList.add('hidden');
+            return;
+        }
+
+        text.textContent = result.text;
+        container.dataset.page = result.page;
+        if (result.pages > 1) {
+            label.textContent = `Page ${result.page} of ${result.pages} (${result.total_lines} lines)`;
+            pager.querySelector('[data-page-step="-1"]').disabled = result.page <= 1;
+            pager.querySelector('[data-page-step="1"]').disabled = result.page >= result.pages;
+            pager.classList.remove('hidden');
+        }
+    } catch (error) {
+        text.textContent = 'Connection error while loading the result.';
+        console.error('Result load error:', error);
+    }
+}
+
+document.querySelectorAll('[data-result-id]').forEach(container => {
+    container.querySelectorAll('[data-page-step]').forEach(button => {
+        button.addEventListener('click', () => {
+            const page = parseInt(container.dataset.page || '1', 10) + parseInt(button.dataset.pageStep, 10);
+            loadResultPage(container, page);
+        });
+    });
+    loadResultPage(container, 1);
+});
@@ -0,0 +1,129 @@
+"""
+Dependency-aware parallel step runner.
+
+This module handles:
+- Registering named steps with optional dependencies on other steps
+- Running every step whose dependencies succeeded on a bounded thread pool
+- Collecting a result/error record per step (failed dependencies skip dependents)
+"""
+
+import time
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StepExecutor:
+    """
+    Runs a small graph of independent or dependent steps concurrently
+    """
+
+    def __init__(self, max_workers: int = 4, name: str = "steps"):
+        """
+        Initialize step executor
+
+        Args:
+            max_workers: Maximum number of steps running at the same time
+            name: Label used in log messages and thread names
+        """
+        self.max_workers = max(1, max_workers)
+        self.name = name
+        self._steps = {}
+
+    def add_step(self, step_name: str, func: Callable, *args, depends_on: Optional[Iterable[str]] = None, **kwargs):
+        """
+        Register a step
+
+        Args:
+            step_name: Unique step name, used as the key in run() results
+            func: Callable to run; raising an exception marks the step failed
+            *args: Positional arguments for func
+            depends_on: Names of steps that must succeed before this one starts
+            **kwargs: Keyword arguments for func
+        """
+        if step_name in self._steps:
+            raise ValueError(f"Step '{step_name}' is already registered")
+        self._steps[step_name] = {
+            "func": func,
+            "args": args,
+            "kwargs": kwargs,
+            "depends_on": list(depends_on or []),
+        }
+
+    def run(self) -> Dict[str, Dict]:
+        """
+        Run all registered steps and wait for them to finish
+
+        Returns:
+            Dictionary of step name -> {"success", "result", "error", "skipped", "duration"}
+        """
+        for step_name, step in self._steps.items():
+            missing = [dep for dep in step["depends_on"] if dep not in self._steps]
+            if missing:
+                raise ValueError(f"Step '{step_name}' depends on unknown steps: {missing}")
+
+        results = {}
+        pending = dict(self._steps)
+        running = {}
+        workers = min(self.max_workers, len(self._steps)) or 1
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.name) as pool:
+            while pending or running:
+                # Skip steps whose dependencies failed, start steps whose dependencies succeeded
+                for step_name, step in list(pending.items()):
+                    deps = step["depends_on"]
+                    failed_deps = [d for d in deps if d in results and not results[d]["success"]]
+                    if failed_deps:
+                        results[step_name] = {
+                            "success": False,
+                            "result": None,
+                            "error": f"Skipped: dependency failed ({', '.join(failed_deps)})",
+                            "skipped": True,
+                            "duration": 0.0,
+                        }
+                        del pending[step_name]
+                    elif all(d in results for d in deps):
+                        # Run in a copy of the caller's context so log fields (orderref, stage) carry over
+                        future = pool.submit(contextvars.copy_context().run, self._run_step, step_name, step)
+                        running[future] = step_name
+                        del pending[step_name]
+
+                if not running:
+                    if pending:
+                        raise ValueError(f"Dependency cycle between steps: {list(pending)}")
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+        return results
+
+    def _run_step(self, step_name: str, step: Dict) -> Dict:
+        """Run one step and capture its result or error"""
+        started = time.monotonic()
+        try:
+            result = step["func"](*step["args"], **step["kwargs"])
+            return {
+                "success": True,
+                "result": result,
+                "error": None,
+                "skipped": False,
+                "duration": round(time.monotonic() - started, 3),
+            }
+        except Exception as e:
+            duration = time.monotonic() - started
+            logger.error(
+                f"[{self.name}] Step '{step_name}' failed: {str(e)}", exc_info=True,
+                extra={"duration_ms": round(duration * 1000)}
+            )
+            return {
+                "success": False,
+                "result": None,
+                "error": str(e),
+                "skipped": False,
+                "duration": round(duration, 3),
+            }
@@ -0,0 +1,331 @@
+"""
+Compiled, cached ticket description templates.
+
+This module handles:
+- Parsing a template once into literal text and {variable} slots
+- Caching compiled templates per file, keyed by path, mtime, size and inode,
+  so a template saved by any uWSGI worker is picked up by all of them
+- Rendering every customer field in one pass (values HTML-escaped)
+- Writing templates atomically (temp file + rename), so readers never see half a file
+- A catalog of template metadata (name, subject, size, modified) kept in memory,
+  updated by save/delete and rebuilt only when the directory's mtime changes
+"""
+
+import os
+import re
+import html
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from file_utils import write_atomic
+
+logger = logging.getLogger(__name__)
+
+# Template variable -> customer_data key(s) (the dict built by customer_to_pc)
+TEMPLATE_VARIABLES = {
+    "customer_name": ("firstname", "lastname"),
+    "order_ref": ("orderref",),
+    "site_id": ("siteid",),
+    "email": ("email",),
+    "phone": ("phone",),
+    "address": ("address",),
+    "apt": ("apt",),
+    "city": ("city",),
+    "state": ("state",),
+    "zip": ("zip",),
+}
+
+# Shown for an empty or missing value (customer_name is left blank instead)
+MISSING_VALUE = "N/A"
+
+_VARIABLE_RE = re.compile(r"\{(" + "|".join(TEMPLATE_VARIABLES) + r")\}")
+
+
+class CompiledTemplate:
+    """
+    A template split into literal text and variable slots
+
+    Unknown {names} and other braces (e.g. inline CSS) are kept as literal text.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        # Alternating literal, variable, literal, ... (always starts and ends with a literal)
+        self.parts: List[str] = _VARIABLE_RE.split(source)
+        self.variables = sorted(set(self.parts[1::2]))
+
+    def render(self, customer_data: Dict) -> str:
+        """
+        Fill in the variables
+
+        Args:
+            customer_data: Customer fields (firstname, lastname, orderref, siteid, email, ...)
+
+        Returns:
+            Rendered description
+        """
+        values = template_values(customer_data)
+        parts = self.parts[:]
+        for i in range(1, len(parts), 2):
+            parts[i] = values[parts[i]]
+        return "".join(parts)
+
+
+def template_values(customer_data: Dict) -> Dict[str, str]:
+    """
+    HTML-escaped value of every template variable for one customer
+
+    Args:
+        customer_data: Customer fields
+
+    Returns:
+        Dictionary of variable -> value
+    """
+    values = {}
+    for variable, keys in TEMPLATE_VARIABLES.items():
+        if variable == "customer_name":
+            value = " ".join(str(customer_data.get(key) or "") for key in keys).strip()
+        else:
+            value = customer_data.get(keys[0])
+            value = MISSING_VALUE if value in (None, "", "None") else str(value)
+        values[variable] = html.escape(value, quote=False)
+    return values
+
+
+class TicketTemplateCache:
+    """
+    Compiled templates per file, recompiled when the file changes on disk
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Tuple, CompiledTemplate]] = {}
+        self.compiles = 0
+
+    @staticmethod
+    def _file_key(st: os.stat_result) -> Tuple:
+        # A saved template is a new file (atomic rename), so the inode changes even when
+        # the mtime resolution is too coarse to tell two saves apart
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def get(self, path: str) -> CompiledTemplate:
+        """
+        Get the compiled template for a file, compiling it if it is new or changed
+
+        Args:
+            path: Template file path
+
+        Returns:
+            CompiledTemplate
+
+        Raises:
+            FileNotFoundError: If the file does not exist
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = self._file_key(st)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        with open(path, "r", encoding="utf-8") as f:
+            compiled = CompiledTemplate(f.read())
+        with self._lock:
+            self._entries[path] = (key, compiled)
+            self.compiles += 1
+        logger.info(f"Compiled ticket template {path} (variables: {', '.join(compiled.variables) or 'none'})")
+        return compiled
+
+    def render(self, path: str, customer_data: Dict) -> str:
+        """
+        Render a template file for one customer
+
+        Args:
+            path: Template file path
+            customer_data: Customer fields
+
+        Returns:
+            Rendered description
+
+        Raises:
+            FileNotFoundError: If the file does not exist
+        """
+        return self.get(path).render(customer_data)
+
+    def invalidate(self, path: Optional[str] = None):
+        """
+        Drop one cached template (or all); other workers notice the change on their next stat
+
+        Args:
+            path: Template file path, or None for all
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
+
+
+class TemplateCatalog:
+    """
+    Metadata of every template in the template directory, served from memory
+
+    Each template is a <name>.txt file with an optional <name>.txt.meta.json. Saves and
+    deletes made through the catalog update it in place; a change made by another worker
+    (or by hand) changes the directory's mtime, and the catalog is then rebuilt from disk.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: Template directory
+        """
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._dir_key: Optional[Tuple] = None
+        self._entries: Dict[str, Dict] = {}
+        self._etag = ""
+        self.rebuilds = 0
+
+    def _stat_dir(self) -> Optional[Tuple]:
+        try:
+            st = os.stat(self.directory)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_ino)
+
+    def _read_entry(self, filename: str) -> Optional[Dict]:
+        file_path = os.path.join(self.directory, filename)
+        try:
+            file_stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        metadata = {}
+        try:
+            with open(f"{file_path}.meta.json", "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable template metadata for {filename}: {e}")
+        return {
+            "id": filename[:-len(".txt")],
+            "name": metadata.get("name", ""),
+            "subject": metadata.get("subject", ""),
+            "filename": filename,
+            "size": file_stat.st_size,
+            "modified": datetime.fromtimestamp(file_stat.st_mtime).isoformat(),
+            "last_modified": metadata.get("last_modified", ""),
+        }
+
+    def _update_etag(self):
+        digest = hashlib.sha1(json.dumps(self._entries, sort_keys=True).encode("utf-8")).hexdigest()
+        self._etag = digest[:16]
+
+    def _refresh(self):
+        """Rebuild from disk if the directory changed since the last look (caller holds the lock)"""
+        dir_key = self._stat_dir()
+        if dir_key == self._dir_key and dir_key is not None:
+            return
+        entries = {}
+        if dir_key is not None:
+            for filename in sorted(os.listdir(self.directory)):
+                if filename.endswith(".txt"):
+                    entry = self._read_entry(filename)
+                    if entry is not None:
+                        entries[filename] = entry
+        self._entries = entries
+        self._dir_key = dir_key
+        self._update_etag()
+        self.rebuilds += 1
+        logger.info(f"Ticket template catalog rebuilt: {len(entries)} templates in {self.directory}")
+
+    def list(self) -> Tuple[List[Dict], str]:
+        """
+        All templates, sorted by filename
+
+        Returns:
+            (list of template metadata, ETag of the list)
+        """
+        with self._lock:
+            self._refresh()
+            return [dict(entry) for entry in self._entries.values()], self._etag
+
+    def get(self, filename: str) -> Optional[Dict]:
+        """
+        Metadata of one template
+
+        Args:
+            filename: Template file name (e.g. new_desc.txt)
+
+        Returns:
+            Template metadata, or None if there is no such template
+        """
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(filename)
+            return dict(entry) if entry else None
+
+    def save(self, filename: str, content: str, metadata: Dict) -> str:
+        """
+        Write a template and its metadata (atomically) and update the catalog
+
+        Args:
+            filename: Template file name
+            content: Template text
+            metadata: name, subject and last_modified
+
+        Returns:
+            Path of the template file
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        file_path = os.path.join(self.directory, filename)
+        with self._lock:
+            self._refresh()
+            write_atomic(file_path, content)
+            write_atomic(f"{file_path}.meta.json", json.dumps(metadata, indent=2))
+            self._apply(filename, self._read_entry(filename))
+        return file_path
+
+    def delete(self, filename: str) -> bool:
+        """
+        Delete a template and its metadata and update the catalog
+
+        Args:
+            filename: Template file name
+
+        Returns:
+            True if the template existed
+        """
+        file_path = os.path.join(self.directory, filename)
+        with self._lock:
+            self._refresh()
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                return False
+            try:
+                os.remove(f"{file_path}.meta.json")
+            except FileNotFoundError:
+                pass
+            self._apply(filename, None)
+        return True
+
+    def _apply(self, filename: str, entry: Optional[Dict]):
+        """
+        Record our own change (caller holds the lock and refreshed just before it).
+        The directory mtime now reflects our change; taking it as current is safe unless
+        another worker changed the directory in the same moment, which at worst means
+        one rebuild is skipped until the next change.
+        """
+        if entry is None:
+            self._entries.pop(filename, None)
+        else:
+            self._entries[filename] = entry
+            self._entries = dict(sorted(self._entries.items()))
+        self._dir_key = self._stat_dir()
+        self._update_etag()
@@ -0,0 +1,294 @@
+"""
+User accounts for the admin interface.
+
+This module handles:
+- Looking users up by username from an in-memory index instead of re-reading users.json
+- Noticing changes made by other uWSGI workers or add_user.py (file mtime/size/inode for
+  the JSON store, a version counter for the SQLite store) and reloading only then
+- Adding, updating and deleting single users; users.json is rewritten atomically under a
+  lock shared by all processes, the SQLite store writes just the one row
+- Importing an existing users.json once when switching to the SQLite store
+"""
+
+import os
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from sqlite_store import SQLiteStore
+from file_utils import write_atomic
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class UserStore(ABC):
+    """
+    Interface shared by the user store backends
+
+    A user is a dict with at least 'username', 'password' (bcrypt hash) and
+    'can_view_config'; other keys are kept as they are.
+    """
+
+    @abstractmethod
+    def get(self, username: str) -> Optional[Dict]:
+        """Get one user, or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list(self) -> List[Dict]:
+        """All users, in the order they were added"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add(self, user: Dict) -> bool:
+        """Add a user; False if the username is taken"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, username: str, **fields) -> bool:
+        """Change fields of one user; False if there is no such user"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, username: str) -> bool:
+        """Delete one user; False if there is no such user"""
+        raise NotImplementedError
+
+
+class JSONUserStore(UserStore):
+    """
+    Users in users.json (a list of user dicts), indexed by username in memory
+    """
+
+    def __init__(self, users_file: str):
+        """
+        Args:
+            users_file: Path to users.json
+        """
+        self.users_file = users_file
+        self._lock = threading.Lock()
+        # (file key, users in file order, username -> user)
+        self._cache: Tuple[Optional[Tuple], List[Dict], Dict[str, Dict]] = (None, [], {})
+        self.loads = 0
+
+    def _file_key(self) -> Optional[Tuple]:
+        try:
+            st = os.stat(self.users_file)
+        except FileNotFoundError:
+            return None
+        # Writes are atomic renames, so the inode changes even within one mtime tick
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _read_file(self) -> List[Dict]:
+        try:
+            with open(self.users_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _index(self) -> Dict[str, Dict]:
+        """Username index, reloaded if the file changed since the last call"""
+        key = self._file_key()
+        cached_key, _, index = self._cache
+        if key is not None and key == cached_key:
+            return index
+        with self._lock:
+            users = self._read_file()
+            index = {user['username']: user for user in users}
+            self._cache = (key, users, index)
+            self.loads += 1
+        return index
+
+    @contextmanager
+    def _locked_users(self):
+        """
+        Read users.json fresh, let the caller change the list, and write it back
+        atomically; the lock file keeps writers in other processes out meanwhile
+
+        Yields:
+            List of user dicts to modify in place
+        """
+        with self._lock:
+            if fcntl is None:
+                lock_file = None
+            else:
+                lock_file = open(self.users_file + ".lock", "a")
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                users = self._read_file()
+                before = json.dumps(users, sort_keys=True)
+                yield users
+                if json.dumps(users, sort_keys=True) != before:
+                    # Password hashes: a new users.json is readable by its owner only
+                    write_atomic(self.users_file, json.dumps(users, indent=2), mode=0o600)
+                    self._cache = (None, [], {})
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+
+    def get(self, username: str) -> Optional[Dict]:
+        user = self._index().get(username)
+        return dict(user) if user else None
+
+    def list(self) -> List[Dict]:
+        self._index()
+        return [dict(user) for user in self._cache[1]]
+
+    def add(self, user: Dict) -> bool:
+        with self._locked_users() as users:
+            if any(u['username'] == user['username'] for u in users):
+                return False
+            users.append(dict(user))
+        return True
+
+    def update(self, username: str, **fields) -> bool:
+        with self._locked_users() as users:
+            for user in users:
+                if user['username'] == username:
+                    user.update(fields)
+                    return True
+        return False
+
+    def delete(self, username: str) -> bool:
+        with self._locked_users() as users:
+            remaining = [u for u in users if u['username'] != username]
+            if len(remaining) == len(users):
+                return False
+            users[:] = remaining
+        return True
+
+
+class SQLiteUserStore(SQLiteStore, UserStore):
+    """
+    Users in the local state database, one row per user, indexed by username in memory
+
+    Every write bumps a version number; each worker reloads its index when the version
+    it last saw is out of date.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS user_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        INSERT OR IGNORE INTO user_meta (key, value) VALUES ('version', '0');
+    """
+
+    def __init__(self, db_path: str, legacy_json_path: Optional[str] = None):
+        """
+        Args:
+            db_path: Path to the SQLite database file
+            legacy_json_path: users.json to import once, if it exists
+        """
+        super().__init__(db_path)
+        self._lock = threading.Lock()
+        # (version, users in insertion order, username -> user)
+        self._cache: Tuple[Optional[str], List[Dict], Dict[str, Dict]] = (None, [], {})
+        self.loads = 0
+        if legacy_json_path:
+            self.migrate_from_json(legacy_json_path)
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """
+        Import users.json once. The file is renamed to <name>.migrated afterwards so
+        there is only one place users are kept.
+
+        Args:
+            json_path: Path to users.json
+
+        Returns:
+            Number of users imported
+        """
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                users = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Could not read {json_path} for migration: {e}")
+            return 0
+
+        with self.transaction() as conn:
+            for user in users:
+                conn.execute(
+                    "INSERT OR IGNORE INTO users (username, data) VALUES (?, ?)",
+                    (user['username'], json.dumps(user))
+                )
+            self._bump_version(conn)
+
+        try:
+            os.replace(json_path, f"{json_path}.migrated")
+        except OSError as e:
+            logger.warning(f"Migrated {json_path} but could not rename it: {e}")
+        logger.info(f"Migrated {len(users)} users from {json_path} to {self.db_path}")
+        return len(users)
+
+    @staticmethod
+    def _bump_version(conn):
+        conn.execute("UPDATE user_meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+
+    def _index(self) -> Dict[str, Dict]:
+        """Username index, reloaded if any worker wrote since the last call"""
+        conn = self._conn()
+        version = conn.execute("SELECT value FROM user_meta WHERE key = 'version'").fetchone()[0]
+        cached_version, _, index = self._cache
+        if version == cached_version:
+            return index
+        with self._lock:
+            users = [json.loads(row['data']) for row in conn.execute("SELECT data FROM users ORDER BY id")]
+            index = {user['username']: user for user in users}
+            self._cache = (version, users, index)
+            self.loads += 1
+        return index
+
+    def get(self, username: str) -> Optional[Dict]:
+        user = self._index().get(username)
+        return dict(user) if user else None
+
+    def list(self) -> List[Dict]:
+        self._index()
+        return [dict(user) for user in self._cache[1]]
+
+    def add(self, user: Dict) -> bool:
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO users (username, data) VALUES (?, ?)",
+                (user['username'], json.dumps(user))
+            )
+            if cursor.rowcount == 0:
+                return False
+            self._bump_version(conn)
+        return True
+
+    def update(self, username: str, **fields) -> bool:
+        with self.transaction() as conn:
+            row = conn.execute("SELECT data FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return False
+            user = json.loads(row['data'])
+            user.update(fields)
+            conn.execute("UPDATE users SET data = ? WHERE username = ?", (json.dumps(user), username))
+            self._bump_version(conn)
+        return True
+
+    def delete(self, username: str) -> bool:
+        with self.transaction() as conn:
+            cursor = conn.execute("DELETE FROM users WHERE username = ?", (username,))
+            if cursor.rowcount == 0:
+                return False
+            self._bump_version(conn)
+        return True
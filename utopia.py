@@ -1,7 +1,9 @@
 """ Working With Utopia"""
-import requests
 import json
+import threading
 import config
+import http_client
+from lookup_cache import LookupCache
 
 # setting up params for API URL
 params = {
@@ -9,13 +11,19 @@ params = {
 }
 
 
+def _http():
+    """Pooled keep-alive session shared by all Utopia calls in this worker"""
+    return http_client.get_session("utopia")
+
+
 # get customer - Contract Lookup
 # When authenticated, this endpoint returns additional order status information
 def getCustomerFromUtopia(orderref):
-    params["orderref"] = orderref
+    # Copy so concurrent lookups don't overwrite each other's orderref
+    JSON_REQUEST = dict(params, orderref=orderref)
 
-    response = requests.post(
-        config.URL_ENDPOINT + config.UTOPIA_Contract_Lookup, data=json.dumps(params))
+    response = _http().post(
+        config.URL_ENDPOINT + config.UTOPIA_Contract_Lookup, data=json.dumps(JSON_REQUEST))
 
     if "error" not in response.text and response.status_code == 200:
         data = response.json()
@@ -26,6 +34,51 @@ def getCustomerFromUtopia(orderref):
     return data
 
 
+_customer_cache = None
+_customer_cache_lock = threading.Lock()
+
+
+def _get_customer_cache():
+    """Contract lookup cache in the shared state DB (created on first use)"""
+    global _customer_cache
+    if _customer_cache is None:
+        with _customer_cache_lock:
+            if _customer_cache is None:
+                _customer_cache = LookupCache(
+                    db_path=config.STATE_DB_FILE,
+                    namespace="utopia_contract",
+                    ttl=config.UTOPIA_CACHE_TTL,
+                    max_entries=config.UTOPIA_CACHE_MAX_ENTRIES,
+                    load_timeout=config.HTTP_CONNECT_TIMEOUT + config.HTTP_READ_TIMEOUT
+                )
+    return _customer_cache
+
+
+# Contract Lookup through the shared cache
+# Repeated lookups of the same order within UTOPIA_CACHE_TTL are answered locally, and
+# concurrent lookups (admin panel, webhook, other workers) share one upstream call.
+# Error responses are not cached.
+def getCustomerFromUtopiaCached(orderref, refresh=False):
+    if config.UTOPIA_CACHE_TTL <= 0:
+        return getCustomerFromUtopia(orderref)
+    return _get_customer_cache().get_or_load(
+        orderref,
+        lambda: getCustomerFromUtopia(orderref),
+        cacheable=lambda data: isinstance(data, dict) and "error" not in data,
+        refresh=refresh
+    )
+
+
+# Drop a cached contract lookup (or all of them when orderref is None)
+def invalidateCustomerCache(orderref=None):
+    return _get_customer_cache().invalidate(orderref)
+
+
+# Contract lookup cache size and hit/miss counters
+def getCustomerCacheStats():
+    return _get_customer_cache().get_stats()
+
+
 # get MAC address of router from UTOPIA
 def getUtopiaCustomerMAC(siteid):
     JSON_REQUEST = {
@@ -33,7 +86,7 @@ def getUtopiaCustomerMAC(siteid):
         "siteid": siteid,
     }
 
-    response = requests.post(config.URL_ENDPOINT + config.UTOPIA_APView, data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + config.UTOPIA_APView, data=json.dumps(JSON_REQUEST))
     try:
         APView = response.json()["result"][0]['eth']['eth1']["macs"][0][:17]
         APView_full = response.json()
@@ -51,7 +104,7 @@ def getCustomerService(siteid):
         "siteid": siteid,
     }
 
-    response = requests.post(config.URL_ENDPOINT + config.UTOPIA_Service_Lookup,
+    response = _http().post(config.URL_ENDPOINT + config.UTOPIA_Service_Lookup,
                              data=json.dumps(JSON_REQUEST))
     try:
         APView_full = response.json()
@@ -86,7 +139,7 @@ def checkAccess(siteid=None, clientid=None):
     if clientid:
         JSON_REQUEST["clientid"] = clientid
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/checkaccess", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/checkaccess", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -103,7 +156,7 @@ def editServiceItem(servid, spsubid1=None, spsubid2=None, spsubid3=None):
     if spsubid3 is not None:
         JSON_REQUEST["spsubid3"] = spsubid3
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/editserviceitem", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/editserviceitem", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -114,7 +167,7 @@ def downloadContract(orderref):
         "orderref": orderref,
     }
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/contractdownload", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/contractdownload", data=json.dumps(JSON_REQUEST))
     return response
 
 
@@ -130,7 +183,7 @@ def getOrders(status=None, siteid=None, orderref=None):
     if orderref:
         JSON_REQUEST["orderref"] = orderref
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/orders", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/orders", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -157,7 +210,7 @@ def editOrderItem(itemid, handoff=None, nnivlan=None, nnivlanservice=None, vlan=
     if spsubid3 is not None:
         JSON_REQUEST["spsubid3"] = spsubid3
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/editorderitem", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/editorderitem", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -168,7 +221,7 @@ def getCustomerByCID(cid):
         "cid": cid,
     }
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/customer", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/customer", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -180,7 +233,7 @@ def suspendService(cid, siteid):
         "siteid": siteid,
     }
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/suspend", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/suspend", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -192,7 +245,7 @@ def unsuspendService(cid, siteid):
         "siteid": siteid,
     }
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/unsuspend", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/unsuspend", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -207,7 +260,7 @@ def changeSpeed(cid, siteid, uiaid, product, issuedate):
         "issuedate": issuedate,
     }
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/changespeed", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/changespeed", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -222,7 +275,7 @@ def cancelService(cid, siteid, issuedate, singleservice=None):
     if singleservice:
         JSON_REQUEST["singleservice"] = singleservice
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/cancelservice", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/cancelservice", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -234,7 +287,7 @@ def getSiteIDByMAC(mac, hourshistory=1):
         "hourshistory": hourshistory,
     }
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/macsearch", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/macsearch", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -244,7 +297,7 @@ def getISPProducts():
         "apikey": config.UTOPIA_API_KEY,
     }
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/products", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/products", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -260,7 +313,7 @@ def getProjects(statusid=None, siteid=None, orderref=None):
     if orderref:
         JSON_REQUEST["orderref"] = orderref
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/projects", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/projects", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -271,7 +324,7 @@ def getProjectDetails(projectid):
         "projectid": projectid,
     }
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/projectdetail", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/projectdetail", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -295,7 +348,7 @@ def searchOutageTickets(siteid=None, clientid=None, eventdate=None, status=None,
     if utc:
         JSON_REQUEST["utc"] = utc
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/outagetickets", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/outagetickets", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -308,7 +361,7 @@ def getOutageTicket(ticketid, utc=False):
     if utc:
         JSON_REQUEST["utc"] = utc
     
-    response = requests.post(config.URL_ENDPOINT + "/spquery/outageticket", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/spquery/outageticket", data=json.dumps(JSON_REQUEST))
     return response.json()
 
 
@@ -319,5 +372,5 @@ def bulkAddressExport(network):
         "network": network,
     }
     
-    response = requests.post(config.URL_ENDPOINT + "/address/bulkexport", data=json.dumps(JSON_REQUEST))
+    response = _http().post(config.URL_ENDPOINT + "/address/bulkexport", data=json.dumps(JSON_REQUEST))
     return response.json()
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""
+Idempotency store for webhook deliveries.
+
+This module handles:
+- Recording each (event, orderref) webhook delivery and its processing state
+  in the local SQLite state database, shared by all uWSGI workers
+- Recognizing redeliveries: in-flight ones are acknowledged without queueing a
+  second job, completed ones short-circuit, failed ones are processed again
+- Expiring old records after a retention period
+"""
+
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+STATUS_PROCESSING = "processing"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).astimezone().isoformat() if ts else None
+
+
+class WebhookIdempotencyStore(SQLiteStore):
+    """
+    SQLite-backed record of webhook deliveries keyed by (event, orderref)
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS webhook_deliveries (
+            event TEXT NOT NULL,
+            orderref TEXT NOT NULL,
+            status TEXT NOT NULL,
+            job_id TEXT,
+            outcome TEXT,
+            deliveries INTEGER NOT NULL DEFAULT 1,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (event, orderref)
+        );
+        CREATE INDEX IF NOT EXISTS idx_webhook_deliveries_updated ON webhook_deliveries (updated_at);
+    """
+
+    def __init__(self, db_path: str = "uac_state.db", retention: float = 7 * 86400, stale_after: float = 1800):
+        """
+        Initialize store
+
+        Args:
+            db_path: Path to SQLite database file
+            retention: Seconds a completed delivery keeps short-circuiting redeliveries
+            stale_after: Seconds after which a delivery still marked processing is treated as
+                abandoned and a redelivery is processed again
+        """
+        super().__init__(db_path)
+        self.retention = retention
+        self.stale_after = stale_after
+
+    @staticmethod
+    def _key(event: Optional[str]) -> str:
+        return event or ""
+
+    def begin(self, event: Optional[str], orderref: str) -> Dict:
+        """
+        Register a delivery and decide whether it needs processing
+
+        Args:
+            event: Webhook event name
+            orderref: Order reference
+
+        Returns:
+            Dictionary with duplicate (True if this delivery should not be processed),
+            status, job_id and deliveries of the (event, orderref) record
+        """
+        now = time.time()
+        event = self._key(event)
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM webhook_deliveries WHERE updated_at < ?", (now - self.retention,))
+            row = conn.execute(
+                "SELECT * FROM webhook_deliveries WHERE event = ? AND orderref = ?", (event, orderref)
+            ).fetchone()
+
+            duplicate = row is not None and (
+                row["status"] == STATUS_COMPLETED
+                or (row["status"] == STATUS_PROCESSING and row["updated_at"] > now - self.stale_after)
+            )
+            if row is None:
+                conn.execute(
+                    "INSERT INTO webhook_deliveries (event, orderref, status, first_seen, last_seen, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (event, orderref, STATUS_PROCESSING, now, now, now)
+                )
+            elif duplicate:
+                conn.execute(
+                    "UPDATE webhook_deliveries SET deliveries = deliveries + 1, last_seen = ? "
+                    "WHERE event = ? AND orderref = ?",
+                    (now, event, orderref)
+                )
+            else:
+                # Failed or abandoned earlier: process this delivery again
+                conn.execute(
+                    "UPDATE webhook_deliveries SET status = ?, job_id = NULL, outcome = NULL, "
+                    "deliveries = deliveries + 1, attempts = attempts + 1, last_seen = ?, updated_at = ? "
+                    "WHERE event = ? AND orderref = ?",
+                    (STATUS_PROCESSING, now, now, event, orderref)
+                )
+            row = conn.execute(
+                "SELECT status, job_id, deliveries FROM webhook_deliveries WHERE event = ? AND orderref = ?",
+                (event, orderref)
+            ).fetchone()
+
+        if duplicate:
+            logger.info(
+                f"Duplicate webhook delivery #{row['deliveries']} for event '{event}' order {orderref} "
+                f"({row['status']}, job {row['job_id']})",
+                extra={"orderref": orderref}
+            )
+        return {"duplicate": duplicate, **dict(row)}
+
+    def attach_job(self, event: Optional[str], orderref: str, job_id: str):
+        """
+        Remember the queue job processing a delivery
+
+        Args:
+            event: Webhook event name
+            orderref: Order reference
+            job_id: Order queue job ID
+        """
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE webhook_deliveries SET job_id = ?, updated_at = ? WHERE event = ? AND orderref = ?",
+                (job_id, time.time(), self._key(event), orderref)
+            )
+
+    def finish(self, event: Optional[str], orderref: str, success: bool, outcome: Optional[str] = None):
+        """
+        Record the result of processing a delivery
+
+        Args:
+            event: Webhook event name
+            orderref: Order reference
+            success: True marks it completed (redeliveries short-circuit); False marks it failed
+                (a redelivery is processed again)
+            outcome: Short outcome or error text
+        """
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE webhook_deliveries SET status = ?, outcome = ?, updated_at = ? WHERE event = ? AND orderref = ?",
+                (STATUS_COMPLETED if success else STATUS_FAILED, outcome, time.time(), self._key(event), orderref)
+            )
+
+    def list_deliveries(self, orderref: Optional[str] = None, duplicates_only: bool = False,
+                        limit: int = 50) -> List[Dict]:
+        """
+        List recorded deliveries, most recently seen first
+
+        Args:
+            orderref: Only deliveries for this order
+            duplicates_only: Only deliveries that were received more than once
+            limit: Maximum number of records to return
+
+        Returns:
+            List of delivery records
+        """
+        query = "SELECT * FROM webhook_deliveries"
+        conditions, params = [], []
+        if orderref:
+            conditions.append("orderref = ?")
+            params.append(orderref)
+        if duplicates_only:
+            conditions.append("deliveries > 1")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY last_seen DESC LIMIT ?"
+        params.append(limit)
+
+        deliveries = []
+        for row in self._conn().execute(query, params):
+            delivery = dict(row)
+            for field in ("first_seen", "last_seen", "updated_at"):
+                delivery[field] = _iso(delivery[field])
+            deliveries.append(delivery)
+        return deliveries